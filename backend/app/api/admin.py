@@ -1,17 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import List, Optional
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
+from functools import partial
+import json
 import uuid
+import os
 
 from app.core.database import get_db
 from app.core.security import get_password_hash, generate_user_encryption_key
 from app.models.user import User, UserRole
 from app.models.audit_log import AuditLog, AuditAction
-from app.api.auth import get_admin_user
+from app.api.auth import get_admin_user, run_password_task
 from app.schemas.auth import UserCreate, UserResponse
+from app.services.principal_cache import principal_cache, revoke_user_sessions
+from app.services.audit import audit_writer
+from app.services.system_stats import read_system_stats, refresh_system_stats
 from app.core.config import settings
+from app.core.executors import password_executor, run_in_executor
 from pydantic import BaseModel
 
 class PasswordResetRequest(BaseModel):
@@ -38,32 +44,31 @@ async def create_user(
     
     # Create new user
     user_id = str(uuid.uuid4())
-    encryption_key, salt = generate_user_encryption_key(user_id, user_data.password)
+    encryption_key, salt = await run_password_task(generate_user_encryption_key, user_id, user_data.password)
+    hashed_password = await run_password_task(get_password_hash, user_data.password)
     
     new_user = User(
         id=user_id,
         email=user_data.email,
         username=user_data.username,
         full_name=user_data.full_name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         role=UserRole.USER,
         encryption_salt=salt,
         storage_quota_mb=settings.DEFAULT_USER_QUOTA_MB
     )
     
     db.add(new_user)
+    db.commit()
     
     # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.USER_CREATE,
         user_id=admin_user.id,
-        action=AuditAction.USER_CREATE,
         resource_type="user",
         resource_id=user_id,
         details=f"Created user {user_data.username}"
     )
-    db.add(audit)
-    db.commit()
     
     # Return user data with proper serialization
     return {
@@ -91,27 +96,29 @@ async def reset_user_password(
         raise HTTPException(status_code=404, detail="User not found")
     
     # Generate new encryption key with new password
-    encryption_key, salt = generate_user_encryption_key(user_id, password_data.new_password)
+    encryption_key, salt = await run_password_task(generate_user_encryption_key, user_id, password_data.new_password)
     
-    user.hashed_password = get_password_hash(password_data.new_password)
+    user.hashed_password = await run_password_task(get_password_hash, password_data.new_password)
     user.encryption_salt = salt
     user.password_changed_at = datetime.now(timezone.utc)
     user.updated_at = datetime.now(timezone.utc)  # Explicitly set updated_at
     user.failed_login_attempts = 0
     user.is_locked = False
     user.locked_until = None
+    revoke_user_sessions(user)
+    
+    details = f"Admin reset password for {user.username}"
+    db.commit()
+    principal_cache.invalidate(user_id)
     
     # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.PASSWORD_CHANGE,
         user_id=admin_user.id,
-        action=AuditAction.PASSWORD_CHANGE,
         resource_type="user",
         resource_id=user_id,
-        details=f"Admin reset password for {user.username}"
+        details=details
     )
-    db.add(audit)
-    db.commit()
     
     return {"message": "Password reset successfully"}
 
@@ -138,18 +145,20 @@ async def update_user_role(
     old_role = user.role.value
     user.role = UserRole.ADMIN if role_data.role == "admin" else UserRole.USER
     user.updated_at = datetime.now(timezone.utc)  # Explicitly set updated_at
+    revoke_user_sessions(user)
+    
+    details = f"Changed role for {user.username} from {old_role} to {role_data.role}"
+    db.commit()
+    principal_cache.invalidate(user_id)
     
     # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.USER_UPDATE,
         user_id=admin_user.id,
-        action=AuditAction.USER_UPDATE,
         resource_type="user",
         resource_id=user_id,
-        details=f"Changed role for {user.username} from {old_role} to {role_data.role}"
+        details=details
     )
-    db.add(audit)
-    db.commit()
     
     return {"message": f"User role updated to {role_data.role}"}
 
@@ -158,44 +167,19 @@ async def get_system_stats(
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    stats = {}
-    
-    # User statistics
-    stats["users"] = {
-        "total": db.query(User).count(),
-        "active": db.query(User).filter(User.is_active == True).count(),
-        "locked": db.query(User).filter(User.is_locked == True).count(),
-        "admins": db.query(User).filter(User.role == UserRole.ADMIN).count()
-    }
-    
-    # Storage statistics
-    total_storage = db.query(func.sum(User.storage_used_mb)).scalar() or 0
-    total_quota = db.query(func.sum(User.storage_quota_mb)).scalar() or 0
+    # Counters are maintained incrementally; this reads one summary row
+    stats = read_system_stats(db)
+    if stats is None:
+        await run_in_executor(None, refresh_system_stats)
+        stats = read_system_stats(db)
     
-    stats["storage"] = {
-        "total_used_mb": total_storage,
-        "total_quota_mb": total_quota,
-        "percentage": (total_storage / total_quota * 100) if total_quota > 0 else 0
+    # Blocking work pools - queue depth and rejections show auth backpressure
+    stats["executors"] = {
+        "password": password_executor.stats()
     }
     
-    # Activity statistics
-    last_24h = datetime.now(timezone.utc) - timedelta(hours=24)
-    last_7d = datetime.now(timezone.utc) - timedelta(days=7)
-    
-    stats["activity"] = {
-        "logins_24h": db.query(AuditLog).filter(
-            AuditLog.action == AuditAction.LOGIN,
-            AuditLog.created_at >= last_24h
-        ).count(),
-        "uploads_7d": db.query(AuditLog).filter(
-            AuditLog.action == AuditAction.FILE_UPLOAD,
-            AuditLog.created_at >= last_7d
-        ).count(),
-        "failed_logins_24h": db.query(AuditLog).filter(
-            AuditLog.action == AuditAction.LOGIN_FAILED,
-            AuditLog.created_at >= last_24h
-        ).count()
-    }
+    # Audit pipeline - lag and spilled/dropped events
+    stats["audit_pipeline"] = audit_writer.stats()
     
     return stats
 
@@ -229,19 +213,115 @@ async def get_audit_logs(
 @router.post("/maintenance/cleanup")
 async def cleanup_deleted_records(
     days_old: int = 30,
-    admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    dry_run: bool = False,
+    admin_user: User = Depends(get_admin_user)
 ):
-    cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old)
+    """Purge records soft-deleted more than days_old days ago, with their files; dry_run only counts them.
     
-    # Permanently delete soft-deleted records older than cutoff
-    from app.models.health_record import HealthRecord
+    A real purge can take many batches, so it is handed to the scheduler's
+    soft_delete_gc job and its outcome shows up in that job's run history.
+    """
+    from app.services.scheduler import scheduler
+    from app.services.soft_delete import purge_soft_deleted
     
-    deleted_count = db.query(HealthRecord).filter(
-        HealthRecord.is_deleted == True,
-        HealthRecord.deleted_at < cutoff_date
-    ).delete()
+    if days_old < 0:
+        raise HTTPException(status_code=400, detail="days_old must not be negative")
     
-    db.commit()
+    if dry_run:
+        result = await run_in_executor(None, partial(purge_soft_deleted, dry_run=True, older_than_days=days_old))
+        return {
+            "message": f"Would clean up {result['health_records']} deleted records and "
+                       f"{result['payment_records']} deleted payments",
+            **result
+        }
+    
+    if not settings.SCHEDULER_ENABLED:
+        raise HTTPException(status_code=503, detail="The scheduler is disabled")
+    await run_in_executor(None, partial(scheduler.request_run, "soft_delete_gc", older_than_days=days_old))
+    return {
+        "message": f"Cleanup of records deleted more than {days_old} days ago queued",
+        "job": "soft_delete_gc",
+        "queued": True
+    }
+
+@router.post("/maintenance/reconcile-storage")
+async def reconcile_object_storage(
+    repair: bool = False,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Find objects no row refers to and rows whose object is missing; repair removes the orphans"""
+    from app.services.storage_reconcile import reconcile_storage
+    
+    result = await run_in_executor(None, partial(reconcile_storage, repair=repair))
+    return {
+        "message": f"Found {result['orphaned_objects']} orphaned objects and "
+                   f"{sum(result['dangling_rows'].values())} rows without their object",
+        **result
+    }
+
+@router.post("/maintenance/audit-partitions")
+async def run_audit_partition_maintenance(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Create upcoming audit log partitions and archive expired ones now"""
+    from app.services.audit_partitions import maintain_audit_partitions
+    
+    result = await run_in_executor(None, maintain_audit_partitions)
+    return {
+        "message": f"Created {len(result['created'])} and archived {len(result['archived'])} audit partitions",
+        **result
+    }
+
+@router.post("/maintenance/fx-rates")
+async def reload_exchange_rates(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Re-import the reference exchange rate CSV configured in FX_RATES_CSV"""
+    from app.services.fx_rates import import_rates, fx_index
+    
+    if not settings.FX_RATES_CSV or not os.path.exists(settings.FX_RATES_CSV):
+        raise HTTPException(status_code=404, detail="Exchange rate file not found")
+    try:
+        imported = await run_in_executor(None, import_rates, settings.FX_RATES_CSV)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "message": f"Imported {imported} exchange rates",
+        "currencies": fx_index.currencies()
+    }
+
+@router.get("/scheduler")
+async def get_scheduled_jobs(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Schedule, next run and last outcome of every periodic job"""
+    from app.services.scheduler import scheduler
+    
+    return {"jobs": await run_in_executor(None, scheduler.status)}
+
+@router.get("/scheduler/{job_name}/runs")
+async def get_job_runs(
+    job_name: str,
+    limit: int = 50,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Recent runs of one periodic job, newest first"""
+    from app.models.scheduled_job import JobRun
     
-    return {"message": f"Cleaned up {deleted_count} deleted records"}
\ No newline at end of file
+    runs = db.query(JobRun).filter(
+        JobRun.job_name == job_name
+    ).order_by(JobRun.started_at.desc()).limit(min(limit, 500)).all()
+    return [
+        {
+            "id": run.id,
+            "status": run.status.value,
+            "worker": run.worker,
+            "started_at": run.started_at.isoformat(),
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+            "duration_ms": run.duration_ms,
+            "result": json.loads(run.result_json) if run.result_json else None,
+            "error": run.error
+        }
+        for run in runs
+    ]
@@ -15,14 +15,38 @@ from app.core.security import (
     generate_user_encryption_key
 )
 from app.models.user import User, UserRole
-from app.models.audit_log import AuditLog, AuditAction
+from app.models.audit_log import AuditAction
 from app.schemas.auth import Token, TokenData, UserCreate, UserLogin, PasswordChange
 from app.core.config import settings
+from app.core.executors import password_executor, ExecutorSaturated
+from app.services.principal_cache import Principal, principal_cache, revoke_user_sessions
+from app.services.audit import audit_writer
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def issue_tokens(user: User) -> dict:
+    """Access and refresh tokens carrying the user's current security stamp"""
+    claims = {"sub": str(user.id), "stm": user.security_stamp or 0}
+    return {
+        "access_token": create_access_token(data=claims),
+        "refresh_token": create_refresh_token(data=claims),
+        "token_type": "bearer"
+    }
+
+async def run_password_task(func, *args):
+    """Run bcrypt/PBKDF2 work on the password pool, shedding load when it is saturated"""
+    try:
+        return await password_executor.run(func, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many authentication requests, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Authenticate a request, hitting the database only on a principal cache miss"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -37,16 +61,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if user_id is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    # Tokens issued before the stamp was introduced carry no claim and map to 0
+    stamp = payload.get("stm", 0)
+    
+    # A stamp mismatch may just mean this worker's entry predates the change
+    principal = principal_cache.get(user_id)
+    if principal is None or principal.security_stamp != stamp:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            principal_cache.invalidate(user_id)
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+    
+    if principal.security_stamp != stamp:
         raise credentials_exception
     
-    if not user.is_active:
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     
-    if user.is_locked and user.locked_until and user.locked_until > datetime.now(timezone.utc):
+    if principal.currently_locked:
         raise HTTPException(status_code=400, detail="Account is locked")
     
+    return principal
+
+async def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    """Full User row for endpoints that need more than the principal"""
+    # Served from the identity map when the principal was just loaded
+    user = db.get(User, principal.id)
+    if user is None:
+        principal_cache.invalidate(principal.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
@@ -81,7 +130,8 @@ async def register(
         )
     
     user_id = str(uuid.uuid4())
-    encryption_key, salt = generate_user_encryption_key(user_id, user_data.password)
+    encryption_key, salt = await run_password_task(generate_user_encryption_key, user_id, user_data.password)
+    hashed_password = await run_password_task(get_password_hash, user_data.password)
     
     first_user = db.query(User).first() is None
     
@@ -90,36 +140,25 @@ async def register(
         email=user_data.email,
         username=user_data.username,
         full_name=user_data.full_name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         role=UserRole.ADMIN if first_user else UserRole.USER,
         encryption_salt=salt,
         storage_quota_mb=settings.DEFAULT_USER_QUOTA_MB
     )
     
     db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
     
-    audit_log = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.USER_CREATE,
         user_id=user_id,
-        action=AuditAction.USER_CREATE,
         resource_type="user",
         resource_id=user_id,
-        ip_address=request.client.host,
-        user_agent=request.headers.get("user-agent")
+        request=request
     )
-    db.add(audit_log)
-    
-    db.commit()
-    db.refresh(db_user)
-    
-    access_token = create_access_token(data={"sub": str(db_user.id)})
-    refresh_token = create_refresh_token(data={"sub": str(db_user.id)})
     
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer"
-    }
+    return issue_tokens(db_user)
 
 @router.post("/token", response_model=Token)
 async def login(
@@ -142,7 +181,7 @@ async def login(
             detail=f"Account locked until {user.locked_until}",
         )
     
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await run_password_task(verify_password, form_data.password, user.hashed_password):
         user.failed_login_attempts += 1
         user.last_failed_login = datetime.now(timezone.utc)
         
@@ -150,15 +189,11 @@ async def login(
             user.is_locked = True
             user.locked_until = datetime.now(timezone.utc) + timedelta(minutes=settings.LOCKOUT_DURATION_MINUTES)
         
-        audit_log = AuditLog(
-            id=str(uuid.uuid4()),
-            user_id=user.id,
-            action=AuditAction.LOGIN_FAILED,
-            ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent")
-        )
-        db.add(audit_log)
         db.commit()
+        audit_writer.record(AuditAction.LOGIN_FAILED, user_id=user.id, request=request)
+        
+        if user.is_locked:
+            principal_cache.invalidate(user.id)
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -166,30 +201,20 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    was_locked = user.is_locked
     user.failed_login_attempts = 0
     user.last_failed_login = None
     user.is_locked = False
     user.locked_until = None
     user.last_login = datetime.now(timezone.utc)
     
-    audit_log = AuditLog(
-        id=str(uuid.uuid4()),
-        user_id=user.id,
-        action=AuditAction.LOGIN,
-        ip_address=request.client.host,
-        user_agent=request.headers.get("user-agent")
-    )
-    db.add(audit_log)
     db.commit()
+    audit_writer.record(AuditAction.LOGIN, user_id=user.id, request=request)
     
-    access_token = create_access_token(data={"sub": str(user.id)})
-    refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    if was_locked:
+        principal_cache.invalidate(user.id)
     
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer"
-    }
+    return issue_tokens(user)
 
 @router.post("/refresh", response_model=Token)
 async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
@@ -209,14 +234,13 @@ async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
             detail="User not found or inactive",
         )
     
-    access_token = create_access_token(data={"sub": str(user.id)})
-    new_refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    if payload.get("stm", 0) != (user.security_stamp or 0):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has been revoked",
+        )
     
-    return {
-        "access_token": access_token,
-        "refresh_token": new_refresh_token,
-        "token_type": "bearer"
-    }
+    return issue_tokens(user)
 
 @router.post("/change-password")
 async def change_password(
@@ -225,7 +249,7 @@ async def change_password(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await run_password_task(verify_password, password_data.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect current password"
@@ -238,38 +262,25 @@ async def change_password(
             detail=message
         )
     
-    encryption_key, salt = generate_user_encryption_key(current_user.id, password_data.new_password)
+    encryption_key, salt = await run_password_task(generate_user_encryption_key, current_user.id, password_data.new_password)
     
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    current_user.hashed_password = await run_password_task(get_password_hash, password_data.new_password)
     current_user.encryption_salt = salt
     current_user.password_changed_at = datetime.now(timezone.utc)
+    revoke_user_sessions(current_user)
     
-    audit_log = AuditLog(
-        id=str(uuid.uuid4()),
-        user_id=current_user.id,
-        action=AuditAction.PASSWORD_CHANGE,
-        ip_address=request.client.host,
-        user_agent=request.headers.get("user-agent")
-    )
-    db.add(audit_log)
     db.commit()
+    principal_cache.invalidate(current_user.id)
+    audit_writer.record(AuditAction.PASSWORD_CHANGE, user_id=current_user.id, request=request)
     
-    return {"message": "Password changed successfully"}
+    # Other sessions are revoked; hand this one fresh tokens
+    return {"message": "Password changed successfully", **issue_tokens(current_user)}
 
 @router.post("/logout")
 async def logout(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    audit_log = AuditLog(
-        id=str(uuid.uuid4()),
-        user_id=current_user.id,
-        action=AuditAction.LOGOUT,
-        ip_address=request.client.host,
-        user_agent=request.headers.get("user-agent")
-    )
-    db.add(audit_log)
-    db.commit()
+    audit_writer.record(AuditAction.LOGOUT, user_id=current_user.id, request=request)
     
     return {"message": "Logged out successfully"}
\ No newline at end of file
@@ -2,19 +2,32 @@
 Enhanced backup API that integrates with the backup container
 """
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 import subprocess
 import uuid
 import os
 import asyncio
 from datetime import datetime, timezone
+from typing import Optional
 import logging
 from enum import Enum
 
 from app.core.database import get_db
 from app.models.user import User
 from app.models.backup import BackupHistory, BackupType, BackupStatus
+from app.models.scheduled_job import ScheduledJob
 from app.api.auth import get_admin_user
+from app.core.executors import run_in_executor
+from app.services.backup_engine import BackupRepository, BackupError, user_object_prefixes
+from app.services.backup_catalog import backup_catalog, DISCOVERED_NOTES
+from app.services.backup_pipeline import ARCHIVE_SUFFIX
+from app.services.backup_restore import restore_archive, verify_archive
+from app.services.backup_jobs import backup_channel, enqueue_backup_job
+from app.services.cron import CronSchedule
+from app.core.config import settings
+import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -71,7 +84,9 @@ async def trigger_backup_container(backup_id: str, source: BackupSource):
                             with open(info_file, 'r') as f:
                                 for line in f:
                                     if line.startswith("FILE="):
-                                        backup.file_path = line.split("=", 1)[1].strip()
+                                        file_path = line.split("=", 1)[1].strip()
+                                        backup_catalog.release_path(db, file_path, backup.id)
+                                        backup.file_path = file_path
                                     elif line.startswith("SIZE_MB="):
                                         try:
                                             backup.size_mb = float(line.split("=", 1)[1].strip())
@@ -144,22 +159,56 @@ async def create_backup(
     _admin_user: User = Depends(get_admin_user),  # Authentication check only
     db: Session = Depends(get_db)
 ):
-    """Create a new backup using the backup container"""
+    """Create a new backup: in-process backups are queued for the backup worker,
+    otherwise the backup container is triggered"""
+    
+    if backup_type == BackupType.INCREMENTAL:
+        backup = BackupHistory(
+            id=str(uuid.uuid4()),
+            backup_type=BackupType.INCREMENTAL,
+            status=BackupStatus.PENDING,
+            notes="Incremental object backup initiated from web UI",
+            includes_database=False,
+            includes_files=True,
+            includes_config=False
+        )
+        db.add(backup)
+        enqueue_backup_job(db, backup.id, backup.backup_type)
+        db.commit()
+        
+        return {
+            "message": "Incremental backup started successfully",
+            "backup_id": str(backup.id),
+            "type": "incremental",
+            "includes": ["MinIO Files"]
+        }
     
     # Create backup history record
+    pipeline = settings.BACKUP_PIPELINE_ENABLED
     backup = BackupHistory(
         id=str(uuid.uuid4()),
         backup_type=backup_type,
-        status=BackupStatus.IN_PROGRESS,
-        started_at=datetime.now(timezone.utc),
+        status=BackupStatus.PENDING if pipeline else BackupStatus.IN_PROGRESS,
+        started_at=None if pipeline else datetime.now(timezone.utc),
         notes="Manual backup initiated from web UI",
         includes_database=True,
         includes_files=True,
         includes_config=False
     )
     db.add(backup)
+    if pipeline:
+        # Dumps, object copy, compression and encryption run concurrently in the backup worker
+        enqueue_backup_job(db, backup.id, backup.backup_type)
     db.commit()
     
+    if pipeline:
+        return {
+            "message": "Backup started successfully",
+            "backup_id": str(backup.id),
+            "type": "comprehensive",
+            "includes": ["PostgreSQL", "TimescaleDB", "MinIO Files", "Encryption"]
+        }
+    
     # Trigger backup in background using backup container
     background_tasks.add_task(trigger_backup_container, backup.id, BackupSource.MANUAL)
     
@@ -177,74 +226,21 @@ async def get_backup_history(
     _admin_user: User = Depends(get_admin_user),  # Authentication check only
     db: Session = Depends(get_db)
 ):
-    """Get backup history including both manual and automatic backups"""
+    """Get backup history including both manual and automatic backups.
     
-    # Get backups from database
-    db_backups = db.query(BackupHistory).order_by(
-        BackupHistory.created_at.desc()
-    ).limit(limit).all()
+    Automatic archives are indexed into backup_history by the backup catalog,
+    so this is a single query.
+    """
     
-    # If we should include automatic backups, scan the backup directory
-    all_backups = []
-    
-    if include_automatic:
-        try:
-            # Check for backup files that aren't in the database (automatic backups)
-            result = subprocess.run(
-                ["docker", "compose", "exec", "-T", "backup", "ls", "-la", "/backups/"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                known_files = {b.file_path for b in db_backups if b.file_path}
-                
-                for line in lines:
-                    # Parse backup files created by backup.sh
-                    if 'healthstash_backup_' in line and '.tar.gz' in line:
-                        parts = line.split()
-                        if len(parts) >= 9:
-                            filename = parts[-1]
-                            file_path = f"/backups/{filename}"
-                            
-                            # Check if this file is already in database
-                            if file_path not in known_files:
-                                # Extract timestamp from filename
-                                try:
-                                    # Format: healthstash_backup_YYYYMMDD_HHMMSS.tar.gz[.enc]
-                                    timestamp_str = filename.split('_')[2] + filename.split('_')[3].split('.')[0]
-                                    created_at = datetime.strptime(timestamp_str, '%Y%m%d%H%M%S')
-                                    
-                                    # Get file size
-                                    size_bytes = int(parts[4])
-                                    size_mb = round(size_bytes / (1024 * 1024), 2)
-                                    
-                                    # Create a pseudo backup record for automatic backup
-                                    auto_backup = {
-                                        "id": f"auto_{timestamp_str}",
-                                        "backup_type": "full",
-                                        "status": "completed",
-                                        "file_path": file_path,
-                                        "size_mb": size_mb,
-                                        "created_at": created_at.isoformat(),
-                                        "completed_at": created_at.isoformat(),
-                                        "notes": "Automatic backup (cron)",
-                                        "source": "automatic",
-                                        "includes_database": True,
-                                        "includes_files": True,
-                                        "includes_config": False
-                                    }
-                                    all_backups.append(auto_backup)
-                                except Exception as e:
-                                    logger.warning(f"Failed to parse automatic backup {filename}: {e}")
-                                    
-        except Exception as e:
-            logger.error(f"Failed to scan backup directory: {e}")
+    query = db.query(BackupHistory)
+    if not include_automatic:
+        query = query.filter(or_(BackupHistory.notes.is_(None), BackupHistory.notes != DISCOVERED_NOTES))
+    db_backups = query.order_by(BackupHistory.created_at.desc()).limit(limit).all()
     
     # Convert database backups to dict format
+    all_backups = []
     for db_backup in db_backups:
+        notes = db_backup.notes or "Manual backup"
         backup_dict = {
             "id": str(db_backup.id),
             "backup_type": db_backup.backup_type.value if db_backup.backup_type else "full",
@@ -252,154 +248,126 @@ async def get_backup_history(
             "file_path": db_backup.file_path,
             "size_mb": db_backup.size_mb,
             "duration_seconds": db_backup.duration_seconds,
+            "metrics": json.loads(db_backup.metrics_json) if db_backup.metrics_json else None,
+            "progress": _progress_dict(db_backup),
             "created_at": db_backup.created_at.isoformat() if db_backup.created_at else None,
             "started_at": db_backup.started_at.isoformat() if db_backup.started_at else None,
             "completed_at": db_backup.completed_at.isoformat() if db_backup.completed_at else None,
             "error_message": db_backup.error_message,
-            "notes": db_backup.notes or "Manual backup",
-            "source": "manual" if "Manual" in (db_backup.notes or "") else "unknown",
+            "notes": notes,
+            "source": "automatic" if notes.startswith("Automatic") else "manual" if "Manual" in notes else "unknown",
             "includes_database": db_backup.includes_database,
             "includes_files": db_backup.includes_files,
             "includes_config": db_backup.includes_config
         }
         all_backups.append(backup_dict)
     
-    # Sort all backups by created_at
-    all_backups.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+    return all_backups
+
+def _progress_dict(backup: BackupHistory) -> dict:
+    return {
+        "status": backup.status.value if backup.status else "unknown",
+        "stage": backup.progress_stage,
+        "bytes": backup.progress_bytes,
+        "total_bytes": backup.progress_total_bytes,
+        "eta_seconds": backup.progress_eta_seconds,
+        "updated_at": backup.progress_updated_at.isoformat() if backup.progress_updated_at else None
+    }
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+@router.get("/{backup_id}/events")
+async def stream_backup_events(
+    backup_id: str,
+    _admin_user: User = Depends(get_admin_user),  # Authentication check only
+    db: Session = Depends(get_db)
+):
+    """Server-sent progress events for one backup, ending when it completes or fails"""
+    
+    # Subscribe before reading the snapshot so no event between the two is lost
+    queue = backup_channel.subscribe(backup_id)
+    try:
+        backup = db.query(BackupHistory).filter(BackupHistory.id == backup_id).first()
+        if not backup:
+            backup_channel.unsubscribe(backup_id, queue)
+            raise HTTPException(status_code=404, detail="Backup not found")
+        snapshot = dict(_progress_dict(backup), backup_id=backup_id)
+    finally:
+        # The request session (shared with the auth check) would otherwise only be
+        # closed after the stream ends, holding a pooled connection for its whole life;
+        # from here on events come from the LISTEN channel alone
+        db.close()
+    
+    async def events():
+        try:
+            yield _sse(snapshot)
+            if snapshot["status"] in ("completed", "failed"):
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+                if event.get("status") in ("completed", "failed"):
+                    return
+        finally:
+            backup_channel.unsubscribe(backup_id, queue)
     
-    return all_backups[:limit]
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/scan")
 async def scan_backup_directory(
-    _admin_user: User = Depends(get_admin_user),  # Authentication check only
-    db: Session = Depends(get_db)
+    _admin_user: User = Depends(get_admin_user)  # Authentication check only
 ):
-    """Scan backup directory and sync with database"""
+    """Scan backup directory and sync with database now instead of waiting for the next periodic scan"""
     
     try:
-        # List all backup files in the container
-        result = subprocess.run(
-            ["docker", "compose", "exec", "-T", "backup", "find", "/backups", "-name", "*.tar.gz*", "-o", "-name", "*.sql*"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail="Failed to scan backup directory")
-        
-        files = result.stdout.strip().split('\n')
-        synced_count = 0
-        
-        for file_path in files:
-            if not file_path:
-                continue
-                
-            # Check if this backup is already in database
-            existing = db.query(BackupHistory).filter(
-                BackupHistory.file_path == file_path
-            ).first()
-            
-            if not existing:
-                # Get file stats
-                stat_result = subprocess.run(
-                    ["docker", "compose", "exec", "-T", "backup", "stat", "-c", "%s %Y", file_path],
-                    capture_output=True,
-                    text=True
-                )
-                
-                if stat_result.returncode == 0:
-                    parts = stat_result.stdout.strip().split()
-                    size_bytes = int(parts[0])
-                    mtime = int(parts[1])
-                    
-                    # Create backup record
-                    backup = BackupHistory(
-                        id=str(uuid.uuid4()),
-                        backup_type=BackupType.FULL,
-                        status=BackupStatus.COMPLETED,
-                        file_path=file_path,
-                        size_mb=round(size_bytes / (1024 * 1024), 2),
-                        created_at=datetime.fromtimestamp(mtime, tz=timezone.utc),
-                        completed_at=datetime.fromtimestamp(mtime, tz=timezone.utc),
-                        notes="Discovered during directory scan",
-                        includes_database=True,
-                        includes_files='.tar.gz' in file_path,
-                        includes_config=False
-                    )
-                    db.add(backup)
-                    synced_count += 1
-        
-        db.commit()
-        
-        return {
-            "message": f"Scan completed. Synced {synced_count} new backups.",
-            "total_files": len(files),
-            "new_records": synced_count
-        }
-        
+        counts = await run_in_executor(None, backup_catalog.refresh)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Scan failed: {str(e)}")
+    
+    return {
+        "message": f"Scan completed. Synced {counts['added']} new backups.",
+        "total_files": counts["files"],
+        "new_records": counts["added"],
+        "removed_records": counts["removed"]
+    }
 
 @router.get("/status")
 async def get_backup_status(
-    _admin_user: User = Depends(get_admin_user)  # Authentication check only
+    _admin_user: User = Depends(get_admin_user),  # Authentication check only
+    db: Session = Depends(get_db)
 ):
     """Get overall backup system status"""
     
     try:
-        # Check if backup container is running
-        container_result = subprocess.run(
-            ["docker", "compose", "ps", "backup", "--format", "json"],
-            capture_output=True,
-            text=True
-        )
-        
-        container_running = "running" in container_result.stdout.lower()
-        
-        # Check cron schedule
-        cron_result = subprocess.run(
-            ["docker", "compose", "exec", "-T", "backup", "crontab", "-l"],
-            capture_output=True,
-            text=True
-        )
-        
-        cron_schedule = None
-        if cron_result.returncode == 0:
-            lines = cron_result.stdout.strip().split('\n')
-            for line in lines:
-                if 'backup.sh' in line:
-                    cron_schedule = line.split()[0:5]
-                    cron_schedule = ' '.join(cron_schedule)
-                    break
-        
-        # Check disk space
-        space_result = subprocess.run(
-            ["docker", "compose", "exec", "-T", "backup", "df", "-h", "/backups"],
-            capture_output=True,
-            text=True
-        )
-        
-        disk_usage = {}
-        if space_result.returncode == 0:
-            lines = space_result.stdout.strip().split('\n')
-            if len(lines) > 1:
-                parts = lines[1].split()
-                if len(parts) >= 4:
-                    disk_usage = {
-                        "total": parts[1],
-                        "used": parts[2],
-                        "available": parts[3],
-                        "percent": parts[4]
-                    }
-        
+        status = await run_in_executor(None, backup_catalog.status)
+        cron_schedule = status["cron_schedule"]
+        scan = db.get(ScheduledJob, "backup_catalog_scan")
+        archives = db.query(BackupHistory).filter(
+            BackupHistory.status == BackupStatus.COMPLETED,
+            BackupHistory.file_path.startswith(backup_catalog.root)
+        ).count()
         return {
-            "container_running": container_running,
+            "container_running": status["container_running"],
             "cron_schedule": cron_schedule,
             "cron_enabled": cron_schedule is not None,
             "next_scheduled_backup": calculate_next_cron_run(cron_schedule) if cron_schedule else None,
-            "disk_usage": disk_usage,
-            "backup_directory": "/backups"
+            "disk_usage": status["disk_usage"],
+            "backup_directory": backup_catalog.root,
+            "catalog": {
+                "archives": archives,
+                "last_scan": scan.last_run_at.isoformat() if scan and scan.last_run_at else None,
+                "next_scan": scan.next_run_at.isoformat() if scan and scan.next_run_at else None
+            }
         }
         
     except Exception as e:
@@ -409,48 +377,70 @@ async def get_backup_status(
             "cron_enabled": False
         }
 
-def calculate_next_cron_run(cron_schedule: str) -> str:
-    """Calculate next cron run time (simplified)"""
-    # For "0 2 * * *" format (daily at 2 AM)
-    if cron_schedule == "0 2 * * *":
-        now = datetime.now(timezone.utc)
-        next_run = now.replace(hour=2, minute=0, second=0, microsecond=0)
-        if next_run <= now:
-            from datetime import timedelta
-            next_run += timedelta(days=1)
-        return next_run.isoformat()
-    return "Unknown"
+def calculate_next_cron_run(cron_schedule: str) -> Optional[str]:
+    """Next run of the backup container's cron schedule, which crond evaluates in UTC"""
+    try:
+        return CronSchedule(cron_schedule).next_after(datetime.now(timezone.utc)).isoformat()
+    except ValueError:
+        return None
+
+def _run_container_restore(file_path: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["docker", "compose", "exec", "-T", "backup", "/backup/restore.sh", file_path],
+        capture_output=True,
+        text=True,
+        timeout=600
+    )
 
-# Keep existing restore and download endpoints as they are
 @router.post("/restore/{backup_id}")
 async def restore_backup(
     backup_id: str,
+    user_id: Optional[str] = None,
+    include_objects: bool = True,
     _admin_user: User = Depends(get_admin_user),  # Authentication check only
     db: Session = Depends(get_db)
 ):
-    """Restore a backup"""
+    """Restore a backup, or only one user's records and files with user_id"""
     backup = db.query(BackupHistory).filter(BackupHistory.id == backup_id).first()
     
     if not backup:
-        # Check if it's an automatic backup
-        if backup_id.startswith("auto_"):
-            raise HTTPException(status_code=400, detail="Cannot restore automatic backups through this endpoint. Use backup container directly.")
         raise HTTPException(status_code=404, detail="Backup not found")
     
     if backup.status != BackupStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Cannot restore incomplete backup")
     
+    if backup.backup_type == BackupType.INCREMENTAL:
+        # Replays the manifest chain up to this backup and puts back only objects that differ
+        prefix = user_object_prefixes(user_id) if user_id else ""
+        try:
+            result = await run_in_executor(None, lambda: BackupRepository().restore(backup.id, prefix=prefix))
+        except BackupError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if result["failed"]:
+            raise HTTPException(status_code=500, detail=f"Restore failed for {result['failed']} objects")
+        return {"message": "Backup restored successfully", **result}
+    
     if not backup.file_path:
         raise HTTPException(status_code=400, detail="Backup file path not found")
     
+    if backup.file_path.endswith(ARCHIVE_SUFFIX):
+        # Verified in the same pass that extracts it, then pg_restore --jobs and parallel object uploads
+        try:
+            result = await run_in_executor(None, restore_archive, backup.file_path, user_id, include_objects)
+        except BackupError as e:
+            raise HTTPException(status_code=400, detail=f"Restore failed: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Restore failed: {str(e)}")
+        if result["objects"] and result["objects"]["failed"]:
+            raise HTTPException(status_code=500, detail=f"Restore failed for {result['objects']['failed']} objects")
+        return {"message": "Backup restored successfully", **result}
+    
+    if user_id:
+        raise HTTPException(status_code=400, detail="Single-user restore needs a pipeline backup archive")
+    
     try:
-        # Use the backup container's restore script
-        result = subprocess.run(
-            ["docker", "compose", "exec", "-T", "backup", "/backup/restore.sh", backup.file_path],
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
+        # Archives written by the backup container are restored by its own script
+        result = await run_in_executor(None, _run_container_restore, backup.file_path)
         
         if result.returncode != 0:
             raise HTTPException(
@@ -462,9 +452,30 @@ async def restore_backup(
         
     except subprocess.TimeoutExpired:
         raise HTTPException(status_code=500, detail="Restore timed out after 10 minutes")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Restore failed: {str(e)}")
 
+@router.post("/verify/{backup_id}")
+async def verify_backup(
+    backup_id: str,
+    _admin_user: User = Depends(get_admin_user),  # Authentication check only
+    db: Session = Depends(get_db)
+):
+    """Decrypt and check every file of a pipeline archive against its checksum manifest"""
+    backup = db.query(BackupHistory).filter(BackupHistory.id == backup_id).first()
+    
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    if not backup.file_path or not backup.file_path.endswith(ARCHIVE_SUFFIX):
+        raise HTTPException(status_code=400, detail="Only pipeline backup archives can be verified")
+    
+    try:
+        return await run_in_executor(None, verify_archive, backup.file_path)
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=f"Verification failed: {str(e)}")
+
 @router.delete("/{backup_id}")
 async def delete_backup(
     backup_id: str,
@@ -473,39 +484,19 @@ async def delete_backup(
 ):
     """Delete a backup"""
     
-    # Handle automatic backup deletion
-    if backup_id.startswith("auto_"):
-        # Extract timestamp and reconstruct filename
-        timestamp = backup_id.replace("auto_", "")
-        filename = f"healthstash_backup_{timestamp}.tar.gz.enc"
-        file_path = f"/backups/{filename}"
-        
-        try:
-            subprocess.run(
-                ["docker", "compose", "exec", "-T", "backup", "rm", "-f", file_path],
-                check=True
-            )
-            return {"message": "Automatic backup deleted successfully"}
-        except:
-            raise HTTPException(status_code=500, detail="Failed to delete backup file")
-    
-    # Handle database-tracked backups
     backup = db.query(BackupHistory).filter(BackupHistory.id == backup_id).first()
     
     if not backup:
         raise HTTPException(status_code=404, detail="Backup not found")
     
-    # Delete backup file if it exists
-    if backup.file_path:
+    # Delete the archive if it lives on the backup volume; repository manifests are kept
+    if backup.file_path and os.path.dirname(backup.file_path) == backup_catalog.root.rstrip("/"):
         try:
-            subprocess.run(
-                ["docker", "compose", "exec", "-T", "backup", "rm", "-f", backup.file_path],
-                check=True
-            )
-        except:
-            pass
+            backup_catalog.remove(backup.file_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not delete backup file {backup.file_path}: {e}")
     
     db.delete(backup)
     db.commit()
     
-    return {"message": "Backup deleted successfully"}
\ No newline at end of file
+    return {"message": "Backup deleted successfully"}
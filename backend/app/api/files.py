@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
@@ -10,18 +10,30 @@ from datetime import datetime, timezone
 from app.core.database import get_db
 from app.core.config import settings
 from app.core.security import (
-    encrypt_file_content, decrypt_file_content,
-    generate_secure_filename, generate_file_checksum,
-    derive_key_from_password, sanitize_filename
+    decrypt_file_content, generate_secure_filename, generate_file_checksum,
+    derive_key_from_password, get_user_file_key, sanitize_filename
 )
 from app.models.user import User
 from app.models.health_record import HealthRecord, RecordCategory
-from app.models.audit_log import AuditLog, AuditAction
+from app.models.stored_object import StoredObject
+from app.models.audit_log import AuditAction
 from app.api.auth import get_current_user
 from app.services.storage import storage_service
+from app.services.audit import audit_writer
+from app.services.dedup import find_stored_object, store_user_content
+from app.services.soft_delete import live_record_exists, storage_used_mb
+from app.services.upload_pipeline import store_uploads, StorageQuotaExceeded
+from app.services.text_extraction import extract_record_text, is_extractable
 
 router = APIRouter()
 
+def parse_record_category(category: str) -> RecordCategory:
+    """Convert string category to enum, falling back to OTHER"""
+    try:
+        return RecordCategory[category.upper()]
+    except (KeyError, AttributeError):
+        return RecordCategory.OTHER
+
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
@@ -30,69 +42,71 @@ async def upload_file(
     description: str = None,
     provider_name: str = None,
     service_date: datetime = ...,  # Made mandatory
+    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Check file size
-    file_size = 0
     contents = await file.read()
+    return await create_file_record(
+        db, current_user, file.filename, file.content_type, contents,
+        category=category, title=title, description=description,
+        provider_name=provider_name, service_date=service_date,
+        background_tasks=background_tasks
+    )
+
+async def create_file_record(
+    db: Session,
+    current_user: User,
+    file_name: str,
+    content_type: str,
+    contents: bytes,
+    category: str = "other",
+    title: str = None,
+    description: str = None,
+    provider_name: str = None,
+    service_date: datetime = None,
+    background_tasks: BackgroundTasks = None
+):
+    """Validate, encrypt and store an uploaded file as a new health record"""
+    # Check file size
     file_size = len(contents)
     
     if file_size > settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024:
         raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE_MB}MB")
     
-    # Check user quota
-    if current_user.storage_used_mb + (file_size / 1024 / 1024) > current_user.storage_quota_mb:
-        raise HTTPException(status_code=507, detail="Storage quota exceeded")
-    
     # Check file extension
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    file_ext = os.path.splitext(file_name)[1].lower()
     if file_ext not in settings.ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"File type {file_ext} not allowed")
     
-    # Generate user encryption key
-    user_key = derive_key_from_password(
-        f"{current_user.id}:{current_user.hashed_password}:{settings.ENCRYPTION_KEY}",
-        current_user.encryption_salt
-    )
+    # Calculate checksum
+    checksum = generate_file_checksum(contents)
     
-    # Encrypt file content
-    encrypted_content = encrypt_file_content(contents, user_key)
+    # Check user quota - content behind one of the user's live records is free;
+    # content only kept for soft-deleted records was uncharged and counts again
+    stored = find_stored_object(db, current_user.id, checksum)
+    already_charged = stored is not None and db.query(live_record_exists(current_user.id)).filter(
+        StoredObject.id == stored.id
+    ).scalar()
+    if not already_charged and current_user.storage_used_mb + (file_size / 1024 / 1024) > current_user.storage_quota_mb:
+        raise HTTPException(status_code=507, detail="Storage quota exceeded")
     
-    # Generate secure filename
-    secure_name = generate_secure_filename(file.filename)
+    # Generate user encryption key
+    user_key = get_user_file_key(current_user)
     
-    # Calculate checksum
-    checksum = generate_file_checksum(contents)
+    # Generate secure filename
+    secure_name = generate_secure_filename(file_name)
     
-    # Upload to MinIO
-    object_name = f"{current_user.id}/{secure_name}"
-    success = await storage_service.upload_file(encrypted_content, object_name)
+    # Encrypt and upload to MinIO, reusing an identical object if one exists
+    object_name, _ = await store_user_content(
+        db, current_user.id, contents, checksum, f"{current_user.id}/{secure_name}", user_key
+    )
     
-    if not success:
+    if not object_name:
         raise HTTPException(status_code=500, detail="Failed to upload file")
     
     # Create database record
-    # Convert string category to enum
-    try:
-        if category.upper() == "LAB_RESULTS":
-            category_enum = RecordCategory.LAB_RESULTS
-        elif category.upper() == "IMAGING":
-            category_enum = RecordCategory.IMAGING
-        elif category.upper() == "CLINICAL_NOTES":
-            category_enum = RecordCategory.CLINICAL_NOTES
-        elif category.upper() == "PRESCRIPTIONS":
-            category_enum = RecordCategory.PRESCRIPTIONS
-        elif category.upper() == "VACCINATIONS":
-            category_enum = RecordCategory.VACCINATIONS
-        elif category.upper() == "PERSONAL_NOTES":
-            category_enum = RecordCategory.PERSONAL_NOTES
-        elif category.upper() == "VITAL_SIGNS":
-            category_enum = RecordCategory.VITAL_SIGNS
-        else:
-            category_enum = RecordCategory.OTHER
-    except:
-        category_enum = RecordCategory.OTHER
+    category_enum = parse_record_category(category)
     
     # Validate service_date is provided
     if not service_date:
@@ -101,11 +115,11 @@ async def upload_file(
     record = HealthRecord(
         id=str(uuid.uuid4()),
         user_id=current_user.id,
-        title=title or sanitize_filename(file.filename),
+        title=title or sanitize_filename(file_name),
         description=description,
         category=category_enum,
-        file_name=sanitize_filename(file.filename),
-        file_type=file.content_type,
+        file_name=sanitize_filename(file_name),
+        file_type=content_type,
         file_size=file_size,
         file_checksum=checksum,
         minio_object_name=object_name,
@@ -116,7 +130,7 @@ async def upload_file(
     db.add(record)
     
     # Generate thumbnail for images
-    if file.content_type and file.content_type.startswith('image/'):
+    if content_type and content_type.startswith('image/'):
         try:
             from app.services.thumbnail import generate_image_thumbnail
             thumbnail = generate_image_thumbnail(contents, size=(200, 200))
@@ -126,24 +140,125 @@ async def upload_file(
         except:
             pass
     
-    # Update user storage
-    current_user.storage_used_mb += file_size / 1024 / 1024
+    # Recount usage from live records - unique bytes only, and content revived
+    # from a soft-deleted record is charged again
+    db.flush()
+    current_user.storage_used_mb = storage_used_mb(db, [current_user.id])[current_user.id]
     
-    # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    db.commit()
+    
+    audit_writer.record(
+        AuditAction.FILE_UPLOAD,
         user_id=current_user.id,
-        action=AuditAction.FILE_UPLOAD,
         resource_type="file",
         resource_id=record.id,
-        details=f"Uploaded {file.filename}"
+        details=f"Uploaded {file_name}"
     )
-    db.add(audit)
     
-    db.commit()
+    # Make document contents searchable without holding up the upload response
+    if background_tasks is not None and is_extractable(record.file_type, record.file_name):
+        background_tasks.add_task(extract_record_text, record.id)
     
     return {"message": "File uploaded successfully", "record_id": record.id}
 
+@router.post("/upload-multiple")
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    category: str = "other",
+    provider_name: str = None,
+    service_date: datetime = ...,  # Made mandatory
+    title_prefix: str = None,
+    background_tasks: BackgroundTasks = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload many files at once, one health record per file, in a single transaction"""
+    files = [file for file in files if file.filename]
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    if len(files) > settings.MAX_FILES_PER_UPLOAD:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {settings.MAX_FILES_PER_UPLOAD})")
+    if not service_date:
+        raise HTTPException(status_code=400, detail="Service date is required")
+    
+    uploads = []
+    for file in files:
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in settings.ALLOWED_EXTENSIONS:
+            raise HTTPException(status_code=400, detail=f"File type {file_ext} not allowed")
+        
+        contents = await file.read()
+        if len(contents) > settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+            raise HTTPException(status_code=413, detail=f"File {file.filename} too large. Maximum size is {settings.MAX_UPLOAD_SIZE_MB}MB")
+        
+        uploads.append({"filename": file.filename, "content_type": file.content_type, "content": contents})
+    
+    # Hash, thumbnail, encrypt and store all files concurrently; the quota is
+    # checked against the batch's new unique content before anything is uploaded
+    remaining_bytes = (current_user.storage_quota_mb - current_user.storage_used_mb) * 1024 * 1024
+    try:
+        stored_files = await store_uploads(
+            db, current_user.id, get_user_file_key(current_user), uploads,
+            lambda filename: f"{current_user.id}/{generate_secure_filename(filename)}",
+            quota_remaining_bytes=max(0, remaining_bytes)
+        )
+    except StorageQuotaExceeded:
+        raise HTTPException(status_code=507, detail="Storage quota exceeded")
+    
+    category_enum = parse_record_category(category)
+    record_ids = []
+    uploaded_names = []
+    failed = []
+    
+    for stored in stored_files:
+        if not stored["object_name"]:
+            failed.append(stored["filename"])
+            continue
+        
+        file_name = sanitize_filename(stored["filename"])
+        record = HealthRecord(
+            id=str(uuid.uuid4()),
+            user_id=current_user.id,
+            title=f"{title_prefix} - {file_name}" if title_prefix else file_name,
+            category=category_enum,
+            file_name=file_name,
+            file_type=stored["content_type"],
+            file_size=stored["size"],
+            file_checksum=stored["checksum"],
+            minio_object_name=stored["object_name"],
+            thumbnail_data=stored["thumbnail_data"],
+            has_thumbnail=stored["thumbnail_data"] is not None,
+            provider_name=provider_name,
+            service_date=service_date
+        )
+        db.add(record)
+        record_ids.append(record.id)
+        uploaded_names.append(stored["filename"])
+        
+        if background_tasks is not None and is_extractable(record.file_type, record.file_name):
+            background_tasks.add_task(extract_record_text, record.id)
+    
+    # Recount usage from live records, as for single uploads
+    db.flush()
+    current_user.storage_used_mb = storage_used_mb(db, [current_user.id])[current_user.id]
+    
+    db.commit()
+    
+    for record_id, file_name in zip(record_ids, uploaded_names):
+        audit_writer.record(
+            AuditAction.FILE_UPLOAD,
+            user_id=current_user.id,
+            resource_type="file",
+            resource_id=record_id,
+            details=f"Uploaded {file_name}"
+        )
+    
+    return {
+        "message": f"Uploaded {len(record_ids)} of {len(stored_files)} files",
+        "record_ids": record_ids,
+        "failed": failed
+    }
+
 @router.get("/download/{record_id}")
 async def download_file(
     record_id: str,
@@ -191,15 +306,12 @@ async def download_file(
     decrypted_content = decrypt_file_content(encrypted_content, user_key)
     
     # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.FILE_DOWNLOAD,
         user_id=current_user.id,
-        action=AuditAction.FILE_DOWNLOAD,
         resource_type="file",
         resource_id=record.id
     )
-    db.add(audit)
-    db.commit()
     
     # Return file as streaming response
     return StreamingResponse(
@@ -224,25 +336,22 @@ async def delete_file(
     if not record:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete from MinIO
-    await storage_service.delete_file(record.minio_object_name)
-    
-    # Update user storage
-    current_user.storage_used_mb -= record.file_size / 1024 / 1024
-    
-    # Soft delete record
+    # Soft delete record; the soft-delete GC removes the row and its object later
     record.is_deleted = True
     record.deleted_at = datetime.now(timezone.utc)
+    db.flush()
+    
+    # Quota is freed now unless another live record shares the object
+    current_user.storage_used_mb = storage_used_mb(db, [current_user.id])[current_user.id]
+    
+    db.commit()
     
     # Add audit log
-    audit = AuditLog(
-        id=str(uuid.uuid4()),
+    audit_writer.record(
+        AuditAction.FILE_DELETE,
         user_id=current_user.id,
-        action=AuditAction.FILE_DELETE,
         resource_type="file",
         resource_id=record.id
     )
-    db.add(audit)
-    db.commit()
     
     return {"message": "File deleted successfully"}
\ No newline at end of file
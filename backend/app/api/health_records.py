@@ -1,16 +1,24 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 import json
 import logging
+import asyncio
 
 from app.core.database import get_db
+from app.core.config import settings
+from app.core.security import get_user_file_key
+from app.core.executors import thumbnail_executor, run_in_executor
 from app.models.user import User
 from app.models.health_record import HealthRecord, RecordCategory
 from app.models.payment_record import PaymentRecord
-from app.api.auth import get_current_user
+from app.api.auth import get_current_user, get_current_principal
+from app.services.principal_cache import Principal
+from app.services.thumbnail import build_stored_thumbnail
+from app.services.text_extraction import search_vector
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +36,9 @@ class UpdateLocationRequest(BaseModel):
 class UpdateBodyPartsRequest(BaseModel):
     body_parts: List[str]
 
+class BatchThumbnailRequest(BaseModel):
+    record_ids: List[str]
+
 class CreateRecordRequest(BaseModel):
     title: str
     category: str  # Changed to str to accept string values
@@ -66,6 +77,7 @@ async def create_record(
         location=record_data.location or "",
         service_date=record_data.service_date,
         content_text=record_data.content_text or "",
+        search_vector=search_vector(record_data.title, record_data.description, record_data.content_text),
         is_deleted=False
     )
     
@@ -93,7 +105,7 @@ async def list_records(
     search: Optional[str] = None,
     limit: int = Query(default=50, le=1000),
     offset: int = 0,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     query = db.query(HealthRecord).filter(
@@ -116,6 +128,7 @@ async def list_records(
             (HealthRecord.title.ilike(search_term)) |
             (HealthRecord.description.ilike(search_term)) |
             (HealthRecord.provider_name.ilike(search_term)) |
+            (HealthRecord.search_vector.op('@@')(func.plainto_tsquery('simple', search))) |
             (HealthRecord.content_text.ilike(search_term))
         )
     
@@ -161,7 +174,7 @@ async def list_records(
 @router.get("/timeline")
 async def get_timeline(
     months: int = 12,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     start_date = datetime.now(timezone.utc) - timedelta(days=months * 30)
@@ -227,7 +240,7 @@ async def get_stats(
 async def update_record_title(
     record_id: str,
     request: UpdateTitleRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     record = db.query(HealthRecord).filter(
@@ -246,8 +259,9 @@ async def update_record_title(
     if len(request.title) > 255:
         raise HTTPException(status_code=400, detail="Title too long (max 255 characters)")
     
-    # Update title
+    # Update title, keeping full-text search in step with it
     record.title = request.title.strip()
+    record.search_vector = search_vector(record.title, record.description, record.content_text)
     record.updated_at = datetime.now(timezone.utc)
     db.commit()
     
@@ -257,7 +271,7 @@ async def update_record_title(
 async def update_record_location(
     record_id: str,
     request: UpdateLocationRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     record = db.query(HealthRecord).filter(
@@ -280,7 +294,7 @@ async def update_record_location(
 async def update_record_body_parts(
     record_id: str,
     request: UpdateBodyPartsRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     record = db.query(HealthRecord).filter(
@@ -303,7 +317,7 @@ async def update_record_body_parts(
 async def update_record_categories(
     record_id: str,
     request: UpdateCategoriesRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     record = db.query(HealthRecord).filter(
@@ -334,10 +348,69 @@ async def update_record_categories(
     
     return {"message": "Categories updated successfully"}
 
+@router.post("/thumbnails")
+async def get_record_thumbnails(
+    request: BatchThumbnailRequest,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Return thumbnails for a page of records in a single round-trip"""
+    record_ids = list(dict.fromkeys(request.record_ids))
+    if len(record_ids) > settings.THUMBNAIL_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many records requested (max {settings.THUMBNAIL_BATCH_MAX})"
+        )
+    
+    thumbnails = {}
+    if record_ids:
+        records = db.query(HealthRecord).filter(
+            HealthRecord.id.in_(record_ids),
+            HealthRecord.user_id == current_user.id,
+            HealthRecord.is_deleted == False
+        ).all()
+        
+        pending = []
+        for record in records:
+            if record.has_thumbnail and record.thumbnail_data:
+                thumbnails[record.id] = record.thumbnail_data
+            elif record.minio_object_name and record.file_type and record.file_type.startswith('image/'):
+                pending.append(record)
+        
+        # Generate missing image thumbnails concurrently on the bounded thumbnail pool
+        if pending:
+            user_key = get_user_file_key(db.get(User, current_user.id))
+            results = await asyncio.gather(*[
+                run_in_executor(
+                    thumbnail_executor, build_stored_thumbnail,
+                    record.minio_object_name, user_key, record.file_type
+                )
+                for record in pending
+            ], return_exceptions=True)
+            
+            generated = False
+            for record, thumbnail in zip(pending, results):
+                if isinstance(thumbnail, Exception):
+                    logger.error(f"Failed to generate thumbnail for record {record.id}: {thumbnail}")
+                    continue
+                if thumbnail:
+                    record.thumbnail_data = thumbnail
+                    record.has_thumbnail = True
+                    thumbnails[record.id] = thumbnail
+                    generated = True
+            
+            if generated:
+                db.commit()
+    
+    return {
+        "thumbnails": thumbnails,
+        "missing": [record_id for record_id in record_ids if record_id not in thumbnails]
+    }
+
 @router.get("/{record_id}/thumbnail")
 async def get_record_thumbnail(
     record_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Getting thumbnail for record {record_id} for user {current_user.id}")
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 import uuid
 import secrets
@@ -8,15 +9,17 @@ import socket
 from datetime import datetime, timedelta, timezone
 
 from app.core.database import get_db
+from app.core.security import get_user_file_key
 from app.models.user import User
-from app.api.auth import get_current_user
+from app.models.upload_session import UploadSession, UploadSessionStatus
+from app.api.auth import get_current_user, get_current_principal
+from app.services.principal_cache import Principal
 from app.core.config import settings
+from app.services import upload_sessions
+from app.services.token_store import token_store
 
 router = APIRouter()
 
-# Store active upload tokens (in production, use Redis)
-upload_tokens = {}
-
 @router.post("/generate-token")
 async def generate_upload_token(
     request: Request,
@@ -25,20 +28,10 @@ async def generate_upload_token(
 ):
     """Generate a temporary token for mobile upload"""
     token = secrets.token_urlsafe(8)[:8].upper()  # 8 character token
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=15)
-    
-    # Store token with user ID and expiry
-    upload_tokens[token] = {
-        "user_id": current_user.id,
-        "expires_at": expires_at,
-        "created_at": datetime.now(timezone.utc)
-    }
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=settings.MOBILE_TOKEN_TTL_MINUTES)
     
-    # Clean up expired tokens
-    now = datetime.now(timezone.utc)
-    expired = [k for k, v in upload_tokens.items() if v["expires_at"] < now]
-    for k in expired:
-        del upload_tokens[k]
+    # Store token with user ID and expiry (shared by all workers; expired tokens are purged in the background)
+    await run_in_threadpool(token_store.set_token, token, current_user.id, expires_at)
     
     # Get the server's actual accessible URL for mobile access
     import os
@@ -91,7 +84,7 @@ async def generate_upload_token(
     
     return {
         "token": token,
-        "expires_in": 900,  # 15 minutes in seconds
+        "expires_in": settings.MOBILE_TOKEN_TTL_MINUTES * 60,
         "upload_url": upload_url
     }
 
@@ -101,40 +94,57 @@ class VerifyTokenRequest(BaseModel):
 @router.post("/verify-token")
 async def verify_upload_token(request: VerifyTokenRequest):
     """Verify if a mobile upload token is valid"""
-    token = request.token
-    if token not in upload_tokens:
+    token_data = await run_in_threadpool(token_store.get_token, request.token)
+    if token_data is None:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
-    token_data = upload_tokens[token]
-    if datetime.now(timezone.utc) > token_data["expires_at"]:
-        del upload_tokens[token]
-        raise HTTPException(status_code=401, detail="Token expired")
-    
     return {"valid": True, "user_id": token_data["user_id"]}
 
+async def track_mobile_upload(user_id: str, file_name: str, record_id: str, request: Request = None):
+    """Record a mobile upload in the user's bounded recent-uploads list"""
+    # Get device info from user agent if available
+    user_agent = request.headers.get("user-agent", "Unknown Device") if request else "Unknown Device"
+    device = "Mobile Device"
+    if "iPhone" in user_agent:
+        device = "iPhone"
+    elif "Android" in user_agent:
+        device = "Android"
+    elif "iPad" in user_agent:
+        device = "iPad"
+    
+    await run_in_threadpool(token_store.add_recent_upload, user_id, {
+        "id": record_id,
+        "name": file_name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "device": device,
+        "user_id": user_id
+    })
+
+async def get_token_user(token: str, db: Session) -> User:
+    """Resolve a mobile upload token to its user"""
+    # Token stores may block on the database or Redis; keep them off the event loop
+    token_data = await run_in_threadpool(token_store.get_token, token)
+    if token_data is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    user = db.query(User).filter(User.id == token_data["user_id"]).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
 @router.post("/upload/{token}")
 async def mobile_upload_file(
     token: str,
     file: UploadFile = File(...),
     category: str = "other",
     service_date: datetime = ...,  # Made mandatory
+    background_tasks: BackgroundTasks = None,
     db: Session = Depends(get_db),
     request: Request = None
 ):
     """Upload file using mobile token"""
-    # Verify token
-    if token not in upload_tokens:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    token_data = upload_tokens[token]
-    if datetime.now(timezone.utc) > token_data["expires_at"]:
-        del upload_tokens[token]
-        raise HTTPException(status_code=401, detail="Token expired")
-    
-    # Get user
-    user = db.query(User).filter(User.id == token_data["user_id"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Verify token and get user
+    user = await get_token_user(token, db)
     
     # Process upload (delegate to files API)
     from app.api.files import upload_file as process_upload
@@ -143,54 +153,242 @@ async def mobile_upload_file(
         category=category,
         title=f"Mobile Upload - {file.filename}",
         service_date=service_date,
+        background_tasks=background_tasks,
         current_user=user,
         db=db
     )
     
-    # Track mobile upload (store in memory for now, in production use Redis/DB)
-    if "mobile_uploads" not in globals():
-        global mobile_uploads
-        mobile_uploads = []
+    await track_mobile_upload(user.id, file.filename, result.get("record_id"), request)
     
-    # Get device info from user agent if available
-    user_agent = request.headers.get("user-agent", "Unknown Device") if request else "Unknown Device"
-    device = "Mobile Device"
-    if "iPhone" in user_agent:
-        device = "iPhone"
-    elif "Android" in user_agent:
-        device = "Android"
-    elif "iPad" in user_agent:
-        device = "iPad"
+    return result
+
+@router.post("/upload/{token}/multiple")
+async def mobile_upload_files(
+    token: str,
+    files: List[UploadFile] = File(...),
+    category: str = "other",
+    service_date: datetime = ...,  # Made mandatory
+    background_tasks: BackgroundTasks = None,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Upload several files in one request using a mobile token"""
+    user = await get_token_user(token, db)
     
-    mobile_uploads.insert(0, {
-        "id": result.get("id"),
-        "name": file.filename,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "device": device,
-        "user_id": user.id
-    })
+    # Process uploads concurrently (delegate to files API)
+    from app.api.files import upload_files as process_uploads
+    result = await process_uploads(
+        files=files,
+        category=category,
+        service_date=service_date,
+        title_prefix="Mobile Upload",
+        background_tasks=background_tasks,
+        current_user=user,
+        db=db
+    )
     
-    # Keep only last 50 uploads per user
-    user_uploads = [u for u in mobile_uploads if u["user_id"] == user.id]
-    if len(user_uploads) > 50:
-        mobile_uploads = [u for u in mobile_uploads if u["user_id"] != user.id or u in user_uploads[:50]]
+    failed = set(result["failed"])
+    uploaded_names = [file.filename for file in files if file.filename and file.filename not in failed]
+    for file_name, record_id in zip(uploaded_names, result["record_ids"]):
+        await track_mobile_upload(user.id, file_name, record_id, request)
     
     return result
 
+class UploadSessionCreate(BaseModel):
+    file_name: str
+    file_type: Optional[str] = None
+    total_size: int
+    chunk_size: Optional[int] = None
+    checksum: Optional[str] = None
+    category: str = "other"
+    service_date: datetime
+
+def get_upload_session(token: str, session_id: str, user: User, db: Session) -> UploadSession:
+    session = db.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.user_id == user.id,
+        UploadSession.upload_token == token
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def require_active_session(session: UploadSession):
+    if session.status != UploadSessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail=f"Upload session is {session.status.value}")
+    expires_at = session.expires_at
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) > expires_at:
+        raise HTTPException(status_code=410, detail="Upload session expired")
+
+@router.post("/upload/{token}/sessions")
+async def create_upload_session(
+    token: str,
+    session_data: UploadSessionCreate,
+    db: Session = Depends(get_db)
+):
+    """Start a resumable upload; parts are then PUT individually and completed at the end"""
+    user = await get_token_user(token, db)
+    
+    if session_data.total_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size must be positive")
+    if session_data.total_size > settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE_MB}MB")
+    
+    chunk_size = session_data.chunk_size or settings.UPLOAD_CHUNK_SIZE_MB * 1024 * 1024
+    if chunk_size <= 0 or chunk_size > settings.UPLOAD_MAX_CHUNK_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between 1 byte and {settings.UPLOAD_MAX_CHUNK_SIZE_MB}MB")
+    
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    session = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        upload_token=token,
+        file_name=session_data.file_name,
+        file_type=session_data.file_type,
+        total_size=session_data.total_size,
+        chunk_size=chunk_size,
+        checksum=session_data.checksum.lower() if session_data.checksum else None,
+        parts_json="{}",
+        category=session_data.category,
+        service_date=session_data.service_date,
+        expires_at=expires_at
+    )
+    db.add(session)
+    db.commit()
+    
+    # Keep the upload token alive for as long as the session can be resumed
+    await run_in_threadpool(token_store.extend_token, token, expires_at)
+    
+    return upload_sessions.session_status(session)
+
+@router.get("/upload/{token}/sessions/{session_id}")
+async def get_upload_session_status(
+    token: str,
+    session_id: str,
+    db: Session = Depends(get_db)
+):
+    """Query received parts and the resumable offset"""
+    user = await get_token_user(token, db)
+    return upload_sessions.session_status(get_upload_session(token, session_id, user, db))
+
+@router.put("/upload/{token}/sessions/{session_id}/parts/{part_number}")
+async def upload_session_part(
+    token: str,
+    session_id: str,
+    part_number: int,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Upload one numbered chunk as the raw request body"""
+    user = await get_token_user(token, db)
+    session = get_upload_session(token, session_id, user, db)
+    require_active_session(session)
+    
+    if part_number < 1 or part_number > upload_sessions.total_parts(session):
+        raise HTTPException(status_code=400, detail="Invalid part number")
+    
+    data = await request.body()
+    expected = upload_sessions.expected_part_size(session, part_number)
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"Part {part_number} must be exactly {expected} bytes")
+    
+    if not await upload_sessions.store_part(db, session, part_number, data, get_user_file_key(user)):
+        raise HTTPException(status_code=500, detail="Failed to store part")
+    
+    db.refresh(session)
+    return {
+        "part_number": part_number,
+        "offset": upload_sessions.contiguous_offset(session)
+    }
+
+async def assemble_and_store(db: Session, user: User, session: UploadSession, background_tasks: BackgroundTasks):
+    """Join the parts of a claimed session, verify them and store the health record"""
+    user_key = get_user_file_key(user)
+    try:
+        contents = await upload_sessions.assemble_parts(session, user_key)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if len(contents) != session.total_size:
+        raise HTTPException(status_code=409, detail="Assembled size does not match total_size")
+    if session.checksum:
+        from app.core.security import generate_file_checksum
+        if generate_file_checksum(contents) != session.checksum:
+            raise HTTPException(status_code=422, detail="Checksum mismatch")
+    
+    # Process upload (delegate to files API)
+    from app.api.files import create_file_record
+    return await create_file_record(
+        db, user, session.file_name, session.file_type, contents,
+        category=session.category or "other",
+        title=f"Mobile Upload - {session.file_name}",
+        service_date=session.service_date,
+        background_tasks=background_tasks
+    )
+
+@router.post("/upload/{token}/sessions/{session_id}/complete")
+async def complete_upload_session(
+    token: str,
+    session_id: str,
+    background_tasks: BackgroundTasks = None,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Assemble all parts and create the health record"""
+    user = await get_token_user(token, db)
+    session = get_upload_session(token, session_id, user, db)
+    require_active_session(session)
+    
+    missing = [n for n in range(1, upload_sessions.total_parts(session) + 1) if n not in upload_sessions.get_parts(session)]
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "missing_parts": missing})
+    
+    # Claim the session so a concurrent complete cannot create a second record
+    if not upload_sessions.transition_session(db, session, UploadSessionStatus.ACTIVE, UploadSessionStatus.COMPLETING):
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+    
+    try:
+        result = await assemble_and_store(db, user, session, background_tasks)
+    except Exception:
+        # Hand the session back so the client can fix the problem and retry
+        db.rollback()
+        upload_sessions.transition_session(db, session, UploadSessionStatus.COMPLETING, UploadSessionStatus.ACTIVE)
+        raise
+    
+    await upload_sessions.discard_parts(session)
+    session.status = UploadSessionStatus.COMPLETED
+    session.record_id = result.get("record_id")
+    db.commit()
+    
+    await track_mobile_upload(user.id, session.file_name, session.record_id, request)
+    
+    return result
+
+@router.delete("/upload/{token}/sessions/{session_id}")
+async def abort_upload_session(
+    token: str,
+    session_id: str,
+    db: Session = Depends(get_db)
+):
+    """Abort a resumable upload and discard stored parts"""
+    user = await get_token_user(token, db)
+    session = get_upload_session(token, session_id, user, db)
+    require_active_session(session)
+    
+    if not upload_sessions.transition_session(db, session, UploadSessionStatus.ACTIVE, UploadSessionStatus.ABORTED):
+        raise HTTPException(status_code=409, detail="Upload session is no longer active")
+    await upload_sessions.discard_parts(session)
+    
+    return {"message": "Upload session aborted"}
+
 @router.get("/recent-uploads")
 async def get_recent_mobile_uploads(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get recent mobile uploads for the current user"""
-    # Initialize mobile_uploads if it doesn't exist
-    if "mobile_uploads" not in globals():
-        global mobile_uploads
-        mobile_uploads = []
-    
-    # Filter uploads for current user (last 10)
-    user_uploads = [u for u in mobile_uploads if u["user_id"] == current_user.id][:10]
-    
     return {
-        "uploads": user_uploads
+        "uploads": await run_in_threadpool(token_store.get_recent_uploads, current_user.id, limit=10)
     }
\ No newline at end of file
@@ -5,28 +5,69 @@ Licensed under the MIT License
 """
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload, defer, aliased
+from sqlalchemy import func, tuple_, literal_column, case
 from typing import List, Optional, Union
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import uuid
 import json
 import hashlib
 from decimal import Decimal
 
 from app.core.database import get_db
-from app.core.security import (
-    encrypt_file_content, decrypt_file_content,
-    generate_file_checksum, derive_key_from_password
-)
+from app.core.security import decrypt_file_content, derive_key_from_password, get_user_file_key
 from app.core.config import settings
-from app.api.auth import get_current_user
-from app.models import User, PaymentRecord, PaymentFile, PaymentStatus, PaymentMethod, HealthRecord
+from app.api.auth import get_current_user, get_current_principal
+from app.services.principal_cache import Principal
+from app.models import User, PaymentRecord, PaymentFile, PaymentStatus, PaymentMethod, HealthRecord, ExchangeRate
 from app.services.storage import StorageService
-from app.services.thumbnail import generate_image_thumbnail, generate_pdf_thumbnail
+from app.services.upload_pipeline import store_uploads
+from app.services.fx_rates import fx_index, rate_in_effect
 
 router = APIRouter()
 storage_service = StorageService()
 
+async def store_payment_files(db: Session, current_user: User, payment_id: str, files: List[UploadFile]) -> List[str]:
+    """Encrypt and upload payment attachments in parallel, adding PaymentFile rows to the session"""
+    uploads = []
+    for file in files:
+        if file.filename:
+            uploads.append({
+                "filename": file.filename,
+                "content_type": file.content_type,
+                "content": await file.read()
+            })
+    
+    if len(uploads) > settings.MAX_FILES_PER_UPLOAD:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {settings.MAX_FILES_PER_UPLOAD})")
+    
+    stored_files = await store_uploads(
+        db, current_user.id, get_user_file_key(current_user), uploads,
+        lambda filename: f"payments/{current_user.id}/{payment_id}/{uuid.uuid4()}_{filename}"
+    )
+    
+    uploaded_files = []
+    for stored in stored_files:
+        if not stored["object_name"]:
+            continue
+        
+        db.add(PaymentFile(
+            id=str(uuid.uuid4()),
+            payment_record_id=payment_id,
+            file_name=stored["filename"],
+            file_type=stored["content_type"],
+            file_size=stored["size"],
+            file_checksum=stored["checksum"],
+            encrypted_file_key="",  # Key is derived from user password
+            minio_object_name=stored["object_name"],
+            thumbnail_data=stored["thumbnail_data"],
+            is_invoice=True,  # Default to invoice, can be updated later
+            is_receipt=False
+        ))
+        uploaded_files.append(stored["filename"])
+    
+    return uploaded_files
+
 @router.get("/")
 async def get_payments(
     skip: int = 0,
@@ -38,10 +79,15 @@ async def get_payments(
     date_from: Optional[Union[date, datetime]] = None,
     date_to: Optional[Union[date, datetime]] = None,
     sort_by: str = Query("expense_date_desc", regex="^(expense_date|invoice_date|amount|created_at)_(asc|desc)$"),
-    current_user: User = Depends(get_current_user),
+    view: str = Query("full", regex="^(full|summary)$"),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    """Get all payment records for the current user with filtering and sorting"""
+    """Get all payment records for the current user with filtering and sorting.
+    
+    Files are returned as metadata only; the summary view also omits addresses,
+    claim numbers and notes for list screens.
+    """
     query = db.query(PaymentRecord).filter(
         PaymentRecord.user_id == current_user.id,
         PaymentRecord.is_deleted == False
@@ -93,9 +139,24 @@ async def get_payments(
     query = query.order_by(order_by)
     
     total = query.count()
+    
+    # Files and linked records come in two IN queries for the whole page, never per row
+    summary_view = view == "summary"
+    deferred = [PaymentRecord.encrypted_files_json, PaymentRecord.metadata_json]
+    if summary_view:
+        deferred += [PaymentRecord.provider_address, PaymentRecord.insurance_claim_number, PaymentRecord.notes]
+    query = query.options(
+        defer(*deferred),
+        selectinload(PaymentRecord.files).load_only(
+            PaymentFile.id, PaymentFile.payment_record_id, PaymentFile.file_name, PaymentFile.file_type,
+            PaymentFile.file_size, PaymentFile.is_invoice, PaymentFile.is_receipt, PaymentFile.uploaded_at
+        ),
+        selectinload(PaymentRecord.health_record).load_only(
+            HealthRecord.id, HealthRecord.title, HealthRecord.service_date
+        )
+    )
     payments = query.offset(skip).limit(limit).all()
     
-    # Decrypt file information for each payment
     result = []
     for payment in payments:
         payment_dict = {
@@ -110,17 +171,19 @@ async def get_payments(
             "payment_method": payment.payment_method.value if payment.payment_method else None,
             "payment_date": payment.payment_date.isoformat() if payment.payment_date else None,
             "provider_name": payment.provider_name,
-            "provider_address": payment.provider_address,
             "service_description": payment.service_description,
-            "insurance_claim_number": payment.insurance_claim_number,
             "insurance_paid_amount": float(payment.insurance_paid_amount) if payment.insurance_paid_amount else None,
             "patient_responsibility": float(payment.patient_responsibility) if payment.patient_responsibility else None,
-            "notes": payment.notes,
             "created_at": payment.created_at.isoformat(),
             "updated_at": payment.updated_at.isoformat(),
             "files": []
         }
         
+        if not summary_view:
+            payment_dict["provider_address"] = payment.provider_address
+            payment_dict["insurance_claim_number"] = payment.insurance_claim_number
+            payment_dict["notes"] = payment.notes
+        
         # Add linked health record info if exists
         if payment.health_record:
             payment_dict["health_record"] = {
@@ -129,7 +192,7 @@ async def get_payments(
                 "service_date": payment.health_record.service_date.isoformat() if payment.health_record.service_date else None
             }
         
-        # Add file information
+        # Add file metadata; thumbnails are served by the detail endpoint
         for file in payment.files:
             payment_dict["files"].append({
                 "id": file.id,
@@ -138,7 +201,6 @@ async def get_payments(
                 "file_size": file.file_size,
                 "is_invoice": file.is_invoice,
                 "is_receipt": file.is_receipt,
-                "thumbnail_data": file.thumbnail_data,
                 "uploaded_at": file.uploaded_at.isoformat()
             })
         
@@ -154,7 +216,8 @@ async def get_payments(
 @router.get("/{payment_id}")
 async def get_payment(
     payment_id: str,
-    current_user: User = Depends(get_current_user),
+    reporting_currency: Optional[str] = Query(None, regex="^[A-Za-z]{3}$"),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get a specific payment record"""
@@ -191,6 +254,14 @@ async def get_payment(
         "files": []
     }
     
+    if reporting_currency:
+        reporting_currency = reporting_currency.upper()
+        converted = fx_index.convert(
+            payment.amount, payment.currency, reporting_currency, payment.expense_date or payment.created_at
+        )
+        payment_dict["reporting_currency"] = reporting_currency
+        payment_dict["reporting_amount"] = float(converted) if converted is not None else None
+    
     # Add linked health record info if exists
     if payment.health_record:
         payment_dict["health_record"] = {
@@ -282,55 +353,9 @@ async def create_payment(
     
     db.add(payment)
     
-    # Process uploaded files
+    # Process uploaded files concurrently
     if files:
-        for file in files:
-            if file.filename:
-                # Read file content
-                content = await file.read()
-                
-                # Generate checksum
-                file_checksum = generate_file_checksum(content)
-                
-                # Generate user encryption key
-                user_key = derive_key_from_password(
-                    f"{current_user.id}:{current_user.hashed_password}:{settings.ENCRYPTION_KEY}",
-                    current_user.encryption_salt
-                )
-                
-                # Encrypt file content
-                encrypted_content = encrypt_file_content(content, user_key)
-                
-                # Generate unique object name for MinIO
-                object_name = f"payments/{current_user.id}/{payment_id}/{uuid.uuid4()}_{file.filename}"
-                
-                # Upload to MinIO
-                success = await storage_service.upload_file(encrypted_content, object_name)
-                
-                if success:
-                    # Generate thumbnail if applicable
-                    thumbnail_data = None
-                    if file.content_type and file.content_type.startswith('image/'):
-                        thumbnail_data = generate_image_thumbnail(content)
-                    elif file.content_type == 'application/pdf':
-                        thumbnail_data = generate_pdf_thumbnail(content)
-                    
-                    # Create payment file record
-                    payment_file = PaymentFile(
-                        id=str(uuid.uuid4()),
-                        payment_record_id=payment_id,
-                        file_name=file.filename,
-                        file_type=file.content_type,
-                        file_size=len(content),
-                        file_checksum=file_checksum,
-                        encrypted_file_key="",  # Key is derived from user password
-                        minio_object_name=object_name,
-                        thumbnail_data=thumbnail_data,
-                        is_invoice=True,  # Default to invoice, can be updated later
-                        is_receipt=False
-                    )
-                    
-                    db.add(payment_file)
+        await store_payment_files(db, current_user, payment_id, files)
     
     db.commit()
     db.refresh(payment)
@@ -356,7 +381,7 @@ async def update_payment(
     insurance_paid_amount: Optional[float] = Form(None),
     patient_responsibility: Optional[float] = Form(None),
     notes: Optional[str] = Form(None),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Update an existing payment record"""
@@ -443,56 +468,7 @@ async def add_payment_files(
     if not payment:
         raise HTTPException(status_code=404, detail="Payment record not found")
     
-    uploaded_files = []
-    
-    for file in files:
-        if file.filename:
-            # Read file content
-            content = await file.read()
-            
-            # Generate checksum
-            file_checksum = generate_file_checksum(content)
-            
-            # Generate user encryption key
-            user_key = derive_key_from_password(
-                f"{current_user.id}:{current_user.hashed_password}:{settings.ENCRYPTION_KEY}",
-                current_user.encryption_salt
-            )
-            
-            # Encrypt file content
-            encrypted_content = encrypt_file_content(content, user_key)
-            
-            # Generate unique object name for MinIO
-            object_name = f"payments/{current_user.id}/{payment_id}/{uuid.uuid4()}_{file.filename}"
-            
-            # Upload to MinIO
-            success = await storage_service.upload_file(encrypted_content, object_name)
-            
-            if success:
-                # Generate thumbnail if applicable
-                thumbnail_data = None
-                if file.content_type and file.content_type.startswith('image/'):
-                    thumbnail_data = thumbnail_service.generate_thumbnail(content, file.content_type)
-                elif file.content_type == 'application/pdf':
-                    thumbnail_data = thumbnail_service.generate_pdf_thumbnail(content)
-                
-                # Create payment file record
-                payment_file = PaymentFile(
-                    id=str(uuid.uuid4()),
-                    payment_record_id=payment_id,
-                    file_name=file.filename,
-                    file_type=file.content_type,
-                    file_size=len(content),
-                    file_checksum=file_checksum,
-                    encrypted_file_key="",  # Key is derived from user password
-                    minio_object_name=object_name,
-                    thumbnail_data=thumbnail_data,
-                    is_invoice=True,
-                    is_receipt=False
-                )
-                
-                db.add(payment_file)
-                uploaded_files.append(file.filename)
+    uploaded_files = await store_payment_files(db, current_user, payment_id, files)
     
     db.commit()
     
@@ -501,10 +477,14 @@ async def add_payment_files(
 @router.delete("/{payment_id}")
 async def delete_payment(
     payment_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    """Soft delete a payment record"""
+    """Soft delete a payment record.
+
+    Its files keep their deduplicated objects until the soft-delete GC purges
+    the record, which drops the file rows and releases each object reference.
+    """
     payment = db.query(PaymentRecord).filter(
         PaymentRecord.id == payment_id,
         PaymentRecord.user_id == current_user.id,
@@ -515,7 +495,8 @@ async def delete_payment(
         raise HTTPException(status_code=404, detail="Payment record not found")
     
     payment.is_deleted = True
-    payment.deleted_at = datetime.now()
+    # UTC, like the GC's retention cutoff
+    payment.deleted_at = datetime.now(timezone.utc)
     
     db.commit()
     
@@ -575,15 +556,87 @@ async def download_payment_file(
 async def get_payment_summary(
     date_from: Optional[Union[date, datetime]] = None,
     date_to: Optional[Union[date, datetime]] = None,
-    current_user: User = Depends(get_current_user),
+    include_monthly: bool = False,
+    include_currencies: bool = False,
+    reporting_currency: Optional[str] = Query(None, regex="^[A-Za-z]{3}$"),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    """Get payment summary statistics for the current user"""
-    query = db.query(PaymentRecord).filter(
+    """Get payment summary statistics for the current user in a single aggregation query.
+    
+    With a reporting currency, amounts are converted at the rate in effect on each
+    expense date by joining the rate table; payments without a rate are counted in
+    unconverted_payments and left out of the totals. Without one, the user's
+    reporting currency setting applies, and native amounts are summed if it is unset.
+    """
+    amount = PaymentRecord.amount
+    insurance_paid = PaymentRecord.insurance_paid_amount
+    patient_responsibility = PaymentRecord.patient_responsibility
+    
+    if not reporting_currency:
+        reporting_currency = db.query(User.reporting_currency).filter(User.id == current_user.id).scalar()
+    
+    if reporting_currency:
+        reporting_currency = reporting_currency.upper()
+        if not fx_index.knows(reporting_currency):
+            raise HTTPException(status_code=400, detail=f"No exchange rates for {reporting_currency}")
+        source_rate = aliased(ExchangeRate)
+        target_rate = aliased(ExchangeRate)
+        rate_date = func.coalesce(PaymentRecord.expense_date, PaymentRecord.created_at)
+        # The base currency is 1 by definition, so it converts even before rates are imported
+        to_base = reporting_currency == settings.FX_BASE_CURRENCY
+        target = 1 if to_base else target_rate.rate
+        factor = case(
+            (PaymentRecord.currency == reporting_currency, 1),
+            (PaymentRecord.currency == settings.FX_BASE_CURRENCY, target),
+            else_=target / source_rate.rate
+        )
+        amount = amount * factor
+        insurance_paid = insurance_paid * factor
+        patient_responsibility = patient_responsibility * factor
+    
+    # Literal unit so the SELECT and GROUP BY render the same expression
+    month = func.date_trunc(literal_column("'month'"), PaymentRecord.expense_date)
+    
+    # Every payment has a status, so the per-status set doubles as the grand total
+    grouping_sets = [
+        tuple_(PaymentRecord.payment_status),
+        tuple_(PaymentRecord.provider_name)
+    ]
+    if include_monthly:
+        grouping_sets.append(tuple_(month))
+    if include_currencies:
+        grouping_sets.append(tuple_(PaymentRecord.currency))
+    
+    query = db.query(
+        func.grouping(PaymentRecord.payment_status).label("by_status"),
+        func.grouping(PaymentRecord.provider_name).label("by_provider"),
+        func.grouping(month).label("by_month"),
+        func.grouping(PaymentRecord.currency).label("by_currency"),
+        PaymentRecord.payment_status,
+        PaymentRecord.provider_name,
+        month.label("month"),
+        PaymentRecord.currency,
+        func.count().label("count"),
+        func.coalesce(func.sum(amount), 0).label("total"),
+        func.coalesce(func.sum(insurance_paid), 0).label("insurance_paid"),
+        func.coalesce(func.sum(patient_responsibility), 0).label("patient_responsibility"),
+        func.coalesce(func.sum(PaymentRecord.amount), 0).label("native_total"),
+        (func.count().filter(amount.is_(None)) if reporting_currency else literal_column("0")).label("unconverted")
+    ).filter(
         PaymentRecord.user_id == current_user.id,
         PaymentRecord.is_deleted == False
     )
     
+    if reporting_currency:
+        query = query.outerjoin(
+            source_rate, rate_in_effect(source_rate, PaymentRecord.currency, rate_date)
+        )
+        if not to_base:
+            query = query.outerjoin(
+                target_rate, rate_in_effect(target_rate, reporting_currency, rate_date)
+            )
+    
     if date_from:
         if isinstance(date_from, date) and not isinstance(date_from, datetime):
             date_from = datetime.combine(date_from, datetime.min.time())
@@ -594,38 +647,45 @@ async def get_payment_summary(
             date_to = datetime.combine(date_to, datetime.max.time())
         query = query.filter(PaymentRecord.expense_date <= date_to)
     
-    payments = query.all()
-    
-    total_amount = sum(p.amount for p in payments)
-    total_insurance_paid = sum(p.insurance_paid_amount for p in payments if p.insurance_paid_amount)
-    total_patient_responsibility = sum(p.patient_responsibility for p in payments if p.patient_responsibility)
-    
-    # Group by status
-    status_summary = {}
-    for status in PaymentStatus:
-        status_payments = [p for p in payments if p.payment_status == status]
-        status_summary[status.value] = {
-            "count": len(status_payments),
-            "total": float(sum(p.amount for p in status_payments))
-        }
-    
-    # Group by provider
-    provider_summary = {}
-    for payment in payments:
-        if payment.provider_name:
-            if payment.provider_name not in provider_summary:
-                provider_summary[payment.provider_name] = {
-                    "count": 0,
-                    "total": 0
-                }
-            provider_summary[payment.provider_name]["count"] += 1
-            provider_summary[payment.provider_name]["total"] += float(payment.amount)
+    rows = query.group_by(func.grouping_sets(*grouping_sets)).all()
     
-    return {
-        "total_amount": float(total_amount),
-        "total_insurance_paid": float(total_insurance_paid),
-        "total_patient_responsibility": float(total_patient_responsibility),
-        "total_payments": len(payments),
-        "status_summary": status_summary,
-        "provider_summary": provider_summary
-    }
\ No newline at end of file
+    summary = {
+        "total_amount": 0.0,
+        "total_insurance_paid": 0.0,
+        "total_patient_responsibility": 0.0,
+        "total_payments": 0,
+        "status_summary": {status.value: {"count": 0, "total": 0.0} for status in PaymentStatus},
+        "provider_summary": {}
+    }
+    if reporting_currency:
+        summary["reporting_currency"] = reporting_currency
+        summary["unconverted_payments"] = 0
+    monthly = []
+    currencies = {}
+    
+    # GROUPING() is 0 for the columns a row is grouped by; each row belongs to one set
+    for row in rows:
+        bucket = {"count": row.count, "total": float(row.total)}
+        if not row.by_status:
+            summary["status_summary"][row.payment_status.value] = bucket
+            summary["total_amount"] += float(row.total)
+            summary["total_insurance_paid"] += float(row.insurance_paid)
+            summary["total_patient_responsibility"] += float(row.patient_responsibility)
+            summary["total_payments"] += row.count
+            if reporting_currency:
+                summary["unconverted_payments"] += row.unconverted
+        elif not row.by_provider:
+            if row.provider_name:
+                summary["provider_summary"][row.provider_name] = bucket
+        elif not row.by_month:
+            if row.month:
+                monthly.append({"month": row.month.strftime("%Y-%m"), **bucket})
+        elif not row.by_currency:
+            currencies[row.currency] = dict(bucket, native_total=float(row.native_total))
+    
+    if include_monthly:
+        summary["monthly_summary"] = sorted(monthly, key=lambda entry: entry["month"])
+    if include_currencies:
+        summary["currency_summary"] = currencies
+    
+    return summary
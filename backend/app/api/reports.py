@@ -0,0 +1,261 @@
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime, timezone
+import uuid
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.executors import run_in_executor
+from app.api.auth import get_current_principal
+from app.services.principal_cache import Principal
+from app.models.audit_log import AuditAction
+from app.models.report_job import ReportJob, ReportKind, ReportStatus
+from app.models.user import User
+from app.services.audit import audit_writer
+from app.services.expense_report import generate_report
+from app.services.user_export import generate_export, iter_stored_export, stream_export
+from app.services.fx_rates import fx_index
+from app.services.storage import storage_service
+
+router = APIRouter()
+
+MAX_ACTIVE_REPORTS = 2
+
+class ReportRequest(BaseModel):
+    year: int
+    reporting_currency: Optional[str] = None
+    include_invoices: bool = True
+
+def _report_dict(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind.value,
+        "year": job.year,
+        "reporting_currency": job.reporting_currency,
+        "include_invoices": job.include_invoices,
+        "status": job.status.value,
+        "ready": job.status == ReportStatus.COMPLETED,
+        "file_size": job.file_size,
+        "payments_count": job.payments_count,
+        "invoices_count": job.invoices_count,
+        "records_count": job.records_count,
+        "vitals_count": job.vitals_count,
+        "files_count": job.files_count,
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat(),
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "downloaded_at": job.downloaded_at.isoformat() if job.downloaded_at else None
+    }
+
+async def _run_report(job_id: str):
+    await run_in_executor(None, generate_report, job_id)
+
+async def _run_export(job_id: str):
+    await run_in_executor(None, generate_export, job_id)
+
+def _check_active_reports(db: Session, user_id: str):
+    active = db.query(ReportJob).filter(
+        ReportJob.user_id == user_id,
+        ReportJob.status.in_([ReportStatus.PENDING, ReportStatus.RUNNING])
+    ).count()
+    if active >= MAX_ACTIVE_REPORTS:
+        raise HTTPException(status_code=429, detail="A report is already being generated")
+
+def _get_job(db: Session, user_id: str, kind: ReportKind, report_id: str) -> ReportJob:
+    job = db.query(ReportJob).filter(
+        ReportJob.id == report_id,
+        ReportJob.user_id == user_id,
+        ReportJob.kind == kind
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return job
+
+@router.post("/expenses", status_code=202)
+async def request_expense_report(
+    report: ReportRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Queue a yearly expense report; poll the returned job until it is ready"""
+    current_year = datetime.now(timezone.utc).year
+    if report.year < 1900 or report.year > current_year:
+        raise HTTPException(status_code=400, detail="Invalid report year")
+
+    preferred = db.query(User.reporting_currency).filter(User.id == current_user.id).scalar()
+    currency = (report.reporting_currency or preferred or settings.DEFAULT_REPORTING_CURRENCY).upper()
+    if not fx_index.knows(currency):
+        raise HTTPException(status_code=400, detail=f"No exchange rates for {currency}")
+
+    _check_active_reports(db, current_user.id)
+
+    job = ReportJob(
+        id=str(uuid.uuid4()),
+        user_id=current_user.id,
+        kind=ReportKind.EXPENSES,
+        year=report.year,
+        reporting_currency=currency,
+        include_invoices=report.include_invoices,
+        status=ReportStatus.PENDING
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    background_tasks.add_task(_run_report, job.id)
+    return _report_dict(job)
+
+@router.get("/expenses")
+async def list_expense_reports(
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """List the current user's expense reports, newest first"""
+    jobs = db.query(ReportJob).filter(
+        ReportJob.user_id == current_user.id,
+        ReportJob.kind == ReportKind.EXPENSES
+    ).order_by(ReportJob.created_at.desc()).limit(50).all()
+    return [_report_dict(job) for job in jobs]
+
+@router.get("/expenses/{report_id}")
+async def get_expense_report(
+    report_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Get the status of one expense report"""
+    return _report_dict(_get_job(db, current_user.id, ReportKind.EXPENSES, report_id))
+
+@router.get("/expenses/{report_id}/download")
+async def download_expense_report(
+    report_id: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Stream a finished report archive from storage"""
+    job = _get_job(db, current_user.id, ReportKind.EXPENSES, report_id)
+    if job.status != ReportStatus.COMPLETED or not job.object_name:
+        raise HTTPException(status_code=409, detail="Report is not ready")
+
+    job.downloaded_at = datetime.now(timezone.utc)
+    db.commit()
+    audit_writer.record(
+        AuditAction.FILE_DOWNLOAD,
+        user_id=current_user.id,
+        resource_type="expense_report",
+        resource_id=job.id,
+        request=request
+    )
+
+    headers = {"Content-Disposition": f"attachment; filename=expenses-{job.year}.zip"}
+    if job.file_size:
+        headers["Content-Length"] = str(job.file_size)
+    return StreamingResponse(
+        storage_service.iter_object(job.object_name),
+        media_type="application/zip",
+        headers=headers
+    )
+
+@router.get("/export")
+async def stream_data_export(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Stream a ZIP of all the current user's data as it is assembled"""
+    # A streamed export counts against the same limit as queued reports
+    _check_active_reports(db, current_user.id)
+    now = datetime.now(timezone.utc)
+    job_id = str(uuid.uuid4())
+    db.add(ReportJob(
+        id=job_id,
+        user_id=current_user.id,
+        kind=ReportKind.EXPORT,
+        status=ReportStatus.RUNNING,
+        started_at=now,
+        heartbeat_at=now
+    ))
+    db.commit()
+    # Release the connection now; yield dependencies only close after the stream ends
+    db.close()
+
+    audit_writer.record(
+        AuditAction.FILE_DOWNLOAD,
+        user_id=current_user.id,
+        resource_type="user_export",
+        request=request
+    )
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d")
+    return StreamingResponse(
+        stream_export(current_user.id, job_id=job_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=healthstash-export-{stamp}.zip"}
+    )
+
+@router.post("/export", status_code=202)
+async def request_data_export(
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Queue an encrypted data export in storage; poll the returned job until it is ready"""
+    _check_active_reports(db, current_user.id)
+
+    job = ReportJob(
+        id=str(uuid.uuid4()),
+        user_id=current_user.id,
+        kind=ReportKind.EXPORT,
+        status=ReportStatus.PENDING
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    background_tasks.add_task(_run_export, job.id)
+    return _report_dict(job)
+
+@router.get("/export/{report_id}")
+async def get_data_export(
+    report_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Get the status of one data export"""
+    return _report_dict(_get_job(db, current_user.id, ReportKind.EXPORT, report_id))
+
+@router.get("/export/{report_id}/download")
+async def download_data_export(
+    report_id: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Decrypt a finished data export while streaming it from storage"""
+    job = _get_job(db, current_user.id, ReportKind.EXPORT, report_id)
+    if job.status != ReportStatus.COMPLETED or not job.object_name:
+        raise HTTPException(status_code=409, detail="Export is not ready")
+    user = db.get(User, current_user.id)
+
+    job.downloaded_at = datetime.now(timezone.utc)
+    db.commit()
+    audit_writer.record(
+        AuditAction.FILE_DOWNLOAD,
+        user_id=current_user.id,
+        resource_type="user_export",
+        resource_id=job.id,
+        request=request
+    )
+
+    headers = {"Content-Disposition": f"attachment; filename=healthstash-export-{job.created_at:%Y%m%d}.zip"}
+    if job.file_size:
+        headers["Content-Length"] = str(job.file_size)
+    return StreamingResponse(
+        iter_stored_export(job, user),
+        media_type="application/zip",
+        headers=headers
+    )
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import or_
+from typing import List, Optional
 import uuid
 
 from app.core.database import get_db
 from app.models.user import User, UserRole
 from app.api.auth import get_current_user, get_admin_user
 from app.schemas.auth import UserResponse
+from app.services.principal_cache import principal_cache
+from app.services.fx_rates import fx_index
 
 router = APIRouter()
 
@@ -22,33 +25,79 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
         "is_active": current_user.is_active,
         "storage_quota_mb": current_user.storage_quota_mb,
         "storage_used_mb": current_user.storage_used_mb,
+        "reporting_currency": current_user.reporting_currency,
         "created_at": current_user.created_at,
         "last_login": current_user.last_login
     }
     return user_dict
 
+@router.put("/me/reporting-currency")
+async def update_reporting_currency(
+    currency: Optional[str] = Query(None, regex="^[A-Za-z]{3}$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Set the currency payment summaries and expense reports use by default; omit to clear it"""
+    if currency:
+        currency = currency.upper()
+        if not fx_index.knows(currency):
+            raise HTTPException(status_code=400, detail=f"No exchange rates for {currency}")
+    
+    current_user.reporting_currency = currency
+    db.commit()
+    
+    return {"reporting_currency": currency}
+
 @router.get("/")
 async def list_users(
+    limit: int = Query(default=50, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+    search: Optional[str] = None,
+    role: Optional[UserRole] = None,
+    is_active: Optional[bool] = None,
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    users = db.query(User).all()
-    return [
-        {
-            "id": str(user.id),
-            "email": user.email,
-            "username": user.username,
-            "full_name": user.full_name,
-            "role": user.role.value if hasattr(user.role, 'value') else user.role,
-            "is_active": user.is_active,
-            "storage_quota_mb": user.storage_quota_mb,
-            "storage_used_mb": user.storage_used_mb,
-            "created_at": user.created_at,
-            "updated_at": user.updated_at,  # Added this field
-            "last_login": user.last_login
-        }
-        for user in users
-    ]
+    query = db.query(User)
+    
+    if search:
+        search_filter = f"%{search}%"
+        query = query.filter(or_(
+            User.username.ilike(search_filter),
+            User.email.ilike(search_filter),
+            User.full_name.ilike(search_filter)
+        ))
+    
+    if role:
+        query = query.filter(User.role == role)
+    
+    if is_active is not None:
+        query = query.filter(User.is_active == is_active)
+    
+    total = query.count()
+    users = query.order_by(User.created_at, User.id).offset(offset).limit(limit).all()
+    
+    return {
+        "total": total,
+        "users": [
+            {
+                "id": str(user.id),
+                "email": user.email,
+                "username": user.username,
+                "full_name": user.full_name,
+                "role": user.role.value if hasattr(user.role, 'value') else user.role,
+                "is_active": user.is_active,
+                "storage_quota_mb": user.storage_quota_mb,
+                "storage_used_mb": user.storage_used_mb,
+                "created_at": user.created_at,
+                "updated_at": user.updated_at,  # Added this field
+                "last_login": user.last_login
+            }
+            for user in users
+        ],
+        "limit": limit,
+        "offset": offset
+    }
 
 @router.put("/{user_id}/quota")
 async def update_user_quota(
@@ -81,5 +130,6 @@ async def delete_user(
     
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(user_id)
     
     return {"message": "User deleted successfully"}
\ No newline at end of file
@@ -8,8 +8,8 @@ import uuid
 import json
 
 from app.core.database import get_timescale_db
-from app.models.user import User
-from app.api.auth import get_current_user
+from app.api.auth import get_current_principal
+from app.services.principal_cache import Principal
 
 router = APIRouter()
 
@@ -24,7 +24,7 @@ class VitalSignCreate(BaseModel):
 @router.post("/")
 async def add_vital_sign(
     vital_data: VitalSignCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
@@ -61,7 +61,7 @@ async def list_vital_signs(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     limit: int = Query(default=100, le=1000),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
@@ -117,7 +117,7 @@ async def list_vital_signs(
 
 @router.get("/latest")
 async def get_latest_vitals(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
@@ -157,7 +157,7 @@ async def get_latest_vitals(
 async def get_vital_trends(
     vital_type: str,
     period: str = "week",  # week, month, year
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
@@ -217,7 +217,7 @@ async def get_vital_trends(
 @router.delete("/all")
 async def delete_all_vitals(
     vital_type: Optional[str] = None,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
@@ -255,7 +255,7 @@ async def delete_all_vitals(
 @router.delete("/{vital_id}")
 async def delete_vital_sign(
     vital_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_timescale_db)
 ):
     try:
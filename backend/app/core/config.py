@@ -40,10 +40,35 @@ class Settings(BaseSettings):
     SESSION_TIMEOUT_MINUTES: int = 30
     MAX_LOGIN_ATTEMPTS: int = 5
     LOCKOUT_DURATION_MINUTES: int = 15
+    AUTH_CACHE_TTL_SECONDS: int = 30  # 0 disables the principal cache
+    AUTH_CACHE_MAX_SIZE: int = 10000
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # waiting hashes beyond this are rejected with 429
     
     DEFAULT_USER_QUOTA_MB: int = 5000
     MAX_FILE_SIZE_MB: int = 500
     
+    MAX_FILES_PER_UPLOAD: int = 50
+    UPLOAD_WORKERS: int = 4  # bounds hashing, encryption and MinIO puts of multi-file uploads
+    
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+    UPLOAD_CHUNK_SIZE_MB: int = 5
+    UPLOAD_MAX_CHUNK_SIZE_MB: int = 50
+    
+    MOBILE_TOKEN_STORE: str = "database"  # memory, database or redis
+    MOBILE_TOKEN_TTL_MINUTES: int = 15
+    MOBILE_RECENT_UPLOADS_LIMIT: int = 50
+    REDIS_URL: str = "redis://redis:6379/0"
+    
+    THUMBNAIL_BATCH_MAX: int = 100
+    THUMBNAIL_WORKERS: int = 4
+    
+    TEXT_EXTRACTION_ENABLED: bool = True
+    TEXT_EXTRACTION_WORKERS: int = 2
+    TEXT_EXTRACTION_MAX_FILE_MB: int = 50
+    TEXT_EXTRACTION_MAX_CHARS: int = 200000
+    TEXT_EXTRACTION_TIMEOUT_SECONDS: int = 60
+    
     MIN_PASSWORD_LENGTH: int = 12
     REQUIRE_UPPERCASE: bool = True
     REQUIRE_LOWERCASE: bool = True
@@ -52,8 +77,56 @@ class Settings(BaseSettings):
     
     BACKUP_ENABLED: bool = True
     BACKUP_RETENTION_DAYS: int = 30
+    BACKUP_DIR: str = "/backups"
+    BACKUP_REPOSITORY_DIR: str = "/backups/repository"  # content-addressed packs and manifests
+    BACKUP_PACK_SIZE_MB: int = 64
+    BACKUP_FULL_INTERVAL: int = 7  # incremental manifests before a new full chain starts
+    BACKUP_EXCLUDE_PREFIXES: str = "uploads/,reports/"  # transient objects never backed up
+    BACKUP_PIPELINE_ENABLED: bool = True  # False hands full backups to the backup container instead
+    BACKUP_DUMP_JOBS: int = 4  # pg_dump --jobs per database
+    BACKUP_ZSTD_LEVEL: int = 3
+    BACKUP_ZSTD_THREADS: int = 0  # 0 uses every core
+    BACKUP_ENCRYPTION_KEY: str = ""  # falls back to ENCRYPTION_KEY
+    BACKUP_WORKER_ENABLED: bool = True  # claim queued backup jobs in this process
+    BACKUP_JOB_POLL_SECONDS: int = 60  # safety net if a NOTIFY is missed
+    BACKUP_JOB_HEARTBEAT_TIMEOUT_SECONDS: int = 180
+    BACKUP_CATALOG_SCAN_SECONDS: int = 60  # how often /backups is re-indexed into backup_history
+    BACKUP_RESTORE_JOBS: int = 4  # pg_restore --jobs per database
+    BACKUP_RESTORE_WORKERS: int = 8  # concurrent object uploads during restore
+    
+    FX_BASE_CURRENCY: str = "EUR"
+    FX_RATES_CSV: str = "/app/data/eurofxref-hist.csv"  # ECB historical reference rates, imported by the leader
+    FX_INDEX_RELOAD_SECONDS: int = 600  # each worker reloads its in-memory rate index this often
+    DEFAULT_REPORTING_CURRENCY: str = "EUR"
+    
+    REPORT_WORKERS: int = 4  # invoices fetched and decrypted concurrently per report
+    REPORT_FETCH_WINDOW: int = 8  # decrypted invoices held in memory at once
+    REPORT_RETENTION_DAYS: int = 7
+    REPORT_HEARTBEAT_SECONDS: int = 30
+    REPORT_STALE_SECONDS: int = 300  # unfinished jobs without a heartbeat for this long are failed
+    
+    SYSTEM_STATS_FOLD_SECONDS: int = 60
+    SYSTEM_STATS_REFRESH_MINUTES: int = 60
+    
+    SCHEDULER_ENABLED: bool = True  # periodic jobs run in whichever worker holds the leader lock
+    SCHEDULER_TICK_SECONDS: int = 5
+    SCHEDULER_HISTORY_DAYS: int = 30
+    
+    SOFT_DELETE_RETENTION_DAYS: int = 30  # deleted records stay restorable from the database this long
+    SOFT_DELETE_GC_BATCH: int = 500
+    
+    RECONCILE_REPAIR: bool = False  # the weekly scan only reports unless enabled
+    RECONCILE_GRACE_MINUTES: int = 60  # newer objects may belong to an upload still committing its row
+    RECONCILE_EXCLUDE_PREFIXES: str = "uploads/,archive/"  # upload parts and audit archives have no rows
     
     ENABLE_AUDIT_LOG: bool = True
+    AUDIT_QUEUE_MAX: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_MS: int = 500
+    AUDIT_WAL_DIR: str = "/var/lib/healthstash/audit-wal"  # must be on a persistent volume; empty disables it
+    AUDIT_WAL_FSYNC: bool = False  # fsync every event; otherwise up to one flush interval can be lost on power failure
+    AUDIT_PARTITION_MONTHS_AHEAD: int = 3
+    AUDIT_RETENTION_MONTHS: int = 24  # older monthly partitions are archived to MinIO; 0 keeps all
     
     class Config:
         env_file = ".env"
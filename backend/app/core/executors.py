@@ -0,0 +1,126 @@
+# MIT License
+# Copyright (c) 2025 Ilker M. KARAKAS
+# HealthStash - Privacy-First Personal Health Data Vault
+
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+import asyncio
+import threading
+import time
+
+from app.core.config import settings
+
+# Bounded pools for blocking work so request handlers never stall the event loop
+thumbnail_executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS,
+    thread_name_prefix="thumbnail"
+)
+
+upload_executor = ThreadPoolExecutor(
+    max_workers=settings.UPLOAD_WORKERS,
+    thread_name_prefix="upload"
+)
+
+# Fetch and decrypt invoices for expense reports; shared by all running report jobs
+report_executor = ThreadPoolExecutor(
+    max_workers=settings.REPORT_WORKERS,
+    thread_name_prefix="report"
+)
+
+class ExecutorSaturated(Exception):
+    """Raised when a bounded executor already has its maximum backlog"""
+
+class BoundedExecutor:
+    """Thread pool that rejects work once max_queue tasks are waiting.
+
+    Keeps queue depth and timing counters so saturation is visible in the
+    admin stats instead of surfacing as latency on unrelated requests.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name)
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._wait_seconds += started - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_seconds += time.perf_counter() - started
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, timed)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed or 1
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(0, self._pending - self._running),
+                "peak_depth": self._peak_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_seconds / completed * 1000, 2),
+                "avg_run_ms": round(self._run_seconds / completed * 1000, 2)
+            }
+
+# bcrypt and PBKDF2 release the GIL, so a small thread pool keeps logins off the event loop
+password_executor = BoundedExecutor(
+    "password",
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+# Text extraction parses untrusted documents, so it runs out of process
+extraction_executor = ProcessPoolExecutor(max_workers=settings.TEXT_EXTRACTION_WORKERS)
+
+def recycle_extraction_executor(stuck: ProcessPoolExecutor):
+    """Kill the workers of an extraction pool and start a fresh one.
+
+    Cancelling a future does not stop a worker process that is already
+    running it, so a hung parser would keep its worker forever. Extractions
+    still running on the old pool fail and are skipped like any other error.
+    """
+    global extraction_executor
+    if stuck is not extraction_executor:
+        return  # another timeout already replaced it
+    extraction_executor = ProcessPoolExecutor(max_workers=settings.TEXT_EXTRACTION_WORKERS)
+    for process in list((stuck._processes or {}).values()):
+        process.kill()
+    stuck.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_executor(executor: Executor, func, *args, **kwargs):
+    """Run a blocking callable on the given executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
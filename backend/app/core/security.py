@@ -4,6 +4,7 @@
 
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Union
+from functools import lru_cache
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
@@ -88,6 +89,14 @@ def derive_key_from_password(password: str, salt: bytes) -> bytes:
     key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
     return key
 
+@lru_cache(maxsize=1024)
+def _cached_user_file_key(user_id: str, hashed_password: str, salt: bytes) -> bytes:
+    return derive_key_from_password(f"{user_id}:{hashed_password}:{settings.ENCRYPTION_KEY}", salt)
+
+def get_user_file_key(user) -> bytes:
+    """Return the file encryption key for a user, memoized per password/salt pair"""
+    return _cached_user_file_key(str(user.id), user.hashed_password, bytes(user.encryption_salt))
+
 def generate_user_encryption_key(user_id: str, password: str) -> tuple[bytes, bytes]:
     salt = os.urandom(16)
     combined = f"{user_id}:{password}:{settings.ENCRYPTION_KEY}"
@@ -13,14 +13,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
+from functools import partial
 import logging
 import asyncio
 import time
-from datetime import datetime, timezone, timedelta
 
 from app.core.config import settings
 from app.core.database import init_db
-from app.api import auth, users, files, health_records, vitals, admin, backup_v2 as backup, mobile, payments
+from app.api import auth, users, files, health_records, vitals, admin, backup_v2 as backup, mobile, payments, reports
 from app.core.security import verify_encryption_setup
 
 logging.basicConfig(level=logging.INFO)
@@ -35,88 +35,72 @@ async def lifespan(app: FastAPI):
     verify_encryption_setup()
     await init_db()
     
-    # Clean up any stuck backups from previous runs
-    from app.core.database import SessionLocal
-    from app.models.backup import BackupHistory, BackupStatus
-    from datetime import datetime, timezone
-    
-    db = SessionLocal()
+    # Worker-local setup only; shared maintenance and DDL run in the scheduler leader below
+    from app.services.fx_rates import fx_index, import_missing_rates, keep_index_fresh
     try:
-        stuck_backups = db.query(BackupHistory).filter(
-            BackupHistory.status == BackupStatus.IN_PROGRESS
-        ).all()
-        
-        for backup in stuck_backups:
-            logger.warning(f"Found stuck backup {backup.id}, marking as failed")
-            backup.status = BackupStatus.FAILED
-            backup.error_message = "Backup interrupted by server restart"
-            backup.completed_at = datetime.now(timezone.utc)
-            
-            if backup.started_at:
-                started = backup.started_at
-                completed = backup.completed_at
-                if started.tzinfo is None:
-                    started = started.replace(tzinfo=timezone.utc)
-                if completed.tzinfo is None:
-                    completed = completed.replace(tzinfo=timezone.utc)
-                backup.duration_seconds = int((completed - started).total_seconds())
-        
-        if stuck_backups:
-            db.commit()
-            logger.info(f"Cleaned up {len(stuck_backups)} stuck backups")
-    finally:
-        db.close()
+        await asyncio.get_running_loop().run_in_executor(None, fx_index.load)
+    except Exception as e:
+        logger.error(f"Exchange rate index load failed: {e}")
+    fx_reload = asyncio.create_task(keep_index_fresh())
+    
+    # Start the batched audit writer, replaying any events a crash left in its WAL
+    from app.services.audit import audit_writer
+    await audit_writer.start()
+    
+    # LISTEN/NOTIFY channel for queued backups and their progress events
+    from app.services.backup_jobs import backup_channel, check_backup_timeouts
+    backup_channel.start()
     
-    # Start background task to monitor stuck backups
-    async def monitor_stuck_backups():
-        while True:
-            try:
-                await asyncio.sleep(60)  # Check every minute
-                
-                db = SessionLocal()
-                try:
-                    # Find backups that have been in progress for more than 5 minutes
-                    cutoff_time = datetime.now(timezone.utc) - timedelta(minutes=5)
-                    
-                    stuck_backups = db.query(BackupHistory).filter(
-                        BackupHistory.status == BackupStatus.IN_PROGRESS,
-                        BackupHistory.started_at < cutoff_time
-                    ).all()
-                    
-                    for backup in stuck_backups:
-                        logger.warning(f"Found stuck backup {backup.id} (running for >5 min), marking as failed")
-                        backup.status = BackupStatus.FAILED
-                        backup.error_message = "Backup timeout - took longer than 5 minutes"
-                        backup.completed_at = datetime.now(timezone.utc)
-                        
-                        if backup.started_at:
-                            started = backup.started_at
-                            completed = backup.completed_at
-                            if started.tzinfo is None:
-                                started = started.replace(tzinfo=timezone.utc)
-                            if completed.tzinfo is None:
-                                completed = completed.replace(tzinfo=timezone.utc)
-                            backup.duration_seconds = int((completed - started).total_seconds())
-                    
-                    if stuck_backups:
-                        db.commit()
-                        logger.info(f"Cleaned up {len(stuck_backups)} timed-out backups")
-                finally:
-                    db.close()
-            except Exception as e:
-                logger.error(f"Error in backup monitor task: {e}")
+    # Periodic maintenance runs in one worker only, the scheduler leader
+    from app.services.audit_partitions import maintain_audit_partitions
+    from app.services.backup_catalog import backup_catalog
+    from app.services.expense_report import fail_interrupted_reports, purge_expired_reports
+    from app.services.scheduler import scheduler, PeriodicJob, purge_job_runs
+    from app.services.soft_delete import purge_soft_deleted
+    from app.services.storage_reconcile import reconcile_storage
+    from app.services.system_stats import install_stats_triggers, refresh_system_stats, fold_stats_deltas
+    from app.services.token_store import token_store
+    from app.services.upload_sessions import expire_upload_sessions
     
-    # Start the monitoring task
-    monitor_task = asyncio.create_task(monitor_stuck_backups())
+    for job in (
+        # Backups left in progress by a restart are failed once past their timeout
+        PeriodicJob("backup_timeouts", check_backup_timeouts, every=60, run_at_start=True),
+        # Index archives on the backup volume so admin listings never touch the filesystem
+        PeriodicJob("backup_catalog_scan", backup_catalog.refresh, every=settings.BACKUP_CATALOG_SCAN_SECONDS,
+                    run_at_start=True),
+        PeriodicJob("mobile_token_expiry", token_store.purge_expired, every=600),
+        PeriodicJob("upload_session_expiry", expire_upload_sessions, every=600),
+        PeriodicJob("report_purge", purge_expired_reports, every=600),
+        # Report jobs run in the worker that queued them; fail those whose worker died
+        PeriodicJob("report_interrupted", fail_interrupted_reports, every=settings.REPORT_HEARTBEAT_SECONDS * 2,
+                    run_at_start=True),
+        # This month's partitions must exist before events fall through to the default partition
+        PeriodicJob("audit_partitions", maintain_audit_partitions, cron="0 3 * * *", run_at_start=True),
+        # Fold trigger deltas into the stats summary, with a full recount at start and against drift
+        PeriodicJob("system_stats_triggers", install_stats_triggers, run_at_start=True),
+        PeriodicJob("system_stats_fold", fold_stats_deltas, every=settings.SYSTEM_STATS_FOLD_SECONDS),
+        PeriodicJob("system_stats_refresh", refresh_system_stats, every=settings.SYSTEM_STATS_REFRESH_MINUTES * 60,
+                    run_at_start=True),
+        # Reference exchange rates on first start; workers pick them up with their next index reload
+        PeriodicJob("fx_rates_import", import_missing_rates, run_at_start=True),
+        PeriodicJob("job_run_purge", purge_job_runs, cron="30 3 * * *"),
+        # Records deleted more than SOFT_DELETE_RETENTION_DAYS ago, with their objects
+        PeriodicJob("soft_delete_gc", purge_soft_deleted, cron="0 4 * * *"),
+        # Objects without rows and rows without objects, after the week's GC runs
+        PeriodicJob("storage_reconcile", partial(reconcile_storage, repair=settings.RECONCILE_REPAIR),
+                    cron="0 5 * * 0")
+    ):
+        scheduler.register(job)
+    scheduler.start()
     
     yield
     
-    # Cancel the monitoring task on shutdown
-    monitor_task.cancel()
-    try:
-        await monitor_task
-    except asyncio.CancelledError:
-        pass
+    await scheduler.stop()
+    backup_channel.stop()
+    fx_reload.cancel()
+    
+    # Drain queued audit events before exit
+    await audit_writer.stop()
     
     logger.info("Shutting down HealthStash application...")
 
@@ -153,6 +137,7 @@ app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(backup.router, prefix="/api/backup", tags=["Backup"])
 app.include_router(mobile.router, prefix="/api/mobile", tags=["Mobile Upload"])
 app.include_router(payments.router, prefix="/api/payments", tags=["Payments"])
+app.include_router(reports.router, prefix="/api/reports", tags=["Reports"])
 
 @app.get("/health")
 async def health_check():
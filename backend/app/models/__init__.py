@@ -2,14 +2,28 @@ from app.models.user import User, UserRole
 from app.models.health_record import HealthRecord, RecordCategory, RecordTag
 from app.models.vital_signs import VitalSign, VitalType
 from app.models.audit_log import AuditLog
-from app.models.backup import BackupHistory
+from app.models.backup import BackupHistory, BackupJob
 from app.models.payment_record import PaymentRecord, PaymentFile, PaymentStatus, PaymentMethod
+from app.models.stored_object import StoredObject
+from app.models.upload_session import UploadSession, UploadSessionStatus
+from app.models.mobile_upload import MobileUploadToken, MobileUploadEvent
+from app.models.system_stats import SystemStats, SystemStatsDelta, ActivityCounter
+from app.models.exchange_rate import ExchangeRate
+from app.models.report_job import ReportJob, ReportKind, ReportStatus
+from app.models.scheduled_job import ScheduledJob, JobRun, JobRunStatus
 
 __all__ = [
     "User", "UserRole",
     "HealthRecord", "RecordCategory", "RecordTag",
     "VitalSign", "VitalType",
     "AuditLog",
-    "BackupHistory",
-    "PaymentRecord", "PaymentFile", "PaymentStatus", "PaymentMethod"
+    "BackupHistory", "BackupJob",
+    "PaymentRecord", "PaymentFile", "PaymentStatus", "PaymentMethod",
+    "StoredObject",
+    "UploadSession", "UploadSessionStatus",
+    "MobileUploadToken", "MobileUploadEvent",
+    "SystemStats", "SystemStatsDelta", "ActivityCounter",
+    "ExchangeRate",
+    "ReportJob", "ReportKind", "ReportStatus",
+    "ScheduledJob", "JobRun", "JobRunStatus"
 ]
\ No newline at end of file
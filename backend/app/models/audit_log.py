@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import enum
@@ -24,12 +24,18 @@ class AuditAction(enum.Enum):
     BACKUP_RESTORE = "backup_restore"
     SETTINGS_CHANGE = "settings_change"
 
+# Range-partitioned by month on created_at; partitions are managed by app/services/audit_partitions.py
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_action_created_at", "action", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(String, primary_key=True, index=True)
+    # The partition key must be part of the primary key
+    id = Column(String, primary_key=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=True, index=True)
-    action = Column(Enum(AuditAction), nullable=False, index=True)
+    action = Column(Enum(AuditAction), nullable=False)
     
     resource_type = Column(String, nullable=True)
     resource_id = Column(String, nullable=True)
@@ -38,6 +44,6 @@ class AuditLog(Base):
     ip_address = Column(String, nullable=True)
     user_agent = Column(String, nullable=True)
     
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), primary_key=True, nullable=False, index=True)
     
     user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
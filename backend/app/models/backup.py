@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, Float, Enum, Text, Boolean
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, Float, Enum, Text, Boolean
 from datetime import datetime, timezone
 import enum
 
@@ -22,11 +22,19 @@ class BackupHistory(Base):
     backup_type = Column(Enum(BackupType), nullable=False)
     status = Column(Enum(BackupStatus), nullable=False, default=BackupStatus.PENDING)
     
-    file_path = Column(String, nullable=True)
-    file_size = Column(Integer, nullable=True)
+    file_path = Column(String, nullable=True, unique=True, index=True)  # looked up by the backup catalog
+    file_size = Column(BigInteger, nullable=True)
     size_mb = Column(Float, nullable=True)  # Size in MB for display
     checksum = Column(String, nullable=True)
     duration_seconds = Column(Integer, nullable=True)  # Duration in seconds
+    metrics_json = Column(Text, nullable=True)  # Per-stage timings and throughput from the pipeline
+    
+    # Live progress, written by the backup job worker while the backup runs
+    progress_stage = Column(String, nullable=True)
+    progress_bytes = Column(BigInteger, nullable=True)
+    progress_total_bytes = Column(BigInteger, nullable=True)  # estimate from the previous backup
+    progress_eta_seconds = Column(Integer, nullable=True)
+    progress_updated_at = Column(DateTime, nullable=True)
     
     includes_database = Column(Boolean, default=True)
     includes_files = Column(Boolean, default=True)
@@ -37,4 +45,24 @@ class BackupHistory(Base):
     
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
\ No newline at end of file
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+class BackupJobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class BackupJob(Base):
+    """Queue entry for a backup; workers are woken with NOTIFY and claim one job at a time"""
+    __tablename__ = "backup_jobs"
+    
+    id = Column(String, primary_key=True)  # same id as the BackupHistory row
+    backup_type = Column(Enum(BackupType), nullable=False)
+    status = Column(Enum(BackupJobStatus), nullable=False, default=BackupJobStatus.QUEUED, index=True)
+    claimed_by = Column(String, nullable=True)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
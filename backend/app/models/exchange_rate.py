@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Date, Numeric, Index
+
+from app.core.database import Base
+
+class ExchangeRate(Base):
+    """Units of currency per one FX_BASE_CURRENCY, in effect from valid_from until valid_to"""
+    __tablename__ = "exchange_rates"
+    __table_args__ = (
+        Index("ix_exchange_rates_currency_range", "currency", "valid_from", "valid_to"),
+    )
+    
+    currency = Column(String(3), primary_key=True)
+    valid_from = Column(Date, primary_key=True)
+    valid_to = Column(Date, nullable=True)  # exclusive; NULL for the latest published rate
+    rate = Column(Numeric(18, 8), nullable=False)
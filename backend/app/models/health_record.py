@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, Enum, Table, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, Enum, Table, Boolean, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import enum
@@ -48,6 +49,7 @@ class HealthRecord(Base):
     body_parts = Column(Text, nullable=True)  # JSON array of affected body parts/systems
     
     content_text = Column(Text, nullable=True)
+    search_vector = Column(TSVECTOR, nullable=True)  # Filled by the text extraction stage
     metadata_json = Column(Text, nullable=True)
     
     is_deleted = Column(Boolean, default=False, nullable=False)
@@ -59,6 +61,10 @@ class HealthRecord(Base):
     user = relationship("User", back_populates="health_records")
     tags = relationship("RecordTag", secondary=record_tags, back_populates="records")
     payment_records = relationship("PaymentRecord", back_populates="health_record")
+    
+    __table_args__ = (
+        Index("ix_health_records_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
 class RecordTag(Base):
     __tablename__ = "tags"
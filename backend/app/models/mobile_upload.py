@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index
+from datetime import datetime, timezone
+
+from app.core.database import Base
+
+class MobileUploadToken(Base):
+    """Short-lived mobile upload token, shared by all backend workers"""
+    __tablename__ = "mobile_upload_tokens"
+    
+    token = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class MobileUploadEvent(Base):
+    """Recent mobile uploads, trimmed to a bounded number per user"""
+    __tablename__ = "mobile_upload_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    record_id = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    device = Column(String, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_mobile_upload_events_user_created", "user_id", "created_at"),
+    )
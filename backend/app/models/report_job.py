@@ -0,0 +1,42 @@
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, Text, ForeignKey, Enum
+from datetime import datetime, timezone
+import enum
+
+from app.core.database import Base
+
+class ReportStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class ReportKind(enum.Enum):
+    EXPENSES = "expenses"
+    EXPORT = "export"
+
+class ReportJob(Base):
+    """A yearly expense report or a full data export assembled in the background into a ZIP in MinIO"""
+    __tablename__ = "report_jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(Enum(ReportKind), nullable=False, default=ReportKind.EXPENSES)
+    year = Column(Integer, nullable=True)  # expense reports only
+    reporting_currency = Column(String(3), nullable=True)  # expense reports only
+    include_invoices = Column(Boolean, default=True, nullable=False)
+    status = Column(Enum(ReportStatus), nullable=False, default=ReportStatus.PENDING)
+    
+    object_name = Column(String, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    payments_count = Column(Integer, default=0, nullable=False)
+    invoices_count = Column(Integer, default=0, nullable=False)
+    records_count = Column(Integer, default=0, nullable=False)  # exports only
+    vitals_count = Column(Integer, default=0, nullable=False)  # exports only
+    files_count = Column(Integer, default=0, nullable=False)  # exports only
+    error_message = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed by the worker while the job runs
+    completed_at = Column(DateTime, nullable=True)
+    downloaded_at = Column(DateTime, nullable=True)
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Enum, Text
+from datetime import datetime, timezone
+import enum
+
+from app.core.database import Base
+
+class JobRunStatus(enum.Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class ScheduledJob(Base):
+    """Schedule state of a periodic job, written by the scheduler leader so every worker can show it"""
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String, primary_key=True)
+    schedule = Column(String, nullable=False)  # cron expression or "every N s"
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(Enum(JobRunStatus), nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    leader = Column(String, nullable=True)  # worker that scheduled next_run_at
+    requested_at = Column(DateTime, nullable=True)  # a manual run asked for from any worker
+    request_json = Column(Text, nullable=True)  # keyword arguments of that run
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class JobRun(Base):
+    """One execution of a scheduled job"""
+    __tablename__ = "job_runs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job_name = Column(String, nullable=False, index=True)
+    status = Column(Enum(JobRunStatus), nullable=False, default=JobRunStatus.RUNNING)
+    worker = Column(String, nullable=True)
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, BigInteger, DateTime, ForeignKey, UniqueConstraint
+from datetime import datetime, timezone
+
+from app.core.database import Base
+
+class StoredObject(Base):
+    """A unique encrypted object in MinIO, shared by every row of the same user with the same content.
+
+    There is no reference count: the soft-delete GC frees an object once no
+    remaining health record or payment file names it.
+    """
+    __tablename__ = "stored_objects"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    checksum = Column(String(64), nullable=False)  # SHA-256 of the plaintext
+    minio_object_name = Column(String, nullable=False, unique=True)
+    size = Column(BigInteger, nullable=False)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_referenced_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "checksum", name="uq_stored_objects_user_checksum"),
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, Enum
+from datetime import datetime, timezone
+
+from app.core.database import Base
+from app.models.audit_log import AuditAction
+
+class SystemStats(Base):
+    """Single-row summary of user and storage counters read by the admin dashboard"""
+    __tablename__ = "system_stats"
+    
+    id = Column(Integer, primary_key=True, default=1)
+    users_total = Column(Integer, default=0, nullable=False)
+    users_active = Column(Integer, default=0, nullable=False)
+    users_locked = Column(Integer, default=0, nullable=False)
+    users_admins = Column(Integer, default=0, nullable=False)
+    storage_used_mb = Column(BigInteger, default=0, nullable=False)
+    storage_quota_mb = Column(BigInteger, default=0, nullable=False)
+    
+    refreshed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class SystemStatsDelta(Base):
+    """Insert-only changes written by the users trigger, folded into SystemStats periodically"""
+    __tablename__ = "system_stats_deltas"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    users_total = Column(Integer, default=0, nullable=False)
+    users_active = Column(Integer, default=0, nullable=False)
+    users_locked = Column(Integer, default=0, nullable=False)
+    users_admins = Column(Integer, default=0, nullable=False)
+    storage_used_mb = Column(BigInteger, default=0, nullable=False)
+    storage_quota_mb = Column(BigInteger, default=0, nullable=False)
+
+class ActivityCounter(Base):
+    """Audit events per action and hour, incremented by the audit writer"""
+    __tablename__ = "activity_counters"
+    
+    bucket = Column(DateTime, primary_key=True)  # start of the hour, UTC
+    action = Column(Enum(AuditAction), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
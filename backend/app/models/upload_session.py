@@ -0,0 +1,35 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text, ForeignKey, Enum
+from datetime import datetime, timezone
+import enum
+
+from app.core.database import Base
+
+class UploadSessionStatus(enum.Enum):
+    ACTIVE = "active"
+    COMPLETING = "completing"  # claimed by one complete request while it assembles the file
+    COMPLETED = "completed"
+    ABORTED = "aborted"
+
+class UploadSession(Base):
+    """A resumable chunked upload; parts live encrypted in MinIO until completion"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    upload_token = Column(String, nullable=True, index=True)
+    status = Column(Enum(UploadSessionStatus), nullable=False, default=UploadSessionStatus.ACTIVE)
+    
+    file_name = Column(String, nullable=False)
+    file_type = Column(String, nullable=True)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    checksum = Column(String(64), nullable=True)  # Optional client-supplied SHA-256
+    parts_json = Column(Text, nullable=False, default="{}")  # {part_number: size}
+    
+    category = Column(String, nullable=True)
+    service_date = Column(DateTime, nullable=False)
+    record_id = Column(String, nullable=True)
+    
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
@@ -24,6 +24,7 @@ class User(Base):
     encryption_salt = Column(LargeBinary, nullable=False)
     storage_quota_mb = Column(Integer, default=5000, nullable=False)
     storage_used_mb = Column(Integer, default=0, nullable=False)
+    reporting_currency = Column(String(3), nullable=True)  # default for summaries and reports
     
     failed_login_attempts = Column(Integer, default=0, nullable=False)
     last_failed_login = Column(DateTime, nullable=True)
@@ -33,6 +34,7 @@ class User(Base):
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
     last_login = Column(DateTime, nullable=True)
     password_changed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    security_stamp = Column(Integer, default=0, server_default="0", nullable=False)
     
     health_records = relationship("HealthRecord", back_populates="user", cascade="all, delete-orphan")
     payment_records = relationship("PaymentRecord", back_populates="user", cascade="all, delete-orphan")
@@ -33,6 +33,7 @@ class UserResponse(BaseModel):
     is_active: bool
     storage_quota_mb: int
     storage_used_mb: int
+    reporting_currency: Optional[str] = None
     created_at: datetime
     last_login: Optional[datetime]
     
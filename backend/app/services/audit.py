@@ -0,0 +1,381 @@
+"""
+HealthStash - Batched Audit Log Writer
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, List
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.models.audit_log import AuditLog, AuditAction
+from app.services.system_stats import record_activity
+
+logger = logging.getLogger(__name__)
+
+def _client_details(request) -> tuple:
+    if request is None:
+        return None, None
+    ip_address = request.client.host if request.client else None
+    return ip_address, request.headers.get("user-agent")
+
+class AuditWriter:
+    """Moves audit inserts off the request path.
+
+    record() appends the event to a write-ahead file and an in-memory queue and
+    returns immediately. A background flusher bulk-inserts queued events every
+    AUDIT_FLUSH_INTERVAL_MS or as soon as AUDIT_BATCH_SIZE are waiting. Inserts
+    ignore duplicate ids, so WAL segments left behind by a crash or a full queue
+    are simply replayed in full; a clean segment is deleted once every event in
+    it is stored.
+
+    Every worker writes its own segment and holds an exclusive flock on it while
+    it is open. Recovery only replays segments it can lock, so it never takes
+    the live segment of another worker; the kernel drops the lock when a worker
+    dies. Each event is flushed to the OS as it is recorded, which survives a
+    process crash. It is fsynced only when the segment rotates unless
+    AUDIT_WAL_FSYNC is set, so a power loss can lose events recorded since the
+    last flush, about AUDIT_FLUSH_INTERVAL_MS worth.
+    """
+
+    def __init__(self, session_factory=None, wal_dir: str = None, max_queue: int = None,
+                 batch_size: int = None, flush_interval_ms: int = None):
+        self.session_factory = session_factory
+        self.wal_dir = settings.AUDIT_WAL_DIR if wal_dir is None else wal_dir
+        self.max_queue = max_queue or settings.AUDIT_QUEUE_MAX
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms or settings.AUDIT_FLUSH_INTERVAL_MS) / 1000
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wal = None
+        self._wal_path = None
+        self._wal_dirty = False  # segment holds events that never reached the queue
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+        self._enqueued = 0
+        self._written = 0
+        self._spilled = 0
+        self._dropped = 0
+        self._failed_flushes = 0
+        self._last_flush_at = None
+        self._last_flush_ms = 0.0
+
+    # Producer side
+
+    def record(
+        self,
+        action: AuditAction,
+        user_id: Optional[str] = None,
+        resource_type: Optional[str] = None,
+        resource_id: Optional[str] = None,
+        details: Optional[str] = None,
+        request=None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None
+    ) -> Optional[str]:
+        """Queue an audit event and return its id without touching the database"""
+        if not settings.ENABLE_AUDIT_LOG:
+            return None
+
+        if request is not None:
+            ip_address, user_agent = _client_details(request)
+
+        event = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "action": action.name,
+            "resource_type": resource_type,
+            "resource_id": resource_id,
+            "details": details,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+
+        with self._lock:
+            logged = self._append_wal(event)
+            if len(self._queue) >= self.max_queue:
+                # The WAL copy is replayed once the backlog clears
+                if logged:
+                    self._spilled += 1
+                    self._wal_dirty = True
+                else:
+                    self._dropped += 1
+                return event["id"]
+            self._queue.append((time.monotonic(), event))
+            self._enqueued += 1
+            wake = len(self._queue) >= self.batch_size
+
+        if wake:
+            self._wake()
+        return event["id"]
+
+    def _append_wal(self, event: dict) -> bool:
+        if self._wal is None:
+            return False
+        try:
+            self._wal.write(json.dumps(event) + "\n")
+            self._wal.flush()
+            if settings.AUDIT_WAL_FSYNC:
+                os.fsync(self._wal.fileno())
+            return True
+        except OSError as e:
+            logger.error(f"Audit WAL write failed, continuing in memory only: {e}")
+            self._close_wal()
+            return False
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # WAL segments
+
+    def _open_wal(self):
+        if not self.wal_dir:
+            return
+        try:
+            os.makedirs(self.wal_dir, exist_ok=True)
+            name = f"audit-{time.time_ns()}-{os.getpid()}.wal"
+            # Lock under a name recovery does not list, then publish it, so no
+            # other worker can claim the segment between creating and locking it
+            pending_path = os.path.join(self.wal_dir, f".{name}")
+            wal = open(pending_path, "a", encoding="utf-8")
+            fcntl.flock(wal.fileno(), fcntl.LOCK_EX)
+            self._wal_path = os.path.join(self.wal_dir, name)
+            os.rename(pending_path, self._wal_path)
+            self._wal = wal
+            self._wal_dirty = False
+        except OSError as e:
+            logger.error(f"Audit WAL unavailable at {self.wal_dir}: {e}")
+            self._wal = None
+            self._wal_path = None
+
+    def _close_wal(self):
+        if self._wal is not None:
+            try:
+                self._wal.close()
+            except OSError:
+                pass
+        self._wal = None
+
+    def _rotate_wal(self) -> Optional[tuple]:
+        """Swap in a fresh segment once the queue is drained; returns (old path, dirty)"""
+        with self._lock:
+            if self._queue or self._wal is None or self._wal.tell() == 0:
+                return None
+            old_path, dirty = self._wal_path, self._wal_dirty
+            os.fsync(self._wal.fileno())
+            self._close_wal()
+            self._open_wal()
+            return old_path, dirty
+
+    def _pending_segments(self) -> List[str]:
+        if not self.wal_dir:
+            return []
+        return sorted(
+            path for path in glob.glob(os.path.join(self.wal_dir, "audit-*.wal"))
+            if path != self._wal_path
+        )
+
+    def _replay_segment(self, path: str) -> int:
+        """Insert a segment's events and delete it, unless another worker holds it"""
+        try:
+            segment = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return 0
+        with segment:
+            try:
+                fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # The live segment of another worker
+                return 0
+            if os.fstat(segment.fileno()).st_nlink == 0:
+                # Replayed and removed by someone else while we waited to open it
+                return 0
+            events = []
+            for line in segment:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    continue
+            replayed = 0
+            for start in range(0, len(events), self.batch_size):
+                replayed += self._insert(events[start:start + self.batch_size])
+            os.remove(path)
+        return replayed
+
+    # Consumer side
+
+    def _rows(self, events: List[dict]) -> List[dict]:
+        return [
+            dict(event, action=AuditAction[event["action"]], created_at=datetime.fromisoformat(event["created_at"]))
+            for event in events
+        ]
+
+    def _insert(self, events: List[dict]) -> int:
+        """Bulk insert with one executemany; falls back per row if a batch violates a constraint"""
+        if not events:
+            return 0
+        session_factory = self.session_factory
+        if session_factory is None:
+            from app.core.database import SessionLocal
+            session_factory = SessionLocal
+
+        table = AuditLog.__table__
+        statement = insert(table).on_conflict_do_nothing(
+            index_elements=["id", "created_at"]
+        ).returning(table.c.action, table.c.created_at)
+        rows = self._rows(events)
+        db = session_factory()
+        try:
+            try:
+                # Only rows actually inserted come back, so WAL replays never double count
+                inserted = db.execute(statement, rows).all()
+                record_activity(db, inserted)
+                db.commit()
+                return len(rows)
+            except IntegrityError:
+                db.rollback()
+
+            # Usually an event for a user deleted before the flush
+            written = 0
+            for row in rows:
+                try:
+                    inserted = db.execute(statement, [row]).all()
+                except IntegrityError:
+                    db.rollback()
+                    inserted = db.execute(statement, [dict(row, user_id=None)]).all()
+                record_activity(db, inserted)
+                db.commit()
+                written += 1
+            return written
+        finally:
+            db.close()
+
+    def flush(self) -> int:
+        """Write everything currently queued; blocking, used by the flusher and on shutdown"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                break
+
+            started = time.perf_counter()
+            try:
+                written += self._insert([event for _, event in batch])
+            except Exception:
+                with self._lock:
+                    self._queue.extendleft(reversed(batch))
+                    self._failed_flushes += 1
+                raise
+            with self._lock:
+                self._written += len(batch)
+                self._last_flush_at = datetime.now(timezone.utc)
+                self._last_flush_ms = (time.perf_counter() - started) * 1000
+
+        rotated = self._rotate_wal()
+        if rotated:
+            old_path, dirty = rotated
+            if dirty:
+                self._replay_segment(old_path)
+            else:
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+        return written
+
+    def recover(self) -> int:
+        """Replay segments left by a previous or crashed process"""
+        recovered = 0
+        for path in self._pending_segments():
+            try:
+                recovered += self._replay_segment(path)
+            except Exception as e:
+                logger.error(f"Failed to replay audit WAL segment {path}: {e}")
+        if recovered:
+            logger.info(f"Recovered {recovered} audit events from the write-ahead log")
+        return recovered
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        backoff = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await loop.run_in_executor(None, self.flush)
+                backoff = self.flush_interval
+            except Exception as e:
+                logger.error(f"Audit flush failed, retrying: {e}")
+                backoff = min(backoff * 2, 30)
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self._loop.run_in_executor(None, self.recover)
+        with self._lock:
+            self._open_wal()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self._loop.run_in_executor(None, self.flush)
+        except Exception as e:
+            logger.error(f"Final audit flush failed, events remain in the WAL: {e}")
+        with self._lock:
+            self._close_wal()
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = self._queue[0][0] if self._queue else None
+            return {
+                "queued": len(self._queue),
+                "lag_ms": round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0.0,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "spilled_to_wal": self._spilled,
+                "dropped": self._dropped,
+                "failed_flushes": self._failed_flushes,
+                "last_flush_at": self._last_flush_at.isoformat() if self._last_flush_at else None,
+                "last_flush_ms": round(self._last_flush_ms, 1),
+                "wal_enabled": self._wal is not None
+            }
+
+audit_writer = AuditWriter()
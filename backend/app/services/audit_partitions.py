@@ -0,0 +1,215 @@
+"""
+HealthStash - Audit Log Partition Maintenance
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from datetime import date, datetime, timezone
+from typing import List, Optional
+import gzip
+import logging
+import os
+import re
+import tempfile
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "audit_logs"
+DEFAULT_PARTITION = "audit_logs_default"
+ARCHIVE_PREFIX = "archive/audit_logs"
+_PARTITION_RE = re.compile(r"^audit_logs_y(\d{4})m(\d{2})$")
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"audit_logs_y{month.year:04d}m{month.month:02d}"
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_RE.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+def is_partitioned(conn) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :name AND relnamespace = 'public'::regnamespace"),
+        {"name": PARENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+def _create_partition(conn, month: date) -> int:
+    """Create a month's partition, moving across rows the default partition caught for it; returns rows moved"""
+    name = partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    in_month = "created_at >= :start AND created_at < :end"
+    create = (
+        f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    )
+
+    moved = conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds).scalar()
+    if not moved:
+        conn.execute(text(create))
+    else:
+        # A partition may not be created over rows the default partition holds, so
+        # they move across while it is detached, all in one transaction
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+        conn.execute(text(create))
+        conn.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    conn.commit()
+    return moved
+
+def ensure_partitions(months_ahead: int = None) -> List[str]:
+    """Create the default partition and monthly partitions through months_ahead"""
+    months_ahead = settings.AUDIT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(datetime.now(timezone.utc).date())
+    created = []
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            logger.warning("audit_logs is not partitioned; apply migrations/partition_audit_logs.sql")
+            return created
+
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        conn.commit()
+
+        existing = {
+            row[0] for row in conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :parent"
+            ), {"parent": PARENT_TABLE})
+        }
+
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            try:
+                _create_partition(conn, month)
+                created.append(name)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Could not create audit partition {name}: {e}")
+
+    if created:
+        logger.info(f"Created audit log partitions: {', '.join(created)}")
+    return created
+
+def drain_default_partition() -> dict:
+    """Move every month caught by the default partition into its own partition.
+
+    Retention only archives monthly partitions, so events written while their
+    month had no partition would otherwise be kept forever. Returns the rows
+    moved per partition and the rows left behind, which are logged.
+    """
+    result = {"moved": {}, "remaining": 0}
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return result
+
+        months = [row[0] for row in conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}"
+        ))]
+        for month in sorted(months):
+            name = partition_name(month)
+            try:
+                result["moved"][name] = _create_partition(conn, month)
+            except Exception as e:
+                # e.g. a detached table of that month is still waiting to be archived
+                conn.rollback()
+                logger.error(f"Could not move default partition rows into {name}: {e}")
+
+        result["remaining"] = conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+        conn.commit()
+
+    if result["remaining"]:
+        logger.warning(f"{result['remaining']} audit events remain in {DEFAULT_PARTITION} outside retention")
+    return result
+
+def _export_partition(name: str) -> str:
+    """COPY a partition into a gzipped CSV temp file and return its path"""
+    handle, path = tempfile.mkstemp(suffix=".csv.gz")
+    raw = engine.raw_connection()
+    try:
+        with os.fdopen(handle, "wb") as file, gzip.GzipFile(fileobj=file, mode="wb") as compressed:
+            cursor = raw.cursor()
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", compressed)
+            cursor.close()
+        return path
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        raw.close()
+
+def archive_old_partitions(retention_months: int = None) -> List[str]:
+    """Detach monthly partitions past retention, archive them to MinIO, then drop them.
+
+    Detached tables whose upload failed are picked up again on the next run.
+    """
+    retention_months = settings.AUDIT_RETENTION_MONTHS if retention_months is None else retention_months
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(datetime.now(timezone.utc).date()), -retention_months)
+    archived = []
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return archived
+
+        tables = conn.execute(text(
+            "SELECT c.relname, i.inhparent IS NOT NULL AS attached FROM pg_class c "
+            "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid "
+            "WHERE c.relkind = 'r' AND c.relname LIKE 'audit\\_logs\\_y%'"
+        )).all()
+
+        for name, attached in sorted(tables):
+            month = partition_month(name)
+            if month is None or month >= cutoff:
+                continue
+
+            if attached:
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                conn.commit()
+
+            path = _export_partition(name)
+            try:
+                object_name = f"{ARCHIVE_PREFIX}/{name}.csv.gz"
+                if not storage_service.put_object_file(path, object_name, content_type="application/gzip"):
+                    logger.error(f"Failed to archive audit partition {name}; keeping detached table")
+                    continue
+            finally:
+                os.remove(path)
+
+            conn.execute(text(f"DROP TABLE {name}"))
+            conn.commit()
+            archived.append(name)
+            logger.info(f"Archived audit partition {name} to {object_name}")
+
+    return archived
+
+def maintain_audit_partitions() -> dict:
+    """Scheduled job: run when a scheduler leader starts and daily after that"""
+    return {
+        "created": ensure_partitions(),
+        "default_partition": drain_default_partition(),
+        "archived": archive_old_partitions()
+    }
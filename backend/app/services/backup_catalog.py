@@ -0,0 +1,218 @@
+"""
+HealthStash - Backup Catalog
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.backup import BackupHistory, BackupStatus, BackupType
+from app.services.backup_pipeline import ARCHIVE_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "healthstash_backup_"
+ARCHIVE_SUFFIXES = (".tar.gz", ".tar.gz.enc", ARCHIVE_SUFFIX, ".sql", ".sql.gz")
+DISCOVERED_NOTES = "Automatic backup (cron)"
+# Archives still being written are left for the next scan
+SETTLE_SECONDS = 120
+HEARTBEAT_TIMEOUT_SECONDS = 90
+
+def is_archive(name: str) -> bool:
+    return name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIXES)
+
+def archive_timestamp(name: str) -> Optional[datetime]:
+    """Creation time encoded as healthstash_backup_YYYYMMDD_HHMMSS.<suffix>"""
+    try:
+        stamp = name[len(ARCHIVE_PREFIX):len(ARCHIVE_PREFIX) + 15]
+        return datetime.strptime(stamp, "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def _human_size(size: int) -> str:
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+        size /= 1024
+
+class BackupCatalog:
+    """Indexes archives on the shared backup volume into BackupHistory.
+
+    The directory is read with scandir and the (size, mtime) of every archive is
+    cached, so a periodic refresh touches the database only for archives that
+    appeared, changed or disappeared since the last scan. Admin listings are
+    then plain queries on backup_history.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.BACKUP_DIR
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._reconciled = False
+
+    def _read_directory(self) -> Dict[str, Tuple[int, int]]:
+        entries = {}
+        settled_before = time.time_ns() - SETTLE_SECONDS * 1_000_000_000
+        try:
+            with os.scandir(self.root) as iterator:
+                for entry in iterator:
+                    if not is_archive(entry.name) or not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime_ns > settled_before:
+                        continue
+                    entries[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def refresh(self) -> dict:
+        """Sync BackupHistory with the directory; returns counts of what changed"""
+        with self._lock:
+            current = self._read_directory()
+            changed = {path: stat for path, stat in current.items() if self._stats.get(path) != stat}
+            removed = set(self._stats) - set(current)
+            counts = {"files": len(current), "added": 0, "updated": 0, "removed": 0}
+
+            if changed or removed or not self._reconciled:
+                db = SessionLocal()
+                try:
+                    self._sync(db, current, changed, removed, counts)
+                    db.commit()
+                finally:
+                    db.close()
+                self._reconciled = True
+
+            self._stats = current
+            return counts
+
+    def _sync(self, db, current: dict, changed: dict, removed: set, counts: dict):
+        if changed:
+            rows = db.query(BackupHistory).filter(BackupHistory.file_path.in_(list(changed))).all()
+            known = {row.file_path: row for row in rows}
+            discovered = []
+            for path, (size, mtime_ns) in changed.items():
+                row = known.get(path)
+                if row is None:
+                    discovered.append(self._discovered(path, size, mtime_ns))
+                elif row.file_size != size and row.status == BackupStatus.COMPLETED:
+                    row.file_size = size
+                    row.size_mb = round(size / (1024 * 1024), 2)
+                    counts["updated"] += 1
+            if discovered:
+                # file_path is unique; a path another worker's scan or the backup job
+                # recorded since the lookup above is skipped, not duplicated
+                table = BackupHistory.__table__
+                statement = insert(table).values(discovered).on_conflict_do_nothing(
+                    index_elements=["file_path"]
+                ).returning(table.c.id)
+                counts["added"] += len(db.execute(statement).all())
+
+        # Rows of archives deleted by retention; the cache starts empty, so the
+        # first scan compares against every discovered row instead
+        candidates = db.query(BackupHistory).filter(
+            BackupHistory.notes == DISCOVERED_NOTES,
+            BackupHistory.status == BackupStatus.COMPLETED
+        )
+        if self._reconciled:
+            if not removed:
+                return
+            candidates = candidates.filter(BackupHistory.file_path.in_(list(removed)))
+        for row in candidates.all():
+            if row.file_path not in current and row.file_path.startswith(self.root):
+                db.delete(row)
+                counts["removed"] += 1
+
+    @staticmethod
+    def _discovered(path: str, size: int, mtime_ns: int) -> dict:
+        """Column values of a BackupHistory row for an archive found on the volume"""
+        name = os.path.basename(path)
+        created = archive_timestamp(name) or datetime.fromtimestamp(mtime_ns / 1e9, tz=timezone.utc)
+        return {
+            "id": str(uuid.uuid4()),
+            "backup_type": BackupType.FULL,
+            "status": BackupStatus.COMPLETED,
+            "file_path": path,
+            "file_size": size,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "created_at": created,
+            "completed_at": created,
+            "notes": DISCOVERED_NOTES,
+            "includes_database": True,
+            "includes_files": not name.endswith((".sql", ".sql.gz")),
+            "includes_config": False
+        }
+
+    @staticmethod
+    def release_path(db, path: str, backup_id: str):
+        """Drop a discovered row for an archive its own backup job is about to record.
+
+        A slow job can finish after the scan indexed its archive; file_path is
+        unique, so the job's row takes the path over instead of failing.
+        """
+        db.query(BackupHistory).filter(
+            BackupHistory.file_path == path,
+            BackupHistory.id != backup_id,
+            BackupHistory.notes == DISCOVERED_NOTES
+        ).delete(synchronize_session=False)
+
+    def remove(self, path: str):
+        """Delete an archive from the volume; paths outside it are refused"""
+        root = os.path.realpath(self.root)
+        real = os.path.realpath(path)
+        if os.path.dirname(real) != root or not is_archive(os.path.basename(real)):
+            raise ValueError(f"Not a backup archive: {path}")
+        with self._lock:
+            try:
+                os.remove(real)
+            except FileNotFoundError:
+                pass
+            self._stats.pop(path, None)
+
+    def status(self) -> dict:
+        """Backup container and volume status from files on the shared volume.
+
+        The container's entrypoint touches triggers/.heartbeat and records its
+        cron schedule in triggers/.schedule.
+        """
+        triggers = os.path.join(self.root, "triggers")
+        try:
+            heartbeat_age = time.time() - os.stat(os.path.join(triggers, ".heartbeat")).st_mtime
+        except OSError:
+            heartbeat_age = None
+        try:
+            with open(os.path.join(triggers, ".schedule")) as f:
+                schedule = f.read().strip() or None
+        except OSError:
+            schedule = None
+
+        disk_usage = {}
+        try:
+            usage = shutil.disk_usage(self.root)
+            disk_usage = {
+                "total": _human_size(usage.total),
+                "used": _human_size(usage.used),
+                "available": _human_size(usage.free),
+                "percent": f"{round(usage.used / usage.total * 100)}%" if usage.total else "0%"
+            }
+        except OSError:
+            pass
+
+        return {
+            "container_running": heartbeat_age is not None and heartbeat_age < HEARTBEAT_TIMEOUT_SECONDS,
+            "cron_schedule": schedule,
+            "disk_usage": disk_usage
+        }
+
+backup_catalog = BackupCatalog()
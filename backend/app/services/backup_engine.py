@@ -0,0 +1,467 @@
+"""
+HealthStash - Incremental Object Backup Engine
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_VERSION = 1
+
+def user_object_prefixes(user_id: str) -> Tuple[str, ...]:
+    """Where one user's objects live: record files and payment attachments"""
+    return (f"{user_id}/", f"payments/{user_id}/")
+
+class BackupError(Exception):
+    """Raised when the repository is inconsistent or a blob fails verification"""
+
+class PackReader:
+    """File-like view of one blob inside a packfile that hashes what it hands out.
+
+    With an expected digest the last read raises BackupError on a mismatch, so
+    an upload consuming the reader fails before corrupt data is committed.
+    """
+
+    def __init__(self, path: str, offset: int, length: int, expected: str = None):
+        self._file = open(path, "rb")
+        self._file.seek(offset)
+        self._remaining = length
+        self._expected = expected
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        if not data:
+            raise BackupError("Backup pack is truncated")
+        self._remaining -= len(data)
+        self.digest.update(data)
+        if self._remaining == 0 and self._expected and self.digest.hexdigest() != self._expected:
+            raise BackupError(f"Blob {self._expected} failed verification")
+        return data
+
+    def close(self):
+        self._file.close()
+
+class BackupRepository:
+    """Content-addressed store of MinIO objects on the backup volume.
+
+    Layout under the repository directory:
+      packs/<id>.pack      blobs appended back to back
+      packs/<id>.idx       JSON lines of {blob, offset, length}, written when the pack is sealed
+      manifests/<id>.json.gz
+      manifests/index.jsonl
+
+    A blob is the SHA-256 of an object's stored bytes, so identical objects are
+    kept once. A full manifest lists every object; an incremental one lists only
+    objects added or changed since its parent plus the names deleted. The state at
+    any backup is rebuilt by replaying manifests from the last full one. Packs are
+    sealed before the manifest that references them is written, so a crash never
+    leaves a manifest pointing at missing data; unsealed packs are discarded.
+    """
+
+    def __init__(self, root: str = None, storage=None, pack_size_mb: int = None):
+        self.root = root or settings.BACKUP_REPOSITORY_DIR
+        self.packs_dir = os.path.join(self.root, "packs")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+        self.pack_size = (pack_size_mb or settings.BACKUP_PACK_SIZE_MB) * 1024 * 1024
+        self._storage = storage
+        self._blobs: Dict[str, Tuple[str, int, int]] = {}
+        self._pack = None
+        self._pack_id = None
+        self._pack_entries: List[dict] = []
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from app.services.storage import storage_service
+            self._storage = storage_service
+        return self._storage
+
+    # Repository bookkeeping
+
+    def _open(self):
+        os.makedirs(self.packs_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        self._load_blob_index()
+
+    def _lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        handle = open(os.path.join(self.root, ".lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            raise BackupError("Another backup or restore is using the repository")
+        return handle
+
+    def _load_blob_index(self):
+        self._blobs = {}
+        for name in sorted(os.listdir(self.packs_dir)):
+            path = os.path.join(self.packs_dir, name)
+            if name.endswith(".pack") and not os.path.exists(path[:-5] + ".idx"):
+                # Left by a run that died before sealing; nothing references it
+                logger.warning(f"Removing unsealed backup pack {name}")
+                os.remove(path)
+            elif name.endswith(".idx"):
+                pack_id = name[:-4]
+                with open(path, "r", encoding="utf-8") as index:
+                    for line in index:
+                        entry = json.loads(line)
+                        self._blobs[entry["blob"]] = (pack_id, entry["offset"], entry["length"])
+
+    def pack_path(self, pack_id: str) -> str:
+        return os.path.join(self.packs_dir, f"{pack_id}.pack")
+
+    def manifest_path(self, manifest_id: str) -> str:
+        return os.path.join(self.manifests_dir, f"{manifest_id}.json.gz")
+
+    def manifests(self) -> List[dict]:
+        """Summary line of every committed manifest, oldest first"""
+        path = os.path.join(self.manifests_dir, "index.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as index:
+            return [json.loads(line) for line in index if line.strip()]
+
+    def read_manifest(self, manifest_id: str) -> dict:
+        path = self.manifest_path(manifest_id)
+        if not os.path.exists(path):
+            raise BackupError(f"Manifest {manifest_id} not found")
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest: dict):
+        path = self.manifest_path(manifest["id"])
+        temp = path + ".tmp"
+        with gzip.open(temp, "wt", encoding="utf-8") as file:
+            json.dump(manifest, file, separators=(",", ":"))
+        os.replace(temp, path)
+
+        summary = {key: manifest[key] for key in ("id", "type", "parent", "created_at")}
+        summary["objects"] = len(manifest["objects"])
+        summary["deleted"] = len(manifest["deleted"])
+        with open(os.path.join(self.manifests_dir, "index.jsonl"), "a", encoding="utf-8") as index:
+            index.write(json.dumps(summary) + "\n")
+            index.flush()
+            os.fsync(index.fileno())
+
+    def chain(self, manifest_id: str) -> List[dict]:
+        """Manifests to replay for a backup, from its full ancestor forward"""
+        by_id = {entry["id"]: entry for entry in self.manifests()}
+        chain = []
+        current = by_id.get(manifest_id)
+        if current is None:
+            raise BackupError(f"Manifest {manifest_id} not found")
+        while True:
+            chain.append(current)
+            if current["type"] == "full":
+                break
+            current = by_id.get(current["parent"])
+            if current is None:
+                raise BackupError(f"Manifest chain of {manifest_id} is broken")
+        return list(reversed(chain))
+
+    def state(self, manifest_id: str) -> Dict[str, dict]:
+        """Object name -> entry as it was when the given backup ran"""
+        objects = {}
+        for entry in self.chain(manifest_id):
+            manifest = self.read_manifest(entry["id"])
+            if manifest["type"] == "full":
+                objects = {}
+            for name in manifest["deleted"]:
+                objects.pop(name, None)
+            objects.update(manifest["objects"])
+        return objects
+
+    def manifest_at(self, moment: datetime) -> Optional[str]:
+        """Latest manifest created at or before moment, for point-in-time restore"""
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        candidate = None
+        for entry in self.manifests():
+            if datetime.fromisoformat(entry["created_at"]) <= moment:
+                candidate = entry["id"]
+        return candidate
+
+    # Packs
+
+    def _start_pack(self):
+        self._pack_id = uuid.uuid4().hex
+        self._pack = open(self.pack_path(self._pack_id), "wb")
+        self._pack_entries = []
+
+    def _seal_pack(self):
+        if self._pack is None:
+            return
+        self._pack.flush()
+        os.fsync(self._pack.fileno())
+        self._pack.close()
+        if self._pack_entries:
+            index_path = os.path.join(self.packs_dir, f"{self._pack_id}.idx")
+            with open(index_path + ".tmp", "w", encoding="utf-8") as index:
+                for entry in self._pack_entries:
+                    index.write(json.dumps(entry) + "\n")
+                index.flush()
+                os.fsync(index.fileno())
+            os.replace(index_path + ".tmp", index_path)
+        else:
+            os.remove(self.pack_path(self._pack_id))
+        self._pack = None
+        self._pack_id = None
+        self._pack_entries = []
+
+    def _discard_pack(self):
+        if self._pack is None:
+            return
+        self._pack.close()
+        os.remove(self.pack_path(self._pack_id))
+        for entry in self._pack_entries:
+            self._blobs.pop(entry["blob"], None)
+        self._pack = None
+        self._pack_id = None
+        self._pack_entries = []
+
+    def add_blob(self, chunks: Iterable[bytes]) -> Tuple[str, int, bool]:
+        """Stream content into the open pack; returns (blob, length, stored).
+
+        Content already in the repository is truncated away again, so each blob
+        is written once no matter how many objects or backups share it.
+        """
+        if self._pack is None:
+            self._start_pack()
+        offset = self._pack.tell()
+        digest = hashlib.sha256()
+        length = 0
+        for chunk in chunks:
+            self._pack.write(chunk)
+            digest.update(chunk)
+            length += len(chunk)
+        blob = digest.hexdigest()
+
+        if blob in self._blobs:
+            self._pack.seek(offset)
+            self._pack.truncate()
+            return blob, length, False
+
+        self._blobs[blob] = (self._pack_id, offset, length)
+        self._pack_entries.append({"blob": blob, "offset": offset, "length": length})
+        if self._pack.tell() >= self.pack_size:
+            self._seal_pack()
+        return blob, length, True
+
+    def open_blob(self, blob: str, verify: bool = False) -> PackReader:
+        location = self._blobs.get(blob)
+        if location is None:
+            raise BackupError(f"Blob {blob} is not in any sealed pack")
+        pack_id, offset, length = location
+        return PackReader(self.pack_path(pack_id), offset, length, expected=blob if verify else None)
+
+    def blob_length(self, blob: str) -> int:
+        return self._blobs[blob][2]
+
+    # Backup
+
+    def _excluded(self, name: str) -> bool:
+        prefixes = [prefix.strip() for prefix in settings.BACKUP_EXCLUDE_PREFIXES.split(",") if prefix.strip()]
+        return any(name.startswith(prefix) for prefix in prefixes)
+
+    def _next_type(self, full: bool) -> Tuple[str, Optional[str]]:
+        manifests = self.manifests()
+        if full or not manifests:
+            return "full", manifests[-1]["id"] if manifests else None
+        since_full = 0
+        for entry in reversed(manifests):
+            if entry["type"] == "full":
+                break
+            since_full += 1
+        if since_full >= settings.BACKUP_FULL_INTERVAL:
+            return "full", manifests[-1]["id"]
+        return "incremental", manifests[-1]["id"]
+
+    def backup(self, manifest_id: str = None, full: bool = False, progress=None) -> dict:
+        """Copy new and changed objects into packs and commit a manifest.
+
+        Unchanged objects are recognised by size and ETag without downloading
+        them. Returns counters for BackupHistory.
+        """
+        manifest_id = manifest_id or uuid.uuid4().hex
+        lock = self._lock()
+        try:
+            self._open()
+            backup_type, parent = self._next_type(full)
+            previous = self.state(parent) if parent else {}
+            objects, changes = {}, {}
+            stats = {
+                "scanned": 0, "added": 0, "changed": 0, "unchanged": 0, "deleted": 0,
+                "bytes_scanned": 0, "bytes_copied": 0, "bytes_deduplicated": 0, "new_blobs": 0
+            }
+
+            try:
+                for item in self.storage.iter_objects():
+                    name = item.object_name
+                    if self._excluded(name):
+                        continue
+                    stats["scanned"] += 1
+                    stats["bytes_scanned"] += item.size or 0
+                    etag = (item.etag or "").strip('"')
+                    known = previous.get(name)
+
+                    if known and known["size"] == item.size and known["etag"] == etag:
+                        objects[name] = known
+                        stats["unchanged"] += 1
+                        continue
+
+                    blob, length, stored = self.add_blob(self.storage.iter_object(name, CHUNK_SIZE))
+                    entry = {
+                        "size": length,
+                        "etag": etag,
+                        "modified": item.last_modified.isoformat() if item.last_modified else None,
+                        "blob": blob
+                    }
+                    objects[name] = changes[name] = entry
+                    stats["changed" if known else "added"] += 1
+                    if stored:
+                        stats["new_blobs"] += 1
+                        stats["bytes_copied"] += length
+                    else:
+                        stats["bytes_deduplicated"] += length
+                    if progress:
+                        progress(stats)
+
+                self._seal_pack()
+            except Exception:
+                self._discard_pack()
+                raise
+
+            deleted = sorted(set(previous) - set(objects))
+            stats["deleted"] = len(deleted)
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "id": manifest_id,
+                "type": backup_type,
+                "parent": parent,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "bucket": getattr(self.storage, "bucket_name", None),
+                "objects": objects if backup_type == "full" else changes,
+                "deleted": [] if backup_type == "full" else deleted,
+                "stats": stats
+            }
+            self._write_manifest(manifest)
+            logger.info(
+                f"Object backup {manifest_id} ({backup_type}): {stats['added']} added, "
+                f"{stats['changed']} changed, {stats['deleted']} deleted, {stats['bytes_copied']} bytes copied"
+            )
+            return dict(stats, manifest=manifest_id, type=backup_type, parent=parent)
+        finally:
+            lock.close()
+
+    # Restore
+
+    def restore(self, manifest_id: str, prefix: Union[str, Tuple[str, ...]] = "", only: Optional[Iterable[str]] = None,
+                skip_unchanged: bool = True, workers: int = None) -> dict:
+        """Put every object of a backup's state back into MinIO, verifying each blob
+        while it streams. Uploads run on BACKUP_RESTORE_WORKERS threads.
+
+        prefix may be a tuple to restore several prefixes, such as
+        user_object_prefixes(). Objects whose current size and ETag already
+        match are skipped; objects created after the backup are left alone.
+        """
+        prefixes = (prefix,) if isinstance(prefix, str) else tuple(prefix)
+        lock = self._lock()
+        try:
+            self._open()
+            objects = self.state(manifest_id)
+            wanted = set(only) if only is not None else None
+            current = {}
+            if skip_unchanged:
+                current = {
+                    item.object_name: (item.size, (item.etag or "").strip('"'))
+                    for scope in prefixes
+                    for item in self.storage.iter_objects(scope)
+                }
+
+            stats = {"restored": 0, "skipped": 0, "failed": 0, "bytes_restored": 0}
+            pending = []
+            for name, entry in objects.items():
+                if not name.startswith(prefixes) or (wanted is not None and name not in wanted):
+                    continue
+                if current.get(name) == (entry["size"], entry["etag"]):
+                    stats["skipped"] += 1
+                    continue
+                pending.append((name, entry))
+
+            with ThreadPoolExecutor(max_workers=workers or settings.BACKUP_RESTORE_WORKERS) as pool:
+                outcomes = pool.map(lambda item: self._restore_object(*item), pending)
+                for (name, entry), restored in zip(pending, outcomes):
+                    if restored:
+                        stats["restored"] += 1
+                        stats["bytes_restored"] += entry["size"]
+                    else:
+                        stats["failed"] += 1
+            return dict(stats, manifest=manifest_id)
+        finally:
+            lock.close()
+
+    def _restore_object(self, name: str, entry: dict) -> bool:
+        reader = self.open_blob(entry["blob"], verify=True)
+        try:
+            return self.storage.put_object_stream(reader, name, length=self.blob_length(entry["blob"]))
+        except BackupError as e:
+            logger.error(f"Backup blob for {name} failed verification: {e}")
+            return False
+        finally:
+            reader.close()
+
+def run_object_backup(backup_id: str, full: bool = False, progress=None):
+    """Blocking job body for BackupType.INCREMENTAL: run the engine and record the outcome"""
+    from app.core.database import SessionLocal
+    from app.models.backup import BackupHistory, BackupStatus
+
+    repository = BackupRepository()
+    db = SessionLocal()
+    try:
+        backup = db.get(BackupHistory, backup_id)
+        if backup is None:
+            return
+        try:
+            result = repository.backup(manifest_id=backup_id, full=full, progress=progress)
+            backup.status = BackupStatus.COMPLETED
+            backup.file_path = repository.manifest_path(backup_id)
+            backup.file_size = result["bytes_copied"]
+            backup.size_mb = round(result["bytes_copied"] / (1024 * 1024), 2)
+            backup.notes = (
+                f"{result['type'].capitalize()} object backup: {result['added']} added, "
+                f"{result['changed']} changed, {result['deleted']} deleted, {result['unchanged']} unchanged"
+            )
+        except Exception as e:
+            logger.error(f"Object backup {backup_id} failed: {e}")
+            backup.status = BackupStatus.FAILED
+            backup.error_message = str(e)
+
+        backup.completed_at = datetime.now(timezone.utc)
+        if backup.started_at:
+            started = backup.started_at
+            if started.tzinfo is None:
+                started = started.replace(tzinfo=timezone.utc)
+            backup.duration_seconds = int((backup.completed_at - started).total_seconds())
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,354 @@
+"""
+HealthStash - Backup Job Channel
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import engine
+from app.models.backup import BackupJob, BackupType
+
+logger = logging.getLogger(__name__)
+
+JOBS_CHANNEL = "backup_jobs"
+PROGRESS_CHANNEL = "backup_progress"
+PROGRESS_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 30
+
+def enqueue_backup_job(db: Session, backup_id: str, backup_type: BackupType):
+    """Queue a backup in the caller's transaction; the NOTIFY is delivered on commit"""
+    db.add(BackupJob(id=backup_id, backup_type=backup_type))
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": JOBS_CHANNEL, "payload": backup_id})
+
+def publish_progress(backup_id: str, event: dict):
+    """Store the latest progress on BackupHistory and broadcast it to every process.
+
+    Missing byte counts keep the stored value, so a finished backup retains the
+    total it processed for the next run's estimate.
+    """
+    event = dict(event, backup_id=backup_id)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE backup_history SET
+                progress_stage = :stage,
+                progress_bytes = COALESCE(:bytes, progress_bytes),
+                progress_total_bytes = COALESCE(:total_bytes, progress_total_bytes),
+                progress_eta_seconds = :eta_seconds,
+                progress_updated_at = :now
+            WHERE id = :id
+        """), {
+            "id": backup_id,
+            "stage": event.get("stage"),
+            "bytes": event.get("bytes"),
+            "total_bytes": event.get("total_bytes"),
+            "eta_seconds": event.get("eta_seconds"),
+            "now": datetime.now(timezone.utc)
+        })
+        conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                     {"channel": PROGRESS_CHANNEL, "payload": json.dumps(event, default=str)})
+
+def _expected_bytes(backup_id: str) -> Optional[int]:
+    """Bytes the previous completed backup of the same type processed, for the ETA"""
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT previous.progress_bytes FROM backup_history current
+            JOIN backup_history previous ON previous.backup_type = current.backup_type
+            WHERE current.id = :id AND previous.status = 'COMPLETED' AND previous.progress_bytes > 0
+            ORDER BY previous.completed_at DESC LIMIT 1
+        """), {"id": backup_id}).scalar()
+
+class ProgressReporter:
+    """Progress callback for the backup engine and pipeline.
+
+    Stages run concurrently, so the latest byte count of each stage is summed.
+    Updates are throttled to one per PROGRESS_INTERVAL except stage changes.
+    """
+
+    def __init__(self, backup_id: str, expected: Optional[int] = None, publish=publish_progress):
+        self.backup_id = backup_id
+        self.started = time.monotonic()
+        self.expected = expected
+        self._publish = publish
+        self._stage_bytes: Dict[str, int] = {}
+        self._last_sent = 0.0
+        self._last_stage = None
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, values: dict):
+        """Record the bytes a stage has processed so far and publish if due"""
+        processed = values.get("bytes_scanned", values.get("bytes", 0)) or 0
+        with self._lock:
+            self._stage_bytes[stage] = processed
+            now = time.monotonic()
+            if stage == self._last_stage and now - self._last_sent < PROGRESS_INTERVAL:
+                return
+            self._last_sent, self._last_stage = now, stage
+            total = sum(self._stage_bytes.values())
+
+        eta = None
+        elapsed = now - self.started
+        if self.expected and 0 < total < self.expected and elapsed > 0:
+            eta = int(elapsed / total * (self.expected - total))
+        try:
+            self._publish(self.backup_id, {
+                "status": "in_progress",
+                "stage": stage,
+                "bytes": total,
+                "total_bytes": self.expected,
+                "eta_seconds": eta
+            })
+        except Exception as e:
+            logger.warning(f"Could not publish progress for backup {self.backup_id}: {e}")
+
+def claim_next_job(worker_id: str) -> Optional[Tuple[str, BackupType]]:
+    """Take the oldest queued job if no backup is running anywhere.
+
+    The advisory lock serialises claimers across processes, so two workers can
+    never both see an idle queue and start backups against the same repository.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('backup_jobs'))"))
+        row = conn.execute(text("""
+            UPDATE backup_jobs SET status = 'RUNNING', claimed_by = :worker, started_at = :now, heartbeat_at = :now
+            WHERE id = (
+                SELECT id FROM backup_jobs
+                WHERE status = 'QUEUED'
+                  AND NOT EXISTS (SELECT 1 FROM backup_jobs WHERE status = 'RUNNING')
+                ORDER BY created_at
+                LIMIT 1
+            )
+            RETURNING id, backup_type
+        """), {"worker": worker_id, "now": datetime.now(timezone.utc)}).first()
+        if row is None:
+            return None
+        conn.execute(text(
+            "UPDATE backup_history SET status = 'IN_PROGRESS', started_at = :now WHERE id = :id"
+        ), {"id": row.id, "now": datetime.now(timezone.utc)})
+    return row.id, BackupType[row.backup_type]
+
+def _finish_job(backup_id: str):
+    with engine.begin() as conn:
+        status = conn.execute(text("SELECT status FROM backup_history WHERE id = :id"), {"id": backup_id}).scalar()
+        conn.execute(text(
+            "UPDATE backup_jobs SET status = :status, finished_at = :now WHERE id = :id"
+        ), {"id": backup_id, "status": "DONE" if status == "COMPLETED" else "FAILED", "now": datetime.now(timezone.utc)})
+    publish_progress(backup_id, {"status": (status or "FAILED").lower(), "stage": "finished"})
+
+def fail_stale_backup_jobs() -> int:
+    """Fail running jobs whose worker stopped sending heartbeats, e.g. after a crash"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.BACKUP_JOB_HEARTBEAT_TIMEOUT_SECONDS)
+    with engine.begin() as conn:
+        stale = conn.execute(text("""
+            UPDATE backup_jobs SET status = 'FAILED', finished_at = :now
+            WHERE status = 'RUNNING' AND heartbeat_at < :cutoff
+            RETURNING id
+        """), {"cutoff": cutoff, "now": datetime.now(timezone.utc)}).scalars().all()
+        if stale:
+            conn.execute(text("""
+                UPDATE backup_history SET status = 'FAILED', completed_at = :now,
+                       error_message = 'Backup worker stopped responding'
+                WHERE id = ANY(:ids) AND status IN ('PENDING', 'IN_PROGRESS')
+            """), {"ids": list(stale), "now": datetime.now(timezone.utc)})
+    for backup_id in stale:
+        logger.warning(f"Backup job {backup_id} lost its worker, marked as failed")
+        publish_progress(backup_id, {"status": "failed", "stage": "finished"})
+    return len(stale)
+
+# Backups run by the backup container report no heartbeat, only a start time
+CONTAINER_BACKUP_TIMEOUT = timedelta(minutes=5)
+
+def fail_unqueued_backups(older_than: Optional[timedelta] = None,
+                          reason: str = "Backup interrupted by server restart") -> int:
+    """Fail in-progress backups outside the job queue, optionally only those started before older_than ago.
+
+    Queued backups may be running in another worker process; their heartbeats decide.
+    """
+    from app.core.database import SessionLocal
+    from app.models.backup import BackupHistory, BackupStatus
+
+    db = SessionLocal()
+    try:
+        query = db.query(BackupHistory).filter(
+            BackupHistory.status == BackupStatus.IN_PROGRESS,
+            BackupHistory.id.notin_(db.query(BackupJob.id).statement)
+        )
+        if older_than is not None:
+            query = query.filter(BackupHistory.started_at < datetime.now(timezone.utc) - older_than)
+        stuck_backups = query.all()
+
+        for backup in stuck_backups:
+            logger.warning(f"Found stuck backup {backup.id}, marking as failed: {reason}")
+            backup.status = BackupStatus.FAILED
+            backup.error_message = reason
+            backup.completed_at = datetime.now(timezone.utc)
+            if backup.started_at:
+                started = backup.started_at
+                if started.tzinfo is None:
+                    started = started.replace(tzinfo=timezone.utc)
+                backup.duration_seconds = int((backup.completed_at - started).total_seconds())
+
+        if stuck_backups:
+            db.commit()
+        return len(stuck_backups)
+    finally:
+        db.close()
+
+def check_backup_timeouts() -> dict:
+    """Scheduled job: fail container backups past their timeout and queued jobs whose worker died"""
+    return {
+        "timed_out": fail_unqueued_backups(CONTAINER_BACKUP_TIMEOUT, "Backup timeout - took longer than 5 minutes"),
+        "stale_jobs": fail_stale_backup_jobs()
+    }
+
+class BackupChannel:
+    """Per-process LISTEN connection plus the job worker.
+
+    NOTIFY on backup_jobs wakes the worker immediately; a slow poll only covers
+    notifications missed while reconnecting. NOTIFY on backup_progress is fanned
+    out to the asyncio queues of SSE clients watching that backup.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    # Progress fan-out
+
+    def subscribe(self, backup_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.setdefault(backup_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, backup_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(backup_id, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(backup_id, None)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        # A client that stopped reading only loses intermediate progress
+        if not queue.full():
+            queue.put_nowait(event)
+
+    def _dispatch(self, channel: str, payload: str):
+        if channel == JOBS_CHANNEL:
+            self._wake.set()
+            return
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.get("backup_id"), ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    # Threads
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(settings.DATABASE_URL)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {JOBS_CHANNEL}; LISTEN {PROGRESS_CHANNEL};")
+                # Anything queued while we were disconnected
+                self._wake.set()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                logger.error(f"Backup channel listener error, reconnecting: {e}")
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _heartbeat(self, backup_id: str, done: threading.Event):
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("UPDATE backup_jobs SET heartbeat_at = :now WHERE id = :id"),
+                                 {"id": backup_id, "now": datetime.now(timezone.utc)})
+            except Exception as e:
+                logger.warning(f"Backup heartbeat failed for {backup_id}: {e}")
+
+    def _run_job(self, backup_id: str, backup_type: BackupType):
+        from app.services.backup_engine import run_object_backup
+        from app.services.backup_pipeline import run_full_backup
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(backup_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            reporter = ProgressReporter(backup_id, expected=_expected_bytes(backup_id))
+            publish_progress(backup_id, {"status": "in_progress", "stage": "starting", "bytes": 0,
+                                         "total_bytes": reporter.expected})
+            if backup_type == BackupType.INCREMENTAL:
+                run_object_backup(backup_id, progress=lambda stats: reporter("objects", stats))
+            else:
+                run_full_backup(backup_id, progress=reporter)
+        finally:
+            done.set()
+            _finish_job(backup_id)
+
+    def _work(self):
+        while not self._stop.is_set():
+            self._wake.wait(timeout=settings.BACKUP_JOB_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                while not self._stop.is_set():
+                    job = claim_next_job(self.worker_id)
+                    if job is None:
+                        break
+                    logger.info(f"Backup worker {self.worker_id} claimed job {job[0]}")
+                    self._run_job(*job)
+            except Exception as e:
+                logger.error(f"Backup worker error: {e}")
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        targets = [("backup-listener", self._listen)]
+        if settings.BACKUP_WORKER_ENABLED:
+            targets.append(("backup-worker", self._work))
+        for name, target in targets:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        # A running backup is not interrupted; its job fails by heartbeat if the process exits
+        self._stop.set()
+        self._wake.set()
+        self._threads = []
+
+backup_channel = BackupChannel()
@@ -0,0 +1,352 @@
+"""
+HealthStash - Streaming Backup Pipeline
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, Optional
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+
+import zstandard
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.exceptions import InvalidTag
+
+from app.core.config import settings
+from app.services.backup_engine import BackupError, BackupRepository
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".tar.zst.aes"
+MAGIC = b"HSBK\x01"
+FRAME_SIZE = 4 * 1024 * 1024
+KDF_ITERATIONS = 200000
+
+def derive_backup_key(salt: bytes, passphrase: str = None) -> bytes:
+    passphrase = passphrase or settings.BACKUP_ENCRYPTION_KEY or settings.ENCRYPTION_KEY
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+    return kdf.derive(passphrase.encode())
+
+class EncryptingWriter:
+    """AES-256-GCM in independently authenticated frames, so archives of any size
+    are encrypted as they stream.
+
+    Layout: MAGIC, 16-byte salt, 8-byte nonce prefix, then frames of a 4-byte
+    length and ciphertext. Each nonce is the prefix plus the frame counter and
+    the last frame is authenticated as final, so reordered or truncated archives
+    fail to decrypt.
+    """
+
+    def __init__(self, target, passphrase: str = None, frame_size: int = FRAME_SIZE):
+        salt = os.urandom(16)
+        self._aead = AESGCM(derive_backup_key(salt, passphrase))
+        self._prefix = os.urandom(8)
+        self._counter = 0
+        self._buffer = bytearray()
+        self._frame_size = frame_size
+        self._target = target
+        self._target.write(MAGIC + salt + self._prefix)
+
+    def _emit(self, frame: bytes, final: bool):
+        nonce = self._prefix + self._counter.to_bytes(4, "big")
+        sealed = self._aead.encrypt(nonce, frame, b"\x01" if final else b"\x00")
+        self._target.write(len(sealed).to_bytes(4, "big") + sealed)
+        self._counter += 1
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._frame_size:
+            self._emit(bytes(self._buffer[:self._frame_size]), final=False)
+            del self._buffer[:self._frame_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._emit(bytes(self._buffer), final=True)
+        self._buffer.clear()
+
+class DecryptingReader:
+    """Readable plaintext view of an EncryptingWriter stream"""
+
+    def __init__(self, source, passphrase: str = None):
+        header = source.read(len(MAGIC) + 24)
+        if len(header) != len(MAGIC) + 24 or not header.startswith(MAGIC):
+            raise BackupError("Not a HealthStash backup archive")
+        salt = header[len(MAGIC):len(MAGIC) + 16]
+        self._prefix = header[len(MAGIC) + 16:]
+        self._aead = AESGCM(derive_backup_key(salt, passphrase))
+        self._source = source
+        self._counter = 0
+        self._buffer = b""
+        self._finished = False
+
+    def _next_frame(self):
+        length = self._source.read(4)
+        if len(length) < 4:
+            raise BackupError("Backup archive is truncated")
+        sealed = self._source.read(int.from_bytes(length, "big"))
+        nonce = self._prefix + self._counter.to_bytes(4, "big")
+        self._counter += 1
+        for final in (False, True):
+            try:
+                frame = self._aead.decrypt(nonce, sealed, b"\x01" if final else b"\x00")
+            except InvalidTag:
+                continue
+            self._finished = final
+            return frame
+        raise BackupError("Backup archive failed authentication; wrong key or corrupted data")
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._finished and (size < 0 or len(self._buffer) < size):
+            self._buffer += self._next_frame()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+class CountingWriter:
+    """Counts, and optionally hashes, bytes passing to the next stage"""
+
+    def __init__(self, target, digest=None):
+        self._target = target
+        self._digest = digest
+        self.bytes = 0
+
+    def write(self, data) -> int:
+        self._target.write(data)
+        if self._digest is not None:
+            self._digest.update(data)
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+class StageTimer:
+    """Wall time and bytes per pipeline stage, safe to update from stage threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(name, seconds=time.perf_counter() - started)
+
+    def record(self, name: str, **values):
+        with self._lock:
+            stage = self.stages.setdefault(name, {})
+            for key, value in values.items():
+                stage[key] = round(value, 3) if isinstance(value, float) else value
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for folder, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+    return total
+
+def dump_database(url: str, target_dir: str, jobs: int = None) -> int:
+    """pg_dump in directory format with parallel workers; returns the dump size.
+
+    Table data is left uncompressed because the archive stage compresses
+    everything once with zstd.
+    """
+    jobs = jobs or settings.BACKUP_DUMP_JOBS
+    result = subprocess.run(
+        [
+            "pg_dump", "--format=directory", f"--jobs={jobs}", "--compress=0",
+            "--no-owner", "--no-acl", f"--file={target_dir}", f"--dbname={url}"
+        ],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"pg_dump failed: {result.stderr.strip()[-500:]}")
+    return _directory_size(target_dir)
+
+class HashingReader:
+    """Hashes a file as tarfile copies it into the archive"""
+
+    def __init__(self, source):
+        self._source = source
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        self.digest.update(data)
+        return data
+
+def _add_tree(tar: tarfile.TarFile, path: str, arcname: str, checksums: dict):
+    """Add a dump directory with toc.dat first, recording each file's SHA-256.
+
+    The table of contents leads so a selective restore can decide which data
+    files to extract while the archive is still streaming past.
+    """
+    names = sorted(os.listdir(path), key=lambda name: (name != "toc.dat", name))
+    tar.add(path, arcname=arcname, recursive=False)
+    for name in names:
+        member = f"{arcname}/{name}"
+        with open(os.path.join(path, name), "rb") as source:
+            reader = HashingReader(source)
+            tar.addfile(tar.gettarinfo(os.path.join(path, name), arcname=member), reader)
+        checksums[member] = reader.digest.hexdigest()
+
+def _add_json(tar: tarfile.TarFile, name: str, payload: dict):
+    data = json.dumps(payload, indent=2, default=str).encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+def run_backup_pipeline(backup_id: str, include_objects: bool = True,
+                        progress: Optional[Callable[[str, dict], None]] = None) -> dict:
+    """Dump both databases and back up objects concurrently, then stream the dumps
+    through tar, multi-threaded zstd and AES-GCM straight into the final archive.
+
+    Objects go to the incremental repository, where they are already stored
+    encrypted and deduplicated; the archive records which manifest belongs to it.
+    Scratch space is one uncompressed copy of the dumps, removed afterwards.
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    staging = os.path.join(settings.BACKUP_DIR, ".staging", backup_id)
+    archive_path = os.path.join(settings.BACKUP_DIR, f"healthstash_backup_{timestamp}{ARCHIVE_SUFFIX}")
+    partial_path = archive_path + ".partial"
+    timer = StageTimer()
+    notify = progress or (lambda stage, values: None)
+    started = time.perf_counter()
+
+    os.makedirs(staging, exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix=f"backup-{backup_id[:8]}") as pool:
+            dumps = {
+                name: pool.submit(timer.run, f"dump_{name}", dump_database, url, os.path.join(staging, name))
+                for name, url in (("postgres", settings.DATABASE_URL), ("timescale", settings.TIMESCALE_URL))
+            }
+            objects = None
+            if include_objects:
+                objects = pool.submit(
+                    timer.run, "objects",
+                    BackupRepository().backup, backup_id,
+                    progress=lambda stats: notify("objects", stats)
+                )
+
+            # pg_dump reports nothing while it runs; the growing dump directory is the progress
+            while progress and wait(dumps.values(), timeout=2).not_done:
+                for name, future in dumps.items():
+                    if not future.done():
+                        notify(f"dump_{name}", {"bytes": _directory_size(os.path.join(staging, name))})
+
+            for name, future in dumps.items():
+                timer.record(f"dump_{name}", bytes=future.result())
+                notify(f"dump_{name}", timer.stages[f"dump_{name}"])
+
+            archive_digest = hashlib.sha256()
+            archive_started = time.perf_counter()
+            with open(partial_path, "wb") as output:
+                encrypted = CountingWriter(output, archive_digest)
+                encryptor = EncryptingWriter(encrypted)
+                compressed = CountingWriter(encryptor)
+                threads = settings.BACKUP_ZSTD_THREADS or -1
+                compressor = zstandard.ZstdCompressor(level=settings.BACKUP_ZSTD_LEVEL, threads=threads)
+                with compressor.stream_writer(compressed, closefd=False) as zstd_stream:
+                    raw = CountingWriter(zstd_stream)
+                    checksums = {}
+                    with tarfile.open(fileobj=raw, mode="w|") as tar:
+                        for name in dumps:
+                            _add_tree(tar, os.path.join(staging, name), name, checksums)
+                            notify("archive", {"bytes": raw.bytes})
+                        object_stats = objects.result() if objects else None
+                        # Written last, so it also carries the checksum of every file before it
+                        _add_json(tar, "backup.json", {
+                            "backup_id": backup_id,
+                            "created_at": datetime.now(timezone.utc).isoformat(),
+                            "databases": list(dumps),
+                            "files": checksums,
+                            "object_manifest": object_stats["manifest"] if object_stats else None,
+                            "object_repository": settings.BACKUP_REPOSITORY_DIR if object_stats else None
+                        })
+                encryptor.close()
+                output.flush()
+                os.fsync(output.fileno())
+            os.replace(partial_path, archive_path)
+
+            archive_seconds = time.perf_counter() - archive_started
+            timer.record("archive", seconds=archive_seconds, bytes=raw.bytes,
+                         compressed_bytes=compressed.bytes, encrypted_bytes=encrypted.bytes)
+            if object_stats:
+                timer.record("objects", bytes=object_stats["bytes_copied"], scanned=object_stats["scanned"])
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    total_seconds = time.perf_counter() - started
+    return {
+        "archive_path": archive_path,
+        "archive_bytes": encrypted.bytes,
+        "checksum": archive_digest.hexdigest(),
+        "raw_bytes": raw.bytes,
+        "compression_ratio": round(raw.bytes / compressed.bytes, 2) if compressed.bytes else None,
+        "throughput_mb_s": round(raw.bytes / (1024 * 1024) / archive_seconds, 2) if archive_seconds else None,
+        "total_seconds": round(total_seconds, 3),
+        "stages": timer.stages,
+        "objects": object_stats
+    }
+
+def run_full_backup(backup_id: str, progress: Optional[Callable[[str, dict], None]] = None):
+    """Blocking job body for BackupType.FULL: run the pipeline and record metrics"""
+    from app.core.database import SessionLocal
+    from app.models.backup import BackupHistory, BackupStatus
+    from app.services.backup_catalog import BackupCatalog
+
+    db = SessionLocal()
+    try:
+        backup = db.get(BackupHistory, backup_id)
+        if backup is None:
+            return
+        try:
+            result = run_backup_pipeline(backup_id, include_objects=backup.includes_files, progress=progress)
+            BackupCatalog.release_path(db, result["archive_path"], backup_id)
+            backup.status = BackupStatus.COMPLETED
+            backup.file_path = result["archive_path"]
+            backup.file_size = result["archive_bytes"]
+            backup.size_mb = round(result["archive_bytes"] / (1024 * 1024), 2)
+            backup.checksum = result["checksum"]
+            backup.metrics_json = json.dumps(result, default=str)
+            backup.notes = (
+                f"Full backup: PostgreSQL + TimescaleDB dumps at {result['throughput_mb_s']} MB/s"
+                + (f", {result['objects']['bytes_copied']} new object bytes" if result["objects"] else "")
+            )
+        except Exception as e:
+            logger.error(f"Backup pipeline {backup_id} failed: {e}")
+            backup.status = BackupStatus.FAILED
+            backup.error_message = str(e)
+
+        backup.completed_at = datetime.now(timezone.utc)
+        if backup.started_at:
+            started = backup.started_at
+            if started.tzinfo is None:
+                started = started.replace(tzinfo=timezone.utc)
+            backup.duration_seconds = int((backup.completed_at - started).total_seconds())
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,358 @@
+"""
+HealthStash - Backup Restore Engine
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import uuid
+
+import zstandard
+
+from app.core.config import settings
+from app.services.backup_engine import BackupError, BackupRepository, user_object_prefixes
+from app.services.backup_pipeline import DecryptingReader, StageTimer
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 1024 * 1024
+
+# Tables holding one user's records, restored in order. Rows match the user id,
+# or for child tables the ids already restored from the parent table.
+USER_TABLES = {
+    "postgres": [
+        ("users", "id", None),
+        ("stored_objects", "user_id", None),
+        ("health_records", "user_id", None),
+        ("payment_records", "user_id", None),
+        ("payment_files", "payment_record_id", "payment_records"),
+    ],
+    "timescale": [
+        ("vital_signs", "user_id", None),
+    ],
+}
+# An account that still exists keeps its current credentials and settings
+INSERT_ONLY_TABLES = {"users"}
+
+def _database_url(name: str) -> str:
+    return {"postgres": settings.DATABASE_URL, "timescale": settings.TIMESCALE_URL}[name]
+
+def _safe_member(member: tarfile.TarInfo) -> bool:
+    parts = member.name.split("/")
+    return (member.isfile() or member.isdir()) and not member.name.startswith("/") and ".." not in parts
+
+def list_table_data(dump_dir: str) -> Dict[str, str]:
+    """Map each public table to its TABLE DATA line from pg_restore --list.
+
+    Only toc.dat is read, so this works before any data file is extracted.
+    """
+    result = subprocess.run(["pg_restore", "--list", dump_dir], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise BackupError(f"pg_restore --list failed: {result.stderr.strip()[-500:]}")
+    entries = {}
+    for line in result.stdout.splitlines():
+        # 3412; 0 16390 TABLE DATA public health_records healthstash
+        if line.startswith(";") or " TABLE DATA " not in line:
+            continue
+        schema, table = line.split(" TABLE DATA ", 1)[1].split()[:2]
+        if schema == "public":
+            entries[table] = line
+    return entries
+
+class UserSelection:
+    """Decides which archive members a single-user restore needs.
+
+    Data files are named after their dump id; once a database's toc.dat has
+    been extracted, only the data files of USER_TABLES are kept.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._data_files: Dict[str, set] = {}
+
+    def wants(self, name: str) -> bool:
+        database, _, file_name = name.partition("/")
+        if not file_name or file_name == "toc.dat":
+            return database in USER_TABLES or name == "backup.json"
+        if database not in USER_TABLES:
+            return False
+        if database in self._data_files:
+            return file_name in self._data_files[database]
+        # Older archives may not lead with the table of contents
+        return True
+
+    def extracted(self, name: str, path: str):
+        database, _, file_name = name.partition("/")
+        if file_name == "toc.dat" and database in USER_TABLES:
+            tables = list_table_data(os.path.dirname(path))
+            self._data_files[database] = {
+                f"{tables[table].split(';')[0].strip()}.dat"
+                for table, _, _ in USER_TABLES[database] if table in tables
+            }
+
+class VerifyOnly:
+    """Selection that extracts nothing; the archive is still read and hashed"""
+
+    def wants(self, name: str) -> bool:
+        return False
+
+    def extracted(self, name: str, path: str):
+        pass
+
+def read_archive(archive_path: str, staging: str, selection: Optional[UserSelection] = None,
+                 passphrase: str = None, progress: Optional[Callable[[str, dict], None]] = None) -> dict:
+    """One pass over a pipeline archive: decrypt, decompress and untar into staging.
+
+    Every member is hashed as it streams past, whether it is extracted or not,
+    and checked against the checksum manifest in backup.json. Returns the
+    backup.json metadata; raises BackupError if anything does not match.
+    """
+    digests: Dict[str, str] = {}
+    metadata = None
+    read_bytes = 0
+    with open(archive_path, "rb") as source:
+        plaintext = DecryptingReader(source, passphrase=passphrase)
+        with zstandard.ZstdDecompressor().stream_reader(plaintext, read_size=COPY_CHUNK) as stream:
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                for member in tar:
+                    if not _safe_member(member):
+                        raise BackupError(f"Unexpected archive member {member.name}")
+                    if member.isdir():
+                        if selection is None or selection.wants(member.name):
+                            os.makedirs(os.path.join(staging, member.name), exist_ok=True)
+                        continue
+
+                    target = None
+                    if member.name == "backup.json":
+                        target = io.BytesIO()
+                    elif selection is None or selection.wants(member.name):
+                        path = os.path.join(staging, member.name)
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        target = open(path, "wb")
+
+                    digest = hashlib.sha256()
+                    data = tar.extractfile(member)
+                    try:
+                        while True:
+                            chunk = data.read(COPY_CHUNK)
+                            if not chunk:
+                                break
+                            digest.update(chunk)
+                            if target is not None:
+                                target.write(chunk)
+                    finally:
+                        if target is not None and member.name != "backup.json":
+                            target.close()
+                    digests[member.name] = digest.hexdigest()
+                    read_bytes += member.size
+
+                    if member.name == "backup.json":
+                        metadata = json.loads(target.getvalue())
+                    elif selection is not None and target is not None:
+                        selection.extracted(member.name, os.path.join(staging, member.name))
+                    if progress:
+                        progress("verify", {"bytes": read_bytes})
+            # tar stops at its end marker; reading on authenticates the final frame
+            while stream.read(COPY_CHUNK):
+                pass
+        plaintext.read()
+
+    if metadata is None:
+        raise BackupError("Archive has no backup.json")
+    expected = metadata.get("files")
+    if expected is None:
+        # Written before checksum manifests; GCM authentication still covers it
+        logger.warning(f"Archive {archive_path} has no checksum manifest")
+        return dict(metadata, verified=False)
+    digests.pop("backup.json")
+    mismatched = sorted(name for name in set(expected) | set(digests) if expected.get(name) != digests.get(name))
+    if mismatched:
+        raise BackupError(f"{len(mismatched)} archive files failed verification, e.g. {mismatched[0]}")
+    return dict(metadata, verified=True)
+
+def restore_database(url: str, dump_dir: str, jobs: int = None):
+    """Replace a database's contents with a directory-format dump using parallel workers"""
+    result = subprocess.run(
+        [
+            "pg_restore", "--clean", "--if-exists", "--no-owner", "--no-acl",
+            f"--jobs={jobs or settings.BACKUP_RESTORE_JOBS}", f"--dbname={url}", dump_dir
+        ],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"pg_restore failed: {result.stderr.strip()[-500:]}")
+
+@contextmanager
+def _table_rows(dump_dir: str, toc_line: str):
+    """Yields the columns and an iterator of COPY text rows of one table,
+    streamed out of pg_restore without loading the table"""
+    with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as listing:
+        listing.write(toc_line + "\n")
+    errors = tempfile.TemporaryFile("w+")
+    process = subprocess.Popen(
+        ["pg_restore", "--data-only", f"--use-list={listing.name}", "--file=-", dump_dir],
+        stdout=subprocess.PIPE,
+        stderr=errors,
+        text=True
+    )
+    try:
+        columns = []
+        for line in process.stdout:
+            if line.startswith("COPY "):
+                # COPY public.health_records (id, user_id, "title", ...) FROM stdin;
+                inner = line[line.index("(") + 1:line.rindex(")")]
+                columns = [column.strip().strip('"') for column in inner.split(",")]
+                break
+
+        def rows():
+            for line in process.stdout:
+                line = line.rstrip("\n")
+                if line == "\\.":
+                    return
+                yield line
+
+        yield columns, rows() if columns else iter(())
+        process.stdout.read()
+        if process.wait() != 0:
+            errors.seek(0)
+            raise BackupError(f"pg_restore failed: {errors.read().strip()[-500:]}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        errors.close()
+        os.remove(listing.name)
+
+def _upsert(cursor, table: str, columns: List[str], rows: io.StringIO, overwrite: bool):
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    staging = f"restore_{table}"
+    cursor.execute(f'CREATE TEMP TABLE "{staging}" (LIKE public."{table}" INCLUDING DEFAULTS) ON COMMIT DROP')
+    cursor.copy_expert(f'COPY "{staging}" ({quoted}) FROM STDIN', rows)
+    if overwrite:
+        assignments = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in columns if column != "id")
+        conflict = f"DO UPDATE SET {assignments}"
+    else:
+        conflict = "DO NOTHING"
+    cursor.execute(f'INSERT INTO public."{table}" ({quoted}) SELECT {quoted} FROM "{staging}" ON CONFLICT (id) {conflict}')
+
+def restore_user_records(database: str, dump_dir: str, user_id: str) -> Dict[str, int]:
+    """Put one user's rows back from a dump, in one transaction.
+
+    Rows from the backup overwrite current ones with the same id; rows created
+    since the backup are kept. Returns restored row counts per table.
+    """
+    from app.core.database import engine, timescale_engine
+
+    tables = list_table_data(dump_dir)
+    connection = (engine if database == "postgres" else timescale_engine).raw_connection()
+    counts, restored_ids = {}, {}
+    try:
+        cursor = connection.cursor()
+        for table, column, parent in USER_TABLES[database]:
+            if table not in tables:
+                continue
+            keep = {user_id} if parent is None else restored_ids.get(parent, set())
+            buffer, ids = io.StringIO(), set()
+            with _table_rows(dump_dir, tables[table]) as (columns, rows):
+                if column not in columns:
+                    continue
+                match, id_index = columns.index(column), columns.index("id")
+                for row in rows:
+                    fields = row.split("\t")
+                    if fields[match] in keep:
+                        buffer.write(row + "\n")
+                        ids.add(fields[id_index])
+            restored_ids[table] = ids
+            counts[table] = len(ids)
+            if ids:
+                buffer.seek(0)
+                _upsert(cursor, table, columns, buffer, overwrite=table not in INSERT_ONLY_TABLES)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return counts
+
+def restore_archive(archive_path: str, user_id: str = None, include_objects: bool = True,
+                    progress: Optional[Callable[[str, dict], None]] = None, skip_unchanged: bool = True) -> dict:
+    """Verify and restore a pipeline archive.
+
+    The archive is verified in the same pass that extracts it, and nothing is
+    written to a database until every file has matched its checksum. Databases
+    are then restored with pg_restore --jobs while objects are uploaded from the
+    repository concurrently. With a user id only that user's records and
+    objects are restored, and only the data files they live in are extracted.
+    """
+    staging = os.path.join(settings.BACKUP_DIR, ".restore", uuid.uuid4().hex)
+    selection = UserSelection(user_id) if user_id else None
+    timer = StageTimer()
+    started = time.perf_counter()
+    os.makedirs(staging, exist_ok=True)
+    try:
+        metadata = timer.run("read", read_archive, archive_path, staging, selection, progress=progress)
+        verified_seconds = time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="restore") as pool:
+            futures = {}
+            for database in metadata["databases"]:
+                dump_dir = os.path.join(staging, database)
+                if user_id:
+                    futures[database] = pool.submit(
+                        timer.run, f"restore_{database}", restore_user_records, database, dump_dir, user_id
+                    )
+                else:
+                    futures[database] = pool.submit(
+                        timer.run, f"restore_{database}", restore_database, _database_url(database), dump_dir
+                    )
+            if include_objects and metadata.get("object_manifest"):
+                futures["objects"] = pool.submit(
+                    timer.run, "objects",
+                    BackupRepository(metadata.get("object_repository")).restore,
+                    metadata["object_manifest"],
+                    prefix=user_object_prefixes(user_id) if user_id else "",
+                    skip_unchanged=skip_unchanged
+                )
+            results = {name: future.result() for name, future in futures.items()}
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {
+        "backup_id": metadata.get("backup_id"),
+        "verified": metadata["verified"],
+        "files_checked": len(metadata.get("files") or {}),
+        "user_id": user_id,
+        "databases": {name: result for name, result in results.items() if name != "objects"},
+        "objects": results.get("objects"),
+        "verify_seconds": round(verified_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "stages": timer.stages
+    }
+
+def verify_archive(archive_path: str) -> dict:
+    """Check an archive end to end without extracting anything"""
+    staging = tempfile.mkdtemp(prefix="verify-", dir=settings.BACKUP_DIR)
+    try:
+        metadata = read_archive(archive_path, staging, VerifyOnly())
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return {
+        "backup_id": metadata.get("backup_id"),
+        "verified": metadata["verified"],
+        "files_checked": len(metadata.get("files") or {})
+    }
@@ -0,0 +1,104 @@
+"""
+HealthStash - Cron Expressions
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from datetime import datetime, timedelta
+from typing import FrozenSet
+
+MONTH_NAMES = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+DAY_NAMES = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *"
+}
+# No expression needs more than a leap-year cycle to match again
+SEARCH_LIMIT = timedelta(days=366 * 8)
+
+def _parse_value(value: str, low: int, names) -> int:
+    if names and value.lower() in names:
+        return names.index(value.lower()) + low
+    return int(value)
+
+def _parse_field(field: str, low: int, high: int, names=None) -> FrozenSet[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in cron field: {field}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _parse_value(start_text, low, names), _parse_value(end_text, low, names)
+        else:
+            start = _parse_value(part, low, names)
+            # "5/15" means from 5 to the end of the range
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class CronSchedule:
+    """A standard five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Matches Vixie cron, including its rule that a restricted day-of-month and
+    day-of-week match when either does. Times are naive or UTC, like the
+    backup container's crond.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected five cron fields: {expression}")
+        minute, hour, day, month, weekday = fields
+        self.minutes = _parse_field(minute, 0, 59)
+        self.hours = _parse_field(hour, 0, 23)
+        self.days = _parse_field(day, 1, 31)
+        self.months = _parse_field(month, 1, 12, MONTH_NAMES)
+        # 7 is also Sunday
+        self.weekdays = frozenset(value % 7 for value in _parse_field(weekday, 0, 7, DAY_NAMES))
+        self._any_day = day == "*"
+        self._any_weekday = weekday == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return in_weekdays
+        if self._any_weekday:
+            return in_days
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after the given time"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + SEARCH_LIMIT
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+    def __str__(self) -> str:
+        return self.expression
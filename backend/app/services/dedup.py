@@ -0,0 +1,76 @@
+"""
+HealthStash - Content-Addressed File Deduplication
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+import uuid
+import logging
+
+from app.core.security import encrypt_file_content
+from app.models.stored_object import StoredObject
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+def find_stored_object(db: Session, user_id: str, checksum: str, lock: bool = False) -> Optional[StoredObject]:
+    """Look up the user's existing object for a plaintext checksum"""
+    query = db.query(StoredObject).filter(
+        StoredObject.user_id == user_id,
+        StoredObject.checksum == checksum
+    )
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+def mark_referenced(stored: StoredObject):
+    stored.last_referenced_at = datetime.now(timezone.utc)
+
+def register_stored_object(
+    db: Session, user_id: str, checksum: str, object_name: str, size: int
+) -> Tuple[StoredObject, bool]:
+    """Record a freshly uploaded object; returns (stored, created).
+
+    If a concurrent upload registered the same content first, the caller uses the
+    winner's object and created is False so it can discard its own.
+    """
+    stored = StoredObject(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        checksum=checksum,
+        minio_object_name=object_name,
+        size=size
+    )
+    try:
+        with db.begin_nested():
+            db.add(stored)
+        return stored, True
+    except IntegrityError:
+        existing = find_stored_object(db, user_id, checksum, lock=True)
+        mark_referenced(existing)
+        return existing, False
+
+async def store_user_content(
+    db: Session, user_id: str, content: bytes, checksum: str, object_name: str, user_key: bytes
+) -> Tuple[Optional[str], bool]:
+    """Store content once per (user, checksum); returns (object_name, is_new).
+
+    object_name is None if the upload to MinIO failed.
+    """
+    existing = find_stored_object(db, user_id, checksum, lock=True)
+    if existing:
+        mark_referenced(existing)
+        return existing.minio_object_name, False
+
+    encrypted_content = encrypt_file_content(content, user_key)
+    if not await storage_service.upload_file(encrypted_content, object_name):
+        return None, False
+
+    stored, created = register_stored_object(db, user_id, checksum, object_name, len(content))
+    if not created:
+        await storage_service.delete_file(object_name)
+    return stored.minio_object_name, created
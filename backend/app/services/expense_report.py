@@ -0,0 +1,381 @@
+"""
+HealthStash - Annual Expense Reports
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+import csv
+import io
+import logging
+import queue
+import threading
+import zipfile
+
+from sqlalchemy import select, func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import report_executor
+from app.core.security import decrypt_file_content, get_user_file_key, sanitize_filename
+from app.models.health_record import HealthRecord
+from app.models.payment_record import PaymentRecord, PaymentFile
+from app.models.report_job import ReportJob, ReportStatus
+from app.models.user import User
+from app.services.fx_rates import fx_index
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+REPORT_PREFIX = "reports"
+CURSOR_BATCH = 500
+PIPE_CHUNK = 1024 * 1024
+
+SUMMARY_COLUMNS = [
+    "expense_date", "invoice_number", "invoice_date", "provider_name", "service_description",
+    "health_record", "payment_status", "payment_method", "payment_date",
+    "amount", "currency", "reporting_amount", "reporting_currency",
+    "insurance_claim_number", "insurance_paid_amount", "patient_responsibility", "attachments"
+]
+
+class ZipPipe:
+    """Write end for the ZIP builder, read end for MinIO's multipart uploader.
+
+    Only a few chunks are buffered between the two threads, so the archive is
+    never held in memory or on disk; a failed writer aborts the upload.
+    """
+
+    def __init__(self, max_chunks: int = 8):
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._pending = bytearray()
+        self._buffer = b""
+        self._eof = False
+        self.reader_done = threading.Event()
+        self.bytes_written = 0
+
+    def _put(self, item):
+        # An uploader that gave up stops reading; fail instead of blocking forever
+        while True:
+            if self.reader_done.is_set():
+                raise IOError("Report upload stopped reading")
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data) -> int:
+        self._pending += data
+        self.bytes_written += len(data)
+        if len(self._pending) >= PIPE_CHUNK:
+            self._put(bytes(self._pending))
+            self._pending.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._pending:
+            self._put(bytes(self._pending))
+            self._pending.clear()
+        self._put(None)
+
+    def abort(self, error: Exception):
+        try:
+            self._put(error)
+        except IOError:
+            pass
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                self._eof = True
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _year_bounds(year: int):
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+def _money(value) -> str:
+    return f"{Decimal(value):.2f}" if value is not None else ""
+
+def _write_summary(db, job: ReportJob, archive: zipfile.ZipFile) -> int:
+    """Stream the year's payments through a server-side cursor into summary.csv"""
+    start, end = _year_bounds(job.year)
+    attachments = select(func.count(PaymentFile.id)).where(
+        PaymentFile.payment_record_id == PaymentRecord.id
+    ).correlate(PaymentRecord).scalar_subquery()
+
+    statement = select(PaymentRecord, HealthRecord.title, attachments.label("attachments")).outerjoin(
+        HealthRecord, HealthRecord.id == PaymentRecord.health_record_id
+    ).where(
+        PaymentRecord.user_id == job.user_id,
+        PaymentRecord.is_deleted == False,
+        PaymentRecord.expense_date >= start,
+        PaymentRecord.expense_date < end
+    ).order_by(PaymentRecord.expense_date, PaymentRecord.id).execution_options(yield_per=CURSOR_BATCH)
+
+    totals = {"amount": Decimal(0), "insurance": Decimal(0), "patient": Decimal(0)}
+    unconverted = 0
+    count = 0
+
+    with archive.open("summary.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as text:
+        writer = csv.writer(text)
+        writer.writerow(SUMMARY_COLUMNS)
+
+        for payment, record_title, attachment_count in db.execute(statement):
+            on = payment.expense_date
+            converted = fx_index.convert(payment.amount, payment.currency, job.reporting_currency, on)
+            if converted is None:
+                unconverted += 1
+            else:
+                totals["amount"] += converted
+                if payment.insurance_paid_amount:
+                    totals["insurance"] += fx_index.convert(
+                        payment.insurance_paid_amount, payment.currency, job.reporting_currency, on
+                    )
+                if payment.patient_responsibility:
+                    totals["patient"] += fx_index.convert(
+                        payment.patient_responsibility, payment.currency, job.reporting_currency, on
+                    )
+
+            writer.writerow([
+                on.date().isoformat(),
+                payment.invoice_number or "",
+                payment.invoice_date.date().isoformat() if payment.invoice_date else "",
+                payment.provider_name or "",
+                payment.service_description or "",
+                record_title or "",
+                payment.payment_status.value if payment.payment_status else "",
+                payment.payment_method.value if payment.payment_method else "",
+                payment.payment_date.date().isoformat() if payment.payment_date else "",
+                _money(payment.amount),
+                payment.currency,
+                _money(converted),
+                job.reporting_currency,
+                payment.insurance_claim_number or "",
+                _money(payment.insurance_paid_amount),
+                _money(payment.patient_responsibility),
+                attachment_count
+            ])
+            count += 1
+            # The ORM would otherwise keep every streamed payment in the identity map
+            db.expunge(payment)
+
+        writer.writerow([])
+        writer.writerow(["total", "", "", "", "", "", "", "", "", "", "",
+                         _money(totals["amount"]), job.reporting_currency, "",
+                         _money(totals["insurance"]), _money(totals["patient"]), ""])
+        if unconverted:
+            writer.writerow([f"{unconverted} payments had no exchange rate and are not in the total"])
+
+    return count
+
+def _fetch_invoice(object_name: str, user_key: bytes) -> Optional[bytes]:
+    encrypted = storage_service.get_object_bytes(object_name)
+    if encrypted is None:
+        return None
+    return decrypt_file_content(encrypted, user_key)
+
+def _write_invoices(db, job: ReportJob, user_key: bytes, archive: zipfile.ZipFile) -> int:
+    """Decrypt attachments in the report pool, keeping at most REPORT_FETCH_WINDOW in memory"""
+    start, end = _year_bounds(job.year)
+    statement = select(
+        PaymentFile.id, PaymentFile.file_name, PaymentFile.minio_object_name,
+        PaymentRecord.id, PaymentRecord.expense_date
+    ).join(
+        PaymentRecord, PaymentRecord.id == PaymentFile.payment_record_id
+    ).where(
+        PaymentRecord.user_id == job.user_id,
+        PaymentRecord.is_deleted == False,
+        PaymentRecord.expense_date >= start,
+        PaymentRecord.expense_date < end,
+        PaymentFile.minio_object_name.isnot(None)
+    ).order_by(PaymentRecord.expense_date, PaymentRecord.id, PaymentFile.uploaded_at).execution_options(
+        yield_per=CURSOR_BATCH
+    )
+
+    window = deque()
+    missing = []
+    written = 0
+
+    def drain_one():
+        nonlocal written
+        name, future = window.popleft()
+        content = future.result()
+        if content is None:
+            missing.append(name)
+            return
+        # Invoices are mostly PDFs and images that do not compress further
+        archive.writestr(name, content, compress_type=zipfile.ZIP_STORED)
+        written += 1
+
+    for file_id, file_name, object_name, payment_id, expense_date in db.execute(statement):
+        name = f"invoices/{expense_date:%Y-%m-%d}_{payment_id[:8]}_{file_id[:8]}_{sanitize_filename(file_name)}"
+        window.append((name, report_executor.submit(_fetch_invoice, object_name, user_key)))
+        if len(window) >= settings.REPORT_FETCH_WINDOW:
+            drain_one()
+
+    while window:
+        drain_one()
+
+    if missing:
+        archive.writestr("missing_invoices.txt", "\n".join(missing) + "\n")
+    return written
+
+def _upload(pipe: ZipPipe, object_name: str, result: dict):
+    try:
+        result["ok"] = storage_service.put_object_stream(pipe, object_name, content_type="application/zip")
+    except Exception as e:
+        result["error"] = e
+    finally:
+        pipe.reader_done.set()
+
+class ReportHeartbeat:
+    """Refreshes a running job's heartbeat_at from a side thread.
+
+    Jobs run inside whichever worker queued them; the heartbeat is how the
+    scheduler leader tells a long job from one lost with its worker.
+    """
+
+    def __init__(self, job_id: str, interval: int = None):
+        self.job_id = job_id
+        self.interval = interval or settings.REPORT_HEARTBEAT_SECONDS
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                db.query(ReportJob).filter(ReportJob.id == self.job_id).update(
+                    {ReportJob.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Report job {self.job_id} heartbeat failed: {e}")
+            finally:
+                db.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._beat, name=f"report-heartbeat-{self.job_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def generate_report(job_id: str):
+    """Blocking job body: build the ZIP while it uploads, then mark the job ready"""
+    db = SessionLocal()
+    heartbeat = ReportHeartbeat(job_id)
+    try:
+        job = db.get(ReportJob, job_id)
+        if job is None or job.status != ReportStatus.PENDING:
+            return
+        job.status = ReportStatus.RUNNING
+        job.started_at = job.heartbeat_at = datetime.now(timezone.utc)
+        db.commit()
+        heartbeat.start()
+
+        user = db.get(User, job.user_id)
+        user_key = get_user_file_key(user)
+        object_name = f"{REPORT_PREFIX}/{job.user_id}/{job.id}/expenses-{job.year}.zip"
+
+        pipe = ZipPipe()
+        result = {}
+        uploader = threading.Thread(target=_upload, args=(pipe, object_name, result), name=f"report-upload-{job.id[:8]}")
+        uploader.start()
+
+        try:
+            with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                payments = _write_summary(db, job, archive)
+                invoices = _write_invoices(db, job, user_key, archive) if job.include_invoices else 0
+            pipe.close()
+        except Exception as e:
+            pipe.abort(e)
+            raise
+        finally:
+            uploader.join()
+
+        if "error" in result:
+            raise result["error"]
+        if not result.get("ok"):
+            raise RuntimeError("Upload to storage failed")
+
+        job.status = ReportStatus.COMPLETED
+        job.object_name = object_name
+        job.file_size = pipe.bytes_written
+        job.payments_count = payments
+        job.invoices_count = invoices
+        job.completed_at = datetime.now(timezone.utc)
+        db.commit()
+        logger.info(f"Expense report {job.id} ready: {payments} payments, {invoices} invoices, {pipe.bytes_written} bytes")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Expense report {job_id} failed: {e}")
+        job = db.get(ReportJob, job_id)
+        if job is not None:
+            job.status = ReportStatus.FAILED
+            job.error_message = str(e)[:1000]
+            job.completed_at = datetime.now(timezone.utc)
+            db.commit()
+    finally:
+        heartbeat.stop()
+        db.close()
+
+def fail_interrupted_reports() -> int:
+    """Scheduler job: fail unfinished jobs whose worker stopped sending heartbeats.
+
+    Jobs of live workers keep heartbeat_at fresh, so this is safe to run while
+    other workers are mid-report. A pending job is judged by its creation time.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(seconds=settings.REPORT_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        # One conditional UPDATE, so a job finishing meanwhile keeps its result
+        interrupted = db.query(ReportJob).filter(
+            ReportJob.status.in_([ReportStatus.PENDING, ReportStatus.RUNNING]),
+            func.coalesce(ReportJob.heartbeat_at, ReportJob.created_at) < stale_before
+        ).update({
+            ReportJob.status: ReportStatus.FAILED,
+            ReportJob.error_message: "Report interrupted: its server worker stopped",
+            ReportJob.completed_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if interrupted:
+            logger.info(f"Marked {interrupted} interrupted report jobs as failed")
+        return interrupted
+    finally:
+        db.close()
+
+def purge_expired_reports() -> int:
+    """Delete finished reports older than REPORT_RETENTION_DAYS together with their archives"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.REPORT_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        expired = db.query(ReportJob).filter(
+            ReportJob.completed_at < cutoff,
+            ReportJob.status.in_([ReportStatus.COMPLETED, ReportStatus.FAILED])
+        ).all()
+        for job in expired:
+            if job.object_name:
+                storage_service.remove_object(job.object_name)
+            db.delete(job)
+        db.commit()
+        return len(expired)
+    finally:
+        db.close()
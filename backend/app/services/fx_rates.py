@@ -0,0 +1,181 @@
+"""
+HealthStash - Exchange Rates
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import csv
+import logging
+import os
+
+from sqlalchemy import and_, or_, cast, Date
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import run_in_executor
+from app.models.exchange_rate import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+# Rates before the euro are not published; the base currency is pinned to 1 from here on
+BASE_VALID_FROM = date(1999, 1, 1)
+
+def parse_ecb_csv(path: str) -> Dict[str, List[Tuple[date, Decimal]]]:
+    """Read an ECB reference-rate CSV (Date,USD,JPY,...) into date-sorted series per currency.
+
+    Both the daily file and the full history file work; "N/A" and empty cells
+    are skipped so currencies that joined or left later keep their own ranges.
+    """
+    series = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header or header[0].strip().lower() != "date":
+            raise ValueError(f"{path} is not an ECB reference rate file")
+        currencies = [name.strip().upper() for name in header[1:]]
+
+        for row in reader:
+            if not row or not row[0].strip():
+                continue
+            day = date.fromisoformat(row[0].strip())
+            for currency, value in zip(currencies, row[1:]):
+                value = value.strip()
+                if not currency or not value or value == "N/A":
+                    continue
+                try:
+                    rate = Decimal(value)
+                except InvalidOperation:
+                    continue
+                if rate > 0:
+                    series.setdefault(currency, []).append((day, rate))
+
+    for points in series.values():
+        points.sort()
+    return series
+
+def _rate_rows(series: Dict[str, List[Tuple[date, Decimal]]]) -> List[dict]:
+    rows = []
+    for currency, points in series.items():
+        for index, (valid_from, rate) in enumerate(points):
+            valid_to = points[index + 1][0] if index + 1 < len(points) else None
+            rows.append({"currency": currency, "valid_from": valid_from, "valid_to": valid_to, "rate": rate})
+    rows.append({
+        "currency": settings.FX_BASE_CURRENCY,
+        "valid_from": BASE_VALID_FROM,
+        "valid_to": None,
+        "rate": Decimal(1)
+    })
+    return rows
+
+def import_rates(path: str = None) -> int:
+    """Replace the stored series of every currency in the CSV; returns the rows written"""
+    path = path or settings.FX_RATES_CSV
+    series = parse_ecb_csv(path)
+    series.pop(settings.FX_BASE_CURRENCY, None)
+    rows = _rate_rows(series)
+
+    db = SessionLocal()
+    try:
+        db.query(ExchangeRate).filter(
+            ExchangeRate.currency.in_(list(series) + [settings.FX_BASE_CURRENCY])
+        ).delete(synchronize_session=False)
+        db.execute(ExchangeRate.__table__.insert(), rows)
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Imported {len(rows)} exchange rates for {len(series)} currencies from {path}")
+    fx_index.load()
+    return len(rows)
+
+def import_missing_rates() -> int:
+    """Leader startup job: import the configured CSV into an empty table"""
+    db = SessionLocal()
+    try:
+        empty = db.query(ExchangeRate.currency).first() is None
+    finally:
+        db.close()
+
+    if empty and settings.FX_RATES_CSV and os.path.exists(settings.FX_RATES_CSV):
+        return import_rates(settings.FX_RATES_CSV)
+    return 0
+
+async def keep_index_fresh():
+    """Per-worker task: pick up rates imported by the leader or through another worker"""
+    while True:
+        await asyncio.sleep(settings.FX_INDEX_RELOAD_SECONDS)
+        try:
+            await run_in_executor(None, fx_index.load)
+        except Exception as e:
+            logger.error(f"Exchange rate index reload failed: {e}")
+
+def rate_in_effect(rate, currency, on):
+    """Join condition selecting the one row of an ExchangeRate alias valid on a date"""
+    day = cast(on, Date)
+    return and_(
+        rate.currency == currency,
+        rate.valid_from <= day,
+        or_(rate.valid_to.is_(None), rate.valid_to > day)
+    )
+
+class FxRateIndex:
+    """Per-currency interval index of the rate table for lookups outside SQL.
+
+    The whole mapping is swapped on load, so readers never see a partial index.
+    """
+
+    def __init__(self):
+        self._series: Dict[str, Tuple[List[date], List[Decimal]]] = {}
+
+    def load(self, db: Session = None):
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(ExchangeRate.currency, ExchangeRate.valid_from, ExchangeRate.rate).order_by(
+                ExchangeRate.currency, ExchangeRate.valid_from
+            ).all()
+        finally:
+            if own_session:
+                db.close()
+
+        series = {}
+        for currency, valid_from, rate in rows:
+            starts, rates = series.setdefault(currency, ([], []))
+            starts.append(valid_from)
+            rates.append(Decimal(rate))
+        self._series = series
+
+    def currencies(self) -> List[str]:
+        return sorted(self._series)
+
+    def knows(self, currency: str) -> bool:
+        return currency == settings.FX_BASE_CURRENCY or currency in self._series
+
+    def rate(self, currency: str, on) -> Optional[Decimal]:
+        if isinstance(on, datetime):
+            on = on.date()
+        entry = self._series.get(currency)
+        if entry is None:
+            # The base currency is 1 by definition, even before any rates are imported
+            return Decimal(1) if currency == settings.FX_BASE_CURRENCY else None
+        starts, rates = entry
+        position = bisect_right(starts, on) - 1
+        return rates[position] if position >= 0 else None
+
+    def convert(self, amount, source: str, target: str, on) -> Optional[Decimal]:
+        amount = Decimal(str(amount))
+        if source == target:
+            return amount
+        source_rate = self.rate(source, on)
+        target_rate = self.rate(target, on)
+        if source_rate is None or target_rate is None:
+            return None
+        return (amount * target_rate / source_rate).quantize(Decimal("0.01"))
+
+fx_index = FxRateIndex()
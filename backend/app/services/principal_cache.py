@@ -0,0 +1,103 @@
+"""
+HealthStash - Authenticated Principal Cache
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+import threading
+import time
+
+from app.core.config import settings
+
+class Principal:
+    """The slice of a user needed to authorize a request.
+
+    Endpoints that only scope queries by user id depend on this instead of the
+    full User row, so a warm cache answers them without touching PostgreSQL.
+    """
+
+    __slots__ = ("id", "role", "is_active", "is_locked", "locked_until", "security_stamp")
+
+    def __init__(self, id: str, role, is_active: bool, is_locked: bool,
+                 locked_until: Optional[datetime], security_stamp: int):
+        self.id = id
+        self.role = role
+        self.is_active = is_active
+        self.is_locked = is_locked
+        self.locked_until = locked_until
+        self.security_stamp = security_stamp
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        locked_until = user.locked_until
+        if locked_until is not None and locked_until.tzinfo is None:
+            locked_until = locked_until.replace(tzinfo=timezone.utc)
+        return cls(
+            id=user.id,
+            role=user.role,
+            is_active=user.is_active,
+            is_locked=user.is_locked,
+            locked_until=locked_until,
+            security_stamp=user.security_stamp or 0
+        )
+
+    @property
+    def currently_locked(self) -> bool:
+        return bool(self.is_locked and self.locked_until and self.locked_until > datetime.now(timezone.utc))
+
+class PrincipalCache:
+    """Per-process LRU of principals with a short TTL.
+
+    Changes made by this worker invalidate immediately; other workers pick them
+    up when the entry expires, and the security stamp in the JWT rejects tokens
+    issued before a password or role change once the row is re-read.
+    """
+
+    def __init__(self, ttl_seconds: int = None, max_size: int = None):
+        self.ttl_seconds = settings.AUTH_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_size = max_size or settings.AUTH_CACHE_MAX_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Principal]:
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            principal, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache()
+
+def revoke_user_sessions(user):
+    """Bump the security stamp so tokens issued before now stop validating.
+
+    Call principal_cache.invalidate(user.id) after committing the change.
+    """
+    user.security_stamp = (user.security_stamp or 0) + 1
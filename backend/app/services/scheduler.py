@@ -0,0 +1,390 @@
+"""
+HealthStash - Periodic Job Scheduler
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import inspect
+import json
+import logging
+import os
+import socket
+
+import psycopg2
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import run_in_executor
+from app.models.scheduled_job import ScheduledJob, JobRun, JobRunStatus
+from app.services.cron import CronSchedule
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK = "healthstash_scheduler"
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _aware(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+class PeriodicJob:
+    """A job run every N seconds, on a cron schedule, or only when a leader starts.
+
+    run_at_start jobs also run as soon as a worker takes over leadership; with
+    neither every nor cron that is the only time they run. Blocking functions
+    run in the default executor, coroutine functions on the event loop.
+    Whatever the function returns is stored with the run.
+    """
+
+    def __init__(self, name: str, func: Callable, every: Optional[int] = None, cron: Optional[str] = None,
+                 run_at_start: bool = False):
+        if every is not None and cron is not None:
+            raise ValueError(f"Job {name} needs at most one of every or cron")
+        if every is None and cron is None and not run_at_start:
+            raise ValueError(f"Job {name} needs every, cron or run_at_start")
+        self.name = name
+        self.func = func
+        self.every = every
+        self.cron = CronSchedule(cron) if cron else None
+        self.run_at_start = run_at_start
+
+    @property
+    def schedule(self) -> str:
+        if self.cron:
+            return str(self.cron)
+        return f"every {self.every}s" if self.every else "at leader start"
+
+    def next_run(self, last_run: Optional[datetime], now: datetime) -> Optional[datetime]:
+        """Next due time after the last run; jobs that never ran start now or one period from now"""
+        if self.every is None and self.cron is None:
+            return now if last_run is None else None
+        if self.cron:
+            if last_run is None and self.run_at_start:
+                return now
+            return self.cron.next_after(last_run or now)
+        if last_run is None:
+            return now if self.run_at_start else now + timedelta(seconds=self.every)
+        return last_run + timedelta(seconds=self.every)
+
+    async def call(self, **kwargs):
+        if inspect.iscoroutinefunction(self.func):
+            return await self.func(**kwargs)
+        return await run_in_executor(None, partial(self.func, **kwargs))
+
+class Scheduler:
+    """Runs periodic jobs in exactly one process.
+
+    Every worker starts a scheduler, but only the one holding a session-level
+    PostgreSQL advisory lock runs jobs; if that process dies its connection
+    closes, the lock is released, and another worker takes over within a tick.
+    A leader that loses its connection cannot cancel runs already in executor
+    threads, so each run also holds a per-job advisory lock on its own
+    connection: a new leader skips jobs whose lock is still held and only fails
+    recorded runs whose lock is free. The leader records every run in job_runs
+    and the next due time of each job in scheduled_jobs, which is what status()
+    reports from any worker. Any worker can ask for a manual run through
+    request_run(); the leader claims it on its next tick.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._next: Dict[str, datetime] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._conn = None
+        self._leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, job: PeriodicJob):
+        self.jobs[job.name] = job
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    def _hold_leadership(self) -> bool:
+        """Keep, or try to take, the leader lock on this worker's connection; blocking"""
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._connect()
+                self._leader = False
+            with self._conn.cursor() as cursor:
+                if self._leader:
+                    # The lock lives as long as the session; a dead session means someone else may lead
+                    cursor.execute("SELECT 1")
+                else:
+                    cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LEADER_LOCK,))
+                    self._leader = cursor.fetchone()[0]
+        except psycopg2.Error as e:
+            if self._leader:
+                logger.warning(f"Scheduler lost its leader connection: {e}")
+            self._release()
+        return self._leader
+
+    def _connect(self):
+        conn = psycopg2.connect(settings.DATABASE_URL, application_name=f"healthstash-scheduler {self.worker_id}")
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _lock_job(self, name: str):
+        """Connection holding the job's advisory lock, or None while a run of it is live anywhere; blocking"""
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (job_lock_name(name),))
+                locked = cursor.fetchone()[0]
+        except psycopg2.Error:
+            conn.close()
+            raise
+        if not locked:
+            conn.close()
+            return None
+        return conn
+
+    def _job_is_live(self, name: str) -> bool:
+        """Whether some connection still holds the job's lock, i.e. its run is in progress; blocking"""
+        with self._conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (job_lock_name(name),))
+            if not cursor.fetchone()[0]:
+                return True
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (job_lock_name(name),))
+        return False
+
+    def _release(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+        self._leader = False
+        self._next.clear()
+
+    def _take_over(self):
+        """Load schedule state left by the previous leader and fail its runs that died with their worker"""
+        now = _utcnow()
+        db = SessionLocal()
+        try:
+            unfinished = db.query(JobRun).filter(JobRun.status == JobRunStatus.RUNNING).all()
+            for run in unfinished:
+                # Runs still holding their job lock are alive, whichever worker started them
+                if self._job_is_live(run.job_name):
+                    continue
+                run.status = JobRunStatus.FAILED
+                run.error = "Scheduler leader stopped during the run"
+                run.finished_at = now
+            states = {state.name: state for state in db.query(ScheduledJob).all()}
+            for name, job in self.jobs.items():
+                state = states.get(name)
+                if state is None:
+                    state = ScheduledJob(name=name)
+                    db.add(state)
+                self._next[name] = now if job.run_at_start else job.next_run(_aware(state.last_run_at), now)
+                state.schedule = job.schedule
+                state.next_run_at = self._next[name]
+                state.leader = self.worker_id
+                state.updated_at = now
+            db.commit()
+        finally:
+            db.close()
+        logger.info(f"Scheduler leader is {self.worker_id} with {len(self.jobs)} jobs")
+
+    def _start_run(self, name: str) -> int:
+        db = SessionLocal()
+        try:
+            run = JobRun(job_name=name, status=JobRunStatus.RUNNING, worker=self.worker_id, started_at=_utcnow())
+            db.add(run)
+            db.commit()
+            return run.id
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: Optional[int], name: str, started: datetime, next_run: Optional[datetime],
+                    result=None, error: Optional[str] = None):
+        finished = _utcnow()
+        duration_ms = int((finished - started).total_seconds() * 1000)
+        status = JobRunStatus.FAILED if error else JobRunStatus.SUCCEEDED
+        db = SessionLocal()
+        try:
+            run = db.get(JobRun, run_id) if run_id is not None else None
+            if run is not None:
+                run.status = status
+                run.finished_at = finished
+                run.duration_ms = duration_ms
+                run.error = error
+                if result is not None:
+                    run.result_json = json.dumps(result, default=str)
+            state = db.get(ScheduledJob, name)
+            if state is not None:
+                state.last_run_at = started
+                state.last_status = status
+                state.last_duration_ms = duration_ms
+                state.last_error = error
+                state.next_run_at = next_run
+                state.leader = self.worker_id
+                state.updated_at = finished
+            db.commit()
+        finally:
+            db.close()
+
+    def request_run(self, name: str, **kwargs) -> bool:
+        """Ask the leader to run a job now with keyword arguments; blocking, callable from any worker"""
+        if name not in self.jobs:
+            return False
+        now = _utcnow()
+        db = SessionLocal()
+        try:
+            state = db.get(ScheduledJob, name)
+            if state is None:
+                state = ScheduledJob(name=name, schedule=self.jobs[name].schedule, updated_at=now)
+                db.add(state)
+            state.requested_at = now
+            state.request_json = json.dumps(kwargs)
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    def _claim_requests(self, idle: List[str]) -> List[Tuple[str, dict]]:
+        """Take the manual run requests of jobs not running here; blocking"""
+        db = SessionLocal()
+        try:
+            claimed = db.query(ScheduledJob.name, ScheduledJob.request_json).filter(
+                ScheduledJob.requested_at.isnot(None),
+                ScheduledJob.name.in_(idle)
+            ).with_for_update(skip_locked=True).all()
+            if claimed:
+                db.query(ScheduledJob).filter(ScheduledJob.name.in_([name for name, _ in claimed])).update(
+                    {ScheduledJob.requested_at: None, ScheduledJob.request_json: None}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+        return [(name, json.loads(request_json) if request_json else {}) for name, request_json in claimed]
+
+    async def _execute(self, job: PeriodicJob, overrides: Optional[dict] = None):
+        try:
+            job_conn = await run_in_executor(None, self._lock_job, job.name)
+        except Exception as e:
+            logger.error(f"Could not lock {job.name}: {e}")
+            return
+        if job_conn is None:
+            # A run started under an earlier leader is still going; try again next tick
+            logger.info(f"Scheduled job {job.name} is still running elsewhere, deferring")
+            if overrides is not None:
+                await run_in_executor(None, partial(self.request_run, job.name, **overrides))
+            return
+        try:
+            started = _utcnow()
+            try:
+                run_id = await run_in_executor(None, self._start_run, job.name)
+            except Exception as e:
+                logger.error(f"Could not record the start of {job.name}: {e}")
+                run_id = None
+            result, error = None, None
+            try:
+                result = await job.call(**(overrides or {}))
+            except Exception as e:
+                logger.error(f"Scheduled job {job.name} failed: {e}")
+                error = str(e)[:1000]
+            # Interval jobs count from the start of the run, so a slow run does not drift the schedule
+            next_run = job.next_run(started, started)
+            if self._leader:
+                self._next[job.name] = next_run
+            try:
+                await run_in_executor(None, self._finish_run, run_id, job.name, started, next_run, result, error)
+            except Exception as e:
+                logger.error(f"Could not record the outcome of {job.name}: {e}")
+        finally:
+            # Closing the connection releases the job lock
+            await run_in_executor(None, job_conn.close)
+
+    async def _loop(self):
+        while True:
+            try:
+                was_leader = self.is_leader
+                leader = await run_in_executor(None, self._hold_leadership)
+                if leader and not was_leader:
+                    await run_in_executor(None, self._take_over)
+                if leader:
+                    idle = [name for name in self.jobs if name not in self._running or self._running[name].done()]
+                    for name, overrides in await run_in_executor(None, self._claim_requests, idle):
+                        self._running[name] = asyncio.create_task(self._execute(self.jobs[name], overrides))
+                    now = _utcnow()
+                    for name, job in self.jobs.items():
+                        due = self._next.get(name)
+                        running = self._running.get(name)
+                        if due is not None and due <= now and (running is None or running.done()):
+                            self._running[name] = asyncio.create_task(self._execute(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {e}")
+                await run_in_executor(None, self._release)
+            await asyncio.sleep(settings.SCHEDULER_TICK_SECONDS)
+
+    def start(self):
+        if settings.SCHEDULER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for task in self._running.values():
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        self._running.clear()
+        # Closing the connection releases the lock for the next leader
+        await run_in_executor(None, self._release)
+
+    def status(self) -> list:
+        """Schedule, next due time and last outcome of every registered job; blocking"""
+        db = SessionLocal()
+        try:
+            states = {state.name: state for state in db.query(ScheduledJob).all()}
+        finally:
+            db.close()
+        jobs = []
+        for name, job in sorted(self.jobs.items()):
+            state = states.get(name)
+            jobs.append({
+                "name": name,
+                "schedule": job.schedule,
+                "next_run_at": _aware(state.next_run_at).isoformat() if state and state.next_run_at else None,
+                "last_run_at": _aware(state.last_run_at).isoformat() if state and state.last_run_at else None,
+                "last_status": state.last_status.value if state and state.last_status else None,
+                "last_duration_ms": state.last_duration_ms if state else None,
+                "last_error": state.last_error if state else None,
+                "leader": state.leader if state else None,
+                "requested_at": _aware(state.requested_at).isoformat() if state and state.requested_at else None
+            })
+        return jobs
+
+def job_lock_name(name: str) -> str:
+    return f"{LEADER_LOCK}:{name}"
+
+def purge_job_runs() -> int:
+    """Drop run history older than SCHEDULER_HISTORY_DAYS"""
+    cutoff = _utcnow() - timedelta(days=settings.SCHEDULER_HISTORY_DAYS)
+    db = SessionLocal()
+    try:
+        purged = db.query(JobRun).filter(JobRun.started_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return purged
+    finally:
+        db.close()
+
+scheduler = Scheduler()
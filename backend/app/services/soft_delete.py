@@ -0,0 +1,209 @@
+"""
+HealthStash - Soft-Delete Garbage Collection
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from sqlalchemy import and_, case, exists, func, select, union_all
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.health_record import HealthRecord, record_tags
+from app.models.payment_record import PaymentRecord, PaymentFile
+from app.models.stored_object import StoredObject
+from app.models.user import User
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+def storage_used_mb(db: Session, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Quota usage of each user: the unique objects behind their live health records"""
+    user_ids = list(user_ids)
+    objects = db.query(
+        HealthRecord.user_id,
+        HealthRecord.minio_object_name,
+        func.max(func.coalesce(StoredObject.size, HealthRecord.file_size, 0)).label("size")
+    ).outerjoin(
+        StoredObject, StoredObject.minio_object_name == HealthRecord.minio_object_name
+    ).filter(
+        HealthRecord.user_id.in_(user_ids),
+        HealthRecord.is_deleted == False,
+        HealthRecord.minio_object_name.isnot(None)
+    ).group_by(HealthRecord.user_id, HealthRecord.minio_object_name).subquery()
+
+    used = {user_id: 0 for user_id in user_ids}
+    for user_id, total in db.query(objects.c.user_id, func.sum(objects.c.size)).group_by(objects.c.user_id):
+        used[user_id] = round(total / 1024 / 1024)
+    return used
+
+def live_record_exists(user_id: str):
+    """Correlated EXISTS over StoredObject: a live record of the user shows the
+    object, so its bytes are already in storage_used_mb"""
+    return exists().where(
+        HealthRecord.user_id == user_id,
+        HealthRecord.minio_object_name == StoredObject.minio_object_name,
+        HealthRecord.is_deleted == False
+    )
+
+def _record_expired(cutoff: datetime):
+    return and_(HealthRecord.is_deleted == True, HealthRecord.deleted_at < cutoff)
+
+def _payment_expired(cutoff: datetime):
+    return and_(PaymentRecord.is_deleted == True, PaymentRecord.deleted_at < cutoff)
+
+def _kept_references(db: Session, names: List[str], cutoff: datetime) -> Dict[str, int]:
+    """Rows pointing at each object that are not due for purging"""
+    records = select(
+        HealthRecord.minio_object_name.label("name"),
+        case((_record_expired(cutoff), 0), else_=1).label("kept")
+    ).where(HealthRecord.minio_object_name.in_(names))
+    files = select(
+        PaymentFile.minio_object_name.label("name"),
+        case((_payment_expired(cutoff), 0), else_=1).label("kept")
+    ).join(
+        PaymentRecord, PaymentFile.payment_record_id == PaymentRecord.id
+    ).where(PaymentFile.minio_object_name.in_(names))
+    refs = union_all(records, files).subquery()
+
+    rows = db.execute(select(refs.c.name, func.sum(refs.c.kept)).group_by(refs.c.name))
+    return {name: kept for name, kept in rows}
+
+def _release_objects(db: Session, candidates: Dict[str, int], cutoff: datetime, dry_run: bool) -> Dict[str, int]:
+    """Drop StoredObject rows nothing else uses; returns the freed object names with their sizes.
+
+    Whether an object is still used is decided by scanning the rows that name
+    it, not by a counter, so deletes and purges need no bookkeeping of their own.
+    """
+    names = list(candidates)
+    query = db.query(StoredObject).filter(StoredObject.minio_object_name.in_(names))
+    if not dry_run:
+        # Serialises with uploads that would add a reference to the same content
+        query = query.with_for_update()
+    stored = {obj.minio_object_name: obj for obj in query}
+    references = _kept_references(db, names, cutoff)
+
+    freed = {}
+    for name in names:
+        if references.get(name):
+            continue
+        obj = stored.get(name)
+        freed[name] = obj.size if obj is not None else candidates[name]
+        if obj is not None and not dry_run:
+            db.delete(obj)
+    return freed
+
+def _record_batch(db: Session, cutoff: datetime, after: str, batch_size: int, dry_run: bool):
+    query = db.query(
+        HealthRecord.id, HealthRecord.user_id, HealthRecord.minio_object_name, HealthRecord.file_size
+    ).filter(_record_expired(cutoff), HealthRecord.id > after).order_by(HealthRecord.id).limit(batch_size)
+    if not dry_run:
+        query = query.with_for_update(skip_locked=True)
+    rows = query.all()
+
+    ids = [row.id for row in rows]
+    if ids and not dry_run:
+        db.query(PaymentRecord).filter(PaymentRecord.health_record_id.in_(ids)).update(
+            {PaymentRecord.health_record_id: None}, synchronize_session=False
+        )
+        db.execute(record_tags.delete().where(record_tags.c.record_id.in_(ids)))
+        db.query(HealthRecord).filter(HealthRecord.id.in_(ids)).delete(synchronize_session=False)
+
+    objects = {row.minio_object_name: row.file_size or 0 for row in rows if row.minio_object_name}
+    return ids, {row.user_id for row in rows}, objects, 0
+
+def _payment_batch(db: Session, cutoff: datetime, after: str, batch_size: int, dry_run: bool):
+    query = db.query(PaymentRecord.id, PaymentRecord.user_id).filter(
+        _payment_expired(cutoff), PaymentRecord.id > after
+    ).order_by(PaymentRecord.id).limit(batch_size)
+    if not dry_run:
+        query = query.with_for_update(skip_locked=True)
+    rows = query.all()
+
+    ids = [row.id for row in rows]
+    files = db.query(PaymentFile.minio_object_name, PaymentFile.file_size).filter(
+        PaymentFile.payment_record_id.in_(ids)
+    ).all() if ids else []
+    if ids and not dry_run:
+        db.query(PaymentFile).filter(PaymentFile.payment_record_id.in_(ids)).delete(synchronize_session=False)
+        db.query(PaymentRecord).filter(PaymentRecord.id.in_(ids)).delete(synchronize_session=False)
+
+    objects = {name: size or 0 for name, size in files if name}
+    return ids, {row.user_id for row in rows}, objects, len(files)
+
+def purge_soft_deleted(dry_run: bool = False, older_than_days: Optional[int] = None,
+                       batch_size: Optional[int] = None) -> dict:
+    """Permanently remove health and payment records soft-deleted more than N days ago.
+
+    Works in batches, each in its own transaction: the rows go first, then
+    every object no remaining row refers to is removed from MinIO in bulk and
+    the owners' storage_used_mb is recounted. An object whose removal fails
+    after the commit is left for the orphan scan. With dry_run nothing is
+    changed and the counts are what a real run would remove now.
+    """
+    days = settings.SOFT_DELETE_RETENTION_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.SOFT_DELETE_GC_BATCH
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    result = {
+        "dry_run": dry_run,
+        "cutoff": cutoff.isoformat(),
+        "health_records": 0,
+        "payment_records": 0,
+        "payment_files": 0,
+        "objects": 0,
+        "bytes": 0,
+        "failed_objects": 0,
+        "users": 0
+    }
+    users = set()
+    # Rows sharing an object can fall into different batches; count each object once
+    released = set()
+
+    for kind, fetch in (("health_records", _record_batch), ("payment_records", _payment_batch)):
+        after = ""
+        while True:
+            db = SessionLocal()
+            try:
+                ids, user_ids, candidates, file_count = fetch(db, cutoff, after, batch_size, dry_run)
+                if not ids:
+                    break
+                freed = _release_objects(db, candidates, cutoff, dry_run) if candidates else {}
+                if not dry_run:
+                    for user_id, used in storage_used_mb(db, user_ids).items():
+                        db.query(User).filter(User.id == user_id).update(
+                            {User.storage_used_mb: used}, synchronize_session=False
+                        )
+                    db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            freed = {name: size for name, size in freed.items() if name not in released}
+            released.update(freed)
+            # Only after the commit: a rolled back batch must not lose objects its rows still use
+            failed = set(storage_service.remove_objects(freed)) if freed and not dry_run else set()
+            if failed:
+                logger.warning(f"Could not remove {len(failed)} objects of purged {kind}")
+
+            after = ids[-1]
+            users.update(user_ids)
+            result[kind] += len(ids)
+            result["payment_files"] += file_count
+            result["objects"] += len(freed) - len(failed)
+            result["bytes"] += sum(size for name, size in freed.items() if name not in failed)
+            result["failed_objects"] += len(failed)
+            if len(ids) < batch_size:
+                break
+
+    result["users"] = len(users)
+    if not dry_run and (result["health_records"] or result["payment_records"]):
+        logger.info(
+            f"Purged {result['health_records']} health records and {result['payment_records']} payment records, "
+            f"freeing {result['objects']} objects"
+        )
+    return result
@@ -1,7 +1,8 @@
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 import io
-from typing import Optional
+from typing import Iterable, List, Optional
 
 from app.core.config import settings
 
@@ -24,6 +25,10 @@ class StorageService:
             print(f"Error creating bucket: {e}")
     
     async def upload_file(self, content: bytes, object_name: str) -> bool:
+        return self.put_object_bytes(content, object_name)
+    
+    def put_object_bytes(self, content: bytes, object_name: str) -> bool:
+        """Blocking upload, safe to call from worker threads"""
         try:
             self.client.put_object(
                 self.bucket_name,
@@ -36,7 +41,46 @@ class StorageService:
             print(f"Error uploading file: {e}")
             return False
     
+    def put_object_file(self, file_path: str, object_name: str, content_type: str = "application/octet-stream") -> bool:
+        """Blocking multipart upload streamed from a local file"""
+        try:
+            self.client.fput_object(self.bucket_name, object_name, file_path, content_type=content_type)
+            return True
+        except S3Error as e:
+            print(f"Error uploading file: {e}")
+            return False
+    
+    def put_object_stream(self, stream, object_name: str, content_type: str = "application/octet-stream",
+                          part_size: int = 10 * 1024 * 1024, length: int = -1) -> bool:
+        """Blocking multipart upload from a readable stream, of unknown length by default"""
+        try:
+            self.client.put_object(
+                self.bucket_name,
+                object_name,
+                stream,
+                length=length,
+                part_size=part_size,
+                content_type=content_type
+            )
+            return True
+        except S3Error as e:
+            print(f"Error uploading file: {e}")
+            return False
+    
+    def iter_object(self, object_name: str, chunk_size: int = 1024 * 1024):
+        """Yield an object in chunks without holding it in memory; blocking"""
+        response = self.client.get_object(self.bucket_name, object_name)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+    
     async def download_file(self, object_name: str) -> Optional[bytes]:
+        return self.get_object_bytes(object_name)
+    
+    def get_object_bytes(self, object_name: str) -> Optional[bytes]:
+        """Blocking download, safe to call from worker threads"""
         try:
             response = self.client.get_object(self.bucket_name, object_name)
             content = response.read()
@@ -48,6 +92,10 @@ class StorageService:
             return None
     
     async def delete_file(self, object_name: str) -> bool:
+        return self.remove_object(object_name)
+    
+    def remove_object(self, object_name: str) -> bool:
+        """Blocking delete, safe to call from worker threads"""
         try:
             self.client.remove_object(self.bucket_name, object_name)
             return True
@@ -55,6 +103,19 @@ class StorageService:
             print(f"Error deleting file: {e}")
             return False
     
+    def remove_objects(self, object_names: Iterable[str]) -> List[str]:
+        """Blocking bulk delete; MinIO removes up to 1000 objects per request.
+        Returns the names that could not be deleted."""
+        errors = self.client.remove_objects(
+            self.bucket_name, (DeleteObject(name) for name in object_names)
+        )
+        # The result is lazy: nothing is deleted until it is consumed
+        return [error.name for error in errors]
+    
+    def iter_objects(self, prefix: str = ""):
+        """Yield every object under prefix with its size, ETag and modification time; blocking"""
+        yield from self.client.list_objects(self.bucket_name, prefix=prefix, recursive=True)
+    
     async def list_files(self, prefix: str) -> list:
         try:
             objects = self.client.list_objects(self.bucket_name, prefix=prefix)
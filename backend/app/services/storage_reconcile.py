@@ -0,0 +1,173 @@
+"""
+HealthStash - Object Store Reconciliation
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from sqlalchemy import literal, select, union_all
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.health_record import HealthRecord
+from app.models.payment_record import PaymentFile
+from app.models.report_job import ReportJob
+from app.models.stored_object import StoredObject
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+CURSOR_BATCH = 5000
+REMOVE_BATCH = 1000  # the most one multi-object delete request takes; also used for row repairs
+SAMPLE_SIZE = 100  # orphans and dangling rows listed in the report
+
+def _excluded(name: str) -> bool:
+    prefixes = [prefix.strip() for prefix in settings.RECONCILE_EXCLUDE_PREFIXES.split(",") if prefix.strip()]
+    return any(name.startswith(prefix) for prefix in prefixes)
+
+def _referenced_names():
+    """Every column naming a MinIO object, as (name, table, row id)"""
+    refs = union_all(
+        select(HealthRecord.minio_object_name.label("name"), literal("health_records").label("source"),
+               HealthRecord.id.label("id")).where(HealthRecord.minio_object_name.isnot(None)),
+        select(PaymentFile.minio_object_name, literal("payment_files"), PaymentFile.id).where(
+            PaymentFile.minio_object_name.isnot(None)
+        ),
+        select(StoredObject.minio_object_name, literal("stored_objects"), StoredObject.id),
+        select(ReportJob.object_name, literal("report_jobs"), ReportJob.id).where(ReportJob.object_name.isnot(None))
+    ).subquery()
+    # Byte order, which is how MinIO lists keys
+    return select(refs.c.name, refs.c.source, refs.c.id).order_by(refs.c.name.collate("C"))
+
+def _in_order(items: Iterable, key) -> Iterator:
+    """Pass items through, failing loudly if they are not sorted; a merge over
+    unsorted input would report everything as orphaned"""
+    previous = None
+    for item in items:
+        current = key(item)
+        if previous is not None and current < previous:
+            raise ValueError(f"Reconciliation input out of order: {current!r} after {previous!r}")
+        previous = current
+        yield item
+
+def merge_join(objects: Iterable, rows: Iterable) -> Iterator[Tuple[Optional[object], Optional[object]]]:
+    """Merge objects and rows, both sorted by name, yielding what has no partner.
+
+    Yields (object, None) for an object no row names and (None, row) for a row
+    whose object does not exist. Several rows may name the same object.
+    """
+    objects = _in_order(objects, lambda item: item.object_name)
+    rows = _in_order(rows, lambda row: row.name)
+    obj, row = next(objects, None), next(rows, None)
+    while obj is not None or row is not None:
+        if row is None or (obj is not None and obj.object_name < row.name):
+            yield obj, None
+            obj = next(objects, None)
+        elif obj is None or row.name < obj.object_name:
+            yield None, row
+            row = next(rows, None)
+        else:
+            name = row.name
+            while row is not None and row.name == name:
+                row = next(rows, None)
+            obj = next(objects, None)
+
+def reconcile_storage(repair: bool = False) -> dict:
+    """Compare the bucket with every object name the database holds.
+
+    Both sides are streamed in name order and merge-joined, so memory stays
+    flat however many objects there are. Orphans are objects no row names;
+    objects younger than RECONCILE_GRACE_MINUTES are left alone because an
+    upload stores its object before its row commits. Dangling rows name an
+    object that does not exist.
+
+    With repair, orphans are removed in bulk and stored_objects entries for
+    missing objects are dropped, so the next upload of that content stores it
+    again. Other dangling rows are only reported: their files cannot be
+    recovered from here, only from a backup.
+    """
+    grace_cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.RECONCILE_GRACE_MINUTES)
+    result = {
+        "repair": repair,
+        "objects_scanned": 0,
+        "rows_scanned": 0,
+        "orphaned_objects": 0,
+        "orphaned_bytes": 0,
+        "recent_objects_skipped": 0,
+        "dangling_rows": {},
+        "removed_objects": 0,
+        "failed_objects": 0,
+        "dropped_stored_objects": 0,
+        "orphan_sample": [],
+        "dangling_sample": []
+    }
+    to_remove, stale_stored = [], []
+
+    def flush_removals():
+        failed = storage_service.remove_objects(to_remove)
+        result["removed_objects"] += len(to_remove) - len(failed)
+        result["failed_objects"] += len(failed)
+        to_remove.clear()
+
+    def flush_stale():
+        # A separate session: the listing session holds its cursor open for the whole scan
+        repair_db = SessionLocal()
+        try:
+            result["dropped_stored_objects"] += repair_db.query(StoredObject).filter(
+                StoredObject.id.in_(stale_stored)
+            ).delete(synchronize_session=False)
+            repair_db.commit()
+        finally:
+            repair_db.close()
+        stale_stored.clear()
+
+    def counted(items, key):
+        for item in items:
+            result[key] += 1
+            yield item
+
+    db = SessionLocal()
+    try:
+        # The row snapshot is taken before listing starts, so every row in it
+        # had its object uploaded before the listing could pass it
+        rows = db.execute(_referenced_names().execution_options(yield_per=CURSOR_BATCH))
+        rows = (row for row in rows if not _excluded(row.name))
+        objects = (item for item in storage_service.iter_objects() if not _excluded(item.object_name))
+
+        for obj, row in merge_join(counted(objects, "objects_scanned"), counted(rows, "rows_scanned")):
+            if obj is not None:
+                if obj.last_modified is not None and obj.last_modified > grace_cutoff:
+                    result["recent_objects_skipped"] += 1
+                    continue
+                result["orphaned_objects"] += 1
+                result["orphaned_bytes"] += obj.size or 0
+                if len(result["orphan_sample"]) < SAMPLE_SIZE:
+                    result["orphan_sample"].append(obj.object_name)
+                if repair:
+                    to_remove.append(obj.object_name)
+                    if len(to_remove) >= REMOVE_BATCH:
+                        flush_removals()
+            else:
+                dangling = result["dangling_rows"]
+                dangling[row.source] = dangling.get(row.source, 0) + 1
+                if len(result["dangling_sample"]) < SAMPLE_SIZE:
+                    result["dangling_sample"].append({"table": row.source, "id": row.id, "object_name": row.name})
+                if repair and row.source == "stored_objects":
+                    stale_stored.append(row.id)
+                    if len(stale_stored) >= REMOVE_BATCH:
+                        flush_stale()
+        if to_remove:
+            flush_removals()
+        if stale_stored:
+            flush_stale()
+    finally:
+        db.close()
+
+    if result["orphaned_objects"] or result["dangling_rows"]:
+        logger.warning(
+            f"Storage reconciliation found {result['orphaned_objects']} orphaned objects and "
+            f"{sum(result['dangling_rows'].values())} rows without their object"
+        )
+    return result
@@ -0,0 +1,209 @@
+"""
+HealthStash - Admin Statistics Summary
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.database import engine
+from app.models.audit_log import AuditAction
+from app.models.system_stats import ActivityCounter
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_RETENTION_DAYS = 8
+
+# Each user change appends a delta row, so concurrent uploads never queue on one hot summary row
+USERS_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION system_stats_users_delta() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO system_stats_deltas (users_total, users_active, users_locked, users_admins, storage_used_mb, storage_quota_mb)
+        VALUES (1, NEW.is_active::int, NEW.is_locked::int, (NEW.role = 'admin')::int,
+                COALESCE(NEW.storage_used_mb, 0), COALESCE(NEW.storage_quota_mb, 0));
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO system_stats_deltas (users_total, users_active, users_locked, users_admins, storage_used_mb, storage_quota_mb)
+        VALUES (-1, -OLD.is_active::int, -OLD.is_locked::int, -(OLD.role = 'admin')::int,
+                -COALESCE(OLD.storage_used_mb, 0), -COALESCE(OLD.storage_quota_mb, 0));
+    ELSE
+        INSERT INTO system_stats_deltas (users_total, users_active, users_locked, users_admins, storage_used_mb, storage_quota_mb)
+        VALUES (0, NEW.is_active::int - OLD.is_active::int, NEW.is_locked::int - OLD.is_locked::int,
+                (NEW.role = 'admin')::int - (OLD.role = 'admin')::int,
+                COALESCE(NEW.storage_used_mb, 0) - COALESCE(OLD.storage_used_mb, 0),
+                COALESCE(NEW.storage_quota_mb, 0) - COALESCE(OLD.storage_quota_mb, 0));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_system_stats_users_write
+AFTER INSERT OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION system_stats_users_delta();
+
+CREATE OR REPLACE TRIGGER trg_system_stats_users_update
+AFTER UPDATE OF is_active, is_locked, role, storage_used_mb, storage_quota_mb ON users
+FOR EACH ROW
+WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active
+      OR OLD.is_locked IS DISTINCT FROM NEW.is_locked
+      OR OLD.role IS DISTINCT FROM NEW.role
+      OR OLD.storage_used_mb IS DISTINCT FROM NEW.storage_used_mb
+      OR OLD.storage_quota_mb IS DISTINCT FROM NEW.storage_quota_mb)
+EXECUTE FUNCTION system_stats_users_delta();
+"""
+
+STAT_COLUMNS = ("users_total", "users_active", "users_locked", "users_admins", "storage_used_mb", "storage_quota_mb")
+
+def install_stats_triggers():
+    with engine.begin() as conn:
+        conn.exec_driver_sql(USERS_TRIGGER_SQL)
+
+def hour_bucket(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def record_activity(db: Session, events: Iterable[Tuple[AuditAction, datetime]]):
+    """Add audit events to the hourly counters inside the caller's transaction"""
+    counts = Counter((hour_bucket(created_at), action) for action, created_at in events)
+    if not counts:
+        return
+    statement = insert(ActivityCounter.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["bucket", "action"],
+        set_={"count": ActivityCounter.__table__.c.count + statement.excluded.count}
+    )
+    # Sorted so concurrent flushers lock counter rows in the same order
+    db.execute(statement, [
+        {"bucket": bucket, "action": action, "count": count}
+        for (bucket, action), count in sorted(counts.items(), key=lambda item: (item[0][0], item[0][1].name))
+    ])
+
+def fold_stats_deltas() -> int:
+    """Apply pending deltas to the summary row and delete them in one statement"""
+    sums = ", ".join(f"COALESCE(SUM({column}), 0) AS {column}" for column in STAT_COLUMNS)
+    assignments = ", ".join(f"{column} = system_stats.{column} + folded.{column}" for column in STAT_COLUMNS)
+    with engine.begin() as conn:
+        result = conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM system_stats_deltas
+                WHERE EXISTS (SELECT 1 FROM system_stats WHERE id = 1)
+                RETURNING *
+            ),
+                 folded AS (SELECT COUNT(*) AS n, {sums} FROM moved)
+            UPDATE system_stats SET {assignments}
+            FROM folded
+            WHERE system_stats.id = 1
+            RETURNING folded.n
+        """)).scalar()
+    return result or 0
+
+def refresh_system_stats():
+    """Recount everything from source tables; corrects drift and seeds the summary.
+
+    Runs in a REPEATABLE READ snapshot: deltas committed after the snapshot are
+    not deleted, and the changes they describe are not in the recount either.
+    Activity counters are only rebuilt for hours the audit writer has finished.
+    """
+    now = datetime.now(timezone.utc)
+    settled = hour_bucket(now) - timedelta(hours=1)
+    since = hour_bucket(now) - timedelta(days=ACTIVITY_RETENTION_DAYS)
+
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        with conn.begin():
+            conn.execute(text("""
+                INSERT INTO system_stats (id, users_total, users_active, users_locked, users_admins,
+                                          storage_used_mb, storage_quota_mb, refreshed_at)
+                SELECT 1,
+                       COUNT(*),
+                       COUNT(*) FILTER (WHERE is_active),
+                       COUNT(*) FILTER (WHERE is_locked),
+                       COUNT(*) FILTER (WHERE role = 'admin'),
+                       COALESCE(SUM(storage_used_mb), 0),
+                       COALESCE(SUM(storage_quota_mb), 0),
+                       :now
+                FROM users
+                ON CONFLICT (id) DO UPDATE SET
+                    users_total = EXCLUDED.users_total,
+                    users_active = EXCLUDED.users_active,
+                    users_locked = EXCLUDED.users_locked,
+                    users_admins = EXCLUDED.users_admins,
+                    storage_used_mb = EXCLUDED.storage_used_mb,
+                    storage_quota_mb = EXCLUDED.storage_quota_mb,
+                    refreshed_at = EXCLUDED.refreshed_at
+            """), {"now": now})
+            conn.execute(text("DELETE FROM system_stats_deltas"))
+
+            conn.execute(text("""
+                INSERT INTO activity_counters (bucket, action, count)
+                SELECT date_trunc('hour', created_at), action, COUNT(*)
+                FROM audit_logs
+                WHERE created_at >= :since AND created_at < :settled
+                GROUP BY 1, 2
+                ON CONFLICT (bucket, action) DO UPDATE SET count = EXCLUDED.count
+            """), {"since": since, "settled": settled})
+            conn.execute(text("DELETE FROM activity_counters WHERE bucket < :since"), {"since": since})
+
+    logger.info("Refreshed system statistics summary")
+
+def read_system_stats(db: Session) -> Optional[dict]:
+    """Summary row plus unfolded deltas and the hourly activity window, in one query;
+    None until refresh_system_stats has seeded the summary"""
+    now = datetime.now(timezone.utc)
+    last_24h = hour_bucket(now) - timedelta(hours=23)
+    last_7d = hour_bucket(now) - timedelta(days=7)
+    totals = ", ".join(f"s.{column} + COALESCE(d.{column}, 0) AS {column}" for column in STAT_COLUMNS)
+    sums = ", ".join(f"SUM({column}) AS {column}" for column in STAT_COLUMNS)
+
+    row = db.execute(text(f"""
+        SELECT {totals}, s.refreshed_at,
+               a.logins_24h, a.uploads_7d, a.failed_logins_24h
+        FROM system_stats s
+        CROSS JOIN (SELECT {sums} FROM system_stats_deltas) d
+        CROSS JOIN (
+            SELECT COALESCE(SUM(count) FILTER (WHERE action = :login AND bucket >= :last_24h), 0) AS logins_24h,
+                   COALESCE(SUM(count) FILTER (WHERE action = :upload), 0) AS uploads_7d,
+                   COALESCE(SUM(count) FILTER (WHERE action = :failed AND bucket >= :last_24h), 0) AS failed_logins_24h
+            FROM activity_counters
+            WHERE bucket >= :last_7d
+        ) a
+        WHERE s.id = 1
+    """), {
+        "login": AuditAction.LOGIN.name,
+        "upload": AuditAction.FILE_UPLOAD.name,
+        "failed": AuditAction.LOGIN_FAILED.name,
+        "last_24h": last_24h,
+        "last_7d": last_7d
+    }).mappings().first()
+
+    if row is None:
+        return None
+
+    total_used = int(row["storage_used_mb"])
+    total_quota = int(row["storage_quota_mb"])
+    return {
+        "users": {
+            "total": int(row["users_total"]),
+            "active": int(row["users_active"]),
+            "locked": int(row["users_locked"]),
+            "admins": int(row["users_admins"])
+        },
+        "storage": {
+            "total_used_mb": total_used,
+            "total_quota_mb": total_quota,
+            "percentage": (total_used / total_quota * 100) if total_quota > 0 else 0
+        },
+        "activity": {
+            "logins_24h": int(row["logins_24h"]),
+            "uploads_7d": int(row["uploads_7d"]),
+            "failed_logins_24h": int(row["failed_logins_24h"])
+        },
+        "refreshed_at": row["refreshed_at"]
+    }
@@ -0,0 +1,266 @@
+"""
+HealthStash - Document Text Extraction
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+import io
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core import executors
+
+logger = logging.getLogger(__name__)
+
+PLAIN_TEXT_EXTENSIONS = {".txt", ".csv", ".json", ".xml", ".hl7"}
+MARKDOWN_EXTENSIONS = {".md", ".markdown"}
+HTML_EXTENSIONS = {".html", ".htm"}
+RTF_EXTENSIONS = {".rtf"}
+OFFICE_TYPES = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)
+# Groups holding fonts, colours, metadata or pictures rather than document text
+RTF_SKIPPED_GROUPS = {"fonttbl", "colortbl", "stylesheet", "info", "pict", "header", "footer", "listtable",
+                      "listoverridetable", "rsidtbl", "generator", "xmlnstbl", "themedata", "datastore"}
+RTF_TOKEN = re.compile(r"\\([a-z]+)(-?\d+)? ?|\\'([0-9a-f]{2})|\\(.)|([{}])|([^\\{}\r\n]+)|[\r\n]+", re.I)
+
+class ExtractionTimeout(Exception):
+    pass
+
+class _Deadline:
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def check(self):
+        if time.monotonic() > self.expires:
+            raise ExtractionTimeout("Text extraction time limit exceeded")
+
+def normalize_text(text: str, max_chars: Optional[int] = None) -> str:
+    """Collapse whitespace and strip characters PostgreSQL cannot store"""
+    max_chars = max_chars or settings.TEXT_EXTRACTION_MAX_CHARS
+    text = text.replace("\x00", " ")
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    text = re.sub(r"\s*\n\s*", "\n", text)
+    return text.strip()[:max_chars]
+
+def _extract_pdf(content: bytes, deadline: _Deadline, max_chars: int) -> str:
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(content))
+    parts, length = [], 0
+    for page in reader.pages:
+        deadline.check()
+        page_text = page.extract_text() or ""
+        parts.append(page_text)
+        length += len(page_text)
+        if length >= max_chars:
+            break
+    return "\n".join(parts)
+
+def _extract_docx(content: bytes, deadline: _Deadline, max_chars: int) -> str:
+    import docx
+    document = docx.Document(io.BytesIO(content))
+    parts, length = [], 0
+    for paragraph in document.paragraphs:
+        deadline.check()
+        parts.append(paragraph.text)
+        length += len(paragraph.text)
+        if length >= max_chars:
+            return "\n".join(parts)
+    for table in document.tables:
+        for row in table.rows:
+            deadline.check()
+            parts.append(" ".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+def _extract_xlsx(content: bytes, deadline: _Deadline, max_chars: int) -> str:
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    parts, length = [], 0
+    try:
+        for sheet in workbook.worksheets:
+            parts.append(sheet.title)
+            for row in sheet.iter_rows(values_only=True):
+                deadline.check()
+                line = " ".join(str(value) for value in row if value is not None)
+                if line:
+                    parts.append(line)
+                    length += len(line)
+                if length >= max_chars:
+                    return "\n".join(parts)
+    finally:
+        workbook.close()
+    return "\n".join(parts)
+
+def _extract_html(content: bytes) -> str:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    for element in soup(["script", "style"]):
+        element.decompose()
+    return soup.get_text("\n")
+
+def _extract_rtf(content: bytes, deadline: _Deadline) -> str:
+    """Text of an RTF document without its control words, tables of fonts and colours or pictures"""
+    parts = []
+    skip_depth = None  # group depth at which an ignored group started
+    depth = 0
+    unicode_skip = 0
+    for match in RTF_TOKEN.finditer(content.decode("latin-1")):
+        word, argument, hex_char, symbol, brace, text = match.groups()
+        if brace == "{":
+            depth += 1
+            continue
+        if brace == "}":
+            if skip_depth is not None and depth <= skip_depth:
+                skip_depth = None
+            depth -= 1
+            deadline.check()
+            continue
+        if symbol == "*" and skip_depth is None:
+            skip_depth = depth  # \* marks a destination readers may ignore
+        elif word and word.lower() in RTF_SKIPPED_GROUPS and skip_depth is None:
+            skip_depth = depth
+        if skip_depth is not None:
+            continue
+
+        if word:
+            word = word.lower()
+            if word in ("par", "line", "row", "sect", "page"):
+                parts.append("\n")
+            elif word in ("tab", "cell"):
+                parts.append(" ")
+            elif word == "u" and argument:
+                parts.append(chr(int(argument) % 65536))
+                unicode_skip = 1  # the ANSI fallback that follows
+        elif hex_char:
+            if unicode_skip:
+                unicode_skip -= 1
+            else:
+                parts.append(bytes([int(hex_char, 16)]).decode("cp1252", errors="replace"))
+        elif symbol in ("\\", "{", "}"):
+            parts.append(symbol)
+        elif symbol == "~":
+            parts.append(" ")
+        elif text:
+            if unicode_skip:
+                text = text[1:]
+                unicode_skip = 0
+            parts.append(text)
+    return "".join(parts)
+
+def _extract_markdown(content: bytes) -> str:
+    import markdown
+    html = markdown.markdown(content.decode("utf-8", errors="replace"))
+    return _extract_html(html.encode("utf-8"))
+
+def extract_text(content: bytes, file_type: Optional[str], file_name: Optional[str],
+                 timeout_seconds: Optional[float] = None, max_chars: Optional[int] = None) -> str:
+    """Extract normalized plain text from a decrypted document, or "" if unsupported"""
+    max_chars = max_chars or settings.TEXT_EXTRACTION_MAX_CHARS
+    deadline = _Deadline(timeout_seconds or settings.TEXT_EXTRACTION_TIMEOUT_SECONDS)
+    ext = os.path.splitext(file_name or "")[1].lower()
+    file_type = file_type or ""
+
+    if ext == ".pdf" or file_type == "application/pdf":
+        text = _extract_pdf(content, deadline, max_chars)
+    elif ext == ".docx" or "wordprocessingml" in file_type:
+        text = _extract_docx(content, deadline, max_chars)
+    elif ext == ".xlsx" or "spreadsheetml" in file_type:
+        text = _extract_xlsx(content, deadline, max_chars)
+    elif ext in HTML_EXTENSIONS or file_type == "text/html":
+        text = _extract_html(content)
+    elif ext in MARKDOWN_EXTENSIONS or file_type == "text/markdown":
+        text = _extract_markdown(content)
+    elif ext in RTF_EXTENSIONS or file_type in ("application/rtf", "text/rtf"):
+        text = _extract_rtf(content, deadline)
+    elif ext in PLAIN_TEXT_EXTENSIONS or file_type.startswith("text/"):
+        text = content[:max_chars * 4].decode("utf-8", errors="replace")
+    else:
+        return ""
+
+    return normalize_text(text, max_chars)
+
+def is_extractable(file_type: Optional[str], file_name: Optional[str]) -> bool:
+    ext = os.path.splitext(file_name or "")[1].lower()
+    file_type = file_type or ""
+    return (
+        ext in {".pdf", ".docx", ".xlsx"} | PLAIN_TEXT_EXTENSIONS | MARKDOWN_EXTENSIONS | HTML_EXTENSIONS | RTF_EXTENSIONS
+        or file_type in ("application/pdf", "application/rtf") + OFFICE_TYPES
+        or file_type.startswith("text/")
+    )
+
+def search_vector(title: Optional[str], description: Optional[str], content_text: Optional[str]):
+    """SQL expression for a record's search_vector, refreshed whenever one of its parts changes"""
+    return func.to_tsvector("simple", func.concat_ws(" ", title, description, content_text))
+
+def extract_stored_text(object_name: str, user_key: bytes, file_type: Optional[str],
+                        file_name: Optional[str]) -> str:
+    """Download, decrypt and extract a stored object inside an extraction worker process"""
+    from app.services.storage import storage_service
+    from app.core.security import decrypt_file_content
+
+    encrypted_content = storage_service.get_object_bytes(object_name)
+    if not encrypted_content:
+        return ""
+    content = decrypt_file_content(encrypted_content, user_key)
+    del encrypted_content
+    return extract_text(content, file_type, file_name)
+
+async def extract_record_text(record_id: str):
+    """Background stage run after upload: fill content_text and search_vector for a record"""
+    from app.core.database import SessionLocal
+    from app.core.security import get_user_file_key
+    from app.models.health_record import HealthRecord
+
+    if not settings.TEXT_EXTRACTION_ENABLED:
+        return
+
+    db = SessionLocal()
+    try:
+        record = db.query(HealthRecord).filter(HealthRecord.id == record_id).first()
+        if not record or not record.minio_object_name:
+            return
+        if not is_extractable(record.file_type, record.file_name):
+            return
+        if record.file_size and record.file_size > settings.TEXT_EXTRACTION_MAX_FILE_MB * 1024 * 1024:
+            logger.info(f"Skipping text extraction for record {record_id}: file too large")
+            return
+
+        pool = executors.extraction_executor
+        try:
+            text = await asyncio.wait_for(
+                executors.run_in_executor(
+                    pool, extract_stored_text,
+                    record.minio_object_name, get_user_file_key(record.user),
+                    record.file_type, record.file_name
+                ),
+                timeout=settings.TEXT_EXTRACTION_TIMEOUT_SECONDS + 5
+            )
+        except ExtractionTimeout:
+            logger.warning(f"Text extraction timed out for record {record_id}")
+            return
+        except asyncio.TimeoutError:
+            # The parser ignored its own deadline and is stuck in native code
+            logger.warning(f"Text extraction hung for record {record_id}; recycling the extraction workers")
+            executors.recycle_extraction_executor(pool)
+            return
+
+        if not text:
+            return
+
+        record.content_text = text
+        record.search_vector = search_vector(record.title, record.description, text)
+        db.commit()
+        logger.info(f"Extracted {len(text)} characters of text for record {record_id}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Text extraction failed for record {record_id}: {e}")
+    finally:
+        db.close()
@@ -6,8 +6,7 @@ import PyPDF2
 import logging
 
 from app.services.storage import storage_service
-from app.core.security import decrypt_file_content, derive_key_from_password
-from app.core.config import settings
+from app.core.security import decrypt_file_content, get_user_file_key
 
 logger = logging.getLogger(__name__)
 
@@ -20,24 +19,31 @@ async def generate_thumbnail(record) -> Optional[str]:
             return None
         
         # Decrypt the file
-        user_key = derive_key_from_password(
-            f"{record.user_id}:{record.user.hashed_password}:{settings.ENCRYPTION_KEY}",
-            record.user.encryption_salt
-        )
+        user_key = get_user_file_key(record.user)
         decrypted_content = decrypt_file_content(encrypted_content, user_key)
         
-        # Generate thumbnail based on file type
-        if record.file_type and record.file_type.startswith('image/'):
-            return generate_image_thumbnail(decrypted_content)
-        elif record.file_type == 'application/pdf':
-            return generate_pdf_thumbnail(decrypted_content)
-        else:
-            return generate_document_icon(record.file_type)
+        return render_thumbnail(decrypted_content, record.file_type)
             
     except Exception as e:
         logger.error(f"Failed to generate thumbnail: {e}")
         return None
 
+def render_thumbnail(content: bytes, file_type: Optional[str]) -> Optional[str]:
+    """Generate thumbnail based on file type"""
+    if file_type and file_type.startswith('image/'):
+        return generate_image_thumbnail(content)
+    elif file_type == 'application/pdf':
+        return generate_pdf_thumbnail(content)
+    else:
+        return generate_document_icon(file_type or '')
+
+def build_stored_thumbnail(object_name: str, user_key: bytes, file_type: Optional[str]) -> Optional[str]:
+    """Download, decrypt and thumbnail a stored object (blocking, for worker pools)"""
+    encrypted_content = storage_service.get_object_bytes(object_name)
+    if not encrypted_content:
+        return None
+    return render_thumbnail(decrypt_file_content(encrypted_content, user_key), file_type)
+
 def generate_image_thumbnail(image_data: bytes, size=(200, 200)) -> str:
     """Generate thumbnail for image files"""
     try:
@@ -0,0 +1,299 @@
+"""
+HealthStash - Mobile Upload Token Store
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, List
+import heapq
+import json
+import threading
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+class TokenStore(ABC):
+    """Interface for mobile upload tokens and per-user recent uploads.
+
+    Tokens map to {"user_id", "expires_at", "created_at"}; lookups ignore
+    expired tokens. Recent uploads are kept newest first and bounded per user.
+    """
+
+    @abstractmethod
+    def set_token(self, token: str, user_id: str, expires_at: datetime):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_token(self, token: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def extend_token(self, token: str, expires_at: datetime):
+        """Push a token's expiry out to at least expires_at"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_token(self, token: str):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        return 0
+
+    @abstractmethod
+    def add_recent_upload(self, user_id: str, upload: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recent_uploads(self, user_id: str, limit: int = 10) -> List[dict]:
+        raise NotImplementedError
+
+class MemoryTokenStore(TokenStore):
+    """In-process store; only correct with a single uvicorn worker"""
+
+    def __init__(self, recent_limit: int = None):
+        self.recent_limit = recent_limit or settings.MOBILE_RECENT_UPLOADS_LIMIT
+        self._tokens = {}
+        self._expiry_heap = []
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def set_token(self, token: str, user_id: str, expires_at: datetime):
+        expires_at = _aware(expires_at)
+        with self._lock:
+            self._tokens[token] = {
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "created_at": datetime.now(timezone.utc)
+            }
+            heapq.heappush(self._expiry_heap, (expires_at, token))
+        self.purge_expired()
+
+    def get_token(self, token: str) -> Optional[dict]:
+        data = self._tokens.get(token)
+        if data is None:
+            return None
+        if data["expires_at"] < datetime.now(timezone.utc):
+            self.delete_token(token)
+            return None
+        return dict(data)
+
+    def extend_token(self, token: str, expires_at: datetime):
+        expires_at = _aware(expires_at)
+        with self._lock:
+            data = self._tokens.get(token)
+            if data and data["expires_at"] < expires_at:
+                data["expires_at"] = expires_at
+                heapq.heappush(self._expiry_heap, (expires_at, token))
+
+    def delete_token(self, token: str):
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def purge_expired(self) -> int:
+        """Pop only the expired head of the heap; stale entries from extensions are skipped"""
+        now = datetime.now(timezone.utc)
+        purged = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                _, token = heapq.heappop(self._expiry_heap)
+                data = self._tokens.get(token)
+                if data and data["expires_at"] < now:
+                    del self._tokens[token]
+                    purged += 1
+        return purged
+
+    def add_recent_upload(self, user_id: str, upload: dict):
+        with self._lock:
+            ring = self._recent.get(user_id)
+            if ring is None:
+                ring = self._recent[user_id] = deque(maxlen=self.recent_limit)
+            ring.appendleft(upload)
+
+    def get_recent_uploads(self, user_id: str, limit: int = 10) -> List[dict]:
+        ring = self._recent.get(user_id)
+        if not ring:
+            return []
+        return list(ring)[:limit]
+
+class DatabaseTokenStore(TokenStore):
+    """PostgreSQL-backed store shared by every worker"""
+
+    def __init__(self, session_factory=None, recent_limit: int = None):
+        if session_factory is None:
+            from app.core.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.recent_limit = recent_limit or settings.MOBILE_RECENT_UPLOADS_LIMIT
+
+    def set_token(self, token: str, user_id: str, expires_at: datetime):
+        from app.models.mobile_upload import MobileUploadToken
+        db = self.session_factory()
+        try:
+            db.merge(MobileUploadToken(token=token, user_id=user_id, expires_at=expires_at))
+            db.commit()
+        finally:
+            db.close()
+
+    def get_token(self, token: str) -> Optional[dict]:
+        from app.models.mobile_upload import MobileUploadToken
+        db = self.session_factory()
+        try:
+            row = db.query(MobileUploadToken).filter(
+                MobileUploadToken.token == token,
+                MobileUploadToken.expires_at > datetime.now(timezone.utc)
+            ).first()
+            if row is None:
+                return None
+            return {
+                "user_id": row.user_id,
+                "expires_at": _aware(row.expires_at),
+                "created_at": _aware(row.created_at)
+            }
+        finally:
+            db.close()
+
+    def extend_token(self, token: str, expires_at: datetime):
+        from app.models.mobile_upload import MobileUploadToken
+        db = self.session_factory()
+        try:
+            db.query(MobileUploadToken).filter(
+                MobileUploadToken.token == token,
+                MobileUploadToken.expires_at < expires_at
+            ).update({MobileUploadToken.expires_at: expires_at}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def delete_token(self, token: str):
+        from app.models.mobile_upload import MobileUploadToken
+        db = self.session_factory()
+        try:
+            db.query(MobileUploadToken).filter(MobileUploadToken.token == token).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        from app.models.mobile_upload import MobileUploadToken
+        db = self.session_factory()
+        try:
+            purged = db.query(MobileUploadToken).filter(
+                MobileUploadToken.expires_at < datetime.now(timezone.utc)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return purged
+        finally:
+            db.close()
+
+    def add_recent_upload(self, user_id: str, upload: dict):
+        from app.models.mobile_upload import MobileUploadEvent
+        db = self.session_factory()
+        try:
+            db.add(MobileUploadEvent(
+                user_id=user_id,
+                record_id=upload.get("id"),
+                name=upload.get("name"),
+                device=upload.get("device")
+            ))
+            db.flush()
+
+            # Trim to the newest recent_limit events for this user
+            keep = db.query(MobileUploadEvent.id).filter(
+                MobileUploadEvent.user_id == user_id
+            ).order_by(MobileUploadEvent.created_at.desc(), MobileUploadEvent.id.desc()).limit(self.recent_limit)
+            db.query(MobileUploadEvent).filter(
+                MobileUploadEvent.user_id == user_id,
+                ~MobileUploadEvent.id.in_(keep.scalar_subquery())
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_recent_uploads(self, user_id: str, limit: int = 10) -> List[dict]:
+        from app.models.mobile_upload import MobileUploadEvent
+        db = self.session_factory()
+        try:
+            events = db.query(MobileUploadEvent).filter(
+                MobileUploadEvent.user_id == user_id
+            ).order_by(MobileUploadEvent.created_at.desc(), MobileUploadEvent.id.desc()).limit(limit).all()
+            return [
+                {
+                    "id": event.record_id,
+                    "name": event.name,
+                    "timestamp": _aware(event.created_at).isoformat(),
+                    "device": event.device,
+                    "user_id": event.user_id
+                }
+                for event in events
+            ]
+        finally:
+            db.close()
+
+class RedisTokenStore(TokenStore):
+    """Redis-compatible store; requires the optional redis package"""
+
+    def __init__(self, url: str = None, recent_limit: int = None):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("MOBILE_TOKEN_STORE=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.recent_limit = recent_limit or settings.MOBILE_RECENT_UPLOADS_LIMIT
+
+    def _ttl(self, expires_at: datetime) -> int:
+        return max(1, int((_aware(expires_at) - datetime.now(timezone.utc)).total_seconds()))
+
+    def set_token(self, token: str, user_id: str, expires_at: datetime):
+        data = {
+            "user_id": user_id,
+            "expires_at": _aware(expires_at).isoformat(),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        self.client.set(f"mobile_token:{token}", json.dumps(data), ex=self._ttl(expires_at))
+
+    def get_token(self, token: str) -> Optional[dict]:
+        raw = self.client.get(f"mobile_token:{token}")
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        data["expires_at"] = datetime.fromisoformat(data["expires_at"])
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return data
+
+    def extend_token(self, token: str, expires_at: datetime):
+        data = self.get_token(token)
+        if data and data["expires_at"] < _aware(expires_at):
+            self.set_token(token, data["user_id"], expires_at)
+
+    def delete_token(self, token: str):
+        self.client.delete(f"mobile_token:{token}")
+
+    def add_recent_upload(self, user_id: str, upload: dict):
+        key = f"mobile_uploads:{user_id}"
+        pipe = self.client.pipeline()
+        pipe.lpush(key, json.dumps(upload))
+        pipe.ltrim(key, 0, self.recent_limit - 1)
+        pipe.execute()
+
+    def get_recent_uploads(self, user_id: str, limit: int = 10) -> List[dict]:
+        return [json.loads(item) for item in self.client.lrange(f"mobile_uploads:{user_id}", 0, limit - 1)]
+
+def create_token_store(backend: str = None) -> TokenStore:
+    backend = (backend or settings.MOBILE_TOKEN_STORE).lower()
+    if backend == "memory":
+        return MemoryTokenStore()
+    if backend == "redis":
+        return RedisTokenStore()
+    if backend == "database":
+        return DatabaseTokenStore()
+    raise ValueError(f"Unknown MOBILE_TOKEN_STORE backend: {backend}")
+
+token_store = create_token_store()
@@ -0,0 +1,163 @@
+"""
+HealthStash - Concurrent Multi-File Upload Pipeline
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import asyncio
+import logging
+
+from app.core.executors import upload_executor, run_in_executor
+from app.core.security import encrypt_file_content, generate_file_checksum
+from app.models.stored_object import StoredObject
+from app.services.dedup import mark_referenced, register_stored_object
+from app.services.soft_delete import live_record_exists
+from app.services.storage import storage_service
+from app.services.thumbnail import generate_image_thumbnail, generate_pdf_thumbnail
+
+logger = logging.getLogger(__name__)
+
+class StorageQuotaExceeded(Exception):
+    """Raised before any upload when a batch would add more unique bytes than the quota allows"""
+
+def _hash_and_thumbnail(content: bytes, content_type: Optional[str], with_thumbnail: bool) -> tuple:
+    checksum = generate_file_checksum(content)
+    thumbnail_data = None
+    if with_thumbnail and content_type:
+        if content_type.startswith('image/'):
+            thumbnail_data = generate_image_thumbnail(content, size=(200, 200))
+        elif content_type == 'application/pdf':
+            thumbnail_data = generate_pdf_thumbnail(content)
+    return checksum, thumbnail_data
+
+def _encrypt_and_put(content: bytes, user_key: bytes, object_name: str) -> bool:
+    return storage_service.put_object_bytes(encrypt_file_content(content, user_key), object_name)
+
+async def store_uploads(
+    db: Session,
+    user_id: str,
+    user_key: bytes,
+    uploads: List[dict],
+    object_name_for,
+    with_thumbnails: bool = True,
+    quota_remaining_bytes: Optional[int] = None
+) -> List[dict]:
+    """Hash, encrypt, thumbnail and store many files concurrently.
+
+    Each upload is a dict with filename, content_type and content. CPU-bound work
+    and MinIO puts run on upload_executor from app.core.executors, so its
+    UPLOAD_WORKERS threads are the only concurrency limit, and content the user
+    already stored (or repeated within the batch) is uploaded once. StoredObject bookkeeping is added to the session but not committed, so
+    the caller can write all rows in a single transaction.
+
+    With quota_remaining_bytes, StorageQuotaExceeded is raised before anything
+    is uploaded if the batch's unique content that is not already charged to
+    the user (new, or stored but only behind soft-deleted records) does not fit.
+
+    Returns one dict per upload with checksum, size, thumbnail_data, object_name
+    (None if the upload failed) and is_new (True when unique bytes were added).
+    """
+    if not uploads:
+        return []
+
+    # Stage 1: hashing and thumbnails in parallel
+    prepared = await asyncio.gather(*[
+        run_in_executor(
+            upload_executor, _hash_and_thumbnail,
+            upload["content"], upload.get("content_type"), with_thumbnails
+        )
+        for upload in uploads
+    ])
+
+    results = []
+    for upload, (checksum, thumbnail_data) in zip(uploads, prepared):
+        results.append({
+            "filename": upload["filename"],
+            "content_type": upload.get("content_type"),
+            "size": len(upload["content"]),
+            "checksum": checksum,
+            "thumbnail_data": thumbnail_data,
+            "object_name": None,
+            "is_new": False
+        })
+
+    # Stage 2: one lookup for content the user already stored; rows are locked
+    # only in stage 4, so no lock is held while MinIO uploads run
+    checksums = {result["checksum"] for result in results}
+    existing_ids, charged = {}, set()
+    for stored_id, checksum, live in db.query(
+        StoredObject.id, StoredObject.checksum, live_record_exists(user_id)
+    ).filter(
+        StoredObject.user_id == user_id,
+        StoredObject.checksum.in_(checksums)
+    ):
+        existing_ids[checksum] = stored_id
+        if live:
+            charged.add(checksum)
+
+    to_upload = {}
+    for index, result in enumerate(results):
+        if result["checksum"] not in existing_ids and result["checksum"] not in to_upload:
+            to_upload[result["checksum"]] = (index, object_name_for(result["filename"]))
+
+    if quota_remaining_bytes is not None:
+        # Stored content only behind soft-deleted records is no longer in the
+        # user's usage, so it counts again like new content
+        counted = {}
+        for result in results:
+            if result["checksum"] not in charged:
+                counted.setdefault(result["checksum"], result["size"])
+        if sum(counted.values()) > quota_remaining_bytes:
+            raise StorageQuotaExceeded()
+
+    # Stage 3: encrypt and upload each unique new content once
+    async def upload_one(index: int, object_name: str) -> bool:
+        try:
+            return await run_in_executor(
+                upload_executor, _encrypt_and_put,
+                uploads[index]["content"], user_key, object_name
+            )
+        except Exception as e:
+            logger.error(f"Failed to upload {object_name}: {e}")
+            return False
+
+    upload_ok = await asyncio.gather(*[
+        upload_one(index, object_name) for index, object_name in to_upload.values()
+    ])
+    uploaded = {
+        checksum: object_name
+        for (checksum, (_, object_name)), ok in zip(to_upload.items(), upload_ok)
+        if ok
+    }
+
+    # Stage 4: reference bookkeeping in the caller's transaction
+    existing = {
+        stored.checksum: stored
+        for stored in db.query(StoredObject).filter(
+            StoredObject.id.in_(list(existing_ids.values()))
+        ).with_for_update().all()
+    } if existing_ids else {}
+
+    for result in results:
+        checksum = result["checksum"]
+        stored = existing.get(checksum)
+        if stored is not None:
+            mark_referenced(stored)
+        elif checksum in existing_ids:
+            # Purged by the soft-delete GC while this batch uploaded; the caller reports it as failed
+            logger.warning(f"Stored content for {result['filename']} was removed during the upload")
+            continue
+        elif checksum in uploaded:
+            stored, created = register_stored_object(db, user_id, checksum, uploaded.pop(checksum), result["size"])
+            if created:
+                result["is_new"] = True
+            else:
+                await storage_service.delete_file(to_upload[checksum][1])
+            existing[checksum] = stored
+        else:
+            continue
+        result["object_name"] = stored.minio_object_name
+
+    return results
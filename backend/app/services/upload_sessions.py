@@ -0,0 +1,130 @@
+"""
+HealthStash - Resumable Chunked Upload Sessions
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Dict
+import json
+import logging
+
+from app.core.executors import upload_executor, run_in_executor
+from app.core.security import encrypt_file_content, decrypt_file_content
+from app.models.upload_session import UploadSession, UploadSessionStatus
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+def part_object_name(session_id: str, part_number: int) -> str:
+    return f"uploads/{session_id}/{part_number:05d}"
+
+def get_parts(session: UploadSession) -> Dict[int, int]:
+    return {int(number): size for number, size in json.loads(session.parts_json or "{}").items()}
+
+def total_parts(session: UploadSession) -> int:
+    return max(1, -(-session.total_size // session.chunk_size))
+
+def contiguous_offset(session: UploadSession) -> int:
+    """Bytes received without gaps from the start of the file (tus-style offset)"""
+    parts = get_parts(session)
+    offset = 0
+    number = 1
+    while number in parts:
+        offset += parts[number]
+        number += 1
+    return offset
+
+def expected_part_size(session: UploadSession, part_number: int) -> int:
+    if part_number < total_parts(session):
+        return session.chunk_size
+    return session.total_size - session.chunk_size * (total_parts(session) - 1)
+
+def session_status(session: UploadSession) -> dict:
+    parts = get_parts(session)
+    return {
+        "session_id": session.id,
+        "status": session.status.value,
+        "file_name": session.file_name,
+        "total_size": session.total_size,
+        "chunk_size": session.chunk_size,
+        "total_parts": total_parts(session),
+        "received_parts": sorted(parts),
+        "bytes_received": sum(parts.values()),
+        "offset": contiguous_offset(session),
+        "record_id": session.record_id,
+        "expires_at": session.expires_at.isoformat() if session.expires_at else None
+    }
+
+async def store_part(db: Session, session: UploadSession, part_number: int, data: bytes, user_key: bytes) -> bool:
+    """Encrypt and store one part, then record it; re-sending a part overwrites it"""
+    ok = await run_in_executor(
+        upload_executor,
+        lambda: storage_service.put_object_bytes(
+            encrypt_file_content(data, user_key), part_object_name(session.id, part_number)
+        )
+    )
+    if not ok:
+        return False
+
+    # Lock the row so concurrent part uploads don't lose each other's bookkeeping
+    locked = db.query(UploadSession).filter(UploadSession.id == session.id).with_for_update().first()
+    parts = get_parts(locked)
+    parts[part_number] = len(data)
+    locked.parts_json = json.dumps(parts)
+    db.commit()
+    return True
+
+def transition_session(db: Session, session: UploadSession, from_status: UploadSessionStatus,
+                       to_status: UploadSessionStatus) -> bool:
+    """Move a session between states only if it is still in from_status.
+
+    The check and the update are one statement, so of two concurrent requests
+    exactly one wins; the change is committed before the caller goes on.
+    """
+    changed = db.query(UploadSession).filter(
+        UploadSession.id == session.id,
+        UploadSession.status == from_status
+    ).update({UploadSession.status: to_status}, synchronize_session=False)
+    db.commit()
+    return changed == 1
+
+def _read_parts(session_id: str, numbers: list, user_key: bytes) -> bytes:
+    content = bytearray()
+    for number in numbers:
+        encrypted_part = storage_service.get_object_bytes(part_object_name(session_id, number))
+        if encrypted_part is None:
+            raise ValueError(f"Part {number} is missing from storage")
+        content += decrypt_file_content(encrypted_part, user_key)
+    return bytes(content)
+
+async def assemble_parts(session: UploadSession, user_key: bytes) -> bytes:
+    numbers = list(range(1, total_parts(session) + 1))
+    return await run_in_executor(upload_executor, _read_parts, session.id, numbers, user_key)
+
+async def discard_parts(session: UploadSession):
+    for number in get_parts(session):
+        await storage_service.delete_file(part_object_name(session.id, number))
+
+async def expire_upload_sessions() -> int:
+    """Remove abandoned sessions past their expiry along with their stored parts"""
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        expired = db.query(UploadSession).filter(
+            UploadSession.expires_at < datetime.now(timezone.utc)
+        ).all()
+
+        for session in expired:
+            if session.status in (UploadSessionStatus.ACTIVE, UploadSessionStatus.COMPLETING):
+                await discard_parts(session)
+            db.delete(session)
+
+        if expired:
+            db.commit()
+            logger.info(f"Expired {len(expired)} upload sessions")
+        return len(expired)
+    finally:
+        db.close()
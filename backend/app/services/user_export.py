@@ -0,0 +1,310 @@
+"""
+HealthStash - Personal Data Export
+Copyright (c) 2025 Ilker M. KARAKAS
+Licensed under the MIT License
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Iterator, Optional
+import enum
+import io
+import json
+import logging
+import threading
+import zipfile
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import SessionLocal, TimescaleSessionLocal
+from app.core.executors import report_executor
+from app.core.security import get_user_file_key, sanitize_filename
+from app.models.health_record import HealthRecord
+from app.models.payment_record import PaymentRecord, PaymentFile
+from app.models.report_job import ReportJob, ReportStatus
+from app.models.user import User
+from app.models.vital_signs import VitalSign
+from app.services.backup_pipeline import CountingWriter, DecryptingReader, EncryptingWriter
+from app.services.expense_report import (
+    CURSOR_BATCH, PIPE_CHUNK, REPORT_PREFIX, ReportHeartbeat, ZipPipe, _fetch_invoice, _upload
+)
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+# Internal columns that mean nothing outside this installation
+RECORD_COLUMNS = [
+    "id", "title", "description", "category", "categories", "file_name", "file_type", "file_size",
+    "provider_name", "service_date", "location", "body_parts", "content_text", "metadata_json",
+    "created_at", "updated_at"
+]
+PAYMENT_COLUMNS = [
+    "id", "health_record_id", "invoice_number", "invoice_date", "expense_date", "amount", "currency",
+    "payment_status", "payment_method", "payment_date", "provider_name", "provider_address",
+    "service_description", "insurance_claim_number", "insurance_paid_amount", "patient_responsibility",
+    "notes", "metadata_json", "created_at", "updated_at"
+]
+PAYMENT_FILE_COLUMNS = [
+    "id", "payment_record_id", "file_name", "file_type", "file_size", "is_receipt", "is_invoice", "uploaded_at"
+]
+VITAL_COLUMNS = ["id", "vital_type", "value", "unit", "custom_name", "notes", "source", "recorded_at", "created_at"]
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def _write_rows(archive: zipfile.ZipFile, name: str, rows, columns) -> int:
+    """Write ORM rows from a server-side cursor as JSON Lines"""
+    count = 0
+    with archive.open(name, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8") as text:
+        for row in rows:
+            text.write(json.dumps({column: _json_value(getattr(row, column)) for column in columns}) + "\n")
+            count += 1
+    return count
+
+def _streamed(db, statement):
+    """Rows of a yield_per cursor, dropped from the identity map once written"""
+    for row in db.scalars(statement.execution_options(yield_per=CURSOR_BATCH)):
+        yield row
+        db.expunge(row)
+
+def _write_files(db, user_id: str, user_key: bytes, archive: zipfile.ZipFile) -> int:
+    """Decrypt record and payment attachments in the report pool, keeping at most
+    REPORT_FETCH_WINDOW of them in memory whatever the number of files"""
+    records = select(
+        HealthRecord.id, HealthRecord.file_name, HealthRecord.minio_object_name, HealthRecord.service_date
+    ).where(
+        HealthRecord.user_id == user_id,
+        HealthRecord.is_deleted == False,
+        HealthRecord.minio_object_name.isnot(None)
+    ).order_by(HealthRecord.service_date, HealthRecord.id)
+    payments = select(
+        PaymentFile.id, PaymentFile.file_name, PaymentFile.minio_object_name, PaymentRecord.expense_date
+    ).join(
+        PaymentRecord, PaymentRecord.id == PaymentFile.payment_record_id
+    ).where(
+        PaymentRecord.user_id == user_id,
+        PaymentRecord.is_deleted == False,
+        PaymentFile.minio_object_name.isnot(None)
+    ).order_by(PaymentRecord.expense_date, PaymentFile.id)
+
+    window = deque()
+    missing = []
+    written = 0
+
+    def drain_one():
+        nonlocal written
+        name, future = window.popleft()
+        content = future.result()
+        if content is None:
+            missing.append(name)
+            return
+        archive.writestr(name, content, compress_type=zipfile.ZIP_STORED)
+        written += 1
+
+    for folder, statement in (("records", records), ("payments", payments)):
+        for file_id, file_name, object_name, dated in db.execute(statement.execution_options(yield_per=CURSOR_BATCH)):
+            day = f"{dated:%Y-%m-%d}_" if dated else ""
+            name = f"files/{folder}/{day}{file_id[:8]}_{sanitize_filename(file_name or 'file')}"
+            window.append((name, report_executor.submit(_fetch_invoice, object_name, user_key)))
+            if len(window) >= settings.REPORT_FETCH_WINDOW:
+                drain_one()
+
+    while window:
+        drain_one()
+
+    if missing:
+        archive.writestr("missing_files.txt", "\n".join(missing) + "\n")
+    return written
+
+def write_export(user_id: str, output) -> dict:
+    """Write a user's records, payments, vitals and decrypted files as a ZIP to output.
+
+    Rows come from server-side cursors and files through a bounded window, so
+    memory use does not grow with the size of the account. Returns counts.
+    """
+    db = SessionLocal()
+    vitals_db = TimescaleSessionLocal()
+    try:
+        user = db.get(User, user_id)
+        user_key = get_user_file_key(user)
+        counts = {}
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("account.json", json.dumps({
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+                "full_name": user.full_name,
+                "exported_at": datetime.now(timezone.utc).isoformat()
+            }, indent=2))
+            counts["records"] = _write_rows(archive, "health_records.jsonl", _streamed(db, select(HealthRecord).where(
+                HealthRecord.user_id == user_id, HealthRecord.is_deleted == False
+            ).order_by(HealthRecord.service_date, HealthRecord.id)), RECORD_COLUMNS)
+            counts["payments"] = _write_rows(archive, "payments.jsonl", _streamed(db, select(PaymentRecord).where(
+                PaymentRecord.user_id == user_id, PaymentRecord.is_deleted == False
+            ).order_by(PaymentRecord.expense_date, PaymentRecord.id)), PAYMENT_COLUMNS)
+            _write_rows(archive, "payment_files.jsonl", _streamed(db, select(PaymentFile).join(
+                PaymentRecord, PaymentRecord.id == PaymentFile.payment_record_id
+            ).where(
+                PaymentRecord.user_id == user_id, PaymentRecord.is_deleted == False
+            ).order_by(PaymentFile.uploaded_at, PaymentFile.id)), PAYMENT_FILE_COLUMNS)
+            counts["vitals"] = _write_rows(archive, "vitals.jsonl", _streamed(vitals_db, select(VitalSign).where(
+                VitalSign.user_id == user_id
+            ).order_by(VitalSign.recorded_at, VitalSign.id)), VITAL_COLUMNS)
+            counts["files"] = _write_files(db, user_id, user_key, archive)
+        return counts
+    finally:
+        vitals_db.close()
+        db.close()
+
+def _release_stream_slot(job_id: str):
+    db = SessionLocal()
+    try:
+        db.query(ReportJob).filter(ReportJob.id == job_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def stream_export(user_id: str, job_id: Optional[str] = None) -> Iterator[bytes]:
+    """Generator for StreamingResponse; the ZIP is built in a thread as the client reads.
+
+    job_id names a RUNNING report_jobs row that holds one of the user's report
+    slots while the stream lasts. It is heartbeated like any job and deleted
+    when the stream ends; if the stream never starts, the scheduler fails it.
+    """
+    pipe = ZipPipe()
+    heartbeat = ReportHeartbeat(job_id) if job_id else None
+
+    def produce():
+        try:
+            write_export(user_id, pipe)
+            pipe.close()
+        except Exception as e:
+            if not pipe.reader_done.is_set():
+                logger.error(f"Data export for user {user_id} failed: {e}")
+            pipe.abort(e)
+
+    writer = threading.Thread(target=produce, name=f"export-{user_id[:8]}", daemon=True)
+    writer.start()
+    if heartbeat:
+        heartbeat.start()
+    try:
+        while True:
+            chunk = pipe.read(PIPE_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        # A client that disconnects stops the writer at its next chunk
+        pipe.reader_done.set()
+        writer.join()
+        if heartbeat:
+            heartbeat.stop()
+            _release_stream_slot(job_id)
+
+def _archive_passphrase(user) -> str:
+    # Stored exports are readable only through this user's key
+    return get_user_file_key(user).decode()
+
+def generate_export(job_id: str):
+    """Blocking job body: encrypt the export into MinIO as it is built"""
+    db = SessionLocal()
+    heartbeat = ReportHeartbeat(job_id)
+    try:
+        job = db.get(ReportJob, job_id)
+        if job is None or job.status != ReportStatus.PENDING:
+            return
+        job.status = ReportStatus.RUNNING
+        job.started_at = job.heartbeat_at = datetime.now(timezone.utc)
+        db.commit()
+        heartbeat.start()
+
+        user = db.get(User, job.user_id)
+        object_name = f"{REPORT_PREFIX}/{job.user_id}/{job.id}/export.zip.aes"
+
+        pipe = ZipPipe()
+        result = {}
+        uploader = threading.Thread(target=_upload, args=(pipe, object_name, result), name=f"export-upload-{job.id[:8]}")
+        uploader.start()
+
+        try:
+            encryptor = EncryptingWriter(pipe, passphrase=_archive_passphrase(user))
+            plaintext = CountingWriter(encryptor)
+            counts = write_export(job.user_id, plaintext)
+            encryptor.close()
+            pipe.close()
+        except Exception as e:
+            pipe.abort(e)
+            raise
+        finally:
+            uploader.join()
+
+        if "error" in result:
+            raise result["error"]
+        if not result.get("ok"):
+            raise RuntimeError("Upload to storage failed")
+
+        job.status = ReportStatus.COMPLETED
+        job.object_name = object_name
+        job.file_size = plaintext.bytes
+        job.records_count = counts["records"]
+        job.payments_count = counts["payments"]
+        job.vitals_count = counts["vitals"]
+        job.files_count = counts["files"]
+        job.completed_at = datetime.now(timezone.utc)
+        db.commit()
+        logger.info(f"Data export {job.id} ready: {counts}, {plaintext.bytes} bytes")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Data export {job_id} failed: {e}")
+        job = db.get(ReportJob, job_id)
+        if job is not None:
+            job.status = ReportStatus.FAILED
+            job.error_message = str(e)[:1000]
+            job.completed_at = datetime.now(timezone.utc)
+            db.commit()
+    finally:
+        heartbeat.stop()
+        db.close()
+
+class _ChunkReader:
+    """read() over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _decrypted_chunks(object_name: str, passphrase: str) -> Iterator[bytes]:
+    chunks = storage_service.iter_object(object_name)
+    try:
+        reader = DecryptingReader(_ChunkReader(chunks), passphrase=passphrase)
+        while True:
+            data = reader.read(PIPE_CHUNK)
+            if not data:
+                break
+            yield data
+    finally:
+        chunks.close()
+
+def iter_stored_export(job: ReportJob, user) -> Iterator[bytes]:
+    """Decrypt a stored export while streaming it to the client"""
+    # Resolved now, while the request's session is still usable
+    return _decrypted_chunks(job.object_name, _archive_passphrase(user))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+HealthStash - Backup and restore benchmark
+
+Builds a synthetic dataset with generate_sample_data.py, then times a full
+backup, an incremental object backup, verification and, optionally, restores
+of the whole archive and of one user. Each run prints one JSON document and
+appends it to --output, so runs can be compared across versions.
+
+Run it inside the backend container against a disposable stack; --restore
+overwrites the databases and objects with the archive just taken:
+
+    docker-compose exec backend python benchmark_backup.py \
+        --users 5 --records 200 --vitals 50000 --fast-files --restore \
+        --output /backups/benchmarks.jsonl
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+from sqlalchemy import func, text
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+
+def _configure_generator():
+    """Point generate_sample_data.py at the databases and bucket the app uses"""
+    for prefix, url in (("POSTGRES", settings.DATABASE_URL), ("TIMESCALE", settings.TIMESCALE_URL)):
+        parsed = make_url(url)
+        os.environ.setdefault(f"{prefix}_HOST", parsed.host or "localhost")
+        os.environ.setdefault(f"{prefix}_DB", parsed.database or "")
+        os.environ.setdefault(f"{prefix}_USER", parsed.username or "")
+        os.environ.setdefault(f"{prefix}_PASSWORD", parsed.password or "")
+    os.environ.setdefault("MINIO_ENDPOINT", settings.MINIO_ENDPOINT)
+    os.environ.setdefault("MINIO_ACCESS_KEY", settings.MINIO_ACCESS_KEY)
+    os.environ.setdefault("MINIO_SECRET_KEY", settings.MINIO_SECRET_KEY)
+    os.environ.setdefault("MINIO_BUCKET_NAME", settings.MINIO_BUCKET_NAME)
+
+def _timed(func_, *args, **kwargs):
+    started = time.perf_counter()
+    result = func_(*args, **kwargs)
+    return result, round(time.perf_counter() - started, 3)
+
+def dataset_size() -> dict:
+    """What the backup will have to move, measured rather than taken from the arguments"""
+    from app.core.database import SessionLocal, TimescaleSessionLocal
+    from app.models.health_record import HealthRecord
+    from app.models.payment_record import PaymentFile
+    from app.models.user import User
+    from app.models.vital_signs import VitalSign
+
+    db = SessionLocal()
+    vitals_db = TimescaleSessionLocal()
+    try:
+        record_files = db.query(func.count(HealthRecord.id), func.coalesce(func.sum(HealthRecord.file_size), 0)).filter(
+            HealthRecord.minio_object_name.isnot(None)
+        ).one()
+        payment_files = db.query(func.count(PaymentFile.id), func.coalesce(func.sum(PaymentFile.file_size), 0)).filter(
+            PaymentFile.minio_object_name.isnot(None)
+        ).one()
+        return {
+            "users": db.query(func.count(User.id)).scalar(),
+            "health_records": db.query(func.count(HealthRecord.id)).scalar(),
+            "objects": record_files[0] + payment_files[0],
+            "object_bytes": int(record_files[1] + payment_files[1]),
+            "vitals": vitals_db.query(func.count(VitalSign.id)).scalar(),
+            "postgres_bytes": db.execute(text("SELECT pg_database_size(current_database())")).scalar(),
+            "timescale_bytes": vitals_db.execute(text("SELECT pg_database_size(current_database())")).scalar()
+        }
+    finally:
+        vitals_db.close()
+        db.close()
+
+def _run_backup(backup_type, notes: str, job) -> dict:
+    """Run a backup job body on a new history row and return the row's outcome"""
+    from app.core.database import SessionLocal
+    from app.models.backup import BackupHistory, BackupStatus, BackupType
+
+    backup_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(BackupHistory(
+            id=backup_id,
+            backup_type=backup_type,
+            status=BackupStatus.IN_PROGRESS,
+            started_at=datetime.now(timezone.utc),
+            notes=notes,
+            includes_database=backup_type != BackupType.INCREMENTAL,
+            includes_files=True,
+            includes_config=False
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    _, seconds = _timed(job, backup_id)
+
+    db = SessionLocal()
+    try:
+        backup = db.get(BackupHistory, backup_id)
+        outcome = {
+            "backup_id": backup_id,
+            "status": backup.status.value,
+            "seconds": seconds,
+            "file_path": backup.file_path,
+            "file_size": backup.file_size,
+            "error": backup.error_message
+        }
+        if backup.metrics_json:
+            outcome["metrics"] = json.loads(backup.metrics_json)
+        return outcome
+    finally:
+        db.close()
+
+def _discard_backup(outcome: dict):
+    from app.core.database import SessionLocal
+    from app.models.backup import BackupHistory
+    from app.services.backup_catalog import backup_catalog
+    from app.services.backup_pipeline import ARCHIVE_SUFFIX
+
+    path = outcome.get("file_path") or ""
+    if path.startswith(settings.BACKUP_DIR) and path.endswith(ARCHIVE_SUFFIX):
+        backup_catalog.remove(path)
+    db = SessionLocal()
+    try:
+        db.query(BackupHistory).filter(BackupHistory.id == outcome["backup_id"]).delete()
+        db.commit()
+    finally:
+        db.close()
+
+def _first_user_id() -> Optional[str]:
+    from app.core.database import SessionLocal
+    from app.models.user import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).order_by(User.created_at).first()
+        return user.id if user else None
+    finally:
+        db.close()
+
+def _slo(limit: Optional[float], seconds: Optional[float]) -> Optional[dict]:
+    if limit is None or seconds is None:
+        return None
+    return {"limit_seconds": limit, "seconds": seconds, "met": seconds <= limit}
+
+def benchmark_failure(result: dict) -> Optional[str]:
+    """Why a run fails: the stage that failed or the SLOs it missed; None if it passed"""
+    if result.get("failed"):
+        return result["failed"]
+    missed = [name for name, check in result.get("slo", {}).items() if not check["met"]]
+    return f"SLO missed for {', '.join(missed)}" if missed else None
+
+def run_benchmark(args) -> dict:
+    from app.models.backup import BackupType
+    from app.services.backup_engine import run_object_backup
+    from app.services.backup_pipeline import run_full_backup
+    from app.services.backup_restore import restore_archive, verify_archive
+
+    result = {
+        "label": args.label,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "host": {
+            "hostname": platform.node(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version()
+        },
+        "settings": {
+            "zstd_level": settings.BACKUP_ZSTD_LEVEL,
+            "zstd_threads": settings.BACKUP_ZSTD_THREADS,
+            "restore_jobs": settings.BACKUP_RESTORE_JOBS,
+            "restore_workers": settings.BACKUP_RESTORE_WORKERS
+        },
+        "stages": {}
+    }
+    stages = result["stages"]
+
+    if not args.skip_generate:
+        _configure_generator()
+        import generate_sample_data
+
+        created, seconds = _timed(
+            generate_sample_data.generate_dataset,
+            users=args.users,
+            records=args.records,
+            vitals=args.vitals,
+            min_file_mb=args.min_file_mb,
+            max_file_mb=args.max_file_mb,
+            fast_files=args.fast_files
+        )
+        stages["generate"] = {"seconds": seconds, **created}
+
+    result["dataset"] = dataset_size()
+
+    full = _run_backup(BackupType.FULL, "Benchmark full backup", run_full_backup)
+    stages["backup_full"] = full
+    if full["status"] != "completed":
+        result["failed"] = "backup_full"
+        return result
+
+    # Nothing changed since the full backup: the cost of an incremental run at rest
+    incremental = _run_backup(BackupType.INCREMENTAL, "Benchmark incremental backup", run_object_backup)
+    stages["backup_incremental"] = incremental
+
+    verified, seconds = _timed(verify_archive, full["file_path"])
+    stages["verify"] = {"seconds": seconds, **verified}
+    if not verified["verified"]:
+        result["failed"] = "verify"
+
+    if args.restore and "failed" not in result:
+        restored, seconds = _timed(restore_archive, full["file_path"], skip_unchanged=not args.cold_objects)
+        stages["restore_full"] = {"seconds": seconds, **restored}
+
+    if args.restore_user and "failed" not in result:
+        user_id = _first_user_id()
+        restored, seconds = _timed(restore_archive, full["file_path"], user_id=user_id,
+                                   skip_unchanged=not args.cold_objects)
+        stages["restore_user"] = {"seconds": seconds, **restored}
+
+    result["slo"] = {
+        name: check for name, check in (
+            ("backup", _slo(args.backup_slo, full["seconds"])),
+            ("restore", _slo(args.restore_slo, stages.get("restore_full", {}).get("seconds"))),
+            ("restore_user", _slo(args.restore_slo_user, stages.get("restore_user", {}).get("seconds")))
+        ) if check is not None
+    }
+
+    if not args.keep_archives:
+        _discard_backup(full)
+        _discard_backup(incremental)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HealthStash backups and restores")
+    parser.add_argument("--label", default=None, help="Free-form tag stored with the results, e.g. a version")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--records", type=int, default=64, help="Health records with a file, per user")
+    parser.add_argument("--vitals", type=int, default=0, help="Vital sign readings per user")
+    parser.add_argument("--min-file-mb", type=float, default=1)
+    parser.add_argument("--max-file-mb", type=float, default=3)
+    parser.add_argument("--fast-files", action="store_true",
+                        help="Upload random bytes instead of rendered PDFs and images")
+    parser.add_argument("--skip-generate", action="store_true", help="Benchmark the data already present")
+    parser.add_argument("--restore", action="store_true",
+                        help="Also restore the full archive; overwrites the current data")
+    parser.add_argument("--restore-user", action="store_true",
+                        help="Also restore the first user from the archive")
+    parser.add_argument("--cold-objects", action="store_true",
+                        help="Upload every object on restore, as into an empty MinIO")
+    parser.add_argument("--backup-slo", type=float, default=None, help="Fail if the full backup takes longer (seconds)")
+    parser.add_argument("--restore-slo", type=float, default=None, help="Fail if the full restore takes longer (seconds)")
+    parser.add_argument("--restore-slo-user", type=float, default=None,
+                        help="Fail if the single-user restore takes longer (seconds)")
+    parser.add_argument("--keep-archives", action="store_true", help="Keep the benchmark backups afterwards")
+    parser.add_argument("--output", default=None, help="Append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    from app.main import app
+    result = {"version": app.version}
+    result.update(run_benchmark(args))
+
+    document = json.dumps(result, default=str)
+    print(json.dumps(result, indent=2, default=str))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(document + "\n")
+
+    failure = benchmark_failure(result)
+    if failure:
+        print(f"Benchmark failed: {failure}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+-- Migration: Backup catalog indexes
+-- Date: 2026-10-19
+-- Description: Index backup_history for the catalog's file lookups and the admin listing
+
+CREATE INDEX IF NOT EXISTS ix_backup_history_file_path ON backup_history (file_path);
+CREATE INDEX IF NOT EXISTS ix_backup_history_created_at ON backup_history (created_at);
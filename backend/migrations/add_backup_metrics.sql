@@ -0,0 +1,11 @@
+-- Migration: Backup pipeline metrics
+-- Date: 2026-10-19
+-- Description: Store per-stage timings and throughput, and allow archives larger than 2 GB
+
+ALTER TABLE backup_history
+ADD COLUMN IF NOT EXISTS metrics_json TEXT;
+
+ALTER TABLE backup_history
+ALTER COLUMN file_size TYPE BIGINT;
+
+COMMENT ON COLUMN backup_history.metrics_json IS 'JSON per-stage timings, byte counts and throughput recorded by the backup pipeline';
@@ -0,0 +1,10 @@
+-- Migration: Live backup progress
+-- Date: 2026-10-19
+-- Description: Progress columns updated by the backup job worker; backup_jobs itself is created by the application
+
+ALTER TABLE backup_history
+ADD COLUMN IF NOT EXISTS progress_stage VARCHAR,
+ADD COLUMN IF NOT EXISTS progress_bytes BIGINT,
+ADD COLUMN IF NOT EXISTS progress_total_bytes BIGINT,
+ADD COLUMN IF NOT EXISTS progress_eta_seconds INTEGER,
+ADD COLUMN IF NOT EXISTS progress_updated_at TIMESTAMP;
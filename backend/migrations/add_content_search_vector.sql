@@ -0,0 +1,18 @@
+-- Migration: Add full-text search vector to health_records
+-- Date: 2026-10-19
+-- Description: Column filled by the background text extraction stage after upload
+
+ALTER TABLE health_records
+ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Backfill from any text already present (manually created records)
+UPDATE health_records
+SET search_vector = to_tsvector('simple', concat_ws(' ', title, description, content_text))
+WHERE search_vector IS NULL
+  AND content_text IS NOT NULL
+  AND content_text <> '';
+
+CREATE INDEX IF NOT EXISTS ix_health_records_search_vector
+ON health_records USING gin (search_vector);
+
+COMMENT ON COLUMN health_records.search_vector IS 'Full-text search vector over title, description and extracted document text';
@@ -0,0 +1,6 @@
+-- Migration: Report job heartbeats
+-- Date: 2026-10-19
+-- Description: Refreshed by the worker running a report or export, so the scheduler leader only fails jobs whose worker died
+
+ALTER TABLE report_jobs
+ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
@@ -0,0 +1,7 @@
+-- Migration: Manual scheduled job runs
+-- Date: 2026-10-19
+-- Description: Any worker records a requested run with its arguments; the scheduler leader claims it on its next tick
+
+ALTER TABLE scheduled_jobs
+ADD COLUMN IF NOT EXISTS requested_at TIMESTAMP,
+ADD COLUMN IF NOT EXISTS request_json TEXT;
@@ -0,0 +1,6 @@
+-- Migration: Add the completing state to upload sessions
+-- Date: 2026-10-19
+-- Description: A complete request claims its session as COMPLETING before assembling the file,
+-- so two concurrent completes cannot both create a health record.
+
+ALTER TYPE uploadsessionstatus ADD VALUE IF NOT EXISTS 'COMPLETING';
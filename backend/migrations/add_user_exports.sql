@@ -0,0 +1,17 @@
+-- Migration: Per-user data exports
+-- Date: 2026-10-19
+-- Description: Export jobs share report_jobs with expense reports, told apart by kind
+
+DO $$ BEGIN
+    CREATE TYPE reportkind AS ENUM ('EXPENSES', 'EXPORT');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+ALTER TABLE report_jobs
+ADD COLUMN IF NOT EXISTS kind reportkind NOT NULL DEFAULT 'EXPENSES',
+ADD COLUMN IF NOT EXISTS records_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS vitals_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS files_count INTEGER NOT NULL DEFAULT 0,
+ALTER COLUMN year DROP NOT NULL,
+ALTER COLUMN reporting_currency DROP NOT NULL;
@@ -0,0 +1,6 @@
+-- Migration: Per-user reporting currency
+-- Date: 2026-10-19
+-- Description: Default currency for payment summaries and expense reports; NULL keeps native amounts in summaries
+
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS reporting_currency VARCHAR(3);
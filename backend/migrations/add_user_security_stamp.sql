@@ -0,0 +1,8 @@
+-- Migration: Add security stamp to users
+-- Date: 2026-10-19
+-- Description: Versioned stamp embedded in JWTs; bumped on password and role changes to revoke older tokens
+
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS security_stamp INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN users.security_stamp IS 'Incremented whenever previously issued tokens must stop validating';
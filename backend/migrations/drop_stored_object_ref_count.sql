@@ -0,0 +1,6 @@
+-- Migration: Drop the stored object reference count
+-- Date: 2026-10-19
+-- Description: Objects are freed by scanning the rows that name them; the counter was never read and drifted on deletes
+
+ALTER TABLE stored_objects
+DROP COLUMN IF EXISTS ref_count;
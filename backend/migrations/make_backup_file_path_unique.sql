@@ -0,0 +1,19 @@
+-- Migration: Unique backup archive paths
+-- Date: 2026-10-19
+-- Description: One backup_history row per archive, so concurrent catalog scans upsert instead of duplicating.
+-- Discovered rows that repeat a path already recorded by a backup job, or by an older discovered row, are removed first.
+
+BEGIN;
+
+DELETE FROM backup_history dup
+USING backup_history kept
+WHERE dup.file_path = kept.file_path
+  AND dup.id <> kept.id
+  AND dup.notes = 'Automatic backup (cron)'
+  AND (kept.notes IS DISTINCT FROM dup.notes OR kept.created_at < dup.created_at
+       OR (kept.created_at = dup.created_at AND kept.id < dup.id));
+
+DROP INDEX IF EXISTS ix_backup_history_file_path;
+CREATE UNIQUE INDEX ix_backup_history_file_path ON backup_history (file_path);
+
+COMMIT;
@@ -0,0 +1,63 @@
+-- Migration: Partition audit_logs by month
+-- Date: 2026-10-19
+-- Description: Rebuild audit_logs as a RANGE (created_at) partitioned table with monthly partitions.
+-- Later partitions are created and archived by the backend (app/services/audit_partitions.py).
+
+BEGIN;
+
+ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey;
+ALTER INDEX IF EXISTS ix_audit_logs_id RENAME TO ix_audit_logs_legacy_id;
+ALTER INDEX IF EXISTS ix_audit_logs_user_id RENAME TO ix_audit_logs_legacy_user_id;
+ALTER INDEX IF EXISTS ix_audit_logs_action RENAME TO ix_audit_logs_legacy_action;
+ALTER INDEX IF EXISTS ix_audit_logs_created_at RENAME TO ix_audit_logs_legacy_created_at;
+
+CREATE TABLE audit_logs (
+    id VARCHAR NOT NULL,
+    user_id VARCHAR REFERENCES users(id),
+    action auditaction NOT NULL,
+    resource_type VARCHAR,
+    resource_id VARCHAR,
+    details TEXT,
+    ip_address VARCHAR,
+    user_agent VARCHAR,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX ix_audit_logs_user_id ON audit_logs (user_id);
+CREATE INDEX ix_audit_logs_created_at ON audit_logs (created_at);
+CREATE INDEX ix_audit_logs_action_created_at ON audit_logs (action, created_at);
+
+CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+
+-- One partition per month from the oldest event through three months ahead
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(created_at) FROM audit_logs_legacy), now())),
+            date_trunc('month', now()) + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+            'audit_logs_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO audit_logs (id, user_id, action, resource_type, resource_id, details, ip_address, user_agent, created_at)
+SELECT id, user_id, action, resource_type, resource_id, details, ip_address, user_agent, created_at
+FROM audit_logs_legacy;
+
+DROP TABLE audit_logs_legacy;
+
+COMMIT;
+
+ANALYZE audit_logs;
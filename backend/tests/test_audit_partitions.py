@@ -0,0 +1,130 @@
+import pytest
+from datetime import date
+from types import SimpleNamespace
+
+from app.services import audit_partitions
+from app.services.audit_partitions import add_months, partition_month, partition_name
+
+class FakeResult:
+    def __init__(self, rows=(), scalar=None):
+        self.rows = list(rows)
+        self.value = scalar
+
+    def scalar(self):
+        return self.value
+
+    def all(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class FakeConnection:
+    """Records executed SQL and answers catalog and count queries from the test's tables"""
+
+    def __init__(self, tables=(), default_rows=None):
+        self.tables = list(tables)
+        self.default_rows = default_rows or {}
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "relkind FROM pg_class" in sql:
+            return FakeResult(scalar="p")
+        if "LEFT JOIN pg_inherits" in sql:
+            return FakeResult(self.tables)
+        if "DISTINCT date_trunc" in sql:
+            return FakeResult([(month,) for month in self.default_rows])
+        if sql.startswith("SELECT count(*)"):
+            if params is None:
+                return FakeResult(scalar=sum(self.default_rows.values()))
+            return FakeResult(scalar=self.default_rows.get(params["start"], 0))
+        return FakeResult()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class TestAuditPartitions:
+    """Test monthly partition naming, default partition draining and archiving"""
+
+    def _patch(self, monkeypatch, conn, upload_ok=True, tmp_path=None):
+        uploads = []
+
+        def export(name):
+            path = tmp_path / f"{name}.csv.gz"
+            path.write_bytes(b"archive")
+            return str(path)
+
+        monkeypatch.setattr(audit_partitions, "engine", SimpleNamespace(connect=lambda: conn))
+        monkeypatch.setattr(audit_partitions, "_export_partition", export)
+        monkeypatch.setattr(audit_partitions, "storage_service", SimpleNamespace(
+            put_object_file=lambda path, name, content_type=None: uploads.append(name) or upload_ok
+        ))
+        return uploads
+
+    @pytest.mark.unit
+    def test_month_arithmetic_and_names(self):
+        """Test months roll over years both ways and names round-trip"""
+        assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+        assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+        assert add_months(date(2026, 10, 1), -24) == date(2024, 10, 1)
+        assert partition_name(date(2026, 3, 1)) == "audit_logs_y2026m03"
+        assert partition_month("audit_logs_y2026m03") == date(2026, 3, 1)
+        assert partition_month("audit_logs_default") is None
+        assert partition_month("audit_logs_y2026m03_old") is None
+
+    @pytest.mark.unit
+    def test_old_partitions_are_archived_then_dropped(self, monkeypatch, tmp_path):
+        """Test partitions past retention are detached, uploaded and dropped, recent ones kept"""
+        conn = FakeConnection(tables=[("audit_logs_y2020m01", True), ("audit_logs_y2099m01", True)])
+        uploads = self._patch(monkeypatch, conn, tmp_path=tmp_path)
+
+        archived = audit_partitions.archive_old_partitions(retention_months=24)
+
+        assert archived == ["audit_logs_y2020m01"]
+        assert uploads == ["archive/audit_logs/audit_logs_y2020m01.csv.gz"]
+        assert "ALTER TABLE audit_logs DETACH PARTITION audit_logs_y2020m01" in conn.statements
+        assert "DROP TABLE audit_logs_y2020m01" in conn.statements
+        assert not any("2099" in sql for sql in conn.statements if sql.startswith(("ALTER", "DROP")))
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.unit
+    def test_failed_upload_drops_nothing(self, monkeypatch, tmp_path):
+        """Test a partition whose upload fails stays as a detached table for the next run"""
+        conn = FakeConnection(tables=[("audit_logs_y2020m01", True), ("audit_logs_y2020m02", False)])
+        uploads = self._patch(monkeypatch, conn, upload_ok=False, tmp_path=tmp_path)
+
+        assert audit_partitions.archive_old_partitions(retention_months=24) == []
+
+        assert len(uploads) == 2
+        assert not any(sql.startswith("DROP") for sql in conn.statements)
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.unit
+    def test_default_partition_rows_move_to_their_month(self, monkeypatch):
+        """Test rows caught by the default partition get a monthly partition, so retention applies"""
+        conn = FakeConnection(default_rows={date(2020, 1, 1): 5})
+        self._patch(monkeypatch, conn)
+
+        result = audit_partitions.drain_default_partition()
+
+        assert result["moved"] == {"audit_logs_y2020m01": 5}
+        moves = [sql.split(" WHERE")[0] for sql in conn.statements if not sql.startswith(("SELECT", "\n"))]
+        assert moves == [
+            "ALTER TABLE audit_logs DETACH PARTITION audit_logs_default",
+            "CREATE TABLE audit_logs_y2020m01 PARTITION OF audit_logs FOR VALUES FROM ('2020-01-01') TO ('2020-02-01')",
+            "INSERT INTO audit_logs_y2020m01 SELECT * FROM audit_logs_default",
+            "DELETE FROM audit_logs_default",
+            "ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT"
+        ]
@@ -0,0 +1,117 @@
+import pytest
+import json
+import os
+
+from app.models.audit_log import AuditAction
+from app.services.audit import AuditWriter
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    """Collects bulk-inserted audit rows instead of writing to PostgreSQL"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def execute(self, statement, rows):
+        if statement.table.name != "audit_logs":
+            # Activity counter upserts issued from the same transaction
+            return FakeResult([])
+        self.sink.extend(rows)
+        return FakeResult([(row["action"], row["created_at"]) for row in rows])
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_writer(tmp_path, **kwargs):
+    inserted = []
+    writer = AuditWriter(
+        session_factory=lambda: FakeSession(inserted),
+        wal_dir=str(tmp_path),
+        **kwargs
+    )
+    writer._open_wal()
+    return writer, inserted
+
+class TestAuditWriter:
+    """Test the batched audit log writer"""
+
+    @pytest.mark.unit
+    def test_flush_bulk_inserts_and_clears_wal(self, tmp_path):
+        """Test queued events are written in one batch and the clean segment removed"""
+        writer, inserted = make_writer(tmp_path, batch_size=10)
+        for _ in range(3):
+            writer.record(AuditAction.LOGIN, user_id="user-1", ip_address="10.0.0.1")
+
+        assert writer.stats()["queued"] == 3
+        assert writer.flush() == 3
+
+        assert [row["action"] for row in inserted] == [AuditAction.LOGIN] * 3
+        assert writer.stats()["written"] == 3
+        assert os.listdir(tmp_path) == [os.path.basename(writer._wal_path)]
+
+    @pytest.mark.unit
+    def test_overflow_spills_to_wal_and_is_replayed(self, tmp_path):
+        """Test events beyond the queue bound are kept in the WAL, not lost"""
+        writer, inserted = make_writer(tmp_path, max_queue=2, batch_size=2)
+        ids = [writer.record(AuditAction.FILE_UPLOAD, user_id="user-1") for _ in range(5)]
+
+        stats = writer.stats()
+        assert stats["queued"] == 2
+        assert stats["spilled_to_wal"] == 3
+        assert stats["dropped"] == 0
+
+        writer.flush()
+        assert {row["id"] for row in inserted} == set(ids)
+
+    @pytest.mark.unit
+    def test_recover_replays_leftover_segments(self, tmp_path):
+        """Test segments from a crashed process are replayed, ignoring a torn last line"""
+        segment = tmp_path / "audit-1.wal"
+        event = {
+            "id": "event-1",
+            "user_id": None,
+            "action": "LOGIN_FAILED",
+            "resource_type": None,
+            "resource_id": None,
+            "details": None,
+            "ip_address": "10.0.0.2",
+            "user_agent": None,
+            "created_at": "2025-01-01T12:00:00+00:00"
+        }
+        segment.write_text(json.dumps(event) + "\n" + '{"id": "torn')
+
+        inserted = []
+        writer = AuditWriter(session_factory=lambda: FakeSession(inserted), wal_dir=str(tmp_path))
+
+        assert writer.recover() == 1
+        assert inserted[0]["action"] == AuditAction.LOGIN_FAILED
+        assert not segment.exists()
+
+    @pytest.mark.unit
+    def test_recover_skips_live_segments_of_other_workers(self, tmp_path):
+        """Test a starting worker leaves another worker's open segment alone"""
+        running, running_inserted = make_writer(tmp_path, max_queue=1)
+        running.record(AuditAction.LOGIN, user_id="user-1")
+        spilled = running.record(AuditAction.LOGOUT, user_id="user-1")
+
+        inserted = []
+        starting = AuditWriter(session_factory=lambda: FakeSession(inserted), wal_dir=str(tmp_path))
+
+        assert starting.recover() == 0
+        assert inserted == []
+        assert os.path.exists(running._wal_path)
+
+        running.flush()
+        assert spilled in {row["id"] for row in running_inserted}
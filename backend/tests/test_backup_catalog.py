@@ -0,0 +1,90 @@
+import pytest
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.backup_catalog import BackupCatalog, is_archive, archive_timestamp, SETTLE_SECONDS
+
+def write_archive(folder, name, age_seconds=SETTLE_SECONDS + 60, size=10):
+    path = folder / name
+    path.write_bytes(b"x" * size)
+    settled = time.time() - age_seconds
+    os.utime(path, (settled, settled))
+    return str(path)
+
+class TestBackupCatalog:
+    """Test how the backup catalog reads the shared backup volume"""
+
+    @pytest.mark.unit
+    def test_recognises_archive_names(self):
+        """Test container, pipeline and SQL archives are indexed but partial files are not"""
+        assert is_archive("healthstash_backup_20261019_020000.tar.gz.enc")
+        assert is_archive("healthstash_backup_20261019_020000.tar.zst.aes")
+        assert not is_archive("healthstash_backup_20261019_020000.tar.zst.aes.partial")
+        assert not is_archive("notes.txt")
+
+        assert archive_timestamp("healthstash_backup_20261019_020000.tar.gz") == datetime(
+            2026, 10, 19, 2, 0, tzinfo=timezone.utc
+        )
+
+    @pytest.mark.unit
+    def test_unsettled_archives_wait_for_next_scan(self, tmp_path):
+        """Test archives still being written are not cached until they settle"""
+        settled = write_archive(tmp_path, "healthstash_backup_20261019_020000.tar.gz")
+        write_archive(tmp_path, "healthstash_backup_20261019_030000.tar.gz", age_seconds=0)
+        (tmp_path / "triggers").mkdir()
+
+        entries = BackupCatalog(str(tmp_path))._read_directory()
+
+        assert list(entries) == [settled]
+        assert entries[settled][0] == 10
+
+    @pytest.mark.unit
+    def test_remove_refuses_paths_outside_volume(self, tmp_path):
+        """Test only archives directly on the backup volume can be deleted"""
+        catalog = BackupCatalog(str(tmp_path / "backups"))
+        os.makedirs(catalog.root)
+        outside = write_archive(tmp_path, "healthstash_backup_20261019_020000.tar.gz")
+
+        with pytest.raises(ValueError):
+            catalog.remove(outside)
+        assert os.path.exists(outside)
+
+        inside = write_archive(tmp_path / "backups", "healthstash_backup_20261019_020000.tar.gz")
+        catalog.remove(inside)
+        assert not os.path.exists(inside)
+
+    @pytest.mark.unit
+    def test_new_archives_are_upserted(self, tmp_path):
+        """Test discovered archives go in as one insert that skips paths recorded meanwhile"""
+        path = write_archive(tmp_path, "healthstash_backup_20261019_020000.tar.gz")
+        catalog = BackupCatalog(str(tmp_path))
+        catalog._reconciled = True
+        statements = []
+
+        class Query:
+            def filter(self, *criteria):
+                return self
+
+            def all(self):
+                return []
+
+        class Session:
+            def query(self, entity):
+                return Query()
+
+            def execute(self, statement):
+                statements.append(statement)
+                # Another worker's scan inserted the same path first
+                return SimpleNamespace(all=lambda: [])
+
+        counts = {"added": 0, "updated": 0, "removed": 0}
+        catalog._sync(Session(), {path: (10, 0)}, {path: (10, 0)}, set(), counts)
+
+        (statement,) = statements
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (file_path) DO NOTHING" in sql
+        assert counts["added"] == 0
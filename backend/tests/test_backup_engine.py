@@ -0,0 +1,119 @@
+import pytest
+import hashlib
+from datetime import datetime, timezone
+
+from app.services.backup_engine import BackupRepository, user_object_prefixes
+
+class FakeObject:
+    def __init__(self, name, content):
+        self.object_name = name
+        self.size = len(content)
+        self.etag = hashlib.md5(content).hexdigest()
+        self.last_modified = datetime.now(timezone.utc)
+
+class FakeStorage:
+    """In-memory bucket exposing the StorageService calls the engine uses"""
+
+    bucket_name = "healthstash-files"
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.downloads = 0
+
+    def iter_objects(self, prefix=""):
+        for name in sorted(self.objects):
+            if name.startswith(prefix):
+                yield FakeObject(name, self.objects[name])
+
+    def iter_object(self, name, chunk_size):
+        self.downloads += 1
+        content = self.objects[name]
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+    def put_object_stream(self, stream, name, length=-1, **kwargs):
+        self.objects[name] = stream.read(length)
+        return True
+
+class TestBackupRepository:
+    """Test the incremental content-addressed object backup"""
+
+    @pytest.mark.unit
+    def test_incremental_copies_only_changes(self, tmp_path):
+        """Test unchanged objects are skipped and identical content is stored once"""
+        storage = FakeStorage({"a/1": b"alpha", "a/2": b"beta", "a/3": b"alpha"})
+        repository = BackupRepository(root=str(tmp_path), storage=storage)
+
+        first = repository.backup("first")
+        assert first["type"] == "full"
+        assert first["new_blobs"] == 2
+        assert first["bytes_deduplicated"] == 5
+
+        storage.downloads = 0
+        storage.objects["a/2"] = b"beta v2"
+        storage.objects["a/4"] = b"gamma"
+        del storage.objects["a/1"]
+
+        second = repository.backup("second")
+        assert second["type"] == "incremental"
+        assert (second["added"], second["changed"], second["deleted"], second["unchanged"]) == (1, 1, 1, 1)
+        assert storage.downloads == 2
+
+    @pytest.mark.unit
+    def test_point_in_time_restore(self, tmp_path):
+        """Test restoring an older backup replays its chain and skips matching objects"""
+        storage = FakeStorage({"a/1": b"alpha", "a/2": b"beta"})
+        repository = BackupRepository(root=str(tmp_path), storage=storage)
+        repository.backup("first")
+
+        storage.objects["a/2"] = b"corrupted"
+        del storage.objects["a/1"]
+        repository.backup("second")
+
+        result = repository.restore("first")
+        assert result["restored"] == 2
+        assert storage.objects["a/1"] == b"alpha"
+        assert storage.objects["a/2"] == b"beta"
+        assert set(repository.state("second")) == {"a/2"}
+
+    @pytest.mark.unit
+    def test_excluded_prefixes_are_not_backed_up(self, tmp_path):
+        """Test transient upload parts are left out of manifests"""
+        storage = FakeStorage({"uploads/session/00001": b"part", "a/1": b"alpha"})
+        repository = BackupRepository(root=str(tmp_path), storage=storage)
+        repository.backup("first")
+
+        assert set(repository.state("first")) == {"a/1"}
+
+    @pytest.mark.unit
+    def test_corrupted_blob_is_not_uploaded(self, tmp_path):
+        """Test a blob that no longer matches its digest fails before replacing the object"""
+        storage = FakeStorage({"u1/a": b"alpha", "u2/b": b"beta"})
+        repository = BackupRepository(root=str(tmp_path), storage=storage)
+        repository.backup("first")
+
+        pack = next((tmp_path / "packs").glob("*.pack"))
+        pack.write_bytes(b"X" + pack.read_bytes()[1:])
+        del storage.objects["u1/a"]
+        del storage.objects["u2/b"]
+
+        result = repository.restore("first", workers=2)
+        assert (result["restored"], result["failed"]) == (1, 1)
+        assert "u1/a" not in storage.objects
+        assert storage.objects["u2/b"] == b"beta"
+
+    @pytest.mark.unit
+    def test_user_restore_includes_payment_attachments(self, tmp_path):
+        """Test a single-user restore brings back record files and payment files, and nobody else's"""
+        storage = FakeStorage({
+            "user-1/scan.pdf": b"scan", "payments/user-1/p1/invoice.pdf": b"invoice",
+            "user-2/other.pdf": b"other", "payments/user-2/p2/bill.pdf": b"bill"
+        })
+        repository = BackupRepository(root=str(tmp_path), storage=storage)
+        repository.backup("first")
+        storage.objects.clear()
+
+        result = repository.restore("first", prefix=user_object_prefixes("user-1"))
+
+        assert result["restored"] == 2
+        assert set(storage.objects) == {"user-1/scan.pdf", "payments/user-1/p1/invoice.pdf"}
@@ -0,0 +1,57 @@
+import pytest
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.api import backup_v2
+from app.models.backup import BackupStatus
+
+class FakeChannel:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.subscribed = 0
+
+    def subscribe(self, backup_id):
+        self.subscribed += 1
+        return self.queue
+
+    def unsubscribe(self, backup_id, queue):
+        self.subscribed -= 1
+
+class FakeSession:
+    def __init__(self, backup):
+        self.backup = backup
+        self.closed = False
+
+    def query(self, entity):
+        return SimpleNamespace(filter=lambda *criteria: SimpleNamespace(first=lambda: self.backup))
+
+    def close(self):
+        self.closed = True
+
+class TestBackupEvents:
+    """Test the server-sent progress stream of a running backup"""
+
+    @pytest.mark.unit
+    def test_stream_reads_channel_after_releasing_session(self, monkeypatch):
+        """Test the snapshot comes from the database, which is released before any event is streamed"""
+        channel = FakeChannel()
+        monkeypatch.setattr(backup_v2, "backup_channel", channel)
+        backup = SimpleNamespace(
+            status=BackupStatus.IN_PROGRESS, progress_stage="database", progress_bytes=10,
+            progress_total_bytes=100, progress_eta_seconds=5, progress_updated_at=None
+        )
+        db = FakeSession(backup)
+
+        async def run():
+            response = await backup_v2.stream_backup_events("backup-1", _admin_user=None, db=db)
+            assert db.closed
+            await channel.queue.put({"backup_id": "backup-1", "status": "completed"})
+            return [chunk async for chunk in response.body_iterator]
+
+        chunks = asyncio.run(run())
+
+        events = [json.loads(chunk[len("data: "):]) for chunk in chunks]
+        assert [event["status"] for event in events] == ["in_progress", "completed"]
+        assert events[0]["bytes"] == 10
+        assert channel.subscribed == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from app.services.backup_jobs import ProgressReporter
+
+class RecordingPublisher:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, backup_id, event):
+        self.events.append(event)
+
+class TestProgressReporter:
+    """Test how backup progress callbacks become published events"""
+
+    @pytest.mark.unit
+    def test_updates_within_a_stage_are_throttled(self):
+        """Test repeated updates of one stage publish once per interval"""
+        publisher = RecordingPublisher()
+        reporter = ProgressReporter("backup-1", publish=publisher)
+
+        for processed in range(0, 1000, 100):
+            reporter("objects", {"bytes_scanned": processed})
+
+        assert len(publisher.events) == 1
+
+    @pytest.mark.unit
+    def test_stage_change_publishes_summed_bytes(self):
+        """Test concurrent stages are summed and a new stage is published at once"""
+        publisher = RecordingPublisher()
+        reporter = ProgressReporter("backup-1", publish=publisher)
+
+        reporter("objects", {"bytes_scanned": 300})
+        reporter("dump_postgres", {"bytes": 200})
+
+        assert [event["stage"] for event in publisher.events] == ["objects", "dump_postgres"]
+        assert publisher.events[-1]["bytes"] == 500
+
+    @pytest.mark.unit
+    def test_eta_from_previous_backup_size(self):
+        """Test the ETA extrapolates elapsed time over the expected total"""
+        publisher = RecordingPublisher()
+        reporter = ProgressReporter("backup-1", expected=1000, publish=publisher)
+        reporter.started -= 10
+
+        reporter("archive", {"bytes": 250})
+
+        assert publisher.events[0]["total_bytes"] == 1000
+        assert publisher.events[0]["eta_seconds"] == 30
@@ -0,0 +1,43 @@
+import pytest
+import io
+import os
+
+from app.services.backup_engine import BackupError
+from app.services.backup_pipeline import EncryptingWriter, DecryptingReader
+
+def encrypt(payload, passphrase="test-passphrase", frame_size=1024):
+    output = io.BytesIO()
+    writer = EncryptingWriter(output, passphrase=passphrase, frame_size=frame_size)
+    for start in range(0, len(payload), 700):
+        writer.write(payload[start:start + 700])
+    writer.close()
+    return output.getvalue()
+
+class TestBackupEncryption:
+    """Test the framed AES-GCM stream used for backup archives"""
+
+    @pytest.mark.unit
+    def test_round_trip_across_frames(self):
+        """Test data spanning many frames decrypts to the original bytes"""
+        payload = os.urandom(10 * 1024 + 17)
+        reader = DecryptingReader(io.BytesIO(encrypt(payload)), passphrase="test-passphrase")
+
+        assert reader.read(100) + reader.read() == payload
+
+    @pytest.mark.unit
+    def test_truncated_archive_is_rejected(self):
+        """Test dropping the final frame is detected rather than returning a short archive"""
+        sealed = encrypt(os.urandom(4096))
+        final_frame = 4 + 16  # length prefix plus tag of the empty final frame
+        reader = DecryptingReader(io.BytesIO(sealed[:-final_frame]), passphrase="test-passphrase")
+
+        with pytest.raises(BackupError):
+            reader.read()
+
+    @pytest.mark.unit
+    def test_wrong_key_is_rejected(self):
+        """Test a different passphrase fails authentication"""
+        reader = DecryptingReader(io.BytesIO(encrypt(b"secret")), passphrase="other-passphrase")
+
+        with pytest.raises(BackupError):
+            reader.read()
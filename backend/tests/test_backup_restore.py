@@ -0,0 +1,76 @@
+import pytest
+import io
+import os
+import tarfile
+
+import zstandard
+
+from app.services.backup_engine import BackupError
+from app.services.backup_pipeline import EncryptingWriter, _add_tree, _add_json
+from app.services.backup_restore import read_archive, UserSelection, VerifyOnly
+
+PASSPHRASE = "test-passphrase"
+
+def build_archive(tmp_path, tamper=False):
+    dump = tmp_path / "dump" / "postgres"
+    dump.mkdir(parents=True)
+    (dump / "3001.dat").write_bytes(b"row\n" * 1000)
+    (dump / "3002.dat").write_bytes(b"other\n" * 1000)
+    (dump / "toc.dat").write_bytes(b"toc")
+
+    output = io.BytesIO()
+    encryptor = EncryptingWriter(output, passphrase=PASSPHRASE, frame_size=1024)
+    with zstandard.ZstdCompressor().stream_writer(encryptor, closefd=False) as compressed:
+        with tarfile.open(fileobj=compressed, mode="w|") as tar:
+            checksums = {}
+            _add_tree(tar, str(dump), "postgres", checksums)
+            if tamper:
+                checksums["postgres/3001.dat"] = "0" * 64
+            _add_json(tar, "backup.json", {"backup_id": "b1", "databases": ["postgres"], "files": checksums})
+    encryptor.close()
+
+    path = tmp_path / "archive.tar.zst.aes"
+    path.write_bytes(output.getvalue())
+    return str(path)
+
+class TestArchiveRestore:
+    """Test the single-pass verification of pipeline archives"""
+
+    @pytest.mark.unit
+    def test_extracts_and_verifies_in_one_pass(self, tmp_path):
+        """Test every file is extracted and checked against the checksum manifest"""
+        staging = tmp_path / "staging"
+        metadata = read_archive(build_archive(tmp_path), str(staging), passphrase=PASSPHRASE)
+
+        assert metadata["verified"] is True
+        assert sorted(os.listdir(staging / "postgres")) == ["3001.dat", "3002.dat", "toc.dat"]
+        assert (staging / "postgres" / "3002.dat").read_bytes() == b"other\n" * 1000
+
+    @pytest.mark.unit
+    def test_checksum_mismatch_is_rejected(self, tmp_path):
+        """Test a file that does not match the manifest fails the whole restore"""
+        with pytest.raises(BackupError):
+            read_archive(build_archive(tmp_path, tamper=True), str(tmp_path / "staging"), passphrase=PASSPHRASE)
+
+    @pytest.mark.unit
+    def test_truncated_archive_is_rejected(self, tmp_path):
+        """Test a missing final frame is detected even though tar already ended"""
+        path = build_archive(tmp_path)
+        with open(path, "rb+") as archive:
+            archive.truncate(os.path.getsize(path) - 20)
+
+        with pytest.raises(BackupError):
+            read_archive(path, str(tmp_path / "staging"), VerifyOnly(), passphrase=PASSPHRASE)
+
+    @pytest.mark.unit
+    def test_user_selection_keeps_only_user_tables(self, tmp_path, monkeypatch):
+        """Test a single-user restore extracts only the data files of user tables"""
+        monkeypatch.setattr(
+            "app.services.backup_restore.list_table_data",
+            lambda dump_dir: {"health_records": "3001; 0 16390 TABLE DATA public health_records healthstash"}
+        )
+        staging = tmp_path / "staging"
+        metadata = read_archive(build_archive(tmp_path), str(staging), UserSelection("u1"), passphrase=PASSPHRASE)
+
+        assert metadata["verified"] is True
+        assert sorted(os.listdir(staging / "postgres")) == ["3001.dat", "toc.dat"]
@@ -0,0 +1,95 @@
+import pytest
+import json
+import sys
+
+import benchmark_backup
+from app.services import backup_restore
+
+class TestBenchmarkBackup:
+    """Test SLO checks, the exit code and the JSON line output of the backup benchmark"""
+
+    def _patch(self, monkeypatch, seconds, status="completed", verified=True):
+        """Stub every stage; seconds gives the duration of backup_full, restore_full and restore_user"""
+        discarded = []
+
+        def run_backup(backup_type, notes, job):
+            return {"backup_id": job.__name__, "status": status, "seconds": seconds["backup_full"],
+                    "file_path": "/backups/full.tar.zst.enc", "file_size": 10, "error": None}
+
+        def timed(func_, *args, **kwargs):
+            stage = "restore_user" if kwargs.get("user_id") else "restore_full"
+            return func_(*args, **kwargs), seconds.get(stage, 0.1)
+
+        monkeypatch.setattr(benchmark_backup, "_run_backup", run_backup)
+        monkeypatch.setattr(benchmark_backup, "_timed", timed)
+        monkeypatch.setattr(benchmark_backup, "dataset_size", lambda: {"users": 1})
+        monkeypatch.setattr(benchmark_backup, "_discard_backup", discarded.append)
+        monkeypatch.setattr(benchmark_backup, "_first_user_id", lambda: "user-1")
+        monkeypatch.setattr(backup_restore, "verify_archive", lambda path: {"verified": verified})
+        monkeypatch.setattr(backup_restore, "restore_archive", lambda path, user_id=None, skip_unchanged=True: {
+            "objects": 3
+        })
+        return discarded
+
+    def _main(self, monkeypatch, tmp_path, *options):
+        output = tmp_path / "benchmarks.jsonl"
+        monkeypatch.setattr(sys, "argv", ["benchmark_backup.py", "--skip-generate", "--label", "ci",
+                                          "--output", str(output), *options])
+        code = 0
+        try:
+            benchmark_backup.main()
+        except SystemExit as exit:
+            code = exit.code
+        return code, [json.loads(line) for line in output.read_text().splitlines()]
+
+    @pytest.mark.unit
+    def test_met_slos_pass(self, monkeypatch, tmp_path):
+        """Test a run within every SLO exits 0 and appends one JSON line with the checks"""
+        discarded = self._patch(monkeypatch, {"backup_full": 5.0, "restore_full": 8.0, "restore_user": 1.0})
+
+        code, lines = self._main(monkeypatch, tmp_path, "--restore", "--restore-user", "--backup-slo", "10",
+                                 "--restore-slo", "10", "--restore-slo-user", "2")
+
+        assert code == 0
+        (result,) = lines
+        assert result["label"] == "ci" and "version" in result
+        assert result["slo"] == {
+            "backup": {"limit_seconds": 10.0, "seconds": 5.0, "met": True},
+            "restore": {"limit_seconds": 10.0, "seconds": 8.0, "met": True},
+            "restore_user": {"limit_seconds": 2.0, "seconds": 1.0, "met": True}
+        }
+        assert set(result["stages"]) == {"backup_full", "backup_incremental", "verify", "restore_full",
+                                         "restore_user"}
+        assert len(discarded) == 2
+
+    @pytest.mark.unit
+    def test_missed_slo_fails(self, monkeypatch, tmp_path, capsys):
+        """Test a restore over its SLO exits 1, names the SLO and still records the run"""
+        self._patch(monkeypatch, {"backup_full": 5.0, "restore_full": 12.5})
+
+        code, lines = self._main(monkeypatch, tmp_path, "--restore", "--backup-slo", "10", "--restore-slo", "10")
+
+        assert code == 1
+        assert lines[0]["slo"]["restore"]["met"] is False
+        assert "SLO missed for restore" in capsys.readouterr().err
+
+    @pytest.mark.unit
+    def test_failed_stage_fails_without_slos(self, monkeypatch, tmp_path):
+        """Test a failed verification stops before restores and fails the run"""
+        self._patch(monkeypatch, {"backup_full": 5.0}, verified=False)
+
+        code, lines = self._main(monkeypatch, tmp_path, "--restore")
+
+        assert code == 1
+        assert lines[0]["failed"] == "verify"
+        assert "restore_full" not in lines[0]["stages"]
+
+    @pytest.mark.unit
+    def test_failure_reasons(self):
+        """Test SLOs without a limit or a measurement are not checked"""
+        assert benchmark_backup._slo(None, 3.0) is None
+        assert benchmark_backup._slo(2.0, None) is None
+        assert benchmark_backup.benchmark_failure({"slo": {}}) is None
+        assert benchmark_backup.benchmark_failure({
+            "slo": {"backup": {"met": False}, "restore": {"met": False}}
+        }) == "SLO missed for backup, restore"
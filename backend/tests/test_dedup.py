@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+
+from app.services import dedup
+
+class TestStoreUserContent:
+    """Test that each user's content is uploaded and stored once"""
+
+    def _patch(self, monkeypatch, existing, created=True, winner=None):
+        events = []
+
+        async def upload_file(content, object_name):
+            events.append(("upload", object_name))
+            return True
+
+        async def delete_file(object_name):
+            events.append(("delete", object_name))
+
+        monkeypatch.setattr(dedup, "find_stored_object", lambda db, user_id, checksum, lock=False: existing)
+        monkeypatch.setattr(dedup, "encrypt_file_content", lambda content, key: content)
+        monkeypatch.setattr(dedup, "storage_service", SimpleNamespace(upload_file=upload_file, delete_file=delete_file))
+        monkeypatch.setattr(dedup, "register_stored_object", lambda db, user_id, checksum, name, size: (
+            winner or SimpleNamespace(minio_object_name=name), created
+        ))
+        return events
+
+    @pytest.mark.unit
+    def test_known_content_reuses_its_object(self, monkeypatch):
+        """Test content the user already stored is referenced without another upload"""
+        existing = SimpleNamespace(minio_object_name="user-1/first", last_referenced_at=None)
+        events = self._patch(monkeypatch, existing)
+
+        result = asyncio.run(dedup.store_user_content(None, "user-1", b"data", "sum", "user-1/second", b"k" * 32))
+
+        assert result == ("user-1/first", False)
+        assert events == []
+        assert existing.last_referenced_at is not None
+
+    @pytest.mark.unit
+    def test_new_content_is_uploaded_once(self, monkeypatch):
+        """Test new content is uploaded and reported as adding unique bytes"""
+        events = self._patch(monkeypatch, None)
+
+        result = asyncio.run(dedup.store_user_content(None, "user-1", b"data", "sum", "user-1/new", b"k" * 32))
+
+        assert result == ("user-1/new", True)
+        assert events == [("upload", "user-1/new")]
+
+    @pytest.mark.unit
+    def test_losing_a_concurrent_upload_discards_the_copy(self, monkeypatch):
+        """Test an upload that lost the registration race uses the winner and deletes its own object"""
+        winner = SimpleNamespace(minio_object_name="user-1/winner")
+        events = self._patch(monkeypatch, None, created=False, winner=winner)
+
+        result = asyncio.run(dedup.store_user_content(None, "user-1", b"data", "sum", "user-1/loser", b"k" * 32))
+
+        assert result == ("user-1/winner", False)
+        assert events == [("upload", "user-1/loser"), ("delete", "user-1/loser")]
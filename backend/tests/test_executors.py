@@ -0,0 +1,44 @@
+import pytest
+import asyncio
+import threading
+
+from app.core.executors import BoundedExecutor, ExecutorSaturated
+
+class TestBoundedExecutor:
+    """Test the bounded executor used for password hashing"""
+
+    @pytest.mark.unit
+    def test_runs_work_and_records_stats(self):
+        """Test results are returned and completions are counted"""
+        executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+
+        assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+
+        stats = executor.stats()
+        assert stats["completed"] == 1
+        assert stats["rejected"] == 0
+        assert stats["queued"] == 0
+
+    @pytest.mark.unit
+    def test_rejects_when_saturated(self):
+        """Test work beyond workers plus queue is rejected, not queued"""
+        executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def scenario():
+            running = asyncio.ensure_future(executor.run(release.wait))
+            waiting = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0.05)
+
+            with pytest.raises(ExecutorSaturated):
+                await executor.run(release.wait)
+
+            release.set()
+            await asyncio.gather(running, waiting)
+
+        asyncio.run(scenario())
+
+        stats = executor.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 2
+        assert stats["peak_depth"] == 2
@@ -0,0 +1,48 @@
+import pytest
+import io
+import threading
+import zipfile
+
+from app.services.expense_report import ZipPipe
+
+def consume(pipe, sink, part_size=64 * 1024):
+    """Read the pipe the way MinIO's multipart uploader does, one part at a time"""
+    while True:
+        part = pipe.read(part_size)
+        if not part:
+            break
+        sink.append(part)
+    pipe.reader_done.set()
+
+class TestZipPipe:
+    """Test streaming a ZIP archive through the bounded upload pipe"""
+
+    @pytest.mark.unit
+    def test_archive_streams_through_pipe(self):
+        """Test a ZIP written to the unseekable pipe is complete and readable"""
+        pipe = ZipPipe(max_chunks=2)
+        parts = []
+        reader = threading.Thread(target=consume, args=(pipe, parts))
+        reader.start()
+
+        invoice = bytes(range(256)) * 20000
+        with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("summary.csv", "expense_date,amount\n2024-01-05,10.00\n")
+            archive.writestr("invoices/a.pdf", invoice, compress_type=zipfile.ZIP_STORED)
+        pipe.close()
+        reader.join(timeout=10)
+
+        data = b"".join(parts)
+        assert len(data) == pipe.bytes_written
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.read("invoices/a.pdf") == invoice
+            assert archive.read("summary.csv").startswith(b"expense_date")
+
+    @pytest.mark.unit
+    def test_writer_fails_when_reader_stops(self):
+        """Test a dead uploader surfaces as an error instead of blocking the writer"""
+        pipe = ZipPipe(max_chunks=1)
+        pipe.reader_done.set()
+
+        with pytest.raises(IOError):
+            pipe.write(b"x" * (2 * 1024 * 1024))
@@ -0,0 +1,68 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+
+from app.services.fx_rates import parse_ecb_csv, FxRateIndex
+
+ECB_CSV = """Date,USD,JPY,BGN,
+2024-01-05,1.0921,158.3,1.9558,
+2024-01-04,1.0953,158.83,N/A,
+2024-01-08,1.0946,N/A,1.9558,
+"""
+
+def make_index(series):
+    index = FxRateIndex()
+    index._series = {
+        currency: ([day for day, _ in points], [rate for _, rate in points])
+        for currency, points in series.items()
+    }
+    index._series["EUR"] = ([date(1999, 1, 1)], [Decimal(1)])
+    return index
+
+class TestFxRates:
+    """Test ECB rate parsing and the in-memory rate index"""
+
+    @pytest.mark.unit
+    def test_parse_skips_missing_cells_and_sorts(self, tmp_path):
+        """Test N/A cells and trailing empty columns are ignored"""
+        path = tmp_path / "eurofxref-hist.csv"
+        path.write_text(ECB_CSV)
+
+        series = parse_ecb_csv(str(path))
+
+        assert [day for day, _ in series["USD"]] == [date(2024, 1, 4), date(2024, 1, 5), date(2024, 1, 8)]
+        assert len(series["JPY"]) == 2
+        assert series["BGN"][0] == (date(2024, 1, 5), Decimal("1.9558"))
+        assert "" not in series
+
+    @pytest.mark.unit
+    def test_rate_carries_forward_over_gaps(self, tmp_path):
+        """Test a weekend date uses the last published rate and earlier dates have none"""
+        path = tmp_path / "eurofxref-hist.csv"
+        path.write_text(ECB_CSV)
+        index = make_index(parse_ecb_csv(str(path)))
+
+        assert index.rate("USD", date(2024, 1, 6)) == Decimal("1.0921")
+        assert index.rate("USD", date(2024, 1, 3)) is None
+
+    @pytest.mark.unit
+    def test_convert_between_non_base_currencies(self, tmp_path):
+        """Test cross rates go through the base currency"""
+        path = tmp_path / "eurofxref-hist.csv"
+        path.write_text(ECB_CSV)
+        index = make_index(parse_ecb_csv(str(path)))
+
+        assert index.convert(109.21, "USD", "EUR", date(2024, 1, 5)) == Decimal("100.00")
+        assert index.convert(100, "EUR", "JPY", date(2024, 1, 5)) == Decimal("15830.00")
+        assert index.convert(50, "CHF", "EUR", date(2024, 1, 5)) is None
+
+    @pytest.mark.unit
+    def test_base_currency_needs_no_imported_rates(self):
+        """Test identity and base conversions work on an empty rate table"""
+        index = FxRateIndex()
+
+        assert index.knows("EUR")
+        assert not index.knows("USD")
+        assert index.convert(12.5, "EUR", "EUR", date(2024, 1, 5)) == Decimal("12.5")
+        assert index.rate("EUR", date(2024, 1, 5)) == Decimal(1)
+        assert index.convert(10, "USD", "EUR", date(2024, 1, 5)) is None
@@ -0,0 +1,102 @@
+import pytest
+import asyncio
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import event
+
+from app.api.payments import get_payments
+from app.models import HealthRecord, PaymentFile, PaymentRecord, PaymentStatus
+from app.models.health_record import RecordCategory
+
+PAYMENT_FIELDS = {
+    "id", "health_record_id", "invoice_number", "invoice_date", "expense_date", "amount", "currency",
+    "payment_status", "payment_method", "payment_date", "provider_name", "service_description",
+    "insurance_paid_amount", "patient_responsibility", "created_at", "updated_at", "files",
+    "provider_address", "insurance_claim_number", "notes", "health_record"
+}
+FILE_FIELDS = {"id", "file_name", "file_type", "file_size", "is_invoice", "is_receipt", "uploaded_at"}
+
+def add_payments(db, user, count):
+    """Payments that each have a linked health record and two files"""
+    for index in range(count):
+        record = HealthRecord(
+            id=str(uuid.uuid4()), user_id=user.id, title=f"Visit {index}",
+            category=RecordCategory.CLINICAL_NOTES, service_date=datetime(2024, 3, 1)
+        )
+        payment = PaymentRecord(
+            id=str(uuid.uuid4()), user_id=user.id, health_record_id=record.id, amount=Decimal("10.00"),
+            currency="EUR", expense_date=datetime(2024, 3, 1 + index % 28), payment_status=PaymentStatus.PAID,
+            provider_name="Clinic", provider_address="Main St 1", insurance_claim_number="C-1", notes="note"
+        )
+        db.add_all([record, payment])
+        for name in ("invoice.pdf", "receipt.jpg"):
+            db.add(PaymentFile(
+                id=str(uuid.uuid4()), payment_record_id=payment.id, file_name=name, file_type="application/pdf",
+                file_size=100, thumbnail_data="data:image/png;base64,AAAA", minio_object_name=f"payments/{name}"
+            ))
+    db.commit()
+    db.expunge_all()
+
+def list_payments(db, user, view="full"):
+    return asyncio.run(get_payments(
+        skip=0, limit=100, search=None, status=None, health_record_id=None, provider=None, date_from=None,
+        date_to=None, sort_by="expense_date_desc", view=view, current_user=SimpleNamespace(id=user.id), db=db
+    ))
+
+def count_queries(db, user):
+    statements = []
+    engine = db.get_bind()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = list_payments(db, user)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    db.expunge_all()
+    return len(statements), response
+
+class TestPaymentListing:
+    """Test the eager-loaded payment listing"""
+
+    @pytest.mark.integration
+    def test_response_shape(self, test_db, test_user):
+        """Test the full view keeps every field and files are metadata without thumbnails"""
+        add_payments(test_db, test_user, 1)
+
+        response = list_payments(test_db, test_user)
+
+        assert set(response) == {"payments", "total", "skip", "limit"}
+        (payment,) = response["payments"]
+        assert set(payment) == PAYMENT_FIELDS
+        assert payment["notes"] == "note"
+        assert set(payment["health_record"]) == {"id", "title", "service_date"}
+        assert len(payment["files"]) == 2
+        assert all(set(file) == FILE_FIELDS for file in payment["files"])
+
+    @pytest.mark.integration
+    def test_summary_view_drops_detail_fields(self, test_db, test_user):
+        """Test the summary view omits addresses, claim numbers and notes only"""
+        add_payments(test_db, test_user, 1)
+
+        (payment,) = list_payments(test_db, test_user, view="summary")["payments"]
+
+        assert set(payment) == PAYMENT_FIELDS - {"provider_address", "insurance_claim_number", "notes"}
+
+    @pytest.mark.integration
+    def test_query_count_does_not_grow_with_payments(self, test_db, test_user):
+        """Test a page costs the same number of queries for 2 payments as for 20"""
+        add_payments(test_db, test_user, 2)
+        few, response = count_queries(test_db, test_user)
+        assert response["total"] == 2
+
+        add_payments(test_db, test_user, 18)
+        many, response = count_queries(test_db, test_user)
+        assert response["total"] == 20
+
+        assert many == few
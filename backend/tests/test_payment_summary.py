@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.api.payments import get_payment_summary
+from app.models import ExchangeRate, PaymentRecord, PaymentStatus
+from app.services.fx_rates import fx_index
+
+@pytest.fixture
+def summary_payments(test_db, test_user):
+    """A USD rate, no GBP rate, and a March with EUR and USD payments"""
+    test_db.add(ExchangeRate(currency="USD", valid_from=date(2024, 1, 1), rate=Decimal("1.25")))
+    payments = [
+        ("EUR", "100.00", datetime(2024, 3, 5), PaymentStatus.PAID, "Clinic A", False),
+        ("USD", "125.00", datetime(2024, 3, 20), PaymentStatus.PENDING, "Clinic A", False),
+        ("GBP", "50.00", datetime(2024, 4, 2), PaymentStatus.PAID, "Lab B", False),
+        ("EUR", "40.00", datetime(2024, 4, 9), PaymentStatus.PAID, "Lab B", True)
+    ]
+    for currency, amount, expense_date, status, provider, deleted in payments:
+        test_db.add(PaymentRecord(
+            id=str(uuid.uuid4()), user_id=test_user.id, amount=Decimal(amount), currency=currency,
+            expense_date=expense_date, payment_status=status, provider_name=provider, is_deleted=deleted
+        ))
+    test_db.commit()
+    fx_index.load(test_db)
+    return test_user
+
+def summarize(db, user, reporting_currency=None):
+    return asyncio.run(get_payment_summary(
+        date_from=None, date_to=None, include_monthly=True, include_currencies=True,
+        reporting_currency=reporting_currency, current_user=SimpleNamespace(id=user.id), db=db
+    ))
+
+class TestPaymentSummary:
+    """Test the grouping sets of the payment summary against a small fixture"""
+
+    @pytest.mark.integration
+    def test_native_totals(self, test_db, summary_payments):
+        """Test without a reporting currency native amounts are summed and nothing is unconverted"""
+        summary = summarize(test_db, summary_payments)
+
+        assert summary["total_payments"] == 3
+        assert summary["total_amount"] == 275.0
+        assert "unconverted_payments" not in summary
+        assert summary["status_summary"]["paid"] == {"count": 2, "total": 150.0}
+        assert summary["status_summary"]["pending"] == {"count": 1, "total": 125.0}
+        assert summary["provider_summary"] == {
+            "Clinic A": {"count": 2, "total": 225.0},
+            "Lab B": {"count": 1, "total": 50.0}
+        }
+
+    @pytest.mark.integration
+    def test_converted_to_base_currency(self, test_db, summary_payments):
+        """Test per-currency, per-month and total rows in EUR, with the GBP payment unconverted"""
+        summary = summarize(test_db, summary_payments, "eur")
+
+        assert summary["reporting_currency"] == "EUR"
+        assert summary["total_payments"] == 3
+        assert summary["total_amount"] == 200.0
+        assert summary["unconverted_payments"] == 1
+        assert summary["monthly_summary"] == [
+            {"month": "2024-03", "count": 2, "total": 200.0},
+            {"month": "2024-04", "count": 1, "total": 0.0}
+        ]
+        assert summary["currency_summary"] == {
+            "EUR": {"count": 1, "total": 100.0, "native_total": 100.0},
+            "USD": {"count": 1, "total": 100.0, "native_total": 125.0},
+            "GBP": {"count": 1, "total": 0.0, "native_total": 50.0}
+        }
+
+    @pytest.mark.integration
+    def test_converted_from_base_currency(self, test_db, summary_payments):
+        """Test converting into a non-base currency applies its rate to base currency payments"""
+        summary = summarize(test_db, summary_payments, "USD")
+
+        assert summary["total_amount"] == 250.0
+        assert summary["unconverted_payments"] == 1
+        assert summary["monthly_summary"][0] == {"month": "2024-03", "count": 2, "total": 250.0}
+        assert summary["currency_summary"]["EUR"]["total"] == 125.0
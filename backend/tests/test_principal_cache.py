@@ -0,0 +1,69 @@
+import pytest
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.models.user import UserRole
+from app.services.principal_cache import Principal, PrincipalCache, revoke_user_sessions
+
+def make_user(user_id="user-1", **overrides):
+    fields = dict(
+        id=user_id,
+        role=UserRole.USER,
+        is_active=True,
+        is_locked=False,
+        locked_until=None,
+        security_stamp=0
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+class TestPrincipalCache:
+    """Test the authenticated principal cache"""
+
+    @pytest.mark.unit
+    def test_principal_expires_after_ttl(self):
+        """Test cached principals are dropped once the TTL passes"""
+        with freeze_time("2025-01-01 12:00:00") as frozen:
+            cache = PrincipalCache(ttl_seconds=30, max_size=10)
+            cache.put(Principal.from_user(make_user()))
+            assert cache.get("user-1").id == "user-1"
+
+            frozen.tick(timedelta(seconds=31))
+            assert cache.get("user-1") is None
+
+    @pytest.mark.unit
+    def test_invalidate_and_eviction(self):
+        """Test explicit invalidation and least recently used eviction"""
+        cache = PrincipalCache(ttl_seconds=30, max_size=2)
+        for user_id in ("a", "b"):
+            cache.put(Principal.from_user(make_user(user_id)))
+        cache.get("a")
+        cache.put(Principal.from_user(make_user("c")))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+        cache.invalidate("a")
+        assert cache.get("a") is None
+
+    @pytest.mark.unit
+    def test_lock_is_evaluated_at_request_time(self):
+        """Test a cached lock stops applying once locked_until passes"""
+        with freeze_time("2025-01-01 12:00:00") as frozen:
+            principal = Principal.from_user(make_user(
+                is_locked=True,
+                locked_until=datetime(2025, 1, 1, 12, 15)
+            ))
+            assert principal.currently_locked
+
+            frozen.tick(timedelta(minutes=16))
+            assert not principal.currently_locked
+
+    @pytest.mark.unit
+    def test_revoke_bumps_security_stamp(self):
+        """Test revoking sessions changes the stamp embedded in new tokens"""
+        user = make_user(security_stamp=3)
+        revoke_user_sessions(user)
+        assert user.security_stamp == 4
+        assert Principal.from_user(user).security_stamp == 4
@@ -0,0 +1,104 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from fastapi import HTTPException
+from sqlalchemy.sql import operators
+
+from app.api import health_records
+from app.api.health_records import BatchThumbnailRequest, get_record_thumbnails
+from app.core.config import settings
+
+def matches(row, criterion):
+    """Evaluate the simple column comparisons the endpoint filters with"""
+    value = getattr(row, criterion.left.key)
+    expected = getattr(criterion.right, "value", False)
+    if criterion.operator is operators.in_op:
+        return value in expected
+    return value == expected
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *criteria):
+        return FakeQuery([row for row in self.rows if all(matches(row, c) for c in criteria)])
+
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    def __init__(self, records):
+        self.records = records
+        self.commits = 0
+
+    def query(self, entity):
+        return FakeQuery(self.records)
+
+    def get(self, entity, key):
+        return SimpleNamespace(id=key)
+
+    def commit(self):
+        self.commits += 1
+
+def make_record(record_id, user_id="user-1", thumbnail=None, file_type="image/png", is_deleted=False):
+    return SimpleNamespace(
+        id=record_id, user_id=user_id, is_deleted=is_deleted, has_thumbnail=thumbnail is not None,
+        thumbnail_data=thumbnail, minio_object_name=f"{user_id}/{record_id}", file_type=file_type
+    )
+
+class TestRecordThumbnails:
+    """Test the batch thumbnail endpoint used by the record grid and timeline"""
+
+    def _call(self, monkeypatch, db, record_ids, generated=None):
+        built = []
+
+        def build(object_name, user_key, file_type):
+            built.append(object_name)
+            return (generated or {}).get(object_name)
+
+        monkeypatch.setattr(health_records, "get_user_file_key", lambda user: b"k" * 32)
+        monkeypatch.setattr(health_records, "build_stored_thumbnail", build)
+        result = asyncio.run(get_record_thumbnails(
+            BatchThumbnailRequest(record_ids=record_ids), current_user=SimpleNamespace(id="user-1"), db=db
+        ))
+        return result, built
+
+    @pytest.mark.unit
+    def test_only_own_live_records_are_returned(self, monkeypatch):
+        """Test records of other users and deleted records are reported missing"""
+        db = FakeSession([
+            make_record("mine", thumbnail="data:image/png;base64,AAA"),
+            make_record("theirs", user_id="user-2", thumbnail="data:image/png;base64,BBB"),
+            make_record("deleted", thumbnail="data:image/png;base64,CCC", is_deleted=True)
+        ])
+
+        result, built = self._call(monkeypatch, db, ["mine", "theirs", "deleted", "mine"])
+
+        assert result["thumbnails"] == {"mine": "data:image/png;base64,AAA"}
+        assert result["missing"] == ["theirs", "deleted"]
+        assert built == []
+
+    @pytest.mark.unit
+    def test_too_many_ids_are_rejected(self, monkeypatch):
+        """Test a request over THUMBNAIL_BATCH_MAX distinct ids fails without querying"""
+        ids = [f"record-{index}" for index in range(settings.THUMBNAIL_BATCH_MAX + 1)]
+
+        with pytest.raises(HTTPException) as error:
+            self._call(monkeypatch, None, ids)
+
+        assert error.value.status_code == 400
+
+    @pytest.mark.unit
+    def test_missing_image_thumbnails_are_generated_and_saved(self, monkeypatch):
+        """Test images without a stored thumbnail get one generated and persisted, other files do not"""
+        image = make_record("image")
+        document = make_record("document", file_type="application/pdf")
+        db = FakeSession([image, document])
+
+        result, built = self._call(monkeypatch, db, ["image", "document"],
+                                   generated={"user-1/image": "data:image/jpeg;base64,NEW"})
+
+        assert built == ["user-1/image"]
+        assert result == {"thumbnails": {"image": "data:image/jpeg;base64,NEW"}, "missing": ["document"]}
+        assert image.thumbnail_data == "data:image/jpeg;base64,NEW" and image.has_thumbnail is True
+        assert db.commits == 1
@@ -0,0 +1,159 @@
+import pytest
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app.models.report_job import ReportJob, ReportStatus
+from app.services import expense_report
+
+class FakeQuery:
+    def __init__(self, session):
+        self.session = session
+
+    def filter(self, *criteria):
+        self.session.criteria.extend(criteria)
+        return self
+
+    def update(self, values, synchronize_session=None):
+        self.session.updates.append(values)
+        return self.session.matched
+
+class FakeSession:
+    """Serves one report job and records commits, rollbacks and bulk updates"""
+
+    def __init__(self, job=None, matched=0):
+        self.job = job
+        self.matched = matched
+        self.commits = []
+        self.criteria = []
+        self.updates = []
+
+    def get(self, entity, key):
+        if entity is ReportJob:
+            return self.job
+        return SimpleNamespace(id=key)
+
+    def query(self, entity):
+        return FakeQuery(self)
+
+    def commit(self):
+        if self.job is not None:
+            self.commits.append(self.job.status)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_job(status=ReportStatus.PENDING):
+    return SimpleNamespace(
+        id="job-1234-5678", user_id="user-1", year=2024, reporting_currency="EUR", include_invoices=False,
+        status=status, started_at=None, heartbeat_at=None, completed_at=None, object_name=None,
+        file_size=None, payments_count=0, invoices_count=0, error_message=None
+    )
+
+class TestReportJobs:
+    """Test the expense report job lifecycle and recovery of jobs lost with their worker"""
+
+    def _patch(self, monkeypatch, db, upload_ok=True):
+        beats = []
+        monkeypatch.setattr(expense_report, "SessionLocal", lambda: db)
+        monkeypatch.setattr(expense_report, "get_user_file_key", lambda user: b"k" * 32)
+        monkeypatch.setattr(expense_report, "ReportHeartbeat", lambda job_id: SimpleNamespace(
+            start=lambda: beats.append("start"), stop=lambda: beats.append("stop")
+        ))
+
+        def write_summary(db, job, archive):
+            archive.writestr("summary.csv", "expense_date,amount\n")
+            return 3
+
+        def put_object_stream(pipe, object_name, content_type=None):
+            while pipe.read(64 * 1024):
+                pass
+            return upload_ok
+
+        monkeypatch.setattr(expense_report, "_write_summary", write_summary)
+        monkeypatch.setattr(expense_report, "storage_service", SimpleNamespace(put_object_stream=put_object_stream))
+        return beats
+
+    @pytest.mark.unit
+    def test_report_runs_to_completion(self, monkeypatch):
+        """Test a pending job is marked running with a heartbeat, then completed with its archive"""
+        job = make_job()
+        db = FakeSession(job)
+        beats = self._patch(monkeypatch, db)
+
+        expense_report.generate_report(job.id)
+
+        assert db.commits == [ReportStatus.RUNNING, ReportStatus.COMPLETED]
+        assert job.heartbeat_at == job.started_at is not None
+        assert job.object_name == f"reports/user-1/{job.id}/expenses-2024.zip"
+        assert job.payments_count == 3
+        assert job.file_size > 0
+        assert beats == ["start", "stop"]
+
+    @pytest.mark.unit
+    def test_failed_upload_fails_the_job(self, monkeypatch):
+        """Test a storage failure is recorded on the job and the heartbeat stops"""
+        job = make_job()
+        db = FakeSession(job)
+        beats = self._patch(monkeypatch, db, upload_ok=False)
+
+        expense_report.generate_report(job.id)
+
+        assert job.status == ReportStatus.FAILED
+        assert job.error_message == "Upload to storage failed"
+        assert job.completed_at is not None
+        assert beats == ["start", "stop"]
+
+    @pytest.mark.unit
+    def test_job_claimed_elsewhere_is_left_alone(self, monkeypatch):
+        """Test a job that is no longer pending is not run a second time"""
+        job = make_job(ReportStatus.FAILED)
+        db = FakeSession(job)
+        beats = self._patch(monkeypatch, db)
+
+        expense_report.generate_report(job.id)
+
+        assert db.commits == []
+        assert beats == ["stop"]
+
+    @pytest.mark.unit
+    def test_only_jobs_without_heartbeat_are_failed(self, monkeypatch):
+        """Test the leader fails unfinished jobs by heartbeat age, in one conditional update"""
+        db = FakeSession(matched=2)
+        monkeypatch.setattr(expense_report, "SessionLocal", lambda: db)
+
+        assert expense_report.fail_interrupted_reports() == 2
+
+        (values,) = db.updates
+        assert values[ReportJob.status] == ReportStatus.FAILED
+        assert "worker stopped" in values[ReportJob.error_message]
+        criteria = " ".join(str(criterion.compile(dialect=postgresql.dialect())) for criterion in db.criteria)
+        assert "report_jobs.status IN" in criteria
+        assert "coalesce(report_jobs.heartbeat_at, report_jobs.created_at) <" in criteria
+
+    @pytest.mark.unit
+    def test_heartbeat_refreshes_until_stopped(self, monkeypatch):
+        """Test the heartbeat thread keeps updating the job and stops cleanly"""
+        db = FakeSession()
+        updated = threading.Event()
+        update = FakeQuery.update
+
+        def record(query, values, synchronize_session=None):
+            updated.set()
+            return update(query, values, synchronize_session)
+
+        monkeypatch.setattr(FakeQuery, "update", record)
+        monkeypatch.setattr(expense_report, "SessionLocal", lambda: db)
+
+        heartbeat = expense_report.ReportHeartbeat("job-1234-5678", interval=0.01)
+        heartbeat.start()
+        assert updated.wait(timeout=5)
+        heartbeat.stop()
+
+        assert isinstance(db.updates[0][ReportJob.heartbeat_at], datetime)
+        assert db.updates[0][ReportJob.heartbeat_at].tzinfo is timezone.utc
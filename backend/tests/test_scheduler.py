@@ -0,0 +1,175 @@
+import pytest
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.models.scheduled_job import JobRunStatus
+from app.services import scheduler as scheduler_module
+from app.services.cron import CronSchedule
+from app.services.scheduler import PeriodicJob, Scheduler
+
+NOW = datetime(2026, 10, 19, 14, 37, 12, tzinfo=timezone.utc)  # a Monday
+
+class TestScheduling:
+    """Test cron next-run times and periodic job schedules"""
+
+    @pytest.mark.unit
+    def test_daily_backup_schedule(self):
+        """Test the default backup schedule runs at 02:00 the following day"""
+        assert CronSchedule("0 2 * * *").next_after(NOW) == datetime(2026, 10, 20, 2, 0, tzinfo=timezone.utc)
+        assert CronSchedule("@hourly").next_after(NOW) == datetime(2026, 10, 19, 15, 0, tzinfo=timezone.utc)
+
+    @pytest.mark.unit
+    def test_steps_ranges_and_names(self):
+        """Test steps, ranges and month and weekday names"""
+        assert CronSchedule("*/15 * * * *").next_after(NOW) == datetime(2026, 10, 19, 14, 45, tzinfo=timezone.utc)
+        assert CronSchedule("0 8 * * mon-fri").next_after(NOW) == datetime(2026, 10, 20, 8, 0, tzinfo=timezone.utc)
+        assert CronSchedule("30 9 * * sat,sun").next_after(NOW) == datetime(2026, 10, 24, 9, 30, tzinfo=timezone.utc)
+        assert CronSchedule("0 0 1 jan *").next_after(NOW) == datetime(2027, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+    @pytest.mark.unit
+    def test_restricted_day_and_weekday_match_either(self):
+        """Test a day-of-month and day-of-week both set match on either, like cron"""
+        schedule = CronSchedule("0 4 1 * 5")
+        assert schedule.next_after(NOW) == datetime(2026, 10, 23, 4, 0, tzinfo=timezone.utc)
+        assert schedule.next_after(datetime(2026, 10, 30, 5, 0, tzinfo=timezone.utc)) == datetime(
+            2026, 11, 1, 4, 0, tzinfo=timezone.utc
+        )
+
+    @pytest.mark.unit
+    def test_invalid_expressions_are_rejected(self):
+        """Test malformed and impossible schedules fail when the job is defined"""
+        for expression in ("0 2 * *", "61 * * * *", "0 0 31 2 *"):
+            with pytest.raises(ValueError):
+                PeriodicJob("broken", lambda: None, cron=expression).next_run(None, NOW)
+
+    @pytest.mark.unit
+    def test_interval_jobs_count_from_last_start(self):
+        """Test interval jobs resume from their recorded last run after a leader change"""
+        job = PeriodicJob("fold", lambda: None, every=60)
+        assert job.next_run(None, NOW) == NOW + timedelta(seconds=60)
+        assert job.next_run(NOW - timedelta(minutes=10), NOW) == NOW - timedelta(minutes=9)
+
+        eager = PeriodicJob("scan", lambda: None, every=60, run_at_start=True)
+        assert eager.next_run(None, NOW) == NOW
+
+    @pytest.mark.unit
+    def test_start_only_jobs_run_once_per_leader(self):
+        """Test a job without every or cron runs when a leader starts and is then left alone"""
+        job = PeriodicJob("triggers", lambda: None, run_at_start=True)
+        assert job.schedule == "at leader start"
+        assert job.next_run(None, NOW) == NOW
+        assert job.next_run(NOW, NOW) is None
+        with pytest.raises(ValueError):
+            PeriodicJob("never", lambda: None)
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *criteria):
+        return self
+
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    def __init__(self, runs, states):
+        self.runs = runs
+        self.states = states
+
+    def query(self, entity):
+        return FakeQuery(self.runs if entity is scheduler_module.JobRun else self.states)
+
+    def add(self, row):
+        self.states.append(row)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class TestLeadership:
+    """Test that runs outlive a lost leader lock without being repeated or failed"""
+
+    @pytest.mark.unit
+    def test_take_over_fails_only_runs_whose_lock_is_free(self, monkeypatch):
+        """Test a new leader leaves live runs alone, fails dead ones and reschedules start jobs"""
+        live = SimpleNamespace(job_name="soft_delete_gc", status=JobRunStatus.RUNNING, error=None, finished_at=None)
+        dead = SimpleNamespace(job_name="storage_reconcile", status=JobRunStatus.RUNNING, error=None,
+                               finished_at=None)
+        db = FakeSession([live, dead], [])
+        monkeypatch.setattr(scheduler_module, "SessionLocal", lambda: db)
+
+        leader = Scheduler()
+        leader.register(PeriodicJob("soft_delete_gc", lambda: None, cron="0 4 * * *"))
+        leader.register(PeriodicJob("triggers", lambda: None, run_at_start=True))
+        monkeypatch.setattr(leader, "_job_is_live", lambda name: name == "soft_delete_gc")
+
+        leader._take_over()
+
+        assert live.status == JobRunStatus.RUNNING
+        assert dead.status == JobRunStatus.FAILED and dead.finished_at is not None
+        assert leader._next["triggers"] <= datetime.now(timezone.utc)
+        assert leader._next["soft_delete_gc"] > datetime.now(timezone.utc)
+
+    @pytest.mark.unit
+    def test_job_still_running_elsewhere_is_deferred(self, monkeypatch):
+        """Test a due job whose lock is held is neither run nor recorded, and stays due"""
+        calls = []
+        leader = Scheduler()
+        leader._leader = True
+        leader._next["soft_delete_gc"] = NOW
+        monkeypatch.setattr(leader, "_lock_job", lambda name: None)
+        monkeypatch.setattr(leader, "_start_run", lambda name: calls.append("start"))
+
+        asyncio.run(leader._execute(PeriodicJob("soft_delete_gc", lambda: calls.append("run"), cron="0 4 * * *")))
+
+        assert calls == []
+        assert leader._next["soft_delete_gc"] == NOW
+
+    @pytest.mark.unit
+    def test_run_holds_its_job_lock_until_recorded(self, monkeypatch):
+        """Test the job lock is released only after the outcome is recorded"""
+        events = []
+        leader = Scheduler()
+        leader._leader = True
+        monkeypatch.setattr(leader, "_lock_job", lambda name: SimpleNamespace(close=lambda: events.append("unlock")))
+        monkeypatch.setattr(leader, "_start_run", lambda name: events.append("start") or 1)
+        monkeypatch.setattr(leader, "_finish_run", lambda run_id, name, started, next_run, result, error:
+                            events.append(("finish", result, next_run)))
+
+        asyncio.run(leader._execute(PeriodicJob("triggers", lambda: events.append("run") or 3, run_at_start=True)))
+
+        assert events == ["start", "run", ("finish", 3, None), "unlock"]
+        assert leader._next["triggers"] is None
+
+    @pytest.mark.unit
+    def test_requested_run_passes_its_arguments(self, monkeypatch):
+        """Test a manual run calls the job with the requested keyword arguments"""
+        calls = []
+        leader = Scheduler()
+        leader._leader = True
+        monkeypatch.setattr(leader, "_lock_job", lambda name: SimpleNamespace(close=lambda: None))
+        monkeypatch.setattr(leader, "_start_run", lambda name: 1)
+        monkeypatch.setattr(leader, "_finish_run", lambda *args: None)
+        job = PeriodicJob("soft_delete_gc", lambda older_than_days=30: calls.append(older_than_days), cron="0 4 * * *")
+
+        asyncio.run(leader._execute(job, {"older_than_days": 7}))
+        asyncio.run(leader._execute(job))
+
+        assert calls == [7, 30]
+
+    @pytest.mark.unit
+    def test_deferred_requested_run_is_requested_again(self, monkeypatch):
+        """Test a manual run that finds the job busy elsewhere is not lost"""
+        requests = []
+        leader = Scheduler()
+        leader.register(PeriodicJob("soft_delete_gc", lambda older_than_days=30: None, cron="0 4 * * *"))
+        monkeypatch.setattr(leader, "_lock_job", lambda name: None)
+        monkeypatch.setattr(leader, "request_run", lambda name, **kwargs: requests.append((name, kwargs)))
+
+        asyncio.run(leader._execute(leader.jobs["soft_delete_gc"], {"older_than_days": 7}))
+
+        assert requests == [("soft_delete_gc", {"older_than_days": 7})]
@@ -0,0 +1,102 @@
+import pytest
+from types import SimpleNamespace
+
+from app.services import soft_delete
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+
+    def query(self, *entities):
+        return SimpleNamespace(filter=lambda *criteria: SimpleNamespace(update=lambda *args, **kwargs: 1))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeQuery(list):
+    def filter(self, *criteria):
+        return self
+
+    def with_for_update(self):
+        return self
+
+class TestSoftDeleteGC:
+    """Test the batching of the soft-delete garbage collector"""
+
+    def _patch(self, monkeypatch, record_batches, freed):
+        sessions, removed = [], []
+        batches = iter(record_batches)
+
+        def session():
+            sessions.append(FakeSession())
+            return sessions[-1]
+
+        def remove_objects(names):
+            removed.append(sorted(names))
+            return [name for name in names if name.startswith("broken")]
+
+        monkeypatch.setattr(soft_delete, "SessionLocal", session)
+        monkeypatch.setattr(soft_delete, "storage_service", SimpleNamespace(remove_objects=remove_objects))
+        monkeypatch.setattr(soft_delete, "_record_batch", lambda db, cutoff, after, size, dry_run: next(batches))
+        monkeypatch.setattr(soft_delete, "_payment_batch", lambda db, cutoff, after, size, dry_run: ([], set(), {}, 0))
+        monkeypatch.setattr(soft_delete, "_release_objects",
+                            lambda db, candidates, cutoff, dry_run: {name: freed[name] for name in candidates})
+        monkeypatch.setattr(soft_delete, "storage_used_mb", lambda db, user_ids: {user_id: 0 for user_id in user_ids})
+        return sessions, removed
+
+    @pytest.mark.unit
+    def test_objects_are_removed_in_bulk_once_per_batch(self, monkeypatch):
+        """Test each batch commits and then removes its objects in one call, counting shared objects once"""
+        sessions, removed = self._patch(monkeypatch, [
+            (["r1", "r2"], {"u1"}, {"a": 10, "b": 20}, 0),
+            (["r3"], {"u1", "u2"}, {"b": 20, "broken-c": 30}, 0)
+        ], {"a": 10, "b": 20, "broken-c": 30})
+
+        result = soft_delete.purge_soft_deleted(batch_size=2)
+
+        assert removed == [["a", "b"], ["broken-c"]]
+        assert [session.commits for session in sessions] == [1, 1, 0]
+        assert result["health_records"] == 3
+        assert result["objects"] == 2
+        assert result["bytes"] == 30
+        assert result["failed_objects"] == 1
+        assert result["users"] == 2
+
+    @pytest.mark.unit
+    def test_dry_run_changes_nothing(self, monkeypatch):
+        """Test a dry run reports what would go without committing or removing objects"""
+        sessions, removed = self._patch(monkeypatch, [
+            (["r1"], {"u1"}, {"a": 10}, 0)
+        ], {"a": 10})
+
+        result = soft_delete.purge_soft_deleted(dry_run=True, batch_size=2)
+
+        assert removed == []
+        assert all(session.commits == 0 for session in sessions)
+        assert result["dry_run"] is True
+        assert result["health_records"] == 1
+        assert result["bytes"] == 10
+
+    @pytest.mark.unit
+    def test_payment_file_references_are_released(self, monkeypatch):
+        """Test purged payment files drop their dedup references and free objects nothing else uses"""
+        shared = SimpleNamespace(minio_object_name="payments/u1/p1/shared", size=100)
+        alone = SimpleNamespace(minio_object_name="payments/u1/p1/alone", size=50)
+        deleted = []
+        db = SimpleNamespace(query=lambda entity: FakeQuery([shared, alone]), delete=deleted.append)
+        # The shared object is still used by one live health record and one purged file
+        monkeypatch.setattr(soft_delete, "_kept_references", lambda db, names, cutoff: {
+            "payments/u1/p1/shared": 1, "payments/u1/p1/alone": 0
+        })
+
+        freed = soft_delete._release_objects(db, {"payments/u1/p1/shared": 100, "payments/u1/p1/alone": 50},
+                                             cutoff=None, dry_run=False)
+
+        assert freed == {"payments/u1/p1/alone": 50}
+        assert deleted == [alone]
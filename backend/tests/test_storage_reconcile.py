@@ -0,0 +1,87 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.services import storage_reconcile
+
+OLD = datetime.now(timezone.utc) - timedelta(days=1)
+
+def _object(name, size=10, modified=OLD):
+    return SimpleNamespace(object_name=name, size=size, last_modified=modified)
+
+def _row(name, source="health_records", row_id=None):
+    return SimpleNamespace(name=name, source=source, id=row_id or name)
+
+class FakeSession:
+    def __init__(self, rows, deleted):
+        self.rows = rows
+        self.deleted = deleted
+
+    def execute(self, statement):
+        return iter(self.rows)
+
+    def query(self, entity):
+        def delete(**kwargs):
+            self.deleted.append(entity)
+            return 1
+        return SimpleNamespace(filter=lambda *criteria: SimpleNamespace(delete=delete))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class TestStorageReconcile:
+    """Test the merge-join of bucket listings against object name columns"""
+
+    @pytest.mark.unit
+    def test_merge_join_yields_only_unmatched(self):
+        """Test orphans and dangling rows come out in order, with shared objects matched once"""
+        objects = [_object("a"), _object("b"), _object("d")]
+        rows = [_row("b"), _row("b", "payment_files"), _row("c"), _row("d"), _row("e")]
+
+        unmatched = [
+            (obj.object_name if obj else None, row.name if row else None)
+            for obj, row in storage_reconcile.merge_join(iter(objects), iter(rows))
+        ]
+        assert unmatched == [("a", None), (None, "c"), (None, "e")]
+
+    @pytest.mark.unit
+    def test_unsorted_input_is_rejected(self):
+        """Test a listing out of order stops the scan instead of reporting everything as orphaned"""
+        with pytest.raises(ValueError):
+            list(storage_reconcile.merge_join(iter([_object("b"), _object("a")]), iter([])))
+
+    @pytest.mark.unit
+    def test_repair_removes_old_orphans_in_batches(self, monkeypatch):
+        """Test repair removes orphans in bulk batches, spares new and excluded objects and drops stale entries"""
+        orphans = [_object(f"user/{index:04d}") for index in range(5)]
+        listing = sorted(orphans + [
+            _object("user/kept"), _object("user/uploading", modified=datetime.now(timezone.utc)),
+            _object("uploads/session/00001")
+        ], key=lambda item: item.object_name)
+        rows = [_row("user/kept"), _row("user/missing", "stored_objects", "stored-1")]
+        removed, deleted = [], []
+
+        def remove_objects(names):
+            removed.append(list(names))
+            return []
+
+        monkeypatch.setattr(storage_reconcile, "REMOVE_BATCH", 2)
+        monkeypatch.setattr(storage_reconcile, "SessionLocal", lambda: FakeSession(rows, deleted))
+        monkeypatch.setattr(storage_reconcile, "storage_service", SimpleNamespace(
+            iter_objects=lambda: iter(listing), remove_objects=remove_objects
+        ))
+
+        result = storage_reconcile.reconcile_storage(repair=True)
+
+        assert [len(batch) for batch in removed] == [2, 2, 1]
+        assert sum(removed, []) == [obj.object_name for obj in orphans]
+        assert result["orphaned_objects"] == 5
+        assert result["orphaned_bytes"] == 50
+        assert result["recent_objects_skipped"] == 1
+        assert result["removed_objects"] == 5
+        assert result["dangling_rows"] == {"stored_objects": 1}
+        assert result["dropped_stored_objects"] == 1
+        assert result["objects_scanned"] == 7
@@ -0,0 +1,65 @@
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.models.audit_log import AuditAction
+from app.services import system_stats
+
+class FakeSession:
+    """Returns one prepared row for the summary query and records statements"""
+
+    def __init__(self, row=None):
+        self.row = row
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        return SimpleNamespace(mappings=lambda: SimpleNamespace(first=lambda: self.row))
+
+class TestSystemStats:
+    """Test the incrementally maintained admin statistics summary"""
+
+    @pytest.mark.unit
+    def test_missing_summary_reads_as_none(self):
+        """Test the endpoint can tell an unseeded summary apart from an empty system"""
+        assert system_stats.read_system_stats(FakeSession()) is None
+
+    @pytest.mark.unit
+    def test_summary_row_is_shaped_for_the_dashboard(self):
+        """Test totals, storage percentage and activity windows come from the one row"""
+        refreshed = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        row = {
+            "users_total": 10, "users_active": 8, "users_locked": 1, "users_admins": 2,
+            "storage_used_mb": 250, "storage_quota_mb": 1000, "refreshed_at": refreshed,
+            "logins_24h": 5, "uploads_7d": 40, "failed_logins_24h": 3
+        }
+
+        stats = system_stats.read_system_stats(FakeSession(row))
+
+        assert stats["users"] == {"total": 10, "active": 8, "locked": 1, "admins": 2}
+        assert stats["storage"] == {"total_used_mb": 250, "total_quota_mb": 1000, "percentage": 25.0}
+        assert stats["activity"] == {"logins_24h": 5, "uploads_7d": 40, "failed_logins_24h": 3}
+        assert stats["refreshed_at"] == refreshed
+
+    @pytest.mark.unit
+    def test_activity_is_counted_per_hour_and_action(self):
+        """Test audit events fold into hourly counters in one sorted upsert"""
+        db = FakeSession()
+        system_stats.record_activity(db, [
+            (AuditAction.LOGIN, datetime(2025, 1, 1, 10, 5, tzinfo=timezone.utc)),
+            (AuditAction.LOGIN, datetime(2025, 1, 1, 10, 55, tzinfo=timezone.utc)),
+            (AuditAction.FILE_UPLOAD, datetime(2025, 1, 1, 9, 30, tzinfo=timezone.utc))
+        ])
+
+        (_, rows), = db.executed
+        assert rows == [
+            {"bucket": datetime(2025, 1, 1, 9), "action": AuditAction.FILE_UPLOAD, "count": 1},
+            {"bucket": datetime(2025, 1, 1, 10), "action": AuditAction.LOGIN, "count": 2}
+        ]
+
+    @pytest.mark.unit
+    def test_no_events_issue_no_statement(self):
+        """Test an empty flush does not touch the counters"""
+        db = FakeSession()
+        system_stats.record_activity(db, [])
+        assert db.executed == []
@@ -0,0 +1,70 @@
+import pytest
+import io
+
+from app.services.text_extraction import extract_text, normalize_text, is_extractable
+
+class TestTextExtraction:
+    """Test document text extraction used to populate content_text"""
+    
+    @pytest.mark.unit
+    def test_normalize_collapses_whitespace(self):
+        """Test whitespace normalization and NUL stripping"""
+        assert normalize_text("  Hemoglobin\t\t13.5 \x00g/dL \n\n\n  Normal  ") == "Hemoglobin 13.5 g/dL\nNormal"
+    
+    @pytest.mark.unit
+    def test_normalize_truncates(self):
+        """Test normalized text respects the character limit"""
+        assert len(normalize_text("a" * 500, max_chars=100)) == 100
+    
+    @pytest.mark.unit
+    def test_extract_plain_text(self):
+        """Test plain text files are decoded"""
+        text = extract_text(b"Cholesterol: 180 mg/dL", "text/plain", "lab.txt")
+        assert text == "Cholesterol: 180 mg/dL"
+    
+    @pytest.mark.unit
+    def test_extract_html_drops_scripts(self):
+        """Test HTML extraction ignores script and style content"""
+        html = b"<html><script>alert(1)</script><body><p>Discharge summary</p></body></html>"
+        text = extract_text(html, "text/html", "summary.html")
+        assert "Discharge summary" in text
+        assert "alert" not in text
+    
+    @pytest.mark.unit
+    def test_extract_markdown(self):
+        """Test markdown is rendered to plain text"""
+        text = extract_text(b"# Vaccination\n\n**Tetanus** booster", None, "notes.md")
+        assert "Vaccination" in text
+        assert "**" not in text
+    
+    @pytest.mark.unit
+    def test_extract_xlsx(self):
+        """Test spreadsheet cells are extracted"""
+        import openpyxl
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["Glucose", 95])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        
+        text = extract_text(buffer.getvalue(), None, "results.xlsx")
+        assert "Glucose 95" in text
+    
+    @pytest.mark.unit
+    def test_extract_rtf_drops_control_words(self):
+        """Test RTF control words, font tables and escapes do not reach the index"""
+        rtf = (rb"{\rtf1\ansi{\fonttbl{\f0 Arial;}}{\*\generator Word;}"
+               rb"\f0\fs24 Blood pressure \'b1 5\par Caf\u233?\tab ok}")
+        text = extract_text(rtf, None, "letter.rtf")
+        assert text == "Blood pressure \u00b1 5\nCaf\u00e9 ok"
+
+    @pytest.mark.unit
+    def test_office_mime_types_are_extractable(self):
+        """Test docx and xlsx uploads are indexed by MIME type even without an extension"""
+        assert is_extractable("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "blob")
+        assert is_extractable("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", None)
+
+    @pytest.mark.unit
+    def test_unsupported_types(self):
+        """Test images are skipped"""
+        assert not is_extractable("image/png", "scan.png")
+        assert extract_text(b"\x89PNG", "image/png", "scan.png") == ""
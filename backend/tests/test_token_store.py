@@ -0,0 +1,60 @@
+import pytest
+from freezegun import freeze_time
+from datetime import datetime, timedelta, timezone
+
+from app.services.token_store import MemoryTokenStore, TokenStore
+
+class TestMemoryTokenStore:
+    """Test the in-process mobile upload token store"""
+    
+    @pytest.mark.unit
+    def test_token_roundtrip(self):
+        """Test tokens resolve to their user until they expire"""
+        store = MemoryTokenStore()
+        store.set_token("ABCD1234", "user-1", datetime.now(timezone.utc) + timedelta(minutes=15))
+        
+        data = store.get_token("ABCD1234")
+        assert data["user_id"] == "user-1"
+        assert store.get_token("UNKNOWN") is None
+    
+    @pytest.mark.unit
+    def test_expired_token_is_rejected(self):
+        """Test expired tokens are not returned and are purged"""
+        store = MemoryTokenStore()
+        store.set_token("OLD", "user-1", datetime.now(timezone.utc) - timedelta(seconds=1))
+        
+        assert store.get_token("OLD") is None
+        assert store.purge_expired() == 0
+    
+    @pytest.mark.unit
+    def test_extend_token_survives_purge(self):
+        """Test extended tokens are not purged by their original expiry"""
+        store = MemoryTokenStore()
+        store.set_token("TOKEN", "user-1", datetime.now(timezone.utc) + timedelta(seconds=1))
+        store.extend_token("TOKEN", datetime.now(timezone.utc) + timedelta(hours=24))
+        
+        with freeze_time(datetime.now(timezone.utc) + timedelta(minutes=1)):
+            assert store.purge_expired() == 0
+            assert store.get_token("TOKEN") is not None
+    
+    @pytest.mark.unit
+    def test_recent_uploads_are_bounded_per_user(self):
+        """Test the recent-uploads ring buffer keeps the newest entries per user"""
+        store = MemoryTokenStore(recent_limit=3)
+        for i in range(5):
+            store.add_recent_upload("user-1", {"id": str(i)})
+        store.add_recent_upload("user-2", {"id": "other"})
+        
+        assert [u["id"] for u in store.get_recent_uploads("user-1")] == ["4", "3", "2"]
+        assert [u["id"] for u in store.get_recent_uploads("user-1", limit=1)] == ["4"]
+        assert [u["id"] for u in store.get_recent_uploads("user-2")] == ["other"]
+    
+    @pytest.mark.unit
+    def test_incomplete_store_cannot_be_created(self):
+        """Test a backend missing part of the interface fails when constructed, not on first use"""
+        class TokensOnly(TokenStore):
+            def set_token(self, token, user_id, expires_at):
+                pass
+        
+        with pytest.raises(TypeError):
+            TokensOnly()
@@ -0,0 +1,96 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+
+from app.core.security import generate_file_checksum
+from app.services import upload_pipeline
+from app.services.upload_pipeline import StorageQuotaExceeded, store_uploads
+
+class FakeQuery(list):
+    def filter(self, *criteria):
+        return self
+
+    def with_for_update(self):
+        return self
+
+    def all(self):
+        return list(self)
+
+class FakeSession:
+    """Holds one StoredObject the user already has, shown by a live record unless live is False"""
+
+    def __init__(self, stored, live=True):
+        self.stored = stored
+        self.live = live
+        self.locked = False
+
+    def query(self, *entities):
+        if len(entities) == 3:
+            return FakeQuery([(self.stored.id, self.stored.checksum, self.live)])
+        self.locked = True
+        return FakeQuery([self.stored])
+
+class TestUploadPipeline:
+    """Test quota checks and dedup bookkeeping of multi-file uploads"""
+
+    def _run(self, monkeypatch, db, uploads, quota):
+        puts = []
+        monkeypatch.setattr(upload_pipeline, "_encrypt_and_put",
+                            lambda content, key, name: puts.append((name, db.locked)) or True)
+        monkeypatch.setattr(upload_pipeline, "register_stored_object",
+                            lambda db, user_id, checksum, name, size: (SimpleNamespace(minio_object_name=name), True))
+        results = asyncio.run(store_uploads(
+            db, "user-1", b"k" * 32, uploads, lambda filename: f"user-1/{filename}",
+            with_thumbnails=False, quota_remaining_bytes=quota
+        ))
+        return results, puts
+
+    @pytest.mark.unit
+    def test_quota_is_checked_before_uploading(self, monkeypatch):
+        """Test a batch over quota is rejected before any object is put into MinIO"""
+        known = b"already stored"
+        db = FakeSession(SimpleNamespace(id="s1", checksum=generate_file_checksum(known),
+                                         minio_object_name="user-1/known", last_referenced_at=None))
+        uploads = [
+            {"filename": "known.txt", "content": known},
+            {"filename": "new.txt", "content": b"x" * 100},
+            {"filename": "copy.txt", "content": b"x" * 100}
+        ]
+        puts = []
+        monkeypatch.setattr(upload_pipeline, "_encrypt_and_put", lambda *args: puts.append(args) or True)
+
+        with pytest.raises(StorageQuotaExceeded):
+            asyncio.run(store_uploads(db, "user-1", b"k" * 32, uploads, lambda name: name,
+                                      with_thumbnails=False, quota_remaining_bytes=99))
+        assert puts == []
+
+    @pytest.mark.unit
+    def test_existing_content_is_locked_after_uploads(self, monkeypatch):
+        """Test only new content counts against the quota and stored rows are locked after the puts"""
+        known = b"already stored"
+        stored = SimpleNamespace(id="s1", checksum=generate_file_checksum(known),
+                                 minio_object_name="user-1/known", last_referenced_at=None)
+        db = FakeSession(stored)
+        uploads = [{"filename": "known.txt", "content": known}, {"filename": "new.txt", "content": b"x" * 100}]
+
+        results, puts = self._run(monkeypatch, db, uploads, quota=100)
+
+        assert puts == [("user-1/new.txt", False)]
+        assert [result["object_name"] for result in results] == ["user-1/known", "user-1/new.txt"]
+        assert [result["is_new"] for result in results] == [False, True]
+        assert stored.last_referenced_at is not None
+
+    @pytest.mark.unit
+    def test_content_of_deleted_records_is_charged_again(self, monkeypatch):
+        """Test re-uploading content whose records were all soft-deleted counts against the quota"""
+        known = b"already stored"
+        stored = SimpleNamespace(id="s1", checksum=generate_file_checksum(known),
+                                 minio_object_name="user-1/known", last_referenced_at=None)
+        uploads = [{"filename": "known.txt", "content": known}]
+
+        with pytest.raises(StorageQuotaExceeded):
+            self._run(monkeypatch, FakeSession(stored, live=False), uploads, quota=len(known) - 1)
+
+        results, puts = self._run(monkeypatch, FakeSession(stored, live=False), uploads, quota=len(known))
+        assert puts == []
+        assert results[0]["object_name"] == "user-1/known"
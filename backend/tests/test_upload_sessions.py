@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from fastapi import HTTPException
+
+from app.api import mobile
+from app.models.upload_session import UploadSessionStatus
+
+class FakeSession:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class TestUploadSessionComplete:
+    """Test that a resumable upload is completed at most once"""
+
+    def _patch(self, monkeypatch, session, store):
+        def transition(db, target, from_status, to_status):
+            # The conditional UPDATE: only a session still in from_status moves
+            if target.status != from_status:
+                return False
+            target.status = to_status
+            return True
+
+        async def token_user(token, db):
+            return SimpleNamespace(id="user-1")
+
+        async def ignore(*args):
+            pass
+
+        monkeypatch.setattr(mobile, "get_token_user", token_user)
+        monkeypatch.setattr(mobile, "get_upload_session", lambda token, session_id, user, db: session)
+        monkeypatch.setattr(mobile, "track_mobile_upload", ignore)
+        monkeypatch.setattr(mobile, "assemble_and_store", store)
+        monkeypatch.setattr(mobile.upload_sessions, "transition_session", transition)
+        monkeypatch.setattr(mobile.upload_sessions, "discard_parts", ignore)
+
+    def _session(self):
+        return SimpleNamespace(
+            id="session-1", status=UploadSessionStatus.ACTIVE, total_size=4, chunk_size=4,
+            parts_json='{"1": 4}', file_name="scan.pdf", record_id=None,
+            expires_at=datetime.now(timezone.utc) + timedelta(hours=1)
+        )
+
+    @pytest.mark.unit
+    def test_concurrent_complete_creates_one_record(self, monkeypatch):
+        """Test a second complete arriving while the first assembles is rejected with 409"""
+        session = self._session()
+        records = []
+
+        async def store(db, user, target, background_tasks):
+            await asyncio.sleep(0.01)
+            records.append(target.id)
+            return {"record_id": f"record-{len(records)}"}
+
+        self._patch(monkeypatch, session, store)
+
+        async def both():
+            return await asyncio.gather(
+                mobile.complete_upload_session("token", "session-1", db=FakeSession()),
+                mobile.complete_upload_session("token", "session-1", db=FakeSession()),
+                return_exceptions=True
+            )
+
+        results = asyncio.run(both())
+
+        assert records == ["session-1"]
+        assert results[0] == {"record_id": "record-1"}
+        assert isinstance(results[1], HTTPException) and results[1].status_code == 409
+        assert session.status == UploadSessionStatus.COMPLETED
+        assert session.record_id == "record-1"
+
+    @pytest.mark.unit
+    def test_failed_complete_can_be_retried(self, monkeypatch):
+        """Test a complete that fails validation hands the session back as active"""
+        session = self._session()
+
+        async def store(db, user, target, background_tasks):
+            raise HTTPException(status_code=422, detail="Checksum mismatch")
+
+        self._patch(monkeypatch, session, store)
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(mobile.complete_upload_session("token", "session-1", db=FakeSession()))
+
+        assert error.value.status_code == 422
+        assert session.status == UploadSessionStatus.ACTIVE
@@ -0,0 +1,80 @@
+import pytest
+import io
+import json
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.models.vital_signs import VitalType
+from app.services import user_export
+from app.services.backup_pipeline import EncryptingWriter
+
+class TestUserExport:
+    """Test the per-user data export archive"""
+
+    @pytest.mark.unit
+    def test_rows_are_written_as_json_lines(self):
+        """Test enums, decimals and dates become plain JSON values"""
+        rows = [
+            SimpleNamespace(vital_type=VitalType.HEART_RATE, value=Decimal("72.50"), recorded_at=datetime(2026, 10, 19, 8, 30)),
+            SimpleNamespace(vital_type=VitalType.WEIGHT, value=80, recorded_at=datetime(2026, 10, 19, 9, 0))
+        ]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            count = user_export._write_rows(archive, "vitals.jsonl", iter(rows), ["vital_type", "value", "recorded_at"])
+
+        with zipfile.ZipFile(buffer) as archive:
+            lines = archive.read("vitals.jsonl").decode().splitlines()
+        assert count == 2
+        assert json.loads(lines[0]) == {"vital_type": "heart_rate", "value": "72.50", "recorded_at": "2026-10-19T08:30:00"}
+
+    @pytest.mark.unit
+    def test_stream_stops_writer_when_client_disconnects(self, monkeypatch):
+        """Test closing the response generator ends the export thread instead of blocking it"""
+        def endless_export(user_id, output):
+            with zipfile.ZipFile(output, "w") as archive:
+                while True:
+                    archive.writestr("files/blob.bin", b"x" * (1024 * 1024))
+
+        monkeypatch.setattr(user_export, "write_export", endless_export)
+        stream = user_export.stream_export("user-1")
+        assert next(stream)
+
+        stream.close()
+
+    @pytest.mark.unit
+    def test_stored_export_decrypts_while_streaming(self, monkeypatch):
+        """Test an export encrypted into storage reads back through the download path"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("health_records.jsonl", "{}\n" * 1000)
+
+        encrypted = io.BytesIO()
+        encryptor = EncryptingWriter(encrypted, passphrase="user-key", frame_size=4096)
+        encryptor.write(archive.getvalue())
+        encryptor.close()
+        data = encrypted.getvalue()
+
+        def iter_object(object_name):
+            for start in range(0, len(data), 1000):
+                yield data[start:start + 1000]
+
+        monkeypatch.setattr(user_export, "storage_service", SimpleNamespace(iter_object=iter_object))
+        monkeypatch.setattr(user_export, "_archive_passphrase", lambda user: "user-key")
+        job = SimpleNamespace(object_name="reports/user-1/job-1/export.zip.aes")
+
+        assert b"".join(user_export.iter_stored_export(job, user=None)) == archive.getvalue()
+
+    @pytest.mark.unit
+    def test_stream_releases_its_report_slot(self, monkeypatch):
+        """Test a streamed export heartbeats its job row and deletes it when the stream ends"""
+        events = []
+        monkeypatch.setattr(user_export, "write_export", lambda user_id, output: output.write(b"data"))
+        monkeypatch.setattr(user_export, "ReportHeartbeat", lambda job_id: SimpleNamespace(
+            start=lambda: events.append(("start", job_id)), stop=lambda: events.append(("stop", job_id))
+        ))
+        monkeypatch.setattr(user_export, "_release_stream_slot", lambda job_id: events.append(("release", job_id)))
+
+        assert b"".join(user_export.stream_export("user-1", job_id="job-1")) == b"data"
+        assert events == [("start", "job-1"), ("stop", "job-1"), ("release", "job-1")]
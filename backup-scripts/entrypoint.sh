@@ -6,6 +6,12 @@ echo "Starting backup trigger watcher..."
 WATCHER_PID=$!
 echo "Trigger watcher started with PID: ${WATCHER_PID}"
 
+# Status files read by the backend's backup catalog from the shared volume
+STATUS_DIR="/backups/triggers"
+mkdir -p ${STATUS_DIR}
+echo "${BACKUP_SCHEDULE}" > ${STATUS_DIR}/.schedule
+touch ${STATUS_DIR}/.heartbeat
+
 # Setup cron job for automated backups
 if [ ! -z "${BACKUP_SCHEDULE}" ]; then
     echo "Setting up backup schedule: ${BACKUP_SCHEDULE}"
@@ -31,5 +37,6 @@ while true; do
         WATCHER_PID=$!
     fi
     
+    touch ${STATUS_DIR}/.heartbeat
     sleep 30
 done
\ No newline at end of file
@@ -0,0 +1,39 @@
+import api from './axios'
+
+// Matches THUMBNAIL_BATCH_MAX on the backend
+const BATCH_SIZE = 100
+
+// Load previews for the given records in as few requests as possible.
+// Records without a stored thumbnail are included too: the server generates
+// and saves image thumbnails on demand, and reports the rest as missing so
+// they are not requested again.
+export async function loadThumbnails(records) {
+  const pending = records.filter(r => !r.thumbnail && !r.thumbnailMissing && !r.loadingThumbnail)
+  if (pending.length === 0) return
+
+  pending.forEach(r => { r.loadingThumbnail = true })
+  try {
+    for (let start = 0; start < pending.length; start += BATCH_SIZE) {
+      const batch = pending.slice(start, start + BATCH_SIZE)
+      const response = await api.post('/records/thumbnails', {
+        record_ids: batch.map(r => r.id)
+      })
+      const thumbnails = response.data?.thumbnails || {}
+      const missing = new Set(response.data?.missing || [])
+      batch.forEach(r => {
+        const thumbnail = thumbnails[r.id]
+        if (thumbnail && thumbnail.startsWith('data:image')) {
+          r.thumbnail = thumbnail
+          r.has_thumbnail = true
+          r.thumbnailError = false
+        } else if (missing.has(r.id)) {
+          r.thumbnailMissing = true
+        }
+      })
+    }
+  } catch (error) {
+    console.error('Failed to load thumbnails:', error)
+  } finally {
+    pending.forEach(r => { r.loadingThumbnail = false })
+  }
+}
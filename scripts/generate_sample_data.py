@@ -5,12 +5,14 @@ import random
 import uuid
 import json
 import datetime
+import argparse
 from faker import Faker
 from PIL import Image, ImageDraw
 import io
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import psycopg2
+from psycopg2.extras import execute_values
 from minio import Minio
 
 fake = Faker()
@@ -21,6 +23,11 @@ POSTGRES_DB = os.getenv('POSTGRES_DB', 'healthstash')
 POSTGRES_USER = os.getenv('POSTGRES_USER', 'healthstash')
 POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', 'changeme')
 
+TIMESCALE_HOST = os.getenv('TIMESCALE_HOST', 'localhost')
+TIMESCALE_DB = os.getenv('TIMESCALE_DB', 'healthstash_vitals')
+TIMESCALE_USER = os.getenv('TIMESCALE_USER', 'healthstash')
+TIMESCALE_PASSWORD = os.getenv('TIMESCALE_PASSWORD', 'changeme')
+
 MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
 MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY', 'minioadmin')
 MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin')
@@ -46,6 +53,19 @@ CATEGORIES = [
     'preventive', 'diagnostic', 'therapeutic', 'rehabilitation'
 ]
 
+# Generated vitals: (type, unit, low, high)
+VITAL_RANGES = [
+    ('heart_rate', 'bpm', 55, 110),
+    ('blood_pressure_systolic', 'mmHg', 100, 150),
+    ('blood_pressure_diastolic', 'mmHg', 60, 95),
+    ('temperature', '°C', 36.0, 38.5),
+    ('weight', 'kg', 55, 110),
+    ('oxygen_saturation', '%', 92, 100),
+    ('blood_glucose', 'mg/dL', 70, 160)
+]
+
+BUCKET_NAME = os.getenv('MINIO_BUCKET_NAME', 'healthstash-files')
+
 MEDICAL_TERMS = {
     'Lab Results': ['Hemoglobin', 'White Blood Cell Count', 'Cholesterol', 'Glucose', 'Creatinine'],
     'X-Ray': ['Chest X-Ray', 'Spine X-Ray', 'Hand X-Ray', 'Knee X-Ray', 'Dental X-Ray'],
@@ -221,58 +241,77 @@ def create_sample_file(record_type, target_size_mb):
     
     return content, file_extension
 
-def main():
-    print("Connecting to PostgreSQL...")
-    conn = psycopg2.connect(
-        host=POSTGRES_HOST,
-        database=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD
-    )
-    cur = conn.cursor()
-    
-    print("Connecting to MinIO...")
-    minio_client = Minio(
-        MINIO_ENDPOINT,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=False
-    )
-    
-    # Ensure bucket exists
-    bucket_name = "healthstash-files"
-    if not minio_client.bucket_exists(bucket_name):
-        minio_client.make_bucket(bucket_name)
-        print(f"Created bucket: {bucket_name}")
-    
-    # Get or create a test user
-    cur.execute("SELECT id FROM users LIMIT 1")
-    user_result = cur.fetchone()
+# Map record type to category enum (using actual database enum values)
+CATEGORY_MAP = {
+    'Lab Results': 'lab_results',
+    'X-Ray': 'imaging', 
+    'MRI Scan': 'imaging',
+    'CT Scan': 'imaging',
+    'Prescription': 'prescriptions',
+    'Vaccination Record': 'vaccinations',
+    'Surgery Report': 'clinical_notes',
+    'Consultation Notes': 'clinical_notes',
+    'Blood Test': 'lab_results',
+    'ECG Report': 'vital_signs',
+    'Ultrasound': 'imaging',
+    'Pathology Report': 'lab_results',
+    'Discharge Summary': 'clinical_notes',
+    'Referral Letter': 'clinical_notes',
+    'Medical Certificate': 'other',
+    'Allergy Test': 'lab_results',
+    'Vision Test': 'clinical_notes',
+    'Hearing Test': 'clinical_notes',
+    'Dental Records': 'clinical_notes',
+    'Physical Therapy': 'clinical_notes',
+    'Mental Health Assessment': 'clinical_notes',
+    'Cardiology Report': 'clinical_notes'
+}
+
+def create_random_file(target_size_mb):
+    """Incompressible content of the requested size, like the JPEGs and PDFs users upload.
+
+    Rendering real documents dominates the run time for large datasets.
+    """
+    return os.urandom(int(target_size_mb * 1024 * 1024)), random.choice(['pdf', 'jpg'])
+
+def get_or_create_users(cur, count):
+    """Existing users first, then generated ones, up to count"""
+    cur.execute("SELECT id FROM users ORDER BY created_at LIMIT %s", (count,))
+    user_ids = [row[0] for row in cur.fetchall()]
     
-    if user_result:
-        user_id = user_result[0]
-        print(f"Using existing user: {user_id}")
-    else:
-        # Create a test user
+    while len(user_ids) < count:
         user_id = str(uuid.uuid4())
+        name = f"sample{uuid.uuid4().hex[:8]}"
+        now = datetime.datetime.utcnow()
+        # Generated users cannot log in: the password hash is not a valid bcrypt hash
         cur.execute("""
-            INSERT INTO users (id, email, full_name, is_active, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (user_id, "test@healthstash.local", "Test User", True, 
-              datetime.datetime.utcnow(), datetime.datetime.utcnow()))
-        conn.commit()
-        print(f"Created test user: {user_id}")
+            INSERT INTO users (
+                id, email, username, full_name, hashed_password, role, is_active, is_locked,
+                encryption_salt, storage_quota_mb, storage_used_mb, failed_login_attempts,
+                created_at, updated_at, password_changed_at
+            ) VALUES (%s, %s, %s, %s, %s, 'user', TRUE, FALSE, %s, 5000, 0, 0, %s, %s, %s)
+        """, (user_id, f"{name}@healthstash.local", name, fake.name(), "!",
+              psycopg2.Binary(os.urandom(32)), now, now, now))
+        user_ids.append(user_id)
+        print(f"Created sample user: {user_id}")
     
-    print("\nGenerating 64 sample health records...")
+    return user_ids
+
+def generate_records(conn, minio_client, user_id, count, min_file_mb=1, max_file_mb=3, fast_files=False):
+    """Upload count sample files for a user and insert their health records; returns bytes uploaded"""
+    cur = conn.cursor()
+    total_bytes = 0
     
-    for i in range(64):
+    for i in range(count):
         record_id = str(uuid.uuid4())
         record_type = random.choice(RECORD_TYPES)
         record_date = fake.date_between(start_date='-2y', end_date='today')
         
-        # Generate file with size between 1-3 MB
-        file_size_mb = random.uniform(1, 3)
-        file_content, file_extension = create_sample_file(record_type, file_size_mb)
+        file_size_mb = random.uniform(min_file_mb, max_file_mb)
+        if fast_files:
+            file_content, file_extension = create_random_file(file_size_mb)
+        else:
+            file_content, file_extension = create_sample_file(record_type, file_size_mb)
         
         # Upload to MinIO
         file_id = uuid.uuid4().hex[:16]
@@ -280,18 +319,18 @@ def main():
         file_path = f"{user_id}/{file_name}"
         
         minio_client.put_object(
-            bucket_name,
+            BUCKET_NAME,
             file_path,
             io.BytesIO(file_content),
             len(file_content),
             content_type='application/pdf' if file_extension == 'pdf' else 'image/jpeg'
         )
+        total_bytes += len(file_content)
         
         # Prepare record data
         title = f"{record_type} - {fake.date()}"
         description = f"{record_type} for {fake.text(max_nb_chars=100)}"
         provider = f"Dr. {fake.last_name()}, {random.choice(['MD', 'DO', 'PhD', 'DDS'])}"
-        facility = f"{fake.company()} Medical Center"
         
         # Random body parts and categories
         body_parts = random.sample(BODY_PARTS, k=random.randint(1, 3))
@@ -311,33 +350,7 @@ def main():
             "follow_up": fake.date_between(start_date='today', end_date='+6m').isoformat()
         }
         
-        # Map record type to category enum (using actual database enum values)
-        category_map = {
-            'Lab Results': 'lab_results',
-            'X-Ray': 'imaging', 
-            'MRI Scan': 'imaging',
-            'CT Scan': 'imaging',
-            'Prescription': 'prescriptions',
-            'Vaccination Record': 'vaccinations',
-            'Surgery Report': 'clinical_notes',
-            'Consultation Notes': 'clinical_notes',
-            'Blood Test': 'lab_results',
-            'ECG Report': 'vital_signs',
-            'Ultrasound': 'imaging',
-            'Pathology Report': 'lab_results',
-            'Discharge Summary': 'clinical_notes',
-            'Referral Letter': 'clinical_notes',
-            'Medical Certificate': 'other',
-            'Allergy Test': 'lab_results',
-            'Vision Test': 'clinical_notes',
-            'Hearing Test': 'clinical_notes',
-            'Dental Records': 'clinical_notes',
-            'Physical Therapy': 'clinical_notes',
-            'Mental Health Assessment': 'clinical_notes',
-            'Cardiology Report': 'clinical_notes'
-        }
-        
-        category = category_map.get(record_type, 'other')
+        category = CATEGORY_MAP.get(record_type, 'other')
         
         # Insert into database with correct column names
         cur.execute("""
@@ -359,29 +372,119 @@ def main():
         
         if (i + 1) % 10 == 0:
             conn.commit()
-            print(f"Created {i + 1}/64 records...")
+            print(f"Created {i + 1}/{count} records...")
     
     conn.commit()
-    print("\n✅ Successfully generated 64 sample health records with files!")
-    
-    # Show statistics
-    cur.execute("""
-        SELECT 
-            COUNT(*) as total_records,
-            COALESCE(SUM(file_size), 0) / (1024.0 * 1024.0) as total_size_mb,
-            COALESCE(AVG(file_size), 0) / (1024.0 * 1024.0) as avg_size_mb
-        FROM health_records
-        WHERE user_id = %s
-    """, (user_id,))
+    cur.close()
+    return total_bytes
+
+def generate_vitals(conn, user_id, count, batch_size=5000):
+    """Insert count vital sign readings for a user, spread over the last two years"""
+    cur = conn.cursor()
+    now = datetime.datetime.utcnow()
+    inserted = 0
     
-    stats = cur.fetchone()
-    print(f"\nStatistics:")
-    print(f"  Total records: {stats[0]}")
-    print(f"  Total size: {stats[1]:.2f} MB")
-    print(f"  Average file size: {stats[2]:.2f} MB")
+    while inserted < count:
+        rows = []
+        for _ in range(min(batch_size, count - inserted)):
+            vital_type, unit, low, high = random.choice(VITAL_RANGES)
+            recorded_at = now - datetime.timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+            rows.append((
+                str(uuid.uuid4()), user_id, vital_type.upper(), round(random.uniform(low, high), 1),
+                unit, 'sample', recorded_at, now
+            ))
+        execute_values(cur, """
+            INSERT INTO vital_signs (id, user_id, vital_type, value, unit, source, recorded_at, created_at)
+            VALUES %s
+        """, rows, page_size=1000)
+        conn.commit()
+        inserted += len(rows)
     
     cur.close()
-    conn.close()
+    return inserted
+
+def connect_postgres():
+    return psycopg2.connect(
+        host=POSTGRES_HOST,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD
+    )
+
+def connect_timescale():
+    return psycopg2.connect(
+        host=TIMESCALE_HOST,
+        database=TIMESCALE_DB,
+        user=TIMESCALE_USER,
+        password=TIMESCALE_PASSWORD
+    )
+
+def connect_minio():
+    minio_client = Minio(
+        MINIO_ENDPOINT,
+        access_key=MINIO_ACCESS_KEY,
+        secret_key=MINIO_SECRET_KEY,
+        secure=False
+    )
+    if not minio_client.bucket_exists(BUCKET_NAME):
+        minio_client.make_bucket(BUCKET_NAME)
+        print(f"Created bucket: {BUCKET_NAME}")
+    return minio_client
+
+def generate_dataset(users=1, records=64, vitals=0, min_file_mb=1, max_file_mb=3, fast_files=False):
+    """Generate records, files and vitals for users; returns what was created"""
+    conn = connect_postgres()
+    minio_client = connect_minio()
+    vitals_conn = connect_timescale() if vitals else None
+    created = {"users": users, "records": 0, "object_bytes": 0, "vitals": 0}
+    
+    try:
+        cur = conn.cursor()
+        user_ids = get_or_create_users(cur, users)
+        conn.commit()
+        cur.close()
+        
+        for user_id in user_ids:
+            print(f"\nGenerating {records} records and {vitals} vitals for user {user_id}...")
+            created["object_bytes"] += generate_records(
+                conn, minio_client, user_id, records, min_file_mb, max_file_mb, fast_files
+            )
+            created["records"] += records
+            if vitals:
+                created["vitals"] += generate_vitals(vitals_conn, user_id, vitals)
+    finally:
+        if vitals_conn is not None:
+            vitals_conn.close()
+        conn.close()
+    
+    return created
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate sample HealthStash data")
+    parser.add_argument("--users", type=int, default=1, help="Users to fill, existing ones first")
+    parser.add_argument("--records", type=int, default=64, help="Health records with a file, per user")
+    parser.add_argument("--vitals", type=int, default=0, help="Vital sign readings per user")
+    parser.add_argument("--min-file-mb", type=float, default=1)
+    parser.add_argument("--max-file-mb", type=float, default=3)
+    parser.add_argument("--fast-files", action="store_true",
+                        help="Upload random bytes instead of rendered PDFs and images")
+    args = parser.parse_args()
+    
+    created = generate_dataset(
+        users=args.users,
+        records=args.records,
+        vitals=args.vitals,
+        min_file_mb=args.min_file_mb,
+        max_file_mb=args.max_file_mb,
+        fast_files=args.fast_files
+    )
+    
+    print(f"\n✅ Successfully generated sample data!")
+    print(f"\nStatistics:")
+    print(f"  Users: {created['users']}")
+    print(f"  Records: {created['records']}")
+    print(f"  Files: {created['object_bytes'] / (1024 * 1024):.2f} MB")
+    print(f"  Vitals: {created['vitals']}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()